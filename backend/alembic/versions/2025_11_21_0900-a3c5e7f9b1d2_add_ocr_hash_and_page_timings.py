@@ -0,0 +1,30 @@
+"""add file_sha256 and ocr_page_timings to processed_invoices
+
+Revision ID: a3c5e7f9b1d2
+Revises: 01af78d1dd58
+Create Date: 2025-11-21 09:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c5e7f9b1d2'
+down_revision: Union[str, None] = '01af78d1dd58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('processed_invoices', sa.Column('file_sha256', sa.String(length=64), nullable=True))
+    op.add_column('processed_invoices', sa.Column('ocr_page_timings', sa.JSON(), nullable=True))
+    op.create_index(op.f('ix_processed_invoices_file_sha256'), 'processed_invoices', ['file_sha256'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_processed_invoices_file_sha256'), table_name='processed_invoices')
+    op.drop_column('processed_invoices', 'ocr_page_timings')
+    op.drop_column('processed_invoices', 'file_sha256')
@@ -0,0 +1,130 @@
+"""add change_log table and capture triggers for the external change feed
+
+Revision ID: e4f6a8b0c2d4
+Revises: a3c5e7f9b1d2
+Create Date: 2025-11-22 09:00:00.000000+00:00
+
+Every insert/update/delete on the tracked tables appends a row to change_log
+(statement-level triggers with transition tables, so bulk writes cost one
+INSERT ... SELECT per statement). Deletes are kept as tombstones.
+
+budget_plan_details has no department_id: it is resolved through
+budget_versions. When a version is deleted its details are removed by the
+FK cascade after the version row is gone, so the version's BEFORE DELETE
+trigger writes the tombstones for its details instead.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4f6a8b0c2d4'
+down_revision: Union[str, None] = 'a3c5e7f9b1d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TRACKED_TABLES = ('expenses', 'revenue_actuals', 'employees', 'bank_transactions')
+
+
+def _create_triggers(table: str, function: str) -> None:
+    for event, transition in (
+        ('INSERT', 'NEW TABLE AS new_rows'),
+        ('UPDATE', 'NEW TABLE AS new_rows'),
+        ('DELETE', 'OLD TABLE AS old_rows'),
+    ):
+        op.execute(f"""
+        CREATE TRIGGER {table}_change_log_{event.lower()}
+        AFTER {event} ON {table}
+        REFERENCING {transition}
+        FOR EACH STATEMENT EXECUTE FUNCTION {function}();
+        """)
+
+
+def _drop_triggers(table: str) -> None:
+    for event in ('insert', 'update', 'delete'):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_change_log_{event} ON {table};")
+
+
+def upgrade() -> None:
+    op.create_table(
+        'change_log',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('entity', sa.String(length=50), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('operation', sa.String(length=10), nullable=False),
+        sa.Column('department_id', sa.Integer(), nullable=True),
+        sa.Column('txid', sa.BigInteger(), server_default=sa.text('txid_current()'), nullable=False),
+        sa.Column('changed_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('idx_change_log_txid_id', 'change_log', ['txid', 'id'], unique=False)
+    op.create_index('idx_change_log_dept_txid_id', 'change_log', ['department_id', 'txid', 'id'], unique=False)
+
+    op.execute("""
+    CREATE OR REPLACE FUNCTION change_log_capture() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO change_log (entity, entity_id, operation, department_id)
+            SELECT TG_TABLE_NAME, o.id, 'delete', o.department_id FROM old_rows o;
+        ELSE
+            INSERT INTO change_log (entity, entity_id, operation, department_id)
+            SELECT TG_TABLE_NAME, n.id, 'upsert', n.department_id FROM new_rows n;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("""
+    CREATE OR REPLACE FUNCTION change_log_capture_budget_plan_details() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            -- Rows whose version is already gone were logged by the version trigger
+            INSERT INTO change_log (entity, entity_id, operation, department_id)
+            SELECT TG_TABLE_NAME, o.id, 'delete', v.department_id
+            FROM old_rows o JOIN budget_versions v ON v.id = o.version_id;
+        ELSE
+            INSERT INTO change_log (entity, entity_id, operation, department_id)
+            SELECT TG_TABLE_NAME, n.id, 'upsert', v.department_id
+            FROM new_rows n LEFT JOIN budget_versions v ON v.id = n.version_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("""
+    CREATE OR REPLACE FUNCTION change_log_capture_budget_version_delete() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO change_log (entity, entity_id, operation, department_id)
+        SELECT 'budget_plan_details', d.id, 'delete', OLD.department_id
+        FROM budget_plan_details d WHERE d.version_id = OLD.id;
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    for table in TRACKED_TABLES:
+        _create_triggers(table, 'change_log_capture')
+    _create_triggers('budget_plan_details', 'change_log_capture_budget_plan_details')
+    op.execute("""
+    CREATE TRIGGER budget_versions_change_log_delete
+    BEFORE DELETE ON budget_versions
+    FOR EACH ROW EXECUTE FUNCTION change_log_capture_budget_version_delete();
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS budget_versions_change_log_delete ON budget_versions;")
+    _drop_triggers('budget_plan_details')
+    for table in TRACKED_TABLES:
+        _drop_triggers(table)
+    op.execute("DROP FUNCTION IF EXISTS change_log_capture_budget_version_delete();")
+    op.execute("DROP FUNCTION IF EXISTS change_log_capture_budget_plan_details();")
+    op.execute("DROP FUNCTION IF EXISTS change_log_capture();")
+    op.drop_index('idx_change_log_dept_txid_id', table_name='change_log')
+    op.drop_index('idx_change_log_txid_id', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,41 @@
+"""add attachment_blobs (content-addressed storage) and attachments.file_sha256
+
+Revision ID: f5a7b9c1d3e6
+Revises: e4f6a8b0c2d4
+Create Date: 2025-11-22 12:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5a7b9c1d3e6'
+down_revision: Union[str, None] = 'e4f6a8b0c2d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'attachment_blobs',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('file_size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('sha256'),
+    )
+    op.add_column('attachments', sa.Column('file_sha256', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_attachments_file_sha256'), 'attachments', ['file_sha256'], unique=False)
+    op.create_foreign_key(
+        'fk_attachments_file_sha256', 'attachments', 'attachment_blobs', ['file_sha256'], ['sha256']
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('fk_attachments_file_sha256', 'attachments', type_='foreignkey')
+    op.drop_index(op.f('ix_attachments_file_sha256'), table_name='attachments')
+    op.drop_column('attachments', 'file_sha256')
+    op.drop_table('attachment_blobs')
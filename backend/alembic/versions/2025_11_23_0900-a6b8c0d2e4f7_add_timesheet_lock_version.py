@@ -0,0 +1,29 @@
+"""add work_timesheets.lock_version (optimistic locking for grid saves)
+
+Revision ID: a6b8c0d2e4f7
+Revises: f5a7b9c1d3e6
+Create Date: 2025-11-23 09:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6b8c0d2e4f7'
+down_revision: Union[str, None] = 'f5a7b9c1d3e6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'work_timesheets',
+        sa.Column('lock_version', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('work_timesheets', 'lock_version')
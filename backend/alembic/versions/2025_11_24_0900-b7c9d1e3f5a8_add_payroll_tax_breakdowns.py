@@ -0,0 +1,67 @@
+"""add payroll_tax_breakdowns (derived НДФЛ / contributions per employee-month)
+
+Revision ID: b7c9d1e3f5a8
+Revises: a6b8c0d2e4f7
+Create Date: 2025-11-24 09:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7c9d1e3f5a8'
+down_revision: Union[str, None] = 'a6b8c0d2e4f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    money = sa.Numeric(precision=15, scale=2)
+    op.create_table(
+        'payroll_tax_breakdowns',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('source', sa.Enum('ACTUAL', 'PLAN', name='payrolltaxsourceenum'), nullable=False),
+        sa.Column('employee_id', sa.Integer(), nullable=False),
+        sa.Column('department_id', sa.Integer(), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('base_salary', money, nullable=False),
+        sa.Column('monthly_bonus', money, nullable=False),
+        sa.Column('quarterly_bonus', money, nullable=False),
+        sa.Column('annual_bonus', money, nullable=False),
+        sa.Column('other_payments', money, nullable=False),
+        sa.Column('gross', money, nullable=False),
+        sa.Column('ndfl', money, nullable=False),
+        sa.Column('pension_contribution', money, nullable=False),
+        sa.Column('medical_contribution', money, nullable=False),
+        sa.Column('social_contribution', money, nullable=False),
+        sa.Column('injury_contribution', money, nullable=False),
+        sa.Column('total_contributions', money, nullable=False),
+        sa.Column('net', money, nullable=False),
+        sa.Column('employer_cost', money, nullable=False),
+        sa.Column('calculated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['employee_id'], ['employees.id']),
+        sa.ForeignKeyConstraint(['department_id'], ['departments.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('source', 'employee_id', 'year', 'month', name='uq_payroll_tax_breakdown_employee_period'),
+    )
+    op.create_index(op.f('ix_payroll_tax_breakdowns_id'), 'payroll_tax_breakdowns', ['id'], unique=False)
+    op.create_index(
+        op.f('ix_payroll_tax_breakdowns_employee_id'), 'payroll_tax_breakdowns', ['employee_id'], unique=False
+    )
+    op.create_index(
+        'idx_payroll_tax_breakdown_dept_period', 'payroll_tax_breakdowns',
+        ['source', 'department_id', 'year', 'month'], unique=False
+    )
+    # Existing payroll is loaded with: python scripts/backfill_payroll_tax_breakdown.py
+
+
+def downgrade() -> None:
+    op.drop_index('idx_payroll_tax_breakdown_dept_period', table_name='payroll_tax_breakdowns')
+    op.drop_index(op.f('ix_payroll_tax_breakdowns_employee_id'), table_name='payroll_tax_breakdowns')
+    op.drop_index(op.f('ix_payroll_tax_breakdowns_id'), table_name='payroll_tax_breakdowns')
+    op.drop_table('payroll_tax_breakdowns')
+    sa.Enum(name='payrolltaxsourceenum').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,27 @@
+"""add payroll_scenarios.calculation_inputs (incremental scenario recalculation)
+
+Revision ID: c8d0e2f4a6b9
+Revises: b7c9d1e3f5a8
+Create Date: 2025-11-25 09:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8d0e2f4a6b9'
+down_revision: Union[str, None] = 'b7c9d1e3f5a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # NULL = details not built by the incremental calculator yet, the next calculation syncs them
+    op.add_column('payroll_scenarios', sa.Column('calculation_inputs', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('payroll_scenarios', 'calculation_inputs')
@@ -0,0 +1,157 @@
+"""log a delete for the old department when a change-feed row moves
+
+Revision ID: d9e1f3a5b7c0
+Revises: c8d0e2f4a6b9
+Create Date: 2025-11-26 09:00:00.000000+00:00
+
+The change feed is filtered by department. An UPDATE that moved a row to
+another department was only logged for the new department, so consumers of
+the old one never got a tombstone. The UPDATE triggers now also see the old
+rows (OLD TABLE AS old_rows) and log a 'delete' for the old department
+before the 'upsert' for the new one. budget_plan_details move with their
+version: a version whose department changes logs the same pair for its
+details.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9e1f3a5b7c0'
+down_revision: Union[str, None] = 'c8d0e2f4a6b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TRACKED_TABLES = ('expenses', 'revenue_actuals', 'employees', 'bank_transactions')
+
+
+def _recreate_update_trigger(table: str, function: str, transition: str) -> None:
+    op.execute(f"DROP TRIGGER IF EXISTS {table}_change_log_update ON {table};")
+    op.execute(f"""
+    CREATE TRIGGER {table}_change_log_update
+    AFTER UPDATE ON {table}
+    REFERENCING {transition}
+    FOR EACH STATEMENT EXECUTE FUNCTION {function}();
+    """)
+
+
+def upgrade() -> None:
+    op.execute("""
+    CREATE OR REPLACE FUNCTION change_log_capture() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO change_log (entity, entity_id, operation, department_id)
+            SELECT TG_TABLE_NAME, o.id, 'delete', o.department_id FROM old_rows o;
+        ELSE
+            IF TG_OP = 'UPDATE' THEN
+                -- Rows moved to another department are gone for the old one
+                INSERT INTO change_log (entity, entity_id, operation, department_id)
+                SELECT TG_TABLE_NAME, o.id, 'delete', o.department_id
+                FROM old_rows o JOIN new_rows n ON n.id = o.id
+                WHERE o.department_id IS DISTINCT FROM n.department_id;
+            END IF;
+            INSERT INTO change_log (entity, entity_id, operation, department_id)
+            SELECT TG_TABLE_NAME, n.id, 'upsert', n.department_id FROM new_rows n;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("""
+    CREATE OR REPLACE FUNCTION change_log_capture_budget_plan_details() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            -- Rows whose version is already gone were logged by the version trigger
+            INSERT INTO change_log (entity, entity_id, operation, department_id)
+            SELECT TG_TABLE_NAME, o.id, 'delete', v.department_id
+            FROM old_rows o JOIN budget_versions v ON v.id = o.version_id;
+        ELSE
+            IF TG_OP = 'UPDATE' THEN
+                -- Details moved to a version of another department
+                INSERT INTO change_log (entity, entity_id, operation, department_id)
+                SELECT TG_TABLE_NAME, o.id, 'delete', ov.department_id
+                FROM old_rows o
+                JOIN new_rows n ON n.id = o.id
+                JOIN budget_versions ov ON ov.id = o.version_id
+                LEFT JOIN budget_versions nv ON nv.id = n.version_id
+                WHERE ov.department_id IS DISTINCT FROM nv.department_id;
+            END IF;
+            INSERT INTO change_log (entity, entity_id, operation, department_id)
+            SELECT TG_TABLE_NAME, n.id, 'upsert', v.department_id
+            FROM new_rows n LEFT JOIN budget_versions v ON v.id = n.version_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("""
+    CREATE OR REPLACE FUNCTION change_log_capture_budget_version_move() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO change_log (entity, entity_id, operation, department_id)
+        SELECT 'budget_plan_details', d.id, 'delete', OLD.department_id
+        FROM budget_plan_details d WHERE d.version_id = NEW.id;
+        INSERT INTO change_log (entity, entity_id, operation, department_id)
+        SELECT 'budget_plan_details', d.id, 'upsert', NEW.department_id
+        FROM budget_plan_details d WHERE d.version_id = NEW.id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    for table in TRACKED_TABLES:
+        _recreate_update_trigger(table, 'change_log_capture', 'OLD TABLE AS old_rows NEW TABLE AS new_rows')
+    _recreate_update_trigger(
+        'budget_plan_details', 'change_log_capture_budget_plan_details', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'
+    )
+    op.execute("""
+    CREATE TRIGGER budget_versions_change_log_move
+    AFTER UPDATE OF department_id ON budget_versions
+    FOR EACH ROW
+    WHEN (OLD.department_id IS DISTINCT FROM NEW.department_id)
+    EXECUTE FUNCTION change_log_capture_budget_version_move();
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS budget_versions_change_log_move ON budget_versions;")
+    op.execute("DROP FUNCTION IF EXISTS change_log_capture_budget_version_move();")
+    for table in TRACKED_TABLES:
+        _recreate_update_trigger(table, 'change_log_capture', 'NEW TABLE AS new_rows')
+    _recreate_update_trigger('budget_plan_details', 'change_log_capture_budget_plan_details', 'NEW TABLE AS new_rows')
+
+    op.execute("""
+    CREATE OR REPLACE FUNCTION change_log_capture() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO change_log (entity, entity_id, operation, department_id)
+            SELECT TG_TABLE_NAME, o.id, 'delete', o.department_id FROM old_rows o;
+        ELSE
+            INSERT INTO change_log (entity, entity_id, operation, department_id)
+            SELECT TG_TABLE_NAME, n.id, 'upsert', n.department_id FROM new_rows n;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("""
+    CREATE OR REPLACE FUNCTION change_log_capture_budget_plan_details() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            -- Rows whose version is already gone were logged by the version trigger
+            INSERT INTO change_log (entity, entity_id, operation, department_id)
+            SELECT TG_TABLE_NAME, o.id, 'delete', v.department_id
+            FROM old_rows o JOIN budget_versions v ON v.id = o.version_id;
+        ELSE
+            INSERT INTO change_log (entity, entity_id, operation, department_id)
+            SELECT TG_TABLE_NAME, n.id, 'upsert', v.department_id
+            FROM new_rows n LEFT JOIN budget_versions v ON v.id = n.version_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
@@ -0,0 +1,30 @@
+"""add batch_id and queued_at to processed_invoices
+
+Revision ID: e0f2a4b6c8d1
+Revises: d9e1f3a5b7c0
+Create Date: 2025-11-27 09:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e0f2a4b6c8d1'
+down_revision: Union[str, None] = 'd9e1f3a5b7c0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('processed_invoices', sa.Column('batch_id', sa.String(length=32), nullable=True))
+    op.add_column('processed_invoices', sa.Column('queued_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_processed_invoices_batch_id'), 'processed_invoices', ['batch_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_processed_invoices_batch_id'), table_name='processed_invoices')
+    op.drop_column('processed_invoices', 'queued_at')
+    op.drop_column('processed_invoices', 'batch_id')
@@ -0,0 +1,59 @@
+"""release attachment blob references in a trigger on attachments
+
+Revision ID: f1a3c5e7b9d2
+Revises: e0f2a4b6c8d1
+Create Date: 2025-11-28 09:00:00.000000+00:00
+
+attachment_blobs.ref_count was only decremented by the delete-attachment
+endpoint, so attachments removed by an expense delete (ORM cascade or
+ON DELETE CASCADE) leaked their blobs. The decrement now happens in an
+AFTER DELETE trigger on attachments; blobs that reach 0 are removed by the
+application (attachment_storage.purge_unreferenced_blobs). Existing counts
+are recomputed from the attachments table.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1a3c5e7b9d2'
+down_revision: Union[str, None] = 'e0f2a4b6c8d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("""
+    CREATE OR REPLACE FUNCTION attachment_blobs_release() RETURNS trigger AS $$
+    BEGIN
+        UPDATE attachment_blobs b
+        SET ref_count = b.ref_count - o.refs
+        FROM (
+            SELECT file_sha256, count(*) AS refs
+            FROM old_rows
+            WHERE file_sha256 IS NOT NULL
+            GROUP BY file_sha256
+        ) o
+        WHERE b.sha256 = o.file_sha256;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+    CREATE TRIGGER attachments_release_blob
+    AFTER DELETE ON attachments
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION attachment_blobs_release();
+    """)
+
+    # Counts leaked by earlier cascade deletes
+    op.execute("""
+    UPDATE attachment_blobs b
+    SET ref_count = (SELECT count(*) FROM attachments a WHERE a.file_sha256 = b.sha256);
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS attachments_release_blob ON attachments;")
+    op.execute("DROP FUNCTION IF EXISTS attachment_blobs_release();")
@@ -0,0 +1,26 @@
+"""add processing_started_at to processed_invoices
+
+Revision ID: a2b4c6d8e0f3
+Revises: f1a3c5e7b9d2
+Create Date: 2025-11-29 09:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2b4c6d8e0f3'
+down_revision: Union[str, None] = 'f1a3c5e7b9d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('processed_invoices', sa.Column('processing_started_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('processed_invoices', 'processing_started_at')
@@ -68,7 +68,7 @@ def ensure_admin(current_user: User) -> None:
 
 
 @router.get("/config", response_model=AdminConfigResponse, tags=["Admin"])
-async def get_admin_config(
+def get_admin_config(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ) -> AdminConfigResponse:
@@ -103,7 +103,7 @@ async def get_admin_config(
 
 
 @router.put("/config", response_model=AdminConfigResponse, tags=["Admin"])
-async def update_admin_config(
+def update_admin_config(
     payload: AdminConfigUpdate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -120,4 +120,4 @@ async def update_admin_config(
     AdminSettingsService.update(db, updates, current_user)
 
     # Return refreshed config snapshot
-    return await get_admin_config(current_user, db)
+    return get_admin_config(current_user, db)
@@ -5,18 +5,19 @@ Provides deep analytical insights into expenses, contractors, departments, and e
 from typing import Optional, List
 from fastapi import APIRouter, Depends, Query, HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract, case, and_, distinct
+from sqlalchemy import func, and_
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 from calendar import month_name as calendar_month_names
 
 from app.db.session import get_db
 from app.db.models import (
-    BudgetPlanDetail, Expense, BudgetCategory, Contractor, Department, Employee,
+    BudgetPlanDetail, BudgetCategory, Contractor, Department, Employee,
     BudgetPlan, BudgetVersion, User, UserRoleEnum, ExpenseStatusEnum,
     ExpenseTypeEnum
 )
 from app.utils.auth import get_current_active_user
+from app.services.analytics_snapshot import query_facts
 from app.schemas.analytics_advanced import (
     ExpenseTrendsResponse, ExpenseTrendPoint, ExpenseTrendSummary,
     ContractorAnalysisResponse, ContractorStats,
@@ -43,6 +44,23 @@ def check_department_access(user: User, department_id: Optional[int]) -> bool:
     return False
 
 
+def _category_names(db: Session, category_ids) -> dict:
+    """Map category id -> name for ids returned by a facts query"""
+    ids = [category_id for category_id in category_ids if category_id is not None]
+    if not ids:
+        return {}
+    return dict(db.query(BudgetCategory.id, BudgetCategory.name).filter(BudgetCategory.id.in_(ids)).all())
+
+
+def _period_bounds(year: int, month: Optional[int]) -> tuple:
+    """[start, end) dates of a year or of one month in it"""
+    if not month:
+        return date(year, 1, 1), date(year + 1, 1, 1)
+    if month == 12:
+        return date(year, 12, 1), date(year + 1, 1, 1)
+    return date(year, month, 1), date(year, month + 1, 1)
+
+
 @router.get("/expense-trends", response_model=ExpenseTrendsResponse)
 def get_expense_trends(
     start_date: date = Query(..., description="Start date for analysis"),
@@ -72,61 +90,47 @@ def get_expense_trends(
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
         department_id = current_user.department_id
 
-    # Base query
-    query = db.query(
-        extract('year', Expense.request_date).label('year'),
-        extract('month', Expense.request_date).label('month'),
-        BudgetCategory.id.label('category_id'),
-        BudgetCategory.name.label('category_name'),
-        func.sum(Expense.amount).label('total_amount'),
-        func.count(Expense.id).label('expense_count'),
-        func.avg(Expense.amount).label('average_amount')
-    ).join(
-        BudgetCategory, Expense.category_id == BudgetCategory.id
-    ).filter(
-        and_(
-            Expense.request_date >= start_date,
-            Expense.request_date <= end_date
-        )
-    )
-
-    # Apply filters
-    if department_id:
-        query = query.filter(Expense.department_id == department_id)
+    # Aggregate in DuckDB over snapshots + live rows
+    sql = """
+        SELECT year(request_date) AS year, month(request_date) AS month, category_id,
+               sum(amount) AS total_amount, count(*) AS expense_count, avg(amount) AS average_amount
+        FROM facts
+        WHERE category_id IS NOT NULL
+    """
+    params = []
     if category_id:
-        query = query.filter(Expense.category_id == category_id)
-
-    # Group by period
-    if period == "month":
-        query = query.group_by('year', 'month', BudgetCategory.id, BudgetCategory.name)
-        query = query.order_by('year', 'month', BudgetCategory.id)
-    else:  # quarter
-        query = query.group_by('year', 'month', BudgetCategory.id, BudgetCategory.name)
+        sql += " AND category_id = ?"
+        params.append(category_id)
+    sql += " GROUP BY ALL ORDER BY year, month, category_id"
 
-    results = query.all()
+    results = query_facts(
+        db, "expenses", sql, params,
+        department_id=department_id, date_from=start_date, date_before=end_date + timedelta(days=1),
+    )
+    category_names = _category_names(db, {r[2] for r in results})
 
     # Build trends with growth rates
     trends = []
     prev_amounts = {}  # Track previous period for growth calculation
 
-    for r in results:
-        period_key = f"{int(r.year)}-{int(r.month):02d}" if period == "month" else f"{int(r.year)}-Q{(int(r.month)-1)//3 + 1}"
-        cat_key = f"{r.category_id}"
+    for year, month, cat_id, cat_total, expense_count, average_amount in results:
+        period_key = f"{year}-{month:02d}" if period == "month" else f"{year}-Q{(month-1)//3 + 1}"
+        cat_key = f"{cat_id}"
 
         growth_rate = None
         if cat_key in prev_amounts:
             if prev_amounts[cat_key] > 0:
-                growth_rate = ((r.total_amount - prev_amounts[cat_key]) / prev_amounts[cat_key]) * 100
+                growth_rate = ((cat_total - prev_amounts[cat_key]) / prev_amounts[cat_key]) * 100
 
-        prev_amounts[cat_key] = r.total_amount
+        prev_amounts[cat_key] = cat_total
 
         trends.append(ExpenseTrendPoint(
             period=period_key,
-            category_id=r.category_id,
-            category_name=r.category_name,
-            total_amount=r.total_amount,
-            expense_count=r.expense_count,
-            average_amount=r.average_amount,
+            category_id=cat_id,
+            category_name=category_names.get(cat_id, "N/A"),
+            total_amount=cat_total,
+            expense_count=expense_count,
+            average_amount=Decimal(str(average_amount)),
             growth_rate=growth_rate
         ))
 
@@ -213,77 +217,57 @@ def get_contractor_analysis(
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
         department_id = current_user.department_id
 
-    # Query contractor statistics
-    query = db.query(
-        Contractor.id.label('contractor_id'),
-        Contractor.name.label('contractor_name'),
-        func.sum(Expense.amount).label('total_amount'),
-        func.count(Expense.id).label('expense_count'),
-        func.avg(Expense.amount).label('average_expense'),
-        func.min(Expense.request_date).label('first_expense_date'),
-        func.max(Expense.request_date).label('last_expense_date'),
-        func.count(distinct(func.concat(
-            extract('year', Expense.request_date),
-            '-',
-            extract('month', Expense.request_date)
-        ))).label('active_months'),
-        func.count(distinct(Expense.category_id)).label('categories_count')
-    ).join(
-        Expense, Contractor.id == Expense.contractor_id
-    ).filter(
-        and_(
-            Expense.request_date >= start_date,
-            Expense.request_date <= end_date
+    # Contractor statistics and top category per contractor in one DuckDB pass
+    results = query_facts(
+        db, "expenses",
+        """
+        WITH by_category AS (
+            SELECT contractor_id, category_id, sum(amount) AS category_amount
+            FROM facts WHERE contractor_id IS NOT NULL AND category_id IS NOT NULL
+            GROUP BY ALL
+        ),
+        top_categories AS (
+            SELECT contractor_id, arg_max(category_id, category_amount) AS top_category_id
+            FROM by_category GROUP BY contractor_id
         )
+        SELECT f.contractor_id, sum(f.amount) AS total_amount, count(*) AS expense_count,
+               avg(f.amount) AS average_expense, min(f.request_date), max(f.request_date),
+               count(DISTINCT date_trunc('month', f.request_date)) AS active_months,
+               count(DISTINCT f.category_id) AS categories_count, any_value(t.top_category_id)
+        FROM facts f LEFT JOIN top_categories t USING (contractor_id)
+        WHERE f.contractor_id IS NOT NULL
+        GROUP BY f.contractor_id
+        ORDER BY total_amount DESC
+        """,
+        department_id=department_id, date_from=start_date, date_before=end_date + timedelta(days=1),
     )
-
-    if department_id:
-        query = query.filter(Expense.department_id == department_id)
-
-    query = query.group_by(Contractor.id, Contractor.name)
-    query = query.order_by(func.sum(Expense.amount).desc())
-
-    results = query.all()
+    contractor_names = dict(
+        db.query(Contractor.id, Contractor.name).filter(Contractor.id.in_([r[0] for r in results])).all()
+    ) if results else {}
+    category_names = _category_names(db, {r[8] for r in results})
 
     # Calculate total for share calculation
-    total_amount = sum(r.total_amount for r in results) if results else Decimal(0)
+    total_amount = sum(r[1] for r in results) if results else Decimal(0)
 
-    # Get top category for each contractor
     contractors = []
-    for r in results:
-        if min_amount and r.total_amount < min_amount:
+    for (contractor_id, contractor_total, expense_count, average_expense, first_date, last_date,
+         active_months, categories_count, top_category_id) in results:
+        if min_amount and contractor_total < min_amount:
             continue
 
-        # Get top category for this contractor
-        top_cat = db.query(
-            BudgetCategory.name
-        ).join(
-            Expense, BudgetCategory.id == Expense.category_id
-        ).filter(
-            and_(
-                Expense.contractor_id == r.contractor_id,
-                Expense.request_date >= start_date,
-                Expense.request_date <= end_date
-            )
-        ).group_by(
-            BudgetCategory.name
-        ).order_by(
-            func.sum(Expense.amount).desc()
-        ).first()
-
-        share = (r.total_amount / total_amount * 100) if total_amount > 0 else Decimal(0)
+        share = (contractor_total / total_amount * 100) if total_amount > 0 else Decimal(0)
 
         contractors.append(ContractorStats(
-            contractor_id=r.contractor_id,
-            contractor_name=r.contractor_name,
-            total_amount=r.total_amount,
-            expense_count=r.expense_count,
-            average_expense=r.average_expense,
-            first_expense_date=r.first_expense_date.date() if r.first_expense_date else None,
-            last_expense_date=r.last_expense_date.date() if r.last_expense_date else None,
-            active_months=r.active_months,
-            categories_count=r.categories_count,
-            top_category=top_cat[0] if top_cat else "N/A",
+            contractor_id=contractor_id,
+            contractor_name=contractor_names.get(contractor_id, "N/A"),
+            total_amount=contractor_total,
+            expense_count=expense_count,
+            average_expense=Decimal(str(average_expense)),
+            first_expense_date=first_date.date() if first_date else None,
+            last_expense_date=last_date.date() if last_date else None,
+            active_months=active_months,
+            categories_count=categories_count,
+            top_category=category_names.get(top_category_id, "N/A"),
             share_of_total=share
         ))
 
@@ -295,12 +279,10 @@ def get_contractor_analysis(
     new_contractors = sum(1 for c in contractors if c.first_expense_date >= start_date)
 
     # Count inactive contractors (had expenses before but not in period)
-    all_contractors = db.query(func.count(distinct(Expense.contractor_id))).filter(
-        Expense.request_date < start_date
-    )
-    if department_id:
-        all_contractors = all_contractors.filter(Expense.department_id == department_id)
-    prev_count = all_contractors.scalar() or 0
+    prev_count = query_facts(
+        db, "expenses", "SELECT count(DISTINCT contractor_id) FROM facts",
+        department_id=department_id, date_before=start_date,
+    )[0][0]
     inactive_count = prev_count - len(contractors) + new_contractors
 
     return ContractorAnalysisResponse(
@@ -349,76 +331,67 @@ def get_department_comparison(
     total_budget = Decimal(0)
     total_actual = Decimal(0)
 
-    for dept in departments:
-        # Get budget (from baseline version)
-        budget_query = db.query(
-            func.sum(BudgetPlanDetail.planned_amount).label('total_budget')
-        ).join(
-            BudgetVersion, BudgetPlanDetail.version_id == BudgetVersion.id
-        ).filter(
-            and_(
-                BudgetVersion.department_id == dept.id,
-                BudgetVersion.year == year,
-                BudgetVersion.is_baseline == True
-            )
-        )
+    department_ids = [dept.id for dept in departments]
+    single_department_id = department_ids[0] if len(department_ids) == 1 else None
 
-        if month:
-            budget_query = budget_query.filter(BudgetPlanDetail.month == month)
-
-        budget_result = budget_query.first()
-        dept_budget = budget_result.total_budget if budget_result and budget_result.total_budget else Decimal(0)
-
-        # Get actual expenses
-        actual_query = db.query(
-            func.sum(Expense.amount).label('total_actual'),
-            func.count(Expense.id).label('expense_count'),
-            func.avg(Expense.amount).label('average_expense')
-        ).filter(
-            and_(
-                Expense.department_id == dept.id,
-                extract('year', Expense.request_date) == year
-            )
+    # Budget (from baseline version) per department
+    budget_query = db.query(
+        BudgetVersion.department_id,
+        func.sum(BudgetPlanDetail.planned_amount)
+    ).join(
+        BudgetVersion, BudgetPlanDetail.version_id == BudgetVersion.id
+    ).filter(
+        and_(
+            BudgetVersion.department_id.in_(department_ids),
+            BudgetVersion.year == year,
+            BudgetVersion.is_baseline == True
         )
+    )
+    if month:
+        budget_query = budget_query.filter(BudgetPlanDetail.month == month)
+    budgets = dict(budget_query.group_by(BudgetVersion.department_id).all())
+
+    employee_counts = dict(
+        db.query(Employee.department_id, func.count(Employee.id)).filter(
+            Employee.department_id.in_(department_ids)
+        ).group_by(Employee.department_id).all()
+    )
 
-        if month:
-            actual_query = actual_query.filter(extract('month', Expense.request_date) == month)
-
-        actual_result = actual_query.first()
-        dept_actual = actual_result.total_actual if actual_result and actual_result.total_actual else Decimal(0)
-        expense_count = actual_result.expense_count if actual_result else 0
-        average_expense = actual_result.average_expense if actual_result and actual_result.average_expense else Decimal(0)
-
-        # Calculate CAPEX/OPEX
-        capex = db.query(func.sum(Expense.amount)).join(
-            BudgetCategory, Expense.category_id == BudgetCategory.id
-        ).filter(
-            and_(
-                Expense.department_id == dept.id,
-                extract('year', Expense.request_date) == year,
-                BudgetCategory.type == ExpenseTypeEnum.CAPEX
-            )
-        ).scalar() or Decimal(0)
+    # Actual expenses, CAPEX and top category per department
+    period_start, period_end = _period_bounds(year, month)
+    actual_rows = query_facts(
+        db, "expenses",
+        """
+        WITH by_category AS (
+            SELECT department_id, category_id, sum(amount) AS category_amount
+            FROM facts WHERE category_id IS NOT NULL
+            GROUP BY ALL
+        ),
+        top_categories AS (
+            SELECT department_id, arg_max(category_id, category_amount) AS top_category_id,
+                   max(category_amount) AS top_category_amount
+            FROM by_category GROUP BY department_id
+        )
+        SELECT f.department_id, sum(f.amount), count(*), avg(f.amount),
+               coalesce(sum(f.amount) FILTER (WHERE f.category_type = ?), 0),
+               any_value(t.top_category_id), any_value(t.top_category_amount)
+        FROM facts f LEFT JOIN top_categories t USING (department_id)
+        GROUP BY f.department_id
+        """,
+        [ExpenseTypeEnum.CAPEX.value],
+        department_id=single_department_id, date_from=period_start, date_before=period_end,
+    )
+    actuals = {row[0]: row[1:] for row in actual_rows}
+    category_names = _category_names(db, {row[5] for row in actual_rows})
 
+    for dept in departments:
+        dept_budget = budgets.get(dept.id) or Decimal(0)
+        dept_actual, expense_count, average_expense, capex, top_category_id, top_category_amount = (
+            actuals.get(dept.id, (Decimal(0), 0, 0, Decimal(0), None, None))
+        )
+        average_expense = Decimal(str(average_expense))
         opex = dept_actual - capex
-
-        # Get employee count
-        employee_count = db.query(func.count(Employee.id)).filter(
-            Employee.department_id == dept.id
-        ).scalar() or 0
-
-        # Get top category
-        top_cat = db.query(
-            BudgetCategory.name,
-            func.sum(Expense.amount).label('cat_total')
-        ).join(
-            Expense, BudgetCategory.id == Expense.category_id
-        ).filter(
-            and_(
-                Expense.department_id == dept.id,
-                extract('year', Expense.request_date) == year
-            )
-        ).group_by(BudgetCategory.name).order_by(func.sum(Expense.amount).desc()).first()
+        employee_count = employee_counts.get(dept.id, 0)
 
         # Calculate metrics
         execution_rate = (dept_actual / dept_budget * 100) if dept_budget > 0 else Decimal(0)
@@ -442,8 +415,8 @@ def get_department_comparison(
             average_expense=average_expense,
             employee_count=employee_count,
             cost_per_employee=cost_per_employee,
-            top_category=top_cat[0] if top_cat else "N/A",
-            top_category_amount=top_cat[1] if top_cat else Decimal(0)
+            top_category=category_names.get(top_category_id, "N/A"),
+            top_category_amount=top_category_amount or Decimal(0)
         ))
 
         total_budget += dept_budget
@@ -505,33 +478,26 @@ def get_seasonal_patterns(
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
         department_id = current_user.department_id
 
-    # Query monthly aggregates
-    query = db.query(
-        extract('year', Expense.request_date).label('year'),
-        extract('month', Expense.request_date).label('month'),
-        func.sum(Expense.amount).label('total_amount'),
-        func.count(Expense.id).label('expense_count')
-    ).filter(
-        and_(
-            extract('year', Expense.request_date) >= start_year,
-            extract('year', Expense.request_date) <= end_year
-        )
+    # Query monthly aggregates (ordered by year within each month for YoY growth)
+    results = query_facts(
+        db, "expenses",
+        """
+        SELECT year(request_date) AS year, month(request_date) AS month,
+               sum(amount) AS total_amount, count(*) AS expense_count
+        FROM facts
+        GROUP BY ALL
+        ORDER BY month, year
+        """,
+        department_id=department_id, date_from=date(start_year, 1, 1), date_before=date(end_year + 1, 1, 1),
     )
 
-    if department_id:
-        query = query.filter(Expense.department_id == department_id)
-
-    query = query.group_by('year', 'month').order_by('month')
-    results = query.all()
-
     # Aggregate by month across all years
     monthly_data = {}
-    for r in results:
-        month_num = int(r.month)
+    for _, month_num, month_total, expense_count in results:
         if month_num not in monthly_data:
             monthly_data[month_num] = {'amounts': [], 'counts': []}
-        monthly_data[month_num]['amounts'].append(float(r.total_amount))
-        monthly_data[month_num]['counts'].append(r.expense_count)
+        monthly_data[month_num]['amounts'].append(float(month_total))
+        monthly_data[month_num]['counts'].append(expense_count)
 
     # Calculate yearly average for seasonality index
     yearly_avg = sum(sum(data['amounts']) for data in monthly_data.values()) / (end_year - start_year + 1) if monthly_data else 0
@@ -667,51 +633,47 @@ def get_cost_efficiency(
     total_on_time = 0
     total_expenses = 0
 
-    for cat in categories:
-        # Get budget from baseline version
-        budget_query = db.query(
-            func.sum(BudgetPlanDetail.planned_amount).label('budget')
-        ).join(
-            BudgetVersion, BudgetPlanDetail.version_id == BudgetVersion.id
-        ).filter(
-            and_(
-                BudgetVersion.year == year,
-                BudgetVersion.is_baseline == True,
-                BudgetPlanDetail.category_id == cat.category_id
-            )
+    # Budget from baseline version per category
+    budget_query = db.query(
+        BudgetPlanDetail.category_id,
+        func.sum(BudgetPlanDetail.planned_amount)
+    ).join(
+        BudgetVersion, BudgetPlanDetail.version_id == BudgetVersion.id
+    ).filter(
+        and_(
+            BudgetVersion.year == year,
+            BudgetVersion.is_baseline == True
         )
+    )
+    if department_id:
+        budget_query = budget_query.filter(BudgetVersion.department_id == department_id)
+    if month:
+        budget_query = budget_query.filter(BudgetPlanDetail.month == month)
+    budgets = dict(budget_query.group_by(BudgetPlanDetail.category_id).all())
+
+    # Actual expenses with timing metrics per category
+    period_start, period_end = _period_bounds(year, month)
+    actual_rows = query_facts(
+        db, "expenses",
+        """
+        SELECT category_id, sum(amount), count(*),
+               avg(floor(epoch(updated_at - created_at) / 86400)),
+               count(*) FILTER (WHERE status = ?)
+        FROM facts
+        WHERE category_id IS NOT NULL
+        GROUP BY category_id
+        """,
+        [ExpenseStatusEnum.PAID.value],
+        department_id=department_id, date_from=period_start, date_before=period_end,
+    )
+    actuals = {row[0]: row[1:] for row in actual_rows}
 
-        if department_id:
-            budget_query = budget_query.filter(BudgetVersion.department_id == department_id)
-        if month:
-            budget_query = budget_query.filter(BudgetPlanDetail.month == month)
-
-        budget_result = budget_query.first()
-        cat_budget = budget_result.budget if budget_result and budget_result.budget else Decimal(0)
-
-        # Get actual expenses with timing metrics
-        actual_query = db.query(
-            func.sum(Expense.amount).label('actual'),
-            func.count(Expense.id).label('expense_count'),
-            func.avg(func.extract('day', Expense.updated_at - Expense.created_at)).label('avg_processing_days'),
-            func.sum(case((Expense.status == ExpenseStatusEnum.PAID, 1), else_=0)).label('paid_count')
-        ).filter(
-            and_(
-                Expense.category_id == cat.category_id,
-                extract('year', Expense.request_date) == year
-            )
+    for cat in categories:
+        cat_budget = budgets.get(cat.category_id) or Decimal(0)
+        cat_actual, expense_count, avg_proc_days, paid_count = actuals.get(
+            cat.category_id, (Decimal(0), 0, 0, 0)
         )
-
-        if department_id:
-            actual_query = actual_query.filter(Expense.department_id == department_id)
-        if month:
-            actual_query = actual_query.filter(extract('month', Expense.request_date) == month)
-
-        actual_result = actual_query.first()
-        cat_actual = actual_result.actual if actual_result and actual_result.actual else Decimal(0)
-        expense_count = actual_result.expense_count if actual_result else 0
-        avg_proc_days = float(actual_result.avg_processing_days or 0)
-        paid_count = actual_result.paid_count if actual_result else 0
+        avg_proc_days = float(avg_proc_days or 0)
 
         if expense_count > 0:
             savings = cat_budget - cat_actual
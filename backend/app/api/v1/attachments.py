@@ -1,19 +1,34 @@
+import asyncio
+import logging
 import os
-import uuid
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, status, UploadFile, File, Form
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pathlib import Path
 
 from app.db import get_db
+from app.db.session import get_async_db
 from app.db.models import User, Attachment, Expense, UserRoleEnum
 from app.schemas.attachment import AttachmentCreate, AttachmentUpdate, AttachmentInDB, AttachmentList
+from app.services.attachment_storage import (
+    FileTooLargeError,
+    acquire_blob,
+    discard_spooled,
+    file_download_response,
+    publish_blob,
+    purge_unreferenced_blobs,
+    release_unpublished_blob,
+    spool_upload,
+)
 from app.utils.auth import get_current_active_user
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(dependencies=[Depends(get_current_active_user)])
 
-# Directory to store uploaded files
+# Directory to store uploaded files (new uploads go to the content-addressed blob store inside it)
 UPLOAD_DIR = Path(__file__).parent.parent.parent / "uploads"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -63,13 +78,13 @@ async def upload_attachment(
     file: UploadFile = File(...),
     file_type: str = Form(None),
     uploaded_by: str = Form(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Upload a file attachment for an expense"""
 
     # Check if expense exists
-    expense = db.query(Expense).filter(Expense.id == expense_id).first()
+    expense = (await db.execute(select(Expense).where(Expense.id == expense_id))).scalar_one_or_none()
     if not expense:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -92,39 +107,48 @@ async def upload_attachment(
             detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
 
-    # Read file content
-    content = await file.read()
-    file_size = len(content)
-
-    if file_size > MAX_FILE_SIZE:
+    # Stream to disk while hashing (off the event loop)
+    try:
+        spooled = await asyncio.to_thread(spool_upload, file.file, MAX_FILE_SIZE)
+    except FileTooLargeError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"File too large. Max size: {MAX_FILE_SIZE / 1024 / 1024}MB"
         )
 
-    # Generate unique filename to prevent collisions
-    file_extension = get_file_extension(file.filename)
-    unique_filename = f"{expense_id}_{uuid.uuid4()}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
-
-    # Save file to disk
-    with open(file_path, "wb") as f:
-        f.write(content)
+    try:
+        # Content-addressed: identical files share one blob
+        await acquire_blob(db, spooled.sha256, spooled.size)
+        file_path = await asyncio.to_thread(publish_blob, spooled)
+    except Exception:
+        await db.rollback()
+        await asyncio.to_thread(discard_spooled, spooled)
+        raise
 
     # Create database record
     db_attachment = Attachment(
         expense_id=expense_id,
         filename=file.filename,
         file_path=str(file_path),
-        file_size=file_size,
+        file_size=spooled.size,
+        file_sha256=spooled.sha256,
         mime_type=file.content_type,
         file_type=file_type,
         uploaded_by=uploaded_by
     )
 
     db.add(db_attachment)
-    db.commit()
-    db.refresh(db_attachment)
+    try:
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        try:
+            await release_unpublished_blob(db, spooled.sha256, spooled.size)
+        except Exception as e:
+            logger.error(f"Failed to release blob {spooled.sha256}: {e}")
+            await db.rollback()
+        raise
+    await db.refresh(db_attachment)
 
     return db_attachment
 
@@ -182,10 +206,11 @@ def get_attachment(
 @router.get("/attachments/{attachment_id}/download")
 def download_attachment(
     attachment_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Download an attachment file"""
+    """Download an attachment file (supports Range and ETag/If-None-Match)"""
 
     attachment = db.query(Attachment).filter(Attachment.id == attachment_id).first()
     if not attachment:
@@ -206,10 +231,19 @@ def download_attachment(
             detail="File not found on server"
         )
 
-    return FileResponse(
-        path=file_path,
+    if attachment.file_sha256:
+        etag = attachment.file_sha256
+    else:
+        # Legacy per-upload file: validator from size and mtime
+        stat = file_path.stat()
+        etag = f"{stat.st_size:x}-{int(stat.st_mtime):x}"
+
+    return file_download_response(
+        request,
+        file_path,
         filename=attachment.filename,
-        media_type=attachment.mime_type or 'application/octet-stream'
+        media_type=attachment.mime_type,
+        etag=etag,
     )
 
 
@@ -265,17 +299,22 @@ def delete_attachment(
     if expense:
         check_expense_access(expense, current_user)
 
-    # Delete file from disk
+    file_sha256 = attachment.file_sha256
     file_path = Path(attachment.file_path)
-    if file_path.exists():
-        try:
-            os.remove(file_path)
-        except Exception as e:
-            # Log error but continue with database deletion
-            print(f"Error deleting file {file_path}: {e}")
 
-    # Delete database record
+    # Delete database record (the trigger drops the blob reference)
     db.delete(attachment)
     db.commit()
 
+    if file_sha256:
+        # Shared blob: removed once no attachment references it
+        purge_unreferenced_blobs(db, [file_sha256])
+    else:
+        # Legacy per-upload file
+        if file_path.exists():
+            try:
+                os.remove(file_path)
+            except Exception as e:
+                logger.error(f"Error deleting file {file_path}: {e}")
+
     return None
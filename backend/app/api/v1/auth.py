@@ -34,7 +34,7 @@ router = APIRouter()
 
 
 @router.post("/register", response_model=UserSchema, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+def register(user_data: UserCreate, db: Session = Depends(get_db)):
     """
     Register a new user
 
@@ -83,7 +83,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=UserLoginResponse)
-async def login(login_data: UserLogin, request: Request, db: Session = Depends(get_db)):
+def login(login_data: UserLogin, request: Request, db: Session = Depends(get_db)):
     """
     Login with username/email and password
 
@@ -132,7 +132,7 @@ async def get_current_user_info(current_user: User = Depends(get_current_active_
 
 
 @router.put("/me", response_model=UserSchema)
-async def update_current_user(
+def update_current_user(
     user_update: UserUpdate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -176,7 +176,7 @@ async def update_current_user(
 
 
 @router.post("/me/change-password", response_model=dict)
-async def change_password(
+def change_password(
     password_data: UserPasswordChange,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -199,7 +199,7 @@ async def change_password(
 
 
 @router.get("/users", response_model=List[UserListItem])
-async def list_users(
+def list_users(
     skip: int = 0,
     limit: int = 100,
     current_user: User = Depends(get_current_active_user),
@@ -219,7 +219,7 @@ async def list_users(
 
 
 @router.get("/users/{user_id}", response_model=UserSchema)
-async def get_user(
+def get_user(
     user_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -245,7 +245,7 @@ async def get_user(
 
 
 @router.put("/users/{user_id}", response_model=UserSchema)
-async def update_user(
+def update_user(
     user_id: int,
     user_update: UserUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -289,7 +289,7 @@ async def update_user(
 
 
 @router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user(
+def delete_user(
     user_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -326,7 +326,7 @@ async def delete_user(
 
 
 @router.post("/users/{user_id}/reset-password", response_model=dict)
-async def reset_user_password(
+def reset_user_password(
     user_id: int,
     password_data: UserPasswordReset,
     current_user: User = Depends(get_current_active_user),
@@ -871,7 +871,7 @@ def bulk_delete_transactions(
 
 
 @router.post("/import/preview")
-async def preview_import(
+def preview_import(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -881,7 +881,7 @@ async def preview_import(
     Returns available columns, auto-detected mapping, and sample data
     """
     # Read file content
-    content = await file.read()
+    content = file.file.read()
 
     # Preview
     importer = BankTransactionImporter(db)
@@ -900,7 +900,7 @@ async def preview_import(
 
 
 @router.post("/import", response_model=BankTransactionImportResult)
-async def import_transactions(
+def import_transactions(
     file: UploadFile = File(...),
     department_id: Optional[int] = Query(None, description="Department ID (required for MANAGER/ADMIN roles, auto-detected for USER)"),
     column_mapping: Optional[str] = Query(None, description="JSON string with column mapping"),
@@ -940,7 +940,7 @@ async def import_transactions(
         raise HTTPException(status_code=404, detail="Department not found")
 
     # Read file content
-    content = await file.read()
+    content = file.file.read()
 
     # Parse column mapping if provided
     parsed_mapping = None
@@ -980,7 +980,7 @@ async def import_transactions(
 
 
 @router.post("/odata/test-connection", response_model=ODataTestConnectionResult)
-async def test_odata_connection(
+def test_odata_connection(
     request: ODataTestConnectionRequest,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -1024,7 +1024,7 @@ async def test_odata_connection(
 
 
 @router.post("/odata/sync", response_model=dict)
-async def sync_from_odata(
+def sync_from_odata(
     request: ODataSyncRequest,
     background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_user),
@@ -14,6 +14,7 @@ import io
 from app.db import get_db
 from app.db.models import (
     User,
+    Department,
     BudgetVersion,
     BudgetScenario,
     BudgetPlanDetail,
@@ -23,6 +24,7 @@ from app.db.models import (
     BudgetScenarioTypeEnum,
     ExpenseTypeEnum,
     ApprovalActionEnum,
+    UserRoleEnum,
 )
 from app.schemas import (
     # Scenarios
@@ -31,6 +33,7 @@ from app.schemas import (
     BudgetScenarioInDB,
     # Versions
     BudgetVersionCreate,
+    BudgetVersionCopyYearRequest,
     BudgetVersionUpdate,
     BudgetVersionInDB,
     BudgetVersionWithDetails,
@@ -55,6 +58,7 @@ from app.schemas import (
 )
 from app.utils.auth import get_current_active_user
 from app.services.budget_calculator import BudgetCalculator
+from app.services.plan_copy import copy_budget_version_details, copy_budget_year
 
 router = APIRouter(dependencies=[Depends(get_current_active_user)])
 
@@ -484,29 +488,8 @@ def create_version(
         ).first()
 
         if source_version:
-            # Copy plan details
-            source_details = db.query(BudgetPlanDetail).filter(
-                BudgetPlanDetail.version_id == copy_from_version_id
-            ).all()
-
-            for detail in source_details:
-                new_detail = BudgetPlanDetail(
-                    version_id=db_version.id,
-                    month=detail.month,
-                    category_id=detail.category_id,
-                    subcategory=detail.subcategory,
-                    planned_amount=detail.planned_amount,
-                    type=detail.type,
-                    calculation_method=detail.calculation_method,
-                    calculation_params=detail.calculation_params,
-                    business_driver=detail.business_driver,
-                    justification=detail.justification,
-                    based_on_year=detail.based_on_year,
-                    based_on_avg=detail.based_on_avg,
-                    based_on_total=detail.based_on_total,
-                    growth_rate=detail.growth_rate,
-                )
-                db.add(new_detail)
+            # Copy plan details (single INSERT ... SELECT)
+            copy_budget_version_details(db, {source_version.id: db_version.id})
 
             # Copy totals
             db_version.total_amount = source_version.total_amount
@@ -519,6 +502,70 @@ def create_version(
     return db_version
 
 
+@router.post("/versions/copy-year", response_model=List[BudgetVersionInDB], status_code=status.HTTP_201_CREATED)
+def copy_versions_from_year(
+    request: BudgetVersionCopyYearRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Copy the baseline version of source_year into a new DRAFT version of target_year
+
+    Planned amounts are multiplied by coefficient (and optional monthly seasonality) in SQL.
+    MANAGER/ADMIN can copy for several departments in one call (one transaction);
+    other roles only for their own department. Departments without a baseline are skipped.
+    """
+    if current_user.role in (UserRoleEnum.MANAGER, UserRoleEnum.ADMIN) and request.department_ids:
+        department_ids = list(dict.fromkeys(request.department_ids))
+        found = {
+            row.id for row in db.query(Department.id).filter(
+                Department.id.in_(department_ids),
+                Department.is_active == True
+            )
+        }
+        missing = [department_id for department_id in department_ids if department_id not in found]
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Departments not found or inactive: {missing}"
+            )
+    else:
+        if not current_user.department_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="User has no assigned department"
+            )
+        if request.department_ids and set(request.department_ids) != {current_user.department_id}:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only MANAGER/ADMIN can copy budgets of other departments"
+            )
+        department_ids = [current_user.department_id]
+
+    results = copy_budget_year(
+        db,
+        request.source_year,
+        request.target_year,
+        department_ids,
+        created_by=current_user.username,
+        coefficient=request.coefficient,
+        seasonality=request.seasonality,
+    )
+    version_ids = [version_id for result in results.values() for version_id in result.version_ids]
+    if not version_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No baseline version for {request.source_year} in the selected departments"
+        )
+
+    versions = db.query(BudgetVersion).filter(BudgetVersion.id.in_(version_ids)).order_by(BudgetVersion.department_id).all()
+    for version in versions:
+        recalculate_version_totals(db, version)
+    db.commit()
+
+    return versions
+
+
 @router.put("/versions/{version_id}", response_model=BudgetVersionInDB)
 def update_version(
     version_id: int,
@@ -1510,7 +1557,7 @@ def unset_version_baseline(
 
 
 @router.post("/versions/{version_id}/import", status_code=status.HTTP_200_OK)
-async def import_budget_plan_details(
+def import_budget_plan_details(
     version_id: int,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
@@ -1525,8 +1572,7 @@ async def import_budget_plan_details(
     - Январь, Февраль, ..., Декабрь (12 month columns with amounts)
     - Обоснование (optional justification)
     """
-    from app.db.models import UserRoleEnum
-    from app.utils.logger import logger, log_info, log_error
+    from app.utils.logger import log_info, log_error
 
     # Verify version exists and user has access
     version = db.query(BudgetVersion).filter(BudgetVersion.id == version_id).first()
@@ -1561,7 +1607,7 @@ async def import_budget_plan_details(
     try:
         # Read Excel file
         log_info(f"Starting budget plan import from {file.filename} for version {version_id}", "Import")
-        content = await file.read()
+        content = file.file.read()
 
         # Validate file size (max 10MB)
         max_size = 10 * 1024 * 1024  # 10MB
@@ -1607,6 +1653,13 @@ async def import_budget_plan_details(
         )
         categories = {cat.name: cat for cat in categories_query.all()}
 
+        # Existing details of the version, loaded once: (month, category_id) -> detail
+        existing_details = {
+            (detail.month, detail.category_id): detail
+            for detail in db.query(BudgetPlanDetail).filter(BudgetPlanDetail.version_id == version_id).all()
+        }
+        new_details = []
+
         created_count = 0
         updated_count = 0
         errors = []
@@ -1653,12 +1706,7 @@ async def import_budget_plan_details(
                             errors.append(f"Строка {index + 2}, {month_name}: Неверный формат суммы")
                             continue
 
-                    # Check if detail already exists
-                    existing = db.query(BudgetPlanDetail).filter(
-                        BudgetPlanDetail.version_id == version_id,
-                        BudgetPlanDetail.month == month_idx,
-                        BudgetPlanDetail.category_id == category.id
-                    ).first()
+                    existing = existing_details.get((month_idx, category.id))
 
                     if existing:
                         # Update existing
@@ -1679,12 +1727,15 @@ async def import_budget_plan_details(
                             justification=justification,
                             calculation_method="manual"
                         )
-                        db.add(new_detail)
+                        existing_details[(month_idx, category.id)] = new_detail
+                        new_details.append(new_detail)
                         created_count += 1
 
             except Exception as e:
                 errors.append(f"Строка {index + 2}: {str(e)}")
 
+        # New details are flushed together (batched multi-row INSERT)
+        db.add_all(new_details)
         db.commit()
 
         # Recalculate version totals
@@ -1714,7 +1765,7 @@ async def import_budget_plan_details(
 
 
 @router.get("/versions/template/download", status_code=status.HTTP_200_OK)
-async def download_budget_template(
+def download_budget_template(
     current_user: User = Depends(get_current_active_user)
 ):
     """
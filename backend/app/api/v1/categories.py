@@ -399,7 +399,7 @@ def export_categories(
 
 
 @router.post("/import", status_code=status.HTTP_200_OK)
-async def import_categories(
+def import_categories(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -425,7 +425,7 @@ async def import_categories(
     try:
         # Read Excel file
         log_info(f"Starting categories import from {file.filename}", "Import")
-        content = await file.read()
+        content = file.file.read()
 
         # Validate file size (max 10MB)
         max_size = 10 * 1024 * 1024  # 10MB
@@ -355,7 +355,7 @@ def export_contractors(
 
 
 @router.post("/import", status_code=status.HTTP_200_OK)
-async def import_contractors(
+def import_contractors(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -380,7 +380,7 @@ async def import_contractors(
     try:
         # Read Excel file
         log_info(f"Starting contractors import from {file.filename}", "Import")
-        content = await file.read()
+        content = file.file.read()
 
         # Validate file size (max 10MB)
         max_size = 10 * 1024 * 1024  # 10MB
@@ -71,7 +71,7 @@ def invalidate_analytics_cache():
 # ==================== Organizations ====================
 
 @router.get("/organizations", response_model=List[FinOrganizationInDB])
-async def list_organizations(
+def list_organizations(
     skip: int = Query(0, ge=0),
     limit: int = Query(settings.CREDIT_PORTFOLIO_PAGE_SIZE, ge=1, le=settings.MAX_CREDIT_PORTFOLIO_PAGE_SIZE),
     department_id: Optional[int] = None,
@@ -105,7 +105,7 @@ async def list_organizations(
 
 
 @router.post("/organizations", response_model=FinOrganizationInDB, status_code=status.HTTP_201_CREATED)
-async def create_organization(
+def create_organization(
     org_data: FinOrganizationCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -131,7 +131,7 @@ async def create_organization(
 
 
 @router.put("/organizations/{org_id}", response_model=FinOrganizationInDB)
-async def update_organization(
+def update_organization(
     org_id: int,
     org_data: FinOrganizationUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -158,7 +158,7 @@ async def update_organization(
 # ==================== Bank Accounts ====================
 
 @router.get("/bank-accounts", response_model=List[FinBankAccountInDB])
-async def list_bank_accounts(
+def list_bank_accounts(
     skip: int = Query(0, ge=0),
     limit: int = Query(settings.CREDIT_PORTFOLIO_PAGE_SIZE, ge=1, le=settings.MAX_CREDIT_PORTFOLIO_PAGE_SIZE),
     department_id: Optional[int] = None,
@@ -183,7 +183,7 @@ async def list_bank_accounts(
 
 
 @router.post("/bank-accounts", response_model=FinBankAccountInDB, status_code=status.HTTP_201_CREATED)
-async def create_bank_account(
+def create_bank_account(
     account_data: FinBankAccountCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -210,7 +210,7 @@ async def create_bank_account(
 # ==================== Contracts ====================
 
 @router.get("/contracts", response_model=List[FinContractInDB])
-async def list_contracts(
+def list_contracts(
     skip: int = Query(0, ge=0),
     limit: int = Query(settings.CREDIT_PORTFOLIO_PAGE_SIZE, ge=1, le=settings.MAX_CREDIT_PORTFOLIO_PAGE_SIZE),
     department_id: Optional[int] = None,
@@ -293,7 +293,7 @@ async def list_contracts(
 
 
 @router.post("/contracts", response_model=FinContractInDB, status_code=status.HTTP_201_CREATED)
-async def create_contract(
+def create_contract(
     contract_data: FinContractCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -320,7 +320,7 @@ async def create_contract(
 
 
 @router.get("/contracts/stats/summary")
-async def get_contracts_summary(
+def get_contracts_summary(
     department_id: Optional[int] = None,
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(20, ge=1, le=100, description="Items per page"),
@@ -466,7 +466,7 @@ async def get_contracts_summary(
 
 
 @router.get("/contract-stats")
-async def get_contract_stats(
+def get_contract_stats(
     department_id: Optional[int] = None,
     date_from: Optional[str] = Query(None, description="Filter from date (YYYY-MM-DD)"),
     date_to: Optional[str] = Query(None, description="Filter to date (YYYY-MM-DD)"),
@@ -518,7 +518,7 @@ async def get_contract_stats(
 # ==================== Receipts ====================
 
 @router.get("/receipts", response_model=List[FinReceiptInDB])
-async def list_receipts(
+def list_receipts(
     skip: int = Query(0, ge=0),
     limit: int = Query(settings.CREDIT_PORTFOLIO_PAGE_SIZE, ge=1, le=settings.MAX_CREDIT_PORTFOLIO_PAGE_SIZE),
     department_id: Optional[int] = None,
@@ -563,7 +563,7 @@ async def list_receipts(
 
 
 @router.get("/receipts/{receipt_id}", response_model=FinReceiptInDB)
-async def get_receipt(
+def get_receipt(
     receipt_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -589,7 +589,7 @@ async def get_receipt(
 
 
 @router.get("/receipts/stats/summary")
-async def get_receipts_summary(
+def get_receipts_summary(
     department_id: Optional[int] = None,
     date_from: Optional[str] = Query(None, description="Filter from date (YYYY-MM-DD)"),
     date_to: Optional[str] = Query(None, description="Filter to date (YYYY-MM-DD)"),
@@ -650,7 +650,7 @@ async def get_receipts_summary(
 # ==================== Expenses ====================
 
 @router.get("/expenses", response_model=List[FinExpenseInDB])
-async def list_expenses(
+def list_expenses(
     skip: int = Query(0, ge=0),
     limit: int = Query(settings.CREDIT_PORTFOLIO_PAGE_SIZE, ge=1, le=settings.MAX_CREDIT_PORTFOLIO_PAGE_SIZE),
     department_id: Optional[int] = None,
@@ -687,7 +687,7 @@ async def list_expenses(
 
 
 @router.get("/expenses/{expense_id}", response_model=FinExpenseInDB)
-async def get_expense(
+def get_expense(
     expense_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -715,7 +715,7 @@ async def get_expense(
 # ==================== Expense Details ====================
 
 @router.get("/expense-details", response_model=List[FinExpenseDetailInDB])
-async def list_expense_details(
+def list_expense_details(
     skip: int = Query(0, ge=0),
     limit: int = Query(settings.CREDIT_PORTFOLIO_PAGE_SIZE, ge=1, le=settings.MAX_CREDIT_PORTFOLIO_PAGE_SIZE),
     department_id: Optional[int] = None,
@@ -750,7 +750,7 @@ async def list_expense_details(
 
 
 @router.get("/expenses/stats/summary")
-async def get_expenses_summary(
+def get_expenses_summary(
     department_id: Optional[int] = None,
     date_from: Optional[str] = Query(None, description="Filter from date (YYYY-MM-DD)"),
     date_to: Optional[str] = Query(None, description="Filter to date (YYYY-MM-DD)"),
@@ -811,7 +811,7 @@ async def get_expenses_summary(
 # ==================== Analytics ====================
 
 @router.get("/summary", response_model=CreditPortfolioSummary)
-async def get_summary(
+def get_summary(
     department_id: Optional[int] = None,
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
@@ -906,7 +906,7 @@ async def get_summary(
 # ==================== Import Logs ====================
 
 @router.get("/import-logs", response_model=List[FinImportLogInDB])
-async def list_import_logs(
+def list_import_logs(
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=500),
     department_id: Optional[int] = None,
@@ -929,7 +929,7 @@ async def list_import_logs(
 # ==================== Import from FTP ====================
 
 @router.post("/import/trigger", status_code=status.HTTP_200_OK)
-async def trigger_ftp_import(
+def trigger_ftp_import(
     department_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -996,7 +996,7 @@ async def trigger_ftp_import(
 # ==================== Advanced Analytics ====================
 
 @router.get("/monthly-stats", response_model=list[MonthlyStats])
-async def get_monthly_stats(
+def get_monthly_stats(
     department_id: Optional[int] = None,
     date_from: Optional[str] = Query(None, description="Filter from date (YYYY-MM-DD)"),
     date_to: Optional[str] = Query(None, description="Filter to date (YYYY-MM-DD)"),
@@ -1120,7 +1120,7 @@ async def get_monthly_stats(
 
 
 @router.get("/analytics/monthly-efficiency")
-async def get_monthly_efficiency(
+def get_monthly_efficiency(
     department_id: Optional[int] = None,
     date_from: Optional[str] = Query(None, description="Filter from date (YYYY-MM-DD)"),
     date_to: Optional[str] = Query(None, description="Filter to date (YYYY-MM-DD)"),
@@ -1235,7 +1235,7 @@ async def get_monthly_efficiency(
 
 
 @router.get("/analytics/org-efficiency")
-async def get_org_efficiency(
+def get_org_efficiency(
     department_id: Optional[int] = None,
     date_from: Optional[str] = Query(None, description="Filter from date (YYYY-MM-DD)"),
     date_to: Optional[str] = Query(None, description="Filter to date (YYYY-MM-DD)"),
@@ -1358,7 +1358,7 @@ async def get_org_efficiency(
 
 
 @router.get("/analytics/cashflow-monthly")
-async def get_monthly_cashflow(
+def get_monthly_cashflow(
     department_id: Optional[int] = None,
     date_from: Optional[str] = Query(None, description="Filter from date (YYYY-MM-DD)"),
     date_to: Optional[str] = Query(None, description="Filter to date (YYYY-MM-DD)"),
@@ -1471,7 +1471,7 @@ async def get_monthly_cashflow(
 
 
 @router.get("/analytics/yearly-comparison")
-async def get_yearly_comparison(
+def get_yearly_comparison(
     department_id: Optional[int] = None,
     date_from: Optional[str] = Query(None, description="Filter from date (YYYY-MM-DD)"),
     date_to: Optional[str] = Query(None, description="Filter to date (YYYY-MM-DD)"),
@@ -1503,80 +1503,48 @@ async def get_yearly_comparison(
         target_department_id = current_user.department_id
 
     # Parse dates
-    from datetime import datetime as dt
-    from sqlalchemy import case, extract
+    from datetime import datetime as dt, timedelta
+    from app.services.analytics_snapshot import query_facts
     date_from_obj = dt.strptime(date_from, '%Y-%m-%d').date() if date_from else None
     date_to_obj = dt.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    period = {
+        "department_id": target_department_id or None,
+        "date_from": date_from_obj,
+        "date_before": date_to_obj + timedelta(days=1) if date_to_obj else None,
+    }
 
-    # Receipts by year
-    receipts_query = db.query(
-        extract('year', FinReceipt.document_date).label('year'),
-        func.sum(FinReceipt.amount).label('received')
-    )
-
-    if target_department_id:
-        receipts_query = receipts_query.filter(FinReceipt.department_id == target_department_id)
-    if date_from_obj:
-        receipts_query = receipts_query.filter(FinReceipt.document_date >= date_from_obj)
-    if date_to_obj:
-        receipts_query = receipts_query.filter(FinReceipt.document_date <= date_to_obj)
-
-    receipts_query = receipts_query.group_by(extract('year', FinReceipt.document_date)).order_by(
-        extract('year', FinReceipt.document_date)
-    )
-
-    receipts_by_year = receipts_query.all()
-
-    # Expenses by year
-    expenses_query = db.query(
-        extract('year', FinExpense.document_date).label('year'),
-        func.sum(
-            case(
-                (FinExpenseDetail.payment_type == 'Погашение долга', FinExpenseDetail.payment_amount),
-                else_=0
-            )
-        ).label('principal'),
-        func.sum(
-            case(
-                (FinExpenseDetail.payment_type == 'Уплата процентов', FinExpenseDetail.payment_amount),
-                else_=0
-            )
-        ).label('interest')
-    ).outerjoin(
-        FinExpenseDetail,
-        FinExpense.operation_id == FinExpenseDetail.expense_operation_id
+    # Receipts and payments by year (DuckDB over snapshots + live rows)
+    receipts_by_year = query_facts(
+        db, "fin_receipts",
+        "SELECT year(document_date) AS year, sum(amount) AS received FROM facts GROUP BY ALL ORDER BY year",
+        **period,
     )
-
-    if target_department_id:
-        expenses_query = expenses_query.filter(FinExpense.department_id == target_department_id)
-    if date_from_obj:
-        expenses_query = expenses_query.filter(FinExpense.document_date >= date_from_obj)
-    if date_to_obj:
-        expenses_query = expenses_query.filter(FinExpense.document_date <= date_to_obj)
-
-    expenses_query = expenses_query.group_by(extract('year', FinExpense.document_date)).order_by(
-        extract('year', FinExpense.document_date)
+    expenses_by_year = query_facts(
+        db, "fin_expense_payments",
+        """
+        SELECT year(document_date) AS year, sum(principal) AS principal, sum(interest) AS interest
+        FROM facts GROUP BY ALL ORDER BY year
+        """,
+        **period,
     )
 
-    expenses_by_year = expenses_query.all()
-
     # Combine results
     years_data = {}
 
-    for row in receipts_by_year:
-        if row.year:
-            year_key = str(int(row.year))
+    for year, received in receipts_by_year:
+        if year:
+            year_key = str(year)
             years_data[year_key] = {
                 "year": year_key,
-                "received": float(row.received or 0),
+                "received": float(received or 0),
                 "principal": 0,
                 "interest": 0,
                 "paid": 0
             }
 
-    for row in expenses_by_year:
-        if row.year:
-            year_key = str(int(row.year))
+    for year, principal, interest in expenses_by_year:
+        if year:
+            year_key = str(year)
             if year_key not in years_data:
                 years_data[year_key] = {
                     "year": year_key,
@@ -1586,8 +1554,8 @@ async def get_yearly_comparison(
                     "paid": 0
                 }
 
-            principal = float(row.principal or 0)
-            interest = float(row.interest or 0)
+            principal = float(principal or 0)
+            interest = float(interest or 0)
 
             years_data[year_key]["principal"] = principal
             years_data[year_key]["interest"] = interest
@@ -1617,7 +1585,7 @@ async def get_yearly_comparison(
 # ==================== Test Data ====================
 
 @router.post("/load-test-data")
-async def load_test_data(
+def load_test_data(
     force: bool = Query(False, description="Force reload, deleting existing data"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
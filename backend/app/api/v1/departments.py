@@ -22,7 +22,7 @@ router = APIRouter(dependencies=[Depends(get_current_active_user)])
 
 
 @router.get("/", response_model=List[DepartmentListItem])
-async def list_departments(
+def list_departments(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     is_active: Optional[bool] = None,
@@ -57,7 +57,7 @@ async def list_departments(
 
 
 @router.post("/", response_model=DepartmentSchema, status_code=status.HTTP_201_CREATED)
-async def create_department(
+def create_department(
     department_data: DepartmentCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -116,7 +116,7 @@ async def create_department(
 
 
 @router.get("/{department_id}", response_model=DepartmentSchema)
-async def get_department(
+def get_department(
     department_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -146,7 +146,7 @@ async def get_department(
 
 
 @router.get("/{department_id}/stats", response_model=DepartmentWithStats)
-async def get_department_stats(
+def get_department_stats(
     department_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -206,7 +206,7 @@ async def get_department_stats(
 
 
 @router.put("/{department_id}", response_model=DepartmentSchema)
-async def update_department(
+def update_department(
     department_id: int,
     department_update: DepartmentUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -267,7 +267,7 @@ async def update_department(
 
 
 @router.delete("/{department_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def deactivate_department(
+def deactivate_department(
     department_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -312,7 +312,7 @@ async def deactivate_department(
 
 
 @router.post("/{department_id}/activate", response_model=DepartmentSchema)
-async def activate_department(
+def activate_department(
     department_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -15,7 +15,7 @@ from app.db.session import get_db
 from app.utils.excel_export import encode_filename_header
 from app.db.models import (
     Employee, User, UserRoleEnum, Department, SalaryHistory, EmployeeStatusEnum,
-    PayrollPlan, PayrollActual, EmployeeKPI, TaxTypeEnum, TaxRate
+    PayrollPlan, PayrollActual, EmployeeKPI, TaxTypeEnum
 )
 from app.schemas.payroll import (
     EmployeeCreate,
@@ -26,8 +26,9 @@ from app.schemas.payroll import (
     SalaryHistoryInDB,
 )
 from app.utils.auth import get_current_active_user
-from app.services.tax_rate_utils import merge_tax_rates_with_defaults
+from app.services.tax_rate_resolver import get_tax_rate_resolver
 from app.services.salary_calculator import SalaryCalculator
+from app.services.salary_distribution import invalidate_salary_distribution_cache
 from app.utils.ndfl_calculator import calculate_progressive_ndfl, calculate_gross_from_net
 from app.db.models import SalaryTypeEnum
 
@@ -51,7 +52,7 @@ def check_department_access(user: User, department_id: int) -> bool:
 
 
 @router.get("/", response_model=List[EmployeeInDB])
-async def list_employees(
+def list_employees(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     department_id: Optional[int] = None,
@@ -101,7 +102,7 @@ async def list_employees(
 # ==================== Export Endpoints ====================
 
 @router.get("/export")
-async def export_employees(
+def export_employees(
     department_id: Optional[int] = None,
     status: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
@@ -173,7 +174,7 @@ async def export_employees(
 
 
 @router.get("/{employee_id}", response_model=EmployeeWithSalaryHistory)
-async def get_employee(
+def get_employee(
     employee_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -200,7 +201,7 @@ async def get_employee(
 
 
 @router.post("/", response_model=EmployeeInDB, status_code=status.HTTP_201_CREATED)
-async def create_employee(
+def create_employee(
     employee_data: EmployeeCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -283,12 +284,13 @@ async def create_employee(
     )
     db.add(salary_history)
     db.commit()
+    invalidate_salary_distribution_cache()
 
     return new_employee
 
 
 @router.put("/{employee_id}", response_model=EmployeeInDB)
-async def update_employee(
+def update_employee(
     employee_id: int,
     employee_data: EmployeeUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -367,11 +369,12 @@ async def update_employee(
         db.add(salary_history)
         db.commit()
 
+    invalidate_salary_distribution_cache()
     return employee
 
 
 @router.delete("/{employee_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_employee(
+def delete_employee(
     employee_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -450,11 +453,12 @@ async def delete_employee(
     # If no related records, safe to delete
     db.delete(employee)
     db.commit()
+    invalidate_salary_distribution_cache()
     return None
 
 
 @router.get("/{employee_id}/salary-history", response_model=List[SalaryHistoryInDB])
-async def get_salary_history(
+def get_salary_history(
     employee_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -485,7 +489,7 @@ async def get_salary_history(
 
 
 @router.post("/{employee_id}/salary-history", response_model=SalaryHistoryInDB, status_code=status.HTTP_201_CREATED)
-async def add_salary_history(
+def add_salary_history(
     employee_id: int,
     salary_data: SalaryHistoryCreate,
     current_user: User = Depends(get_current_active_user),
@@ -522,12 +526,13 @@ async def add_salary_history(
 
     db.commit()
     db.refresh(new_history)
+    invalidate_salary_distribution_cache()
 
     return new_history
 
 
 @router.get("/{employee_id}/tax-calculation")
-async def get_employee_tax_calculation(
+def get_employee_tax_calculation(
     employee_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -540,7 +545,6 @@ async def get_employee_tax_calculation(
     НДФЛ рассчитывается от годовой зарплаты по прогрессивной шкале.
     Страховые взносы рассчитываются от месячного оклада (gross) из справочников.
     """
-    from sqlalchemy import and_, or_
     from datetime import date
     from decimal import Decimal
 
@@ -591,21 +595,7 @@ async def get_employee_tax_calculation(
     gross_amount = monthly_gross_salary
 
     # Get active tax rates for current date (department-specific + global)
-    tax_rates = db.query(TaxRate).filter(
-        TaxRate.is_active == True,
-        TaxRate.effective_from <= today,
-        or_(
-            TaxRate.effective_to.is_(None),
-            TaxRate.effective_to >= today
-        )
-    ).filter(
-        or_(
-            TaxRate.department_id == employee.department_id,
-            TaxRate.department_id.is_(None)
-        )
-    ).all()
-
-    selected_rates = merge_tax_rates_with_defaults(tax_rates)
+    selected_rates = get_tax_rate_resolver(db).rates_on(today, employee.department_id)
 
     # Initialize result
     income_tax = Decimal(0)
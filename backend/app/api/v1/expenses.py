@@ -14,6 +14,7 @@ from app.schemas import ExpenseCreate, ExpenseUpdate, ExpenseInDB, ExpenseList,
 from app.utils.excel_export import ExcelExporter, encode_filename_header
 from app.services.ftp_import_service import import_from_ftp
 from app.services.baseline_bus import baseline_bus
+from app.services.attachment_storage import purge_unreferenced_blobs
 from app.utils.auth import get_current_active_user
 
 router = APIRouter(dependencies=[Depends(get_current_active_user)])
@@ -604,9 +605,13 @@ def delete_expense(
     category_id = db_expense.category_id
     department_id = db_expense.department_id
     request_year = db_expense.request_date.year if db_expense.request_date else None
+    blob_hashes = [attachment.file_sha256 for attachment in db_expense.attachments if attachment.file_sha256]
 
     db.delete(db_expense)
     db.commit()
+    if blob_hashes:
+        # Attachments were deleted by the cascade: remove blobs nobody references now
+        purge_unreferenced_blobs(db, blob_hashes)
     baseline_bus.invalidate_for_expense(
         category_id=category_id,
         department_id=department_id,
@@ -717,6 +722,11 @@ class FTPImportRequest(BaseModel):
         description="If True, updates only critical fields (status, amount, payment_date) for existing expenses. "
                     "If False, performs full update of all fields."
     )
+    bulk: bool = Field(
+        default=True,
+        description="Set-based import: reference data preloaded once, multi-row writes, single commit. "
+                    "If False, uses the legacy row-by-row import."
+    )
 
 
 @router.post("/import/ftp")
@@ -759,7 +769,8 @@ async def import_expenses_from_ftp(
             remote_path=request.remote_path,
             delete_from_year=request.delete_from_year,
             delete_from_month=request.delete_from_month,
-            skip_duplicates=request.skip_duplicates
+            skip_duplicates=request.skip_duplicates,
+            bulk=request.bulk
         )
 
         return {
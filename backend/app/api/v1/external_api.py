@@ -4,15 +4,17 @@ External API endpoints for data import/export
 Provides token-based authentication for external systems to upload and download data.
 Supports all major entities: expenses, revenues, budgets, payroll, etc.
 """
-from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from fastapi.responses import StreamingResponse
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status, Query
+from sqlalchemy import extract, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
-import io
+from decimal import Decimal
 import json
 
 from app.db import get_db
+from app.db.session import get_async_db
 from app.utils.excel_export import encode_filename_header
 from app.db.models import (
     APIToken,
@@ -23,6 +25,8 @@ from app.db.models import (
     Organization,
     Employee,
     EmployeeStatusEnum,
+    ExpenseStatusEnum,
+    ExpenseTypeEnum,
     PayrollPlan,
     PayrollActual,
     BudgetPlan,
@@ -30,6 +34,9 @@ from app.db.models import (
     RevenuePlan,
     RevenueStream,
     RevenueCategory,
+    BudgetPlanDetail,
+    BudgetVersion,
+    BankTransaction,
 )
 from app.schemas import (
     ExpenseCreate,
@@ -41,6 +48,35 @@ from app.schemas import (
     RevenueActualCreate,
 )
 from app.utils.api_token import check_token_scope
+from app.services.bulk_upsert import (
+    BulkImportResult,
+    BulkImportSpec,
+    ImportPayloadError,
+    bulk_upsert,
+    decode_import_body,
+    to_datetime,
+    to_decimal,
+    to_enum,
+    to_int,
+    to_str,
+)
+from app.services.change_feed import (
+    CHANGE_FEED_DEFAULT_LIMIT,
+    CHANGE_FEED_MAX_LIMIT,
+    ChangeFeedSource,
+    InvalidCursorError,
+    get_head_cursor,
+    read_changes,
+)
+from app.services.export_stream import (
+    EXPORT_MAX_LIMIT,
+    accepts_gzip,
+    export_response,
+    iter_export_rows,
+    paginate,
+)
+from app.services.payroll_tax_breakdown import refresh_payroll_taxes
+from app.services.salary_distribution import invalidate_salary_distribution_cache
 from app.utils.logger import log_info, log_warning, log_error
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
@@ -50,11 +86,11 @@ security = HTTPBearer()
 
 async def verify_api_token_dependency(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> APIToken:
-    """Dependency to verify API token with database session"""
-    from app.utils.api_token import verify_api_token
-    return await verify_api_token(credentials, db)
+    """Dependency to verify API token with async database session"""
+    from app.utils.api_token import verify_api_token_async
+    return await verify_api_token_async(credentials, db)
 
 
 def check_read_access(token: APIToken):
@@ -75,6 +111,232 @@ def check_write_access(token: APIToken):
         )
 
 
+def _filter_by_period(statement, date_column, year: Optional[int], month: Optional[int]):
+    """Year/month filter as a date range on the column (index-friendly)"""
+    if year and month:
+        start = datetime(year, month, 1)
+        end = datetime(year + (month == 12), month % 12 + 1, 1)
+        return statement.where(date_column >= start, date_column < end)
+    if year:
+        return statement.where(date_column >= datetime(year, 1, 1), date_column < datetime(year + 1, 1, 1))
+    if month:
+        return statement.where(extract("month", date_column) == month)
+    return statement
+
+
+def _expense_select():
+    """Columns exported for expenses"""
+    return select(
+        Expense.id,
+        Expense.amount,
+        Expense.category_id,
+        Expense.contractor_id,
+        Expense.organization_id,
+        Expense.comment.label("description"),
+        Expense.request_date,
+        Expense.payment_date,
+        Expense.status,
+        Expense.department_id,
+    )
+
+
+EXPENSE_EXPORT_FIELDS = [
+    "id", "amount", "category_id", "contractor_id", "organization_id",
+    "description", "request_date", "payment_date", "status", "department_id",
+]
+
+
+def _serialize_expense(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "amount": float(row.amount),
+        "category_id": row.category_id,
+        "contractor_id": row.contractor_id,
+        "organization_id": row.organization_id,
+        "description": row.description,
+        "request_date": row.request_date.isoformat() if row.request_date else None,
+        "payment_date": row.payment_date.isoformat() if row.payment_date else None,
+        "status": row.status.value,
+        "department_id": row.department_id,
+    }
+
+
+def _revenue_actual_select():
+    """Columns exported for revenue actuals"""
+    return select(
+        RevenueActual.id,
+        RevenueActual.year,
+        RevenueActual.month,
+        RevenueActual.revenue_stream_id,
+        RevenueActual.revenue_category_id,
+        RevenueActual.planned_amount,
+        RevenueActual.actual_amount,
+        RevenueActual.variance,
+        RevenueActual.variance_percent,
+        RevenueActual.department_id,
+    )
+
+
+REVENUE_ACTUAL_EXPORT_FIELDS = [
+    "id", "year", "month", "revenue_stream_id", "revenue_category_id",
+    "planned_amount", "actual_amount", "variance", "variance_percent", "department_id",
+]
+
+
+def _serialize_revenue_actual(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "year": row.year,
+        "month": row.month,
+        "revenue_stream_id": row.revenue_stream_id,
+        "revenue_category_id": row.revenue_category_id,
+        "planned_amount": float(row.planned_amount) if row.planned_amount else None,
+        "actual_amount": float(row.actual_amount),
+        "variance": float(row.variance) if row.variance else None,
+        "variance_percent": float(row.variance_percent) if row.variance_percent else None,
+        "department_id": row.department_id,
+    }
+
+
+def _budget_plan_select():
+    """Columns exported for budget plans"""
+    return select(
+        BudgetPlan.id,
+        BudgetPlan.year,
+        BudgetPlan.month,
+        BudgetPlan.category_id,
+        BudgetPlan.planned_amount,
+        BudgetPlan.department_id,
+    )
+
+
+BUDGET_PLAN_EXPORT_FIELDS = ["id", "year", "month", "category_id", "planned_amount", "department_id"]
+
+
+def _serialize_budget_plan(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "year": row.year,
+        "month": row.month,
+        "category_id": row.category_id,
+        "planned_amount": float(row.planned_amount),
+        "department_id": row.department_id,
+    }
+
+
+def _employee_select():
+    """Columns exported for employees"""
+    return select(
+        Employee.id,
+        Employee.full_name,
+        Employee.position,
+        Employee.base_salary,
+        Employee.hire_date,
+        Employee.department_id,
+        Employee.status,
+    )
+
+
+EMPLOYEE_EXPORT_FIELDS = ["id", "full_name", "position", "base_salary", "hire_date", "department_id", "is_active"]
+
+
+def _serialize_employee(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "full_name": row.full_name,
+        "position": row.position,
+        "base_salary": float(row.base_salary),
+        "hire_date": row.hire_date.isoformat() if row.hire_date else None,
+        "department_id": row.department_id,
+        "is_active": row.status == EmployeeStatusEnum.ACTIVE,
+    }
+
+
+def _budget_plan_detail_select():
+    """Columns exported for budget plan details"""
+    return select(
+        BudgetPlanDetail.id,
+        BudgetPlanDetail.version_id,
+        BudgetPlanDetail.month,
+        BudgetPlanDetail.category_id,
+        BudgetPlanDetail.subcategory,
+        BudgetPlanDetail.planned_amount,
+        BudgetPlanDetail.type,
+    )
+
+
+def _serialize_budget_plan_detail(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "version_id": row.version_id,
+        "month": row.month,
+        "category_id": row.category_id,
+        "subcategory": row.subcategory,
+        "planned_amount": float(row.planned_amount),
+        "type": row.type.value,
+    }
+
+
+def _bank_transaction_select():
+    """Columns exported for bank transactions"""
+    return select(
+        BankTransaction.id,
+        BankTransaction.transaction_date,
+        BankTransaction.amount,
+        BankTransaction.transaction_type,
+        BankTransaction.counterparty_name,
+        BankTransaction.counterparty_inn,
+        BankTransaction.payment_purpose,
+        BankTransaction.document_number,
+        BankTransaction.document_date,
+        BankTransaction.organization_id,
+        BankTransaction.category_id,
+        BankTransaction.expense_id,
+        BankTransaction.status,
+        BankTransaction.department_id,
+        BankTransaction.is_active,
+    )
+
+
+def _serialize_bank_transaction(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "transaction_date": row.transaction_date.isoformat() if row.transaction_date else None,
+        "amount": float(row.amount),
+        "transaction_type": row.transaction_type.value,
+        "counterparty_name": row.counterparty_name,
+        "counterparty_inn": row.counterparty_inn,
+        "payment_purpose": row.payment_purpose,
+        "document_number": row.document_number,
+        "document_date": row.document_date.isoformat() if row.document_date else None,
+        "organization_id": row.organization_id,
+        "category_id": row.category_id,
+        "expense_id": row.expense_id,
+        "status": row.status.value,
+        "department_id": row.department_id,
+        "is_active": row.is_active,
+    }
+
+
+# Entities served by the change feed (names match change_log.entity)
+CHANGE_FEED_SOURCES: Dict[str, ChangeFeedSource] = {
+    "expenses": (_expense_select(), Expense.id, Expense.department_id, _serialize_expense),
+    "revenue_actuals": (
+        _revenue_actual_select(), RevenueActual.id, RevenueActual.department_id, _serialize_revenue_actual,
+    ),
+    "budget_plan_details": (
+        _budget_plan_detail_select().join(BudgetVersion, BudgetVersion.id == BudgetPlanDetail.version_id),
+        BudgetPlanDetail.id,
+        BudgetVersion.department_id,
+        _serialize_budget_plan_detail,
+    ),
+    "employees": (_employee_select(), Employee.id, Employee.department_id, _serialize_employee),
+    "bank_transactions": (
+        _bank_transaction_select(), BankTransaction.id, BankTransaction.department_id, _serialize_bank_transaction,
+    ),
+}
+
+
 # ============================================================================
 # Generic Data Export Endpoints
 # ============================================================================
@@ -91,7 +353,10 @@ def check_write_access(token: APIToken):
     **Фильтры:**
     - `year` - Фильтр по году (например, 2025)
     - `month` - Фильтр по месяцу (1-12)
-    - `format` - Формат вывода: `json` (по умолчанию) или `csv`
+    - `format` - Формат вывода: `json` (по умолчанию), `csv` или `ndjson`
+    - `after_id`, `limit` - Постраничная выгрузка по id (следующая страница: `after_id` = последний полученный id)
+
+    Ответ передается потоком; при `Accept-Encoding: gzip` сжимается gzip.
 
     **Изоляция по департаментам:**
     Возвращает только расходы департамента, к которому привязан API токен.
@@ -139,88 +404,39 @@ def check_write_access(token: APIToken):
 )
 async def export_expenses(
     year: Optional[int] = None,
-    month: Optional[int] = None,
-    format: str = Query("json", regex="^(json|csv)$"),
-    db: Session = Depends(get_db),
+    month: Optional[int] = Query(None, ge=1, le=12),
+    format: str = Query("json", regex="^(json|csv|ndjson)$"),
+    after_id: Optional[int] = Query(None, ge=0, description="Вернуть записи с id больше указанного"),
+    limit: Optional[int] = Query(None, ge=1, le=EXPORT_MAX_LIMIT, description="Максимум записей"),
+    accept_encoding: Optional[str] = Header(None),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """
-    Export expenses data
+    Export expenses data (streamed)
 
     Requires: READ scope
     """
     check_read_access(token)
 
-    query = db.query(Expense)
+    statement = _expense_select()
 
     # Department isolation
     if token.department_id:
-        query = query.filter(Expense.department_id == token.department_id)
+        statement = statement.where(Expense.department_id == token.department_id)
 
     # Filters
-    if year:
-        query = query.filter(Expense.request_date.year == year)
-    if month:
-        query = query.filter(Expense.request_date.month == month)
-
-    expenses = query.all()
-
-    log_info(
-        f"External API: Exported {len(expenses)} expenses",
-        context=f"Token: {token.name} (ID: {token.id})"
+    statement = _filter_by_period(statement, Expense.request_date, year, month)
+    statement = paginate(statement, Expense.id, after_id, limit)
+
+    return export_response(
+        iter_export_rows(statement, _serialize_expense),
+        EXPENSE_EXPORT_FIELDS,
+        format,
+        "expenses",
+        gzip=accepts_gzip(accept_encoding),
+        log_context=f"Token: {token.name} (ID: {token.id})",
     )
 
-    if format == "csv":
-        # CSV export
-        import csv
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Header
-        writer.writerow([
-            "id", "amount", "category_id", "contractor_id", "organization_id",
-            "description", "request_date", "payment_date", "status", "department_id"
-        ])
-
-        # Data
-        for expense in expenses:
-            writer.writerow([
-                expense.id,
-                float(expense.amount),
-                expense.category_id,
-                expense.contractor_id,
-                expense.organization_id,
-                expense.description,
-                expense.request_date.isoformat() if expense.request_date else None,
-                expense.payment_date.isoformat() if expense.payment_date else None,
-                expense.status.value,
-                expense.department_id,
-            ])
-
-        return StreamingResponse(
-            io.BytesIO(output.getvalue().encode()),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename=expenses_{datetime.now().strftime('%Y%m%d')}.csv"}
-        )
-    else:
-        # JSON export
-        data = []
-        for expense in expenses:
-            data.append({
-                "id": expense.id,
-                "amount": float(expense.amount),
-                "category_id": expense.category_id,
-                "contractor_id": expense.contractor_id,
-                "organization_id": expense.organization_id,
-                "description": expense.description,
-                "request_date": expense.request_date.isoformat() if expense.request_date else None,
-                "payment_date": expense.payment_date.isoformat() if expense.payment_date else None,
-                "status": expense.status.value,
-                "department_id": expense.department_id,
-            })
-
-        return {"data": data, "count": len(data)}
-
 
 @router.get(
     "/export/revenue-actuals",
@@ -233,7 +449,10 @@ async def export_expenses(
     **Фильтры:**
     - `year` - Фильтр по году (например, 2025)
     - `month` - Фильтр по месяцу (1-12)
-    - `format` - Формат вывода: `json` (по умолчанию) или `csv`
+    - `format` - Формат вывода: `json` (по умолчанию), `csv` или `ndjson`
+    - `after_id`, `limit` - Постраничная выгрузка по id (следующая страница: `after_id` = последний полученный id)
+
+    Ответ передается потоком; при `Accept-Encoding: gzip` сжимается gzip.
 
     **Изоляция по департаментам:**
     Возвращает только доходы департамента, к которому привязан API токен.
@@ -279,88 +498,42 @@ async def export_expenses(
 )
 async def export_revenue_actuals(
     year: Optional[int] = None,
-    month: Optional[int] = None,
-    format: str = Query("json", regex="^(json|csv)$"),
-    db: Session = Depends(get_db),
+    month: Optional[int] = Query(None, ge=1, le=12),
+    format: str = Query("json", regex="^(json|csv|ndjson)$"),
+    after_id: Optional[int] = Query(None, ge=0, description="Вернуть записи с id больше указанного"),
+    limit: Optional[int] = Query(None, ge=1, le=EXPORT_MAX_LIMIT, description="Максимум записей"),
+    accept_encoding: Optional[str] = Header(None),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """
-    Export revenue actuals data
+    Export revenue actuals data (streamed)
 
     Requires: READ scope
     """
     check_read_access(token)
 
-    query = db.query(RevenueActual)
+    statement = _revenue_actual_select()
 
     # Department isolation
     if token.department_id:
-        query = query.filter(RevenueActual.department_id == token.department_id)
+        statement = statement.where(RevenueActual.department_id == token.department_id)
 
     # Filters
     if year:
-        query = query.filter(RevenueActual.year == year)
+        statement = statement.where(RevenueActual.year == year)
     if month:
-        query = query.filter(RevenueActual.month == month)
-
-    actuals = query.all()
-
-    log_info(
-        f"External API: Exported {len(actuals)} revenue actuals",
-        context=f"Token: {token.name} (ID: {token.id})"
+        statement = statement.where(RevenueActual.month == month)
+    statement = paginate(statement, RevenueActual.id, after_id, limit)
+
+    return export_response(
+        iter_export_rows(statement, _serialize_revenue_actual),
+        REVENUE_ACTUAL_EXPORT_FIELDS,
+        format,
+        "revenue_actuals",
+        gzip=accepts_gzip(accept_encoding),
+        log_context=f"Token: {token.name} (ID: {token.id})",
     )
 
-    if format == "csv":
-        # CSV export
-        import csv
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Header
-        writer.writerow([
-            "id", "year", "month", "revenue_stream_id", "revenue_category_id",
-            "planned_amount", "actual_amount", "variance", "variance_percent", "department_id"
-        ])
-
-        # Data
-        for actual in actuals:
-            writer.writerow([
-                actual.id,
-                actual.year,
-                actual.month,
-                actual.revenue_stream_id,
-                actual.revenue_category_id,
-                float(actual.planned_amount) if actual.planned_amount else None,
-                float(actual.actual_amount),
-                float(actual.variance) if actual.variance else None,
-                float(actual.variance_percent) if actual.variance_percent else None,
-                actual.department_id,
-            ])
-
-        return StreamingResponse(
-            io.BytesIO(output.getvalue().encode()),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename=revenue_actuals_{datetime.now().strftime('%Y%m%d')}.csv"}
-        )
-    else:
-        # JSON export
-        data = []
-        for actual in actuals:
-            data.append({
-                "id": actual.id,
-                "year": actual.year,
-                "month": actual.month,
-                "revenue_stream_id": actual.revenue_stream_id,
-                "revenue_category_id": actual.revenue_category_id,
-                "planned_amount": float(actual.planned_amount) if actual.planned_amount else None,
-                "actual_amount": float(actual.actual_amount),
-                "variance": float(actual.variance) if actual.variance else None,
-                "variance_percent": float(actual.variance_percent) if actual.variance_percent else None,
-                "department_id": actual.department_id,
-            })
-
-        return {"data": data, "count": len(data)}
-
 
 @router.get(
     "/export/budget-plans",
@@ -372,7 +545,10 @@ async def export_revenue_actuals(
 
     **Фильтры:**
     - `year` - Фильтр по году (например, 2025)
-    - `format` - Формат вывода (только `json` поддерживается)
+    - `format` - Формат вывода: `json` (по умолчанию), `csv` или `ndjson`
+    - `after_id`, `limit` - Постраничная выгрузка по id (следующая страница: `after_id` = последний полученный id)
+
+    Ответ передается потоком; при `Accept-Encoding: gzip` сжимается gzip.
 
     **Изоляция по департаментам:**
     Возвращает только планы департамента, к которому привязан API токен.
@@ -411,47 +587,39 @@ async def export_revenue_actuals(
 )
 async def export_budget_plans(
     year: Optional[int] = None,
-    format: str = Query("json", regex="^(json|csv)$"),
-    db: Session = Depends(get_db),
+    format: str = Query("json", regex="^(json|csv|ndjson)$"),
+    after_id: Optional[int] = Query(None, ge=0, description="Вернуть записи с id больше указанного"),
+    limit: Optional[int] = Query(None, ge=1, le=EXPORT_MAX_LIMIT, description="Максимум записей"),
+    accept_encoding: Optional[str] = Header(None),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """
-    Export budget plans data
+    Export budget plans data (streamed)
 
     Requires: READ scope
     """
     check_read_access(token)
 
-    query = db.query(BudgetPlan)
+    statement = _budget_plan_select()
 
     # Department isolation
     if token.department_id:
-        query = query.filter(BudgetPlan.department_id == token.department_id)
+        statement = statement.where(BudgetPlan.department_id == token.department_id)
 
     # Filters
     if year:
-        query = query.filter(BudgetPlan.year == year)
-
-    plans = query.all()
-
-    log_info(
-        f"External API: Exported {len(plans)} budget plans",
-        context=f"Token: {token.name} (ID: {token.id})"
+        statement = statement.where(BudgetPlan.year == year)
+    statement = paginate(statement, BudgetPlan.id, after_id, limit)
+
+    return export_response(
+        iter_export_rows(statement, _serialize_budget_plan),
+        BUDGET_PLAN_EXPORT_FIELDS,
+        format,
+        "budget_plans",
+        gzip=accepts_gzip(accept_encoding),
+        log_context=f"Token: {token.name} (ID: {token.id})",
     )
 
-    data = []
-    for plan in plans:
-        data.append({
-            "id": plan.id,
-            "year": plan.year,
-            "month": plan.month,
-            "category_id": plan.category_id,
-            "planned_amount": float(plan.planned_amount),
-            "department_id": plan.department_id,
-        })
-
-    return {"data": data, "count": len(data)}
-
 
 @router.get(
     "/export/employees",
@@ -465,6 +633,12 @@ async def export_budget_plans(
     - Экспортируются только активные сотрудники (`is_active = true`)
     - Данные автоматически фильтруются по департаменту токена
 
+    **Параметры:**
+    - `format` - Формат вывода: `json` (по умолчанию), `csv` или `ndjson`
+    - `after_id`, `limit` - Постраничная выгрузка по id (следующая страница: `after_id` = последний полученный id)
+
+    Ответ передается потоком; при `Accept-Encoding: gzip` сжимается gzip.
+
     **Пример ответа включает:**
     - `id` - ID сотрудника
     - `full_name` - Полное имя
@@ -502,49 +676,362 @@ async def export_budget_plans(
     tags=["External API - Экспорт"]
 )
 async def export_employees(
-    format: str = Query("json", regex="^(json|csv)$"),
-    db: Session = Depends(get_db),
+    format: str = Query("json", regex="^(json|csv|ndjson)$"),
+    after_id: Optional[int] = Query(None, ge=0, description="Вернуть записи с id больше указанного"),
+    limit: Optional[int] = Query(None, ge=1, le=EXPORT_MAX_LIMIT, description="Максимум записей"),
+    accept_encoding: Optional[str] = Header(None),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """
-    Export employees data
+    Export employees data (streamed)
 
     Requires: READ scope
     """
     check_read_access(token)
 
-    query = db.query(Employee).filter(Employee.status == EmployeeStatusEnum.ACTIVE)
+    statement = _employee_select().where(Employee.status == EmployeeStatusEnum.ACTIVE)
 
     # Department isolation
     if token.department_id:
-        query = query.filter(Employee.department_id == token.department_id)
+        statement = statement.where(Employee.department_id == token.department_id)
 
-    employees = query.all()
+    statement = paginate(statement, Employee.id, after_id, limit)
 
-    log_info(
-        f"External API: Exported {len(employees)} employees",
-        context=f"Token: {token.name} (ID: {token.id})"
+    return export_response(
+        iter_export_rows(statement, _serialize_employee),
+        EMPLOYEE_EXPORT_FIELDS,
+        format,
+        "employees",
+        gzip=accepts_gzip(accept_encoding),
+        log_context=f"Token: {token.name} (ID: {token.id})",
     )
 
-    data = []
-    for emp in employees:
-        data.append({
-            "id": emp.id,
-            "full_name": emp.full_name,
-            "position": emp.position,
-            "base_salary": float(emp.base_salary),
-            "hire_date": emp.hire_date.isoformat() if emp.hire_date else None,
-            "department_id": emp.department_id,
-            "is_active": emp.status == EmployeeStatusEnum.ACTIVE,
-        })
 
-    return {"data": data, "count": len(data)}
+# ============================================================================
+# Change Feed Endpoints
+# ============================================================================
+
+
+@router.get(
+    "/changes",
+    summary="Лента изменений",
+    description=f"""
+    Возвращает изменения (создание, изменение, удаление) после переданного курсора.
+
+    **Требуемый scope:** READ
+
+    **Сущности:** {', '.join(CHANGE_FEED_SOURCES)}
+
+    **Параметры:**
+    - `cursor` - Курсор из `next_cursor` предыдущего ответа (без курсора - с начала журнала)
+    - `entities` - Список сущностей через запятую (по умолчанию все)
+    - `limit` - Максимум записей журнала за запрос (по умолчанию {CHANGE_FEED_DEFAULT_LIMIT})
+
+    **Ответ:**
+    - `changes` - Изменения по порядку; для каждой строки только последнее изменение в пределах страницы.
+      `operation`: `upsert` (в `data` текущее состояние строки) или `delete` (`data` = null)
+    - `next_cursor` - Курсор для следующего запроса (сохраняйте его после обработки страницы)
+    - `has_more` - Есть ли еще изменения после `next_cursor`
+
+    **Первичная синхронизация:** получите курсор через `/changes/head`, затем выполните полный экспорт
+    и продолжайте с этого курсора.
+    """,
+    tags=["External API - Экспорт"]
+)
+async def get_changes(
+    cursor: Optional[str] = None,
+    entities: Optional[str] = Query(None, description="Сущности через запятую"),
+    limit: int = Query(CHANGE_FEED_DEFAULT_LIMIT, ge=1, le=CHANGE_FEED_MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_db),
+    token: APIToken = Depends(verify_api_token_dependency)
+):
+    """Get changes after cursor (READ scope)"""
+    check_read_access(token)
+
+    entity_list = [e.strip() for e in entities.split(",") if e.strip()] if entities else None
+    unknown = set(entity_list or []) - set(CHANGE_FEED_SOURCES)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown entities: {', '.join(sorted(unknown))}"
+        )
+
+    try:
+        page = await read_changes(
+            db,
+            CHANGE_FEED_SOURCES,
+            cursor=cursor,
+            department_id=token.department_id,
+            entities=entity_list,
+            limit=limit,
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return {
+        "changes": page.changes,
+        "next_cursor": page.next_cursor,
+        "has_more": page.has_more,
+    }
+
+
+@router.get(
+    "/changes/head",
+    summary="Текущий курсор ленты изменений",
+    description="Курсор, указывающий на последнее изменение. Используется перед полной выгрузкой. **Требуемый scope:** READ",
+    tags=["External API - Экспорт"]
+)
+async def get_changes_head(
+    db: AsyncSession = Depends(get_async_db),
+    token: APIToken = Depends(verify_api_token_dependency)
+):
+    """Get current change feed cursor (READ scope)"""
+    check_read_access(token)
+    return {"cursor": await get_head_cursor(db, token.department_id)}
 
 
 # ============================================================================
-# Generic Data Import Endpoints
+# Bulk Import
 # ============================================================================
 
+IMPORT_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "array", "items": {"type": "object"}}},
+            "application/x-ndjson": {"schema": {"type": "string", "description": "Один JSON-объект на строку"}},
+        },
+    }
+}
+
+
+async def read_import_payload(request: Request) -> List[Any]:
+    """Import body: JSON array or NDJSON, optionally gzip (Content-Encoding: gzip)"""
+    try:
+        return await decode_import_body(
+            request.stream(),
+            request.headers.get("content-type"),
+            request.headers.get("content-encoding"),
+        )
+    except ImportPayloadError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def _run_bulk_import(
+    db: Session,
+    spec: BulkImportSpec,
+    data: List[Any],
+    token: APIToken,
+    entity_label: str,
+    insert_values: Optional[Dict[str, Any]] = None,
+    before_commit: Optional[Callable[[BulkImportResult], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Validate and write the payload in one transaction, in the shared response format
+
+    before_commit runs in the same transaction (derived data of the written rows).
+    """
+    if not data:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No data provided"
+        )
+    if spec.department_scoped and not token.department_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Token must be bound to a department to import this data"
+        )
+
+    try:
+        result = bulk_upsert(db, spec, data, token.department_id, insert_values=insert_values)
+        if before_commit is not None:
+            before_commit(result)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to commit data: {str(e)}"
+        )
+
+    for error in result.errors[:20]:
+        log_error(f"Error importing {entity_label} at index {error['index']}: {error['error']}")
+    log_info(
+        f"External API: Imported {result.created_count} {entity_label}, updated {result.updated_count} "
+        f"({len(result.errors)} errors)",
+        context=f"Token: {token.name} (ID: {token.id})"
+    )
+
+    return {
+        "success": True,
+        "created_count": result.created_count,
+        "updated_count": result.updated_count,
+        "error_count": len(result.errors),
+        "errors": result.errors
+    }
+
+
+def _check_month(row: Dict[str, Any]) -> None:
+    if row.get("month") is not None and not 1 <= row["month"] <= 12:
+        raise ValueError("month: must be between 1 and 12")
+
+
+def _imported_employee_years(data: List[Any], result: BulkImportResult) -> Set[Tuple[int, int]]:
+    """(employee_id, year) of the rows written by an import (rows with errors are skipped)"""
+    failed = {error["index"] for error in result.errors}
+    keys = set()
+    for index, row in enumerate(data):
+        if index in failed:
+            continue
+        try:
+            keys.add((to_int(row.get("employee_id")), to_int(row.get("year"))))
+        except (AttributeError, ValueError):
+            continue
+    return keys
+
+
+def _prepare_revenue_actual(row: Dict[str, Any]) -> None:
+    _check_month(row)
+    planned, actual = row.get("planned_amount"), row.get("actual_amount")
+    if planned and actual is not None:
+        row["variance"] = actual - planned
+        row["variance_percent"] = (row["variance"] / planned) * 100
+
+
+def _prepare_expense(row: Dict[str, Any]) -> None:
+    if row.get("amount") is not None and row["amount"] <= 0:
+        raise ValueError("amount: must be greater than 0")
+    if "status" in row:
+        if row["status"] is None:
+            row.pop("status")
+        else:
+            row["is_paid"] = row["status"] == ExpenseStatusEnum.PAID
+            row["is_closed"] = row["status"] == ExpenseStatusEnum.CLOSED
+
+
+PAYROLL_PLAN_COMPONENTS = ("base_salary", "monthly_bonus", "quarterly_bonus", "annual_bonus", "other_payments")
+
+
+def _prepare_payroll_plan(row: Dict[str, Any]) -> None:
+    _check_month(row)
+    for component in PAYROLL_PLAN_COMPONENTS:
+        if row.get(component) is None:
+            row[component] = Decimal("0")
+    row["total_planned"] = sum(row[component] for component in PAYROLL_PLAN_COMPONENTS)
+
+
+REVENUE_ACTUAL_IMPORT = BulkImportSpec(
+    model=RevenueActual,
+    fields={
+        "year": to_int,
+        "month": to_int,
+        "revenue_stream_id": to_int,
+        "revenue_category_id": to_int,
+        "actual_amount": to_decimal,
+        "planned_amount": to_decimal,
+        "notes": None,
+    },
+    required=("year", "month", "revenue_stream_id", "revenue_category_id", "actual_amount"),
+    references={
+        "revenue_stream_id": (RevenueStream, True),
+        "revenue_category_id": (RevenueCategory, True),
+    },
+    prepare=_prepare_revenue_actual,
+)
+
+EXPENSE_IMPORT = BulkImportSpec(
+    model=Expense,
+    fields={
+        "number": to_str,
+        "amount": to_decimal,
+        "category_id": to_int,
+        "contractor_id": to_int,
+        "organization_id": to_int,
+        "description": None,
+        "comment": None,
+        "requester": None,
+        "request_date": to_datetime,
+        "payment_date": to_datetime,
+        "status": to_enum(ExpenseStatusEnum),
+    },
+    required=("number", "amount", "organization_id", "request_date"),
+    match_on=(("number",),),
+    aliases={"description": "comment"},
+    references={
+        "category_id": (BudgetCategory, True),
+        "contractor_id": (Contractor, True),
+        "organization_id": (Organization, False),
+    },
+    prepare=_prepare_expense,
+)
+
+CONTRACTOR_IMPORT = BulkImportSpec(
+    model=Contractor,
+    fields={
+        "name": to_str,
+        "short_name": None,
+        "inn": to_str,
+        "kpp": to_str,
+        "contact_info": None,
+        "is_active": None,
+    },
+    required=("name",),
+    match_on=(("inn",),),
+)
+
+ORGANIZATION_IMPORT = BulkImportSpec(
+    model=Organization,
+    fields={
+        "name": to_str,
+        "legal_name": None,
+        "full_name": None,
+        "short_name": None,
+        "inn": to_str,
+        "kpp": to_str,
+        "ogrn": to_str,
+        "is_active": None,
+    },
+    required=("name",),
+    match_on=(("inn",), ("name",)),
+    unique=(("name",),),
+    # Organizations are shared between departments (name is globally unique)
+    department_scoped=False,
+)
+
+BUDGET_CATEGORY_IMPORT = BulkImportSpec(
+    model=BudgetCategory,
+    fields={
+        "name": to_str,
+        "category_type": to_enum(ExpenseTypeEnum),
+        "description": None,
+        "parent_id": to_int,
+        "is_active": None,
+    },
+    required=("name", "category_type"),
+    match_on=(("name",),),
+    aliases={"category_type": "type"},
+    references={"parent_id": (BudgetCategory, True)},
+)
+
+PAYROLL_PLAN_IMPORT = BulkImportSpec(
+    model=PayrollPlan,
+    fields={
+        "year": to_int,
+        "month": to_int,
+        "employee_id": to_int,
+        "base_salary": to_decimal,
+        "monthly_bonus": to_decimal,
+        "quarterly_bonus": to_decimal,
+        "annual_bonus": to_decimal,
+        "other_payments": to_decimal,
+        "notes": None,
+    },
+    required=("year", "month", "employee_id", "base_salary"),
+    match_on=(("employee_id", "year", "month"),),
+    references={"employee_id": (Employee, True)},
+    prepare=_prepare_payroll_plan,
+)
+
 
 @router.post(
     "/import/revenue-actuals",
@@ -581,6 +1068,12 @@ async def export_employees(
 
     **Опциональные поля:**
     - `planned_amount` - Плановая сумма (для расчета отклонений)
+    - `notes` - Примечания
+
+    **Формат тела запроса:** JSON-массив или NDJSON (`Content-Type: application/x-ndjson`, один объект на строку).
+    Для больших объемов тело можно сжать gzip (`Content-Encoding: gzip`).
+
+    Все строки проверяются до записи; строки с ошибками не сохраняются и возвращаются в `errors`.
     """,
     responses={
         200: {
@@ -590,6 +1083,7 @@ async def export_employees(
                     "example": {
                         "success": True,
                         "created_count": 12,
+                        "updated_count": 0,
                         "error_count": 0,
                         "errors": []
                     }
@@ -600,10 +1094,11 @@ async def export_employees(
         401: {"description": "Недействительный токен"},
         403: {"description": "Требуется WRITE scope"}
     },
+    openapi_extra=IMPORT_REQUEST_BODY,
     tags=["External API - Импорт"]
 )
-async def import_revenue_actuals(
-    data: List[Dict[str, Any]],
+def import_revenue_actuals(
+    data: List[Any] = Depends(read_import_payload),
     db: Session = Depends(get_db),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
@@ -611,78 +1106,19 @@ async def import_revenue_actuals(
     Import revenue actuals data in bulk
 
     Requires: WRITE scope
-
-    Data format:
-    [
-        {
-            "year": 2025,
-            "month": 1,
-            "revenue_stream_id": 1,
-            "revenue_category_id": 1,
-            "actual_amount": 100000.00,
-            "planned_amount": 95000.00
-        },
-        ...
-    ]
     """
     check_write_access(token)
-
-    if not data:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="No data provided"
-        )
-
-    created_count = 0
-    errors = []
-
-    for idx, item in enumerate(data):
-        try:
-            # Auto-assign department from token
-            item["department_id"] = token.department_id
-
-            # Create RevenueActual
-            actual = RevenueActual(**item, created_by=token.created_by)
-
-            # Calculate variance
-            if actual.planned_amount is not None and actual.planned_amount != 0:
-                actual.variance = actual.actual_amount - actual.planned_amount
-                actual.variance_percent = (actual.variance / actual.planned_amount) * 100
-
-            db.add(actual)
-            created_count += 1
-
-        except Exception as e:
-            errors.append({"index": idx, "error": str(e), "data": item})
-            log_error(f"Error importing revenue actual at index {idx}: {str(e)}")
-
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to commit data: {str(e)}"
-        )
-
-    log_info(
-        f"External API: Imported {created_count} revenue actuals ({len(errors)} errors)",
-        context=f"Token: {token.name} (ID: {token.id})"
+    return _run_bulk_import(
+        db, REVENUE_ACTUAL_IMPORT, data, token, "revenue actuals",
+        insert_values={"department_id": token.department_id, "created_by": token.created_by},
     )
 
-    return {
-        "success": True,
-        "created_count": created_count,
-        "error_count": len(errors),
-        "errors": errors
-    }
-
 
 @router.post(
     "/import/expenses",
     summary="Массовый импорт расходов",
     description="""
-    Импортирует несколько записей расходов за один запрос.
+    Импортирует несколько записей расходов за один запрос с upsert по номеру заявки.
 
     **Требуемый scope:** WRITE
 
@@ -690,6 +1126,7 @@ async def import_revenue_actuals(
     ```json
     [
         {
+            "number": "EXT-2025-0001",
             "amount": 10000.00,
             "category_id": 1,
             "contractor_id": 1,
@@ -704,28 +1141,39 @@ async def import_revenue_actuals(
 
     **Особенности:**
     - `department_id` автоматически назначается из токена
+    - Если заявка с таким `number` уже есть в департаменте → обновление, иначе создание
     - Даты принимаются в ISO формате (YYYY-MM-DD)
-    - Частичный успех: продолжает импорт при ошибках в отдельных записях
-    - Возвращает список ошибок с индексами и описаниями
+    - Все строки проверяются до записи (поля, ссылки на категории/контрагентов/организации);
+      строки с ошибками не сохраняются и возвращаются в `errors` с индексами
+    **Формат тела запроса:** JSON-массив или NDJSON (`Content-Type: application/x-ndjson`, один объект на строку).
+    Для больших объемов тело можно сжать gzip (`Content-Encoding: gzip`).
 
     **Обязательные поля:**
+    - `number` - Номер заявки
     - `amount` - Сумма (должна быть больше 0)
-    - `category_id` - ID категории бюджета
+    - `organization_id` - ID организации
     - `request_date` - Дата запроса
 
     **Опциональные поля:**
+    - `category_id` - ID категории бюджета
     - `contractor_id` - ID контрагента
-    - `organization_id` - ID организации
-    - `description` - Описание
+    - `description` (или `comment`) - Описание
+    - `requester` - Заявитель
     - `payment_date` - Дата оплаты
-    - `status` - Статус (DRAFT, PENDING, APPROVED, REJECTED, PAID)
+    - `status` - Статус (DRAFT, PENDING, PAID, REJECTED, CLOSED)
 
     **Пример использования:**
     ```bash
     curl -X POST "http://localhost:8000/api/v1/external/import/expenses" \\
       -H "Authorization: Bearer itb_your_token_here" \\
       -H "Content-Type: application/json" \\
-      -d '[{"amount": 50000, "category_id": 1, "contractor_id": 5, "description": "Серверы", "request_date": "2025-01-15", "status": "DRAFT"}]'
+      -d '[{"number": "EXT-1", "amount": 50000, "category_id": 1, "contractor_id": 5, "organization_id": 1, "description": "Серверы", "request_date": "2025-01-15", "status": "DRAFT"}]'
+
+    # NDJSON + gzip
+    gzip -c expenses.ndjson | curl -X POST "http://localhost:8000/api/v1/external/import/expenses" \\
+      -H "Authorization: Bearer itb_your_token_here" \\
+      -H "Content-Type: application/x-ndjson" -H "Content-Encoding: gzip" \\
+      --data-binary @-
     ```
     """,
     responses={
@@ -736,6 +1184,7 @@ async def import_revenue_actuals(
                     "example": {
                         "success": True,
                         "created_count": 45,
+                        "updated_count": 3,
                         "error_count": 2,
                         "errors": [
                             {
@@ -753,89 +1202,25 @@ async def import_revenue_actuals(
         403: {"description": "У токена нет WRITE scope"},
         500: {"description": "Ошибка при сохранении в базу данных"}
     },
+    openapi_extra=IMPORT_REQUEST_BODY,
     tags=["External API - Импорт"]
 )
-async def import_expenses(
-    data: List[Dict[str, Any]],
+def import_expenses(
+    data: List[Any] = Depends(read_import_payload),
     db: Session = Depends(get_db),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """
-    Import expenses data in bulk
+    Import expenses data in bulk (upsert by number)
 
     Requires: WRITE scope
-
-    Data format:
-    [
-        {
-            "amount": 10000.00,
-            "category_id": 1,
-            "contractor_id": 1,
-            "organization_id": 1,
-            "description": "Equipment purchase",
-            "request_date": "2025-01-15",
-            "status": "DRAFT"
-        },
-        ...
-    ]
     """
     check_write_access(token)
-
-    if not data:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="No data provided"
-        )
-
-    created_count = 0
-    errors = []
-
-    for idx, item in enumerate(data):
-        try:
-            # Auto-assign department from token
-            item["department_id"] = token.department_id
-
-            # Parse dates
-            if "request_date" in item and isinstance(item["request_date"], str):
-                item["request_date"] = datetime.fromisoformat(item["request_date"])
-            if "payment_date" in item and isinstance(item["payment_date"], str):
-                item["payment_date"] = datetime.fromisoformat(item["payment_date"])
-
-            # Create Expense
-            expense = Expense(**item, created_by=token.created_by)
-            db.add(expense)
-            created_count += 1
-
-        except Exception as e:
-            errors.append({"index": idx, "error": str(e), "data": item})
-            log_error(f"Error importing expense at index {idx}: {str(e)}")
-
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to commit data: {str(e)}"
-        )
-
-    log_info(
-        f"External API: Imported {created_count} expenses ({len(errors)} errors)",
-        context=f"Token: {token.name} (ID: {token.id})"
+    return _run_bulk_import(
+        db, EXPENSE_IMPORT, data, token, "expenses",
+        insert_values={"department_id": token.department_id},
     )
 
-    return {
-        "success": True,
-        "created_count": created_count,
-        "error_count": len(errors),
-        "errors": errors
-    }
-
-
-# ============================================================================
-# Reference Data Endpoints
-# ============================================================================
-
 
 @router.get(
     "/reference/categories",
@@ -844,18 +1229,18 @@ async def import_expenses(
     tags=["External API - Справочники"]
 )
 async def get_categories(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """Get all budget categories (READ scope)"""
     check_read_access(token)
 
-    query = db.query(BudgetCategory).filter(BudgetCategory.is_active == True)
+    query = select(BudgetCategory).where(BudgetCategory.is_active == True)
 
     if token.department_id:
-        query = query.filter(BudgetCategory.department_id == token.department_id)
+        query = query.where(BudgetCategory.department_id == token.department_id)
 
-    categories = query.all()
+    categories = (await db.execute(query)).scalars().all()
 
     return {
         "data": [
@@ -877,18 +1262,18 @@ async def get_categories(
     tags=["External API - Справочники"]
 )
 async def get_contractors(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """Get all contractors (READ scope)"""
     check_read_access(token)
 
-    query = db.query(Contractor).filter(Contractor.is_active == True)
+    query = select(Contractor).where(Contractor.is_active == True)
 
     if token.department_id:
-        query = query.filter(Contractor.department_id == token.department_id)
+        query = query.where(Contractor.department_id == token.department_id)
 
-    contractors = query.all()
+    contractors = (await db.execute(query)).scalars().all()
 
     return {
         "data": [
@@ -910,18 +1295,18 @@ async def get_contractors(
     tags=["External API - Справочники"]
 )
 async def get_revenue_streams(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """Get all revenue streams (READ scope)"""
     check_read_access(token)
 
-    query = db.query(RevenueStream).filter(RevenueStream.is_active == True)
+    query = select(RevenueStream).where(RevenueStream.is_active == True)
 
     if token.department_id:
-        query = query.filter(RevenueStream.department_id == token.department_id)
+        query = query.where(RevenueStream.department_id == token.department_id)
 
-    streams = query.all()
+    streams = (await db.execute(query)).scalars().all()
 
     return {
         "data": [
@@ -943,18 +1328,18 @@ async def get_revenue_streams(
     tags=["External API - Справочники"]
 )
 async def get_revenue_categories(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """Get all revenue categories (READ scope)"""
     check_read_access(token)
 
-    query = db.query(RevenueCategory).filter(RevenueCategory.is_active == True)
+    query = select(RevenueCategory).where(RevenueCategory.is_active == True)
 
     if token.department_id:
-        query = query.filter(RevenueCategory.department_id == token.department_id)
+        query = query.where(RevenueCategory.department_id == token.department_id)
 
-    categories = query.all()
+    categories = (await db.execute(query)).scalars().all()
 
     return {
         "data": [
@@ -976,18 +1361,18 @@ async def get_revenue_categories(
     tags=["External API - Справочники"]
 )
 async def get_organizations(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """Get all organizations (READ scope)"""
     check_read_access(token)
 
-    query = db.query(Organization).filter(Organization.is_active == True)
+    query = select(Organization).where(Organization.is_active == True)
 
     if token.department_id:
-        query = query.filter(Organization.department_id == token.department_id)
+        query = query.where(Organization.department_id == token.department_id)
 
-    orgs = query.all()
+    orgs = (await db.execute(query)).scalars().all()
 
     return {
         "data": [
@@ -1023,10 +1408,13 @@ async def get_organizations(
 
     **Обязательные поля:**
     - `name` - Название контрагента
-    - `inn` - ИНН (используется для поиска дубликатов)
 
     **Опциональные поля:**
-    - `contact_person`, `email`, `phone`, `address`
+    - `inn` - ИНН (используется для поиска дубликатов; без ИНН контрагент всегда создается)
+    - `short_name`, `kpp`, `contact_info`, `is_active`
+
+    **Формат тела запроса:** JSON-массив или NDJSON (`Content-Type: application/x-ndjson`, один объект на строку).
+    Для больших объемов тело можно сжать gzip (`Content-Encoding: gzip`).
     """,
     responses={
         200: {
@@ -1044,192 +1432,60 @@ async def get_organizations(
             }
         }
     },
+    openapi_extra=IMPORT_REQUEST_BODY,
     tags=["External API - Импорт"]
 )
-async def import_contractors(
-    data: List[Dict[str, Any]],
+def import_contractors(
+    data: List[Any] = Depends(read_import_payload),
     db: Session = Depends(get_db),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """
-    Import contractors data in bulk
+    Import contractors data in bulk (upsert by INN)
 
     Requires: WRITE scope
-
-    Data format:
-    [
-        {
-            "name": "ООО Поставщик",
-            "inn": "1234567890",
-            "contact_person": "Иванов И.И.",
-            "email": "contact@supplier.ru",
-            "phone": "+7 (495) 123-45-67"
-        },
-        ...
-    ]
     """
     check_write_access(token)
-
-    if not data:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="No data provided"
-        )
-
-    created_count = 0
-    updated_count = 0
-    errors = []
-
-    for idx, item in enumerate(data):
-        try:
-            # Auto-assign department from token
-            item["department_id"] = token.department_id
-
-            # Check if contractor exists by INN
-            existing = None
-            if item.get("inn"):
-                existing = db.query(Contractor).filter(
-                    Contractor.inn == item["inn"],
-                    Contractor.department_id == token.department_id
-                ).first()
-
-            if existing:
-                # Update existing
-                for key, value in item.items():
-                    if key != "id":
-                        setattr(existing, key, value)
-                updated_count += 1
-            else:
-                # Create new
-                contractor = Contractor(**item)
-                db.add(contractor)
-                created_count += 1
-
-        except Exception as e:
-            errors.append({"index": idx, "error": str(e), "data": item})
-            log_error(f"Error importing contractor at index {idx}: {str(e)}")
-
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to commit data: {str(e)}"
-        )
-
-    log_info(
-        f"External API: Imported {created_count} contractors, updated {updated_count} ({len(errors)} errors)",
-        context=f"Token: {token.name} (ID: {token.id})"
+    return _run_bulk_import(
+        db, CONTRACTOR_IMPORT, data, token, "contractors",
+        insert_values={"department_id": token.department_id},
     )
 
-    return {
-        "success": True,
-        "created_count": created_count,
-        "updated_count": updated_count,
-        "error_count": len(errors),
-        "errors": errors
-    }
-
 
 @router.post(
     "/import/organizations",
     summary="Импорт/обновление организаций",
     description="""
-    Массовый импорт организаций с upsert по ИНН.
+    Массовый импорт организаций с upsert по ИНН (если ИНН не найден - по названию).
 
     **Требуемый scope:** WRITE
 
-    **Обязательные поля:**  `name`, `inn`
+    **Обязательные поля:** `name`
 
-    **Опциональные поля:** `legal_name`, `kpp`, `address`
+    **Опциональные поля:** `inn`, `legal_name`, `full_name`, `short_name`, `kpp`, `ogrn`, `is_active`
+
+    **Формат тела запроса:** JSON-массив или NDJSON (`Content-Type: application/x-ndjson`, один объект на строку).
+    Для больших объемов тело можно сжать gzip (`Content-Encoding: gzip`).
     """,
+    openapi_extra=IMPORT_REQUEST_BODY,
     tags=["External API - Импорт"]
 )
-async def import_organizations(
-    data: List[Dict[str, Any]],
+def import_organizations(
+    data: List[Any] = Depends(read_import_payload),
     db: Session = Depends(get_db),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """
-    Import organizations data in bulk
+    Import organizations data in bulk (upsert by INN, then by name)
 
     Requires: WRITE scope
-
-    Data format:
-    [
-        {
-            "name": "ООО Компания",
-            "legal_name": "Общество с ограниченной ответственностью Компания",
-            "inn": "1234567890",
-            "kpp": "123456789"
-        },
-        ...
-    ]
     """
     check_write_access(token)
-
-    if not data:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="No data provided"
-        )
-
-    created_count = 0
-    updated_count = 0
-    errors = []
-
-    for idx, item in enumerate(data):
-        try:
-            # Auto-assign department from token
-            item["department_id"] = token.department_id
-
-            # Check if organization exists by INN
-            existing = None
-            if item.get("inn"):
-                existing = db.query(Organization).filter(
-                    Organization.inn == item["inn"],
-                    Organization.department_id == token.department_id
-                ).first()
-
-            if existing:
-                # Update existing
-                for key, value in item.items():
-                    if key != "id":
-                        setattr(existing, key, value)
-                updated_count += 1
-            else:
-                # Create new
-                org = Organization(**item)
-                db.add(org)
-                created_count += 1
-
-        except Exception as e:
-            errors.append({"index": idx, "error": str(e), "data": item})
-            log_error(f"Error importing organization at index {idx}: {str(e)}")
-
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to commit data: {str(e)}"
-        )
-
-    log_info(
-        f"External API: Imported {created_count} organizations, updated {updated_count} ({len(errors)} errors)",
-        context=f"Token: {token.name} (ID: {token.id})"
+    return _run_bulk_import(
+        db, ORGANIZATION_IMPORT, data, token, "organizations",
+        insert_values={"department_id": token.department_id},
     )
 
-    return {
-        "success": True,
-        "created_count": created_count,
-        "updated_count": updated_count,
-        "error_count": len(errors),
-        "errors": errors
-    }
-
 
 @router.post(
     "/import/budget-categories",
@@ -1241,91 +1497,30 @@ async def import_organizations(
 
     **Обязательные поля:** `name`, `category_type` (OPEX или CAPEX)
 
-    **Опциональные поля:** `description`
+    **Опциональные поля:** `description`, `parent_id`, `is_active`
+
+    **Формат тела запроса:** JSON-массив или NDJSON (`Content-Type: application/x-ndjson`, один объект на строку).
+    Для больших объемов тело можно сжать gzip (`Content-Encoding: gzip`).
     """,
+    openapi_extra=IMPORT_REQUEST_BODY,
     tags=["External API - Импорт"]
 )
-async def import_budget_categories(
-    data: List[Dict[str, Any]],
+def import_budget_categories(
+    data: List[Any] = Depends(read_import_payload),
     db: Session = Depends(get_db),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """
-    Import budget categories data in bulk
+    Import budget categories data in bulk (upsert by name)
 
     Requires: WRITE scope
-
-    Data format:
-    [
-        {
-            "name": "Оборудование",
-            "category_type": "CAPEX",
-            "description": "Закупка оборудования"
-        },
-        ...
-    ]
     """
     check_write_access(token)
-
-    if not data:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="No data provided"
-        )
-
-    created_count = 0
-    updated_count = 0
-    errors = []
-
-    for idx, item in enumerate(data):
-        try:
-            # Auto-assign department from token
-            item["department_id"] = token.department_id
-
-            # Check if category exists by name
-            existing = db.query(BudgetCategory).filter(
-                BudgetCategory.name == item["name"],
-                BudgetCategory.department_id == token.department_id
-            ).first()
-
-            if existing:
-                # Update existing
-                for key, value in item.items():
-                    if key != "id":
-                        setattr(existing, key, value)
-                updated_count += 1
-            else:
-                # Create new
-                category = BudgetCategory(**item)
-                db.add(category)
-                created_count += 1
-
-        except Exception as e:
-            errors.append({"index": idx, "error": str(e), "data": item})
-            log_error(f"Error importing budget category at index {idx}: {str(e)}")
-
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to commit data: {str(e)}"
-        )
-
-    log_info(
-        f"External API: Imported {created_count} budget categories, updated {updated_count} ({len(errors)} errors)",
-        context=f"Token: {token.name} (ID: {token.id})"
+    return _run_bulk_import(
+        db, BUDGET_CATEGORY_IMPORT, data, token, "budget categories",
+        insert_values={"department_id": token.department_id},
     )
 
-    return {
-        "success": True,
-        "created_count": created_count,
-        "updated_count": updated_count,
-        "error_count": len(errors),
-        "errors": errors
-    }
-
 
 @router.post(
     "/import/payroll-plans",
@@ -1337,98 +1532,41 @@ async def import_budget_categories(
 
     **Обязательные поля:** `year`, `month`, `employee_id`, `base_salary`
 
-    **Опциональные поля:** `bonus_type`, `bonus_amount`, `social_contributions`
+    **Опциональные поля:** `monthly_bonus`, `quarterly_bonus`, `annual_bonus`, `other_payments`, `notes`
 
-    **Типы бонусов:** FIXED, PERFORMANCE_BASED, MIXED
+    Незаданные выплаты считаются равными 0; `total_planned` рассчитывается автоматически.
+
+    **Формат тела запроса:** JSON-массив или NDJSON (`Content-Type: application/x-ndjson`, один объект на строку).
+    Для больших объемов тело можно сжать gzip (`Content-Encoding: gzip`).
     """,
+    openapi_extra=IMPORT_REQUEST_BODY,
     tags=["External API - Импорт"]
 )
-async def import_payroll_plans(
-    data: List[Dict[str, Any]],
+def import_payroll_plans(
+    data: List[Any] = Depends(read_import_payload),
     db: Session = Depends(get_db),
     token: APIToken = Depends(verify_api_token_dependency)
 ):
     """
-    Import payroll plans data in bulk
+    Import payroll plans data in bulk (upsert by employee_id, year, month)
 
     Requires: WRITE scope
-
-    Data format:
-    [
-        {
-            "year": 2025,
-            "month": 1,
-            "employee_id": 1,
-            "base_salary": 100000.00,
-            "bonus_type": "FIXED",
-            "bonus_amount": 20000.00,
-            "social_contributions": 30000.00
-        },
-        ...
-    ]
     """
     check_write_access(token)
 
-    if not data:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="No data provided"
-        )
+    def refresh_taxes(imported: BulkImportResult) -> None:
+        # Only the imported employees' years, in the import transaction
+        if imported.created_count or imported.updated_count:
+            refresh_payroll_taxes(db, _imported_employee_years(data, imported))
 
-    created_count = 0
-    updated_count = 0
-    errors = []
-
-    for idx, item in enumerate(data):
-        try:
-            # Auto-assign department from token
-            item["department_id"] = token.department_id
-
-            # Check if payroll plan exists
-            existing = db.query(PayrollPlan).filter(
-                PayrollPlan.year == item["year"],
-                PayrollPlan.month == item["month"],
-                PayrollPlan.employee_id == item["employee_id"],
-                PayrollPlan.department_id == token.department_id
-            ).first()
-
-            if existing:
-                # Update existing
-                for key, value in item.items():
-                    if key != "id":
-                        setattr(existing, key, value)
-                updated_count += 1
-            else:
-                # Create new
-                plan = PayrollPlan(**item)
-                db.add(plan)
-                created_count += 1
-
-        except Exception as e:
-            errors.append({"index": idx, "error": str(e), "data": item})
-            log_error(f"Error importing payroll plan at index {idx}: {str(e)}")
-
-    try:
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to commit data: {str(e)}"
-        )
-
-    log_info(
-        f"External API: Imported {created_count} payroll plans, updated {updated_count} ({len(errors)} errors)",
-        context=f"Token: {token.name} (ID: {token.id})"
+    result = _run_bulk_import(
+        db, PAYROLL_PLAN_IMPORT, data, token, "payroll plans",
+        insert_values={"department_id": token.department_id},
+        before_commit=refresh_taxes,
     )
-
-    return {
-        "success": True,
-        "created_count": created_count,
-        "updated_count": updated_count,
-        "error_count": len(errors),
-        "errors": errors
-    }
+    if result["created_count"] or result["updated_count"]:
+        invalidate_salary_distribution_cache()
+    return result
 
 
 @router.get(
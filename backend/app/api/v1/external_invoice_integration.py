@@ -5,18 +5,19 @@ Endpoints for 1C to fetch processed invoices in JSON format
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import and_
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
 from loguru import logger
 
-from app.db.session import get_db
+from app.db.session import get_db, get_async_db
 from app.db.models import (
     ProcessedInvoice,
     InvoiceProcessingStatusEnum,
     APIToken,
     APITokenScopeEnum
 )
-from app.utils.api_token import verify_api_token, check_token_scope
+from app.utils.api_token import verify_api_token_async, check_token_scope
 from pydantic import BaseModel, Field
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
@@ -27,10 +28,10 @@ security = HTTPBearer()
 
 async def verify_api_token_dependency(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> APIToken:
-    """Dependency to verify API token with database session"""
-    return await verify_api_token(credentials, db)
+    """Dependency to verify API token with async database session"""
+    return await verify_api_token_async(credentials, db)
 
 
 # ==================== Schemas ====================
@@ -109,7 +110,7 @@ class MarkCreatedIn1CRequest(BaseModel):
 # ==================== Endpoints ====================
 
 @router.get("/pending", response_model=List[InvoiceListItem])
-async def get_pending_invoices_list(
+def get_pending_invoices_list(
     department_id: Optional[int] = Query(None, description="Фильтр по департаменту"),
     only_not_created_in_1c: bool = Query(False, description="Только счета, еще не созданные в 1С"),
     limit: int = Query(100, ge=1, le=500, description="Максимум записей"),
@@ -175,7 +176,7 @@ async def get_pending_invoices_list(
 
 
 @router.get("/{invoice_id}", response_model=InvoiceFor1C)
-async def get_invoice_details(
+def get_invoice_details(
     invoice_id: int,
     token: APIToken = Depends(verify_api_token_dependency),
     db: Session = Depends(get_db)
@@ -255,7 +256,7 @@ async def get_invoice_details(
 
 
 @router.post("/{invoice_id}/acknowledge", response_model=AcknowledgeResponse)
-async def acknowledge_invoice(
+def acknowledge_invoice(
     invoice_id: int,
     token: APIToken = Depends(verify_api_token_dependency),
     db: Session = Depends(get_db)
@@ -300,7 +301,7 @@ async def acknowledge_invoice(
 
 
 @router.post("/{invoice_id}/mark-created-in-1c", response_model=AcknowledgeResponse)
-async def mark_invoice_created_in_1c(
+def mark_invoice_created_in_1c(
     invoice_id: int,
     request: MarkCreatedIn1CRequest,
     token: APIToken = Depends(verify_api_token_dependency),
@@ -7,15 +7,21 @@ from decimal import Decimal
 import calendar
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import func, extract, and_, or_
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 
 from app.db import get_db
-from app.db.models import User, UserRoleEnum, ForecastExpense, Expense, BudgetCategory, Contractor, Organization, PayrollPlan
+from app.db.models import User, UserRoleEnum, Department, ForecastExpense, Expense, BudgetCategory, Contractor, Organization, PayrollPlan
 from app.utils.excel_export import ExcelExporter
 from app.utils.auth import get_current_active_user
 from app.services.ai_forecast_service import AIForecastService
+from app.services.forecast_generator import (
+    ForecastGenerator,
+    adjust_to_workday,
+    round_to_hundreds,
+)
 
 router = APIRouter(dependencies=[Depends(get_current_active_user)])
 
@@ -43,43 +49,6 @@ def check_department_access(current_user: User, department_id: int) -> None:
     # MANAGER and ADMIN can access any department
 
 
-# Helper functions for working days
-def is_weekend(date_obj: date) -> bool:
-    """Проверяет, является ли дата выходным днем (суббота=5, воскресенье=6)"""
-    return date_obj.weekday() in (5, 6)
-
-
-def get_previous_workday(date_obj: date) -> date:
-    """Возвращает предыдущий рабочий день (пропускает выходные)"""
-    current = date_obj
-    while True:
-        current = current - timedelta(days=1)
-        if not is_weekend(current):
-            return current
-
-
-def adjust_to_workday(date_obj: date) -> date:
-    """
-    Переносит дату на рабочий день согласно правилам:
-    - Если дата попадает на выходные (суббота или воскресенье) - переносит на предыдущий рабочий день
-    - Если дата - рабочий день, оставляет как есть
-    """
-    # Если дата на выходные, переносим на предыдущий рабочий день
-    if is_weekend(date_obj):
-        return get_previous_workday(date_obj)
-
-    return date_obj
-
-
-def round_to_hundreds(amount: Decimal) -> Decimal:
-    """
-    Округляет сумму до сотен (например: 12345 -> 12300, 12380 -> 12400)
-    """
-    amount_float = float(amount)
-    rounded = round(amount_float / 100) * 100
-    return Decimal(str(rounded))
-
-
 # Pydantic schemas
 class ForecastExpenseBase(BaseModel):
     department_id: int
@@ -130,6 +99,22 @@ class GenerateForecastRequest(BaseModel):
     include_average: bool = True  # Включить средние по нерегулярным
 
 
+class GenerateForecastBatchRequest(BaseModel):
+    """Request for generating forecasts for several months/departments"""
+    target_year: int
+    target_months: List[int] = Field(min_length=1)
+    department_ids: Optional[List[int]] = None  # None = все активные отделы
+    include_regular: bool = True
+    include_average: bool = True
+
+    @field_validator("target_months")
+    @classmethod
+    def validate_months(cls, v: List[int]) -> List[int]:
+        if any(month < 1 or month > 12 for month in v):
+            raise ValueError("target_months must be within 1..12")
+        return v
+
+
 class GenerateAIForecastRequest(BaseModel):
     """Request for generating AI-powered forecast"""
     target_month: int = Field(ge=1, le=12)
@@ -148,6 +133,7 @@ def generate_forecast(
     Generate forecast for next month based on:
     1. Regular expenses (repeating monthly)
     2. Average of non-regular expenses
+    3. Payroll plans (ФОТ)
 
     - USER: Can only generate forecasts for their own department
     - MANAGER/ADMIN: Can generate forecasts for any department
@@ -155,300 +141,70 @@ def generate_forecast(
     # Check department access
     check_department_access(current_user, request.department_id)
 
-    target_date = date(request.target_year, request.target_month, 1)
-
-    # Удаляем существующий прогноз на этот месяц для этого отдела
-    db.query(ForecastExpense).filter(
-        ForecastExpense.department_id == request.department_id,
-        extract('year', ForecastExpense.forecast_date) == request.target_year,
-        extract('month', ForecastExpense.forecast_date) == request.target_month
-    ).delete()
-
-    created_count = 0
-
-    # 1. Определяем регулярные расходы (те, что повторяются каждый месяц)
-    if request.include_regular:
-        # Берем расходы за последние 3 месяца
-        three_months_ago = target_date - timedelta(days=90)
-
-        # Ищем контрагентов+категории, которые встречаются в каждом из последних 3 месяцев
-        regular_expenses = db.query(
-            Expense.category_id,
-            Expense.contractor_id,
-            Expense.organization_id,
-            func.avg(Expense.amount).label('avg_amount'),
-            func.count(Expense.id).label('count')
-        ).filter(
-            Expense.department_id == request.department_id,
-            Expense.category_id.is_not(None),  # Только заявки с категорией
-            Expense.request_date >= three_months_ago,
-            Expense.request_date < target_date,
-            Expense.status.in_(['PAID', 'PENDING'])
-        ).group_by(
-            Expense.category_id,
-            Expense.contractor_id,
-            Expense.organization_id
-        ).having(
-            func.count(Expense.id) >= 3  # Минимум 3 раза за 3 месяца
-        ).all()
-
-        for reg in regular_expenses:
-            # Находим все заявки этого типа для вычисления среднего дня оплаты
-            expenses = db.query(Expense).filter(
-                Expense.department_id == request.department_id,
-                Expense.category_id == reg.category_id,
-                Expense.contractor_id == reg.contractor_id,
-                Expense.organization_id == reg.organization_id,
-                Expense.request_date >= three_months_ago,
-                Expense.request_date < target_date,
-                Expense.status.in_(['PAID', 'PENDING'])
-            ).all()
-
-            # Вычисляем среднее число месяца когда происходит оплата
-            if expenses:
-                avg_day = sum(e.request_date.day for e in expenses) / len(expenses)
-                day_of_month = round(avg_day)
-                # Берем комментарий из самой свежей заявки с описанием
-                comment = None
-                for exp in sorted(expenses, key=lambda x: x.request_date, reverse=True):
-                    if exp.comment and exp.comment.strip():
-                        comment = exp.comment.strip()
-                        break
-                # Если нет комментария, используем простое описание
-                if not comment:
-                    comment = "Регулярная оплата"
-            else:
-                day_of_month = 15
-                comment = "Регулярная оплата"
-
-            # Проверяем, что день существует в целевом месяце
-            max_day = calendar.monthrange(request.target_year, request.target_month)[1]
-            if day_of_month > max_day:
-                day_of_month = max_day
-            elif day_of_month < 1:
-                day_of_month = 1
-
-            # Применяем правила рабочих дней
-            original_date = date(request.target_year, request.target_month, day_of_month)
-            adjusted_date = adjust_to_workday(original_date)
-
-            # Round amount to hundreds
-            rounded_amount = round_to_hundreds(reg.avg_amount)
-
-            forecast = ForecastExpense(
-                department_id=request.department_id,
-                category_id=reg.category_id,
-                contractor_id=reg.contractor_id,
-                organization_id=reg.organization_id,
-                forecast_date=adjusted_date,
-                amount=rounded_amount,
-                is_regular=True,
-                comment=comment
-            )
-            db.add(forecast)
-            created_count += 1
-
-    # 2. Добавляем средние по категориям (для нерегулярных)
-    if request.include_average:
-        # Берем статистику за последние 6 месяцев по категориям
-        six_months_ago = target_date - timedelta(days=180)
-
-        # Исключаем уже добавленные регулярные расходы
-        existing_regular = db.query(
-            ForecastExpense.category_id,
-            ForecastExpense.contractor_id
-        ).filter(
-            ForecastExpense.department_id == request.department_id,
-            ForecastExpense.is_regular == True,
-            extract('year', ForecastExpense.forecast_date) == request.target_year,
-            extract('month', ForecastExpense.forecast_date) == request.target_month
-        ).all()
-
-        regular_pairs = {(r.category_id, r.contractor_id) for r in existing_regular}
-
-        # Получаем средние по категориям
-        category_averages = db.query(
-            Expense.category_id,
-            Expense.organization_id,
-            func.avg(Expense.amount).label('avg_amount'),
-            func.count(Expense.id).label('count')
-        ).filter(
-            Expense.department_id == request.department_id,
-            Expense.category_id.is_not(None),  # Только заявки с категорией
-            Expense.request_date >= six_months_ago,
-            Expense.request_date < target_date,
-            Expense.status.in_(['PAID', 'PENDING'])
-        ).group_by(
-            Expense.category_id,
-            Expense.organization_id
-        ).having(
-            func.count(Expense.id) >= 2  # Минимум 2 раза за 6 месяцев
-        ).all()
-
-        for avg in category_averages:
-            # Пропускаем если эта категория уже есть в регулярных
-            if any((reg[0] == avg.category_id) for reg in regular_pairs):
-                continue
-
-            # Находим все заявки этой категории для вычисления среднего дня оплаты
-            expenses = db.query(Expense).filter(
-                Expense.department_id == request.department_id,
-                Expense.category_id == avg.category_id,
-                Expense.organization_id == avg.organization_id,
-                Expense.request_date >= six_months_ago,
-                Expense.request_date < target_date,
-                Expense.status.in_(['PAID', 'PENDING'])
-            ).all()
-
-            # Вычисляем среднее число месяца когда происходит оплата
-            if expenses:
-                avg_day = sum(e.request_date.day for e in expenses) / len(expenses)
-                day_of_month = round(avg_day)
-                # Берем комментарий из самой свежей заявки с описанием
-                comment = None
-                for exp in sorted(expenses, key=lambda x: x.request_date, reverse=True):
-                    if exp.comment and exp.comment.strip():
-                        comment = exp.comment.strip()
-                        break
-                # Если нет комментария, используем название категории
-                if not comment:
-                    category = db.query(BudgetCategory).filter(BudgetCategory.id == avg.category_id).first()
-                    comment = category.name if category else "Прочие расходы"
-            else:
-                day_of_month = 20
-                category = db.query(BudgetCategory).filter(BudgetCategory.id == avg.category_id).first()
-                comment = category.name if category else "Прочие расходы"
-
-            # Проверяем, что день существует в целевом месяце
-            max_day = calendar.monthrange(request.target_year, request.target_month)[1]
-            if day_of_month > max_day:
-                day_of_month = max_day
-            elif day_of_month < 1:
-                day_of_month = 1
-
-            # Применяем правила рабочих дней
-            original_date = date(request.target_year, request.target_month, day_of_month)
-            adjusted_date = adjust_to_workday(original_date)
-
-            # Round amount to hundreds
-            rounded_amount = round_to_hundreds(avg.avg_amount)
-
-            forecast = ForecastExpense(
-                department_id=request.department_id,
-                category_id=avg.category_id,
-                contractor_id=None,
-                organization_id=avg.organization_id,
-                forecast_date=adjusted_date,
-                amount=rounded_amount,
-                is_regular=False,
-                comment=comment
-            )
-            db.add(forecast)
-            created_count += 1
-
-    # 3. Добавляем ФОТ (фонд оплаты труда) из планов по зарплате
-    payroll_plans = db.query(PayrollPlan).filter(
-        PayrollPlan.department_id == request.department_id,
-        PayrollPlan.year == request.target_year,
-        PayrollPlan.month == request.target_month
-    ).all()
-
-    if payroll_plans:
-        # Суммируем все выплаты по всем сотрудникам
-        total_payroll = sum(float(p.total_planned) for p in payroll_plans)
-
-        if total_payroll > 0:
-            # Найдем категорию "ФОТ"
-            fot_category = db.query(BudgetCategory).filter(
-                BudgetCategory.department_id == request.department_id,
-                BudgetCategory.name.ilike("%фот%")
-            ).first()
-
-            if not fot_category:
-                # Используем первую активную категорию как fallback
-                fot_category = db.query(BudgetCategory).filter(
-                    BudgetCategory.department_id == request.department_id,
-                    BudgetCategory.is_active == True
-                ).first()
-
-            # Получаем первую активную организацию
-            default_org = db.query(Organization).filter(
-                Organization.is_active == True
-            ).first()
-            org_id = default_org.id if default_org else 1
-
-            if fot_category:
-                # Расчет сумм: итого = 100% от total_payroll
-                # Аванс: 40% (выплата сотрудникам)
-                advance_amount = round_to_hundreds(Decimal(str(total_payroll * 0.40)))
-                # Зарплата + премия: 47% (выплата сотрудникам)
-                salary_bonus_amount = round_to_hundreds(Decimal(str(total_payroll * 0.47)))
-                # НДФЛ: 13% (перечисление в налоговую)
-                ndfl_amount = round_to_hundreds(Decimal(str(total_payroll * 0.13)))
-
-                # Даты выплат с учетом рабочих дней
-                max_day_in_month = calendar.monthrange(request.target_year, request.target_month)[1]
+    created = ForecastGenerator(db).generate(
+        department_ids=[request.department_id],
+        periods=[(request.target_year, request.target_month)],
+        include_regular=request.include_regular,
+        include_average=request.include_average,
+    )
+    db.commit()
 
-                # Аванс - 10 число
-                advance_day = min(10, max_day_in_month)
-                advance_date = adjust_to_workday(date(request.target_year, request.target_month, advance_day))
+    return {
+        "created": created[(request.department_id, request.target_year, request.target_month)],
+        "target_month": request.target_month,
+        "target_year": request.target_year
+    }
 
-                # Оклад + премия - 25 число
-                salary_day = min(25, max_day_in_month)
-                salary_date = adjust_to_workday(date(request.target_year, request.target_month, salary_day))
 
-                # НДФЛ - платится вместе с зарплатой
-                ndfl_date = salary_date
+@router.post("/generate-batch", response_model=dict)
+def generate_forecast_batch(
+    request: GenerateForecastBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Generate forecasts for several months and/or departments in one call
 
-                # Добавляем 3 прогноза ФОТ
-                # 1. Аванс
-                forecast_advance = ForecastExpense(
-                    department_id=request.department_id,
-                    category_id=fot_category.id,
-                    contractor_id=None,
-                    organization_id=org_id,
-                    forecast_date=advance_date,
-                    amount=advance_amount,
-                    is_regular=True,
-                    comment="Аванс сотрудникам"
-                )
-                db.add(forecast_advance)
-                created_count += 1
+    - department_ids omitted: all active departments (MANAGER/ADMIN only)
+    - USER: Can only generate forecasts for their own department
+    """
+    if request.department_ids is None:
+        if current_user.role == UserRoleEnum.USER:
+            department_ids = [current_user.department_id]
+        else:
+            department_ids = [
+                row.id for row in db.query(Department.id).filter(Department.is_active == True).all()
+            ]
+    else:
+        department_ids = request.department_ids
 
-                # 2. Оклад + премия
-                forecast_salary = ForecastExpense(
-                    department_id=request.department_id,
-                    category_id=fot_category.id,
-                    contractor_id=None,
-                    organization_id=org_id,
-                    forecast_date=salary_date,
-                    amount=salary_bonus_amount,
-                    is_regular=True,
-                    comment="Оклад и премии сотрудникам"
-                )
-                db.add(forecast_salary)
-                created_count += 1
+    for department_id in department_ids:
+        check_department_access(current_user, department_id)
 
-                # 3. НДФЛ
-                forecast_ndfl = ForecastExpense(
-                    department_id=request.department_id,
-                    category_id=fot_category.id,
-                    contractor_id=None,
-                    organization_id=org_id,
-                    forecast_date=ndfl_date,
-                    amount=ndfl_amount,
-                    is_regular=True,
-                    comment="НДФЛ с заработной платы"
-                )
-                db.add(forecast_ndfl)
-                created_count += 1
+    periods = [(request.target_year, month) for month in request.target_months]
 
+    created = ForecastGenerator(db).generate(
+        department_ids=department_ids,
+        periods=periods,
+        include_regular=request.include_regular,
+        include_average=request.include_average,
+    )
     db.commit()
 
     return {
-        "created": created_count,
-        "target_month": request.target_month,
-        "target_year": request.target_year
+        "created": sum(created.values()),
+        "target_year": request.target_year,
+        "target_months": sorted(set(request.target_months)),
+        "departments": len(set(department_ids)),
+        "details": [
+            {
+                "department_id": department_id,
+                "year": year,
+                "month": month,
+                "created": count,
+            }
+            for (department_id, year, month), count in sorted(created.items())
+        ],
     }
 
 
@@ -842,28 +598,8 @@ def export_forecast_calendar(
     )
 
 
-@router.post("/ai-generate", response_model=dict)
-async def generate_ai_forecast(
-    request: GenerateAIForecastRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
-):
-    """
-    Generate HYBRID forecast: Base statistical + AI enhancements
-
-    Process:
-    1. Delete all existing forecasts for the target month
-    2. Generate base forecast (regular + average expenses with proper categories/contractors)
-    3. AI analyzes patterns and suggests additional items
-    4. Round all amounts to hundreds
-    5. Match AI items to real categories and contractors from historical data
-
-    - USER: Can only generate forecasts for their own department
-    - MANAGER/ADMIN: Can generate forecasts for any department
-    """
-    # Check department access
-    check_department_access(current_user, request.department_id)
-
+def _generate_base_forecast(db: Session, request: GenerateAIForecastRequest) -> int:
+    """Steps 1-2 of the hybrid forecast: replace the month with the statistical base forecast"""
     # STEP 1: Delete ALL existing forecasts for this month
     db.query(ForecastExpense).filter(
         ForecastExpense.department_id == request.department_id,
@@ -1031,18 +767,11 @@ async def generate_ai_forecast(
 
     db.commit()
 
-    # STEP 3: Initialize AI forecast service
-    ai_service = AIForecastService(db)
+    return base_created
 
-    # STEP 4: Generate AI forecast
-    ai_result = await ai_service.generate_ai_forecast(
-        department_id=request.department_id,
-        year=request.target_year,
-        month=request.target_month,
-        category_id=request.category_id,
-    )
 
-    # STEP 5: Add AI suggestions as ADDITIONAL items
+def _save_ai_forecast_items(db: Session, request: GenerateAIForecastRequest, ai_result: dict) -> int:
+    """Step 5 of the hybrid forecast: store AI suggestions as additional items"""
     ai_created = 0
     if ai_result.get("success") and ai_result.get("items"):
         # Get existing categories for better matching
@@ -1164,6 +893,48 @@ async def generate_ai_forecast(
 
         db.commit()
 
+    return ai_created
+
+
+@router.post("/ai-generate", response_model=dict)
+async def generate_ai_forecast(
+    request: GenerateAIForecastRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Generate HYBRID forecast: Base statistical + AI enhancements
+
+    Process:
+    1. Delete all existing forecasts for the target month
+    2. Generate base forecast (regular + average expenses with proper categories/contractors)
+    3. AI analyzes patterns and suggests additional items
+    4. Round all amounts to hundreds
+    5. Match AI items to real categories and contractors from historical data
+
+    - USER: Can only generate forecasts for their own department
+    - MANAGER/ADMIN: Can generate forecasts for any department
+    """
+    # Check department access
+    check_department_access(current_user, request.department_id)
+
+    # DB work is synchronous: run it in the threadpool, only the AI call is awaited
+    base_created = await run_in_threadpool(_generate_base_forecast, db, request)
+
+    # STEP 3: Initialize AI forecast service
+    ai_service = AIForecastService(db)
+
+    # STEP 4: Generate AI forecast
+    ai_result = await ai_service.generate_ai_forecast(
+        department_id=request.department_id,
+        year=request.target_year,
+        month=request.target_month,
+        category_id=request.category_id,
+    )
+
+    # STEP 5: Add AI suggestions as ADDITIONAL items
+    ai_created = await run_in_threadpool(_save_ai_forecast_items, db, request, ai_result)
+
     ai_result["created_forecast_records"] = ai_created
 
     # Return comprehensive result
@@ -4,10 +4,14 @@ Supports: Upload → OCR → AI Parse → Create Expense workflow
 """
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, status
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import BinaryIO, List, Optional, Tuple
+from datetime import datetime
 from pathlib import Path
+import asyncio
 import tempfile
 import shutil
+import uuid
+import zipfile
 from loguru import logger
 
 from app.db.session import get_db
@@ -19,6 +23,8 @@ from app.db.models import (
 )
 from app.schemas.invoice_processing import (
     InvoiceUploadResponse,
+    InvoiceBatchUploadResponse,
+    InvoiceBatchStatusResponse,
     InvoiceProcessRequest,
     InvoiceProcessResponse,
     ProcessedInvoiceListItem,
@@ -40,17 +46,156 @@ from app.schemas.invoice_processing import (
 )
 from app.utils.auth import get_current_active_user
 from app.services.invoice_processor import InvoiceProcessorService
+from app.services.invoice_queue import (
+    invoice_queue,
+    new_batch_id,
+    claim_invoice,
+    mark_invoice_failed,
+    get_batch_department,
+    get_batch_progress,
+)
+from app.core.config import settings
 
 
 router = APIRouter(prefix="/invoice-processing", tags=["invoice-processing"])
 
 
+ALLOWED_INVOICE_EXTENSIONS = ['.pdf', '.jpg', '.jpeg', '.png', '.tiff', '.bmp']
+MAX_INVOICE_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+
+
+def _store_invoice_file(department_id: int, filename: str, source: BinaryIO) -> Path:
+    """
+    Сохранение файла счета на диск
+
+    Структура: uploads/invoices/{department_id}/{year}/{timestamp}_{filename}
+    """
+    now = datetime.now()
+    upload_dir = Path(f"uploads/invoices/{department_id}/{now.year}")
+    upload_dir.mkdir(parents=True, exist_ok=True)
+
+    # Генерируем уникальное имя файла
+    timestamp = now.strftime("%Y%m%d_%H%M%S")
+    file_path = upload_dir / f"{timestamp}_{filename}"
+    if file_path.exists():
+        file_path = upload_dir / f"{timestamp}_{uuid.uuid4().hex[:8]}_{filename}"
+
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer)
+
+    return file_path
+
+
+class BatchTooLargeError(ValueError):
+    """В пакете больше файлов, чем INVOICE_BATCH_MAX_FILES"""
+
+    def __init__(self, count: int):
+        self.count = count
+        super().__init__(
+            f"Слишком много файлов в пакете ({count}), максимум {settings.INVOICE_BATCH_MAX_FILES}"
+        )
+
+
+def _count_batch_files(uploads: List[UploadFile]) -> int:
+    """Число файлов пакета поддерживаемого формата (ZIP - по оглавлению, без распаковки)"""
+    count = 0
+    for upload in uploads:
+        filename = Path(upload.filename or "").name
+        if Path(filename).suffix.lower() != '.zip':
+            count += 1
+            continue
+        try:
+            with zipfile.ZipFile(upload.file) as archive:
+                count += sum(
+                    1 for member in archive.infolist()
+                    if not member.is_dir()
+                    and Path(member.filename).suffix.lower() in ALLOWED_INVOICE_EXTENSIONS
+                )
+        except zipfile.BadZipFile:
+            pass
+        upload.file.seek(0)
+    return count
+
+
+def _store_batch_files(department_id: int, uploads: List[UploadFile]) -> Tuple[List[Tuple[str, Path, int]], List[str]]:
+    """
+    Сохранение файлов пакетной загрузки (ZIP-архивы распаковываются)
+
+    Returns:
+        (сохраненные файлы [(имя, путь, размер)], пропущенные имена)
+
+    Raises:
+        BatchTooLargeError: Файлов больше INVOICE_BATCH_MAX_FILES (проверяется до распаковки)
+    """
+    count = _count_batch_files(uploads)
+    if count > settings.INVOICE_BATCH_MAX_FILES:
+        raise BatchTooLargeError(count)
+
+    stored: List[Tuple[str, Path, int]] = []
+    skipped: List[str] = []
+
+    def store(filename: str, source: BinaryIO, size: int) -> None:
+        if Path(filename).suffix.lower() not in ALLOWED_INVOICE_EXTENSIONS or size > MAX_INVOICE_FILE_SIZE:
+            skipped.append(filename)
+            return
+        stored.append((filename, _store_invoice_file(department_id, filename, source), size))
+
+    for upload in uploads:
+        filename = Path(upload.filename or "").name
+        if Path(filename).suffix.lower() == '.zip':
+            try:
+                with zipfile.ZipFile(upload.file) as archive:
+                    for member in archive.infolist():
+                        if member.is_dir():
+                            continue
+                        with archive.open(member) as source:
+                            store(Path(member.filename).name, source, member.file_size)
+            except zipfile.BadZipFile:
+                skipped.append(filename)
+            continue
+
+        upload.file.seek(0, 2)
+        size = upload.file.tell()
+        upload.file.seek(0)
+        store(filename, upload.file, size)
+
+    return stored, skipped
+
+
+def _create_invoice_records(
+    db: Session,
+    department_id: int,
+    uploaded_by: int,
+    stored: List[Tuple[str, Path, int]],
+    batch_id: Optional[str] = None,
+    queued_at: Optional[datetime] = None,
+) -> List[int]:
+    """Записи PENDING для сохраненных файлов одним коммитом (вызывается вне event loop)"""
+    invoices = [
+        ProcessedInvoice(
+            department_id=department_id,
+            uploaded_by=uploaded_by,
+            original_filename=filename,
+            file_path=str(file_path),
+            file_size_kb=int(size / 1024),
+            status=InvoiceProcessingStatusEnum.PENDING,
+            batch_id=batch_id,
+            queued_at=queued_at,
+        )
+        for filename, file_path, size in stored
+    ]
+    db.add_all(invoices)
+    db.commit()
+    return [invoice.id for invoice in invoices]
+
+
 # ==================== File Upload ====================
 
 @router.post("/upload", response_model=InvoiceUploadResponse, status_code=status.HTTP_201_CREATED)
 async def upload_invoice_file(
     file: UploadFile = File(..., description="PDF or Image file of invoice"),
     department_id: Optional[int] = Query(None, description="Department ID (optional, defaults to user's department)"),
+    auto_process: bool = Query(False, description="Сразу поставить счет в очередь обработки (OCR + AI)"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -66,7 +211,7 @@ async def upload_invoice_file(
     3. Возврат invoice_id для последующей обработки
     """
     # Проверка формата файла
-    allowed_extensions = ['.pdf', '.jpg', '.jpeg', '.png', '.tiff', '.bmp']
+    allowed_extensions = ALLOWED_INVOICE_EXTENSIONS
     file_ext = Path(file.filename).suffix.lower()
 
     if file_ext not in allowed_extensions:
@@ -76,7 +221,7 @@ async def upload_invoice_file(
         )
 
     # Проверка размера (макс 10MB)
-    max_size_bytes = 10 * 1024 * 1024  # 10MB
+    max_size_bytes = MAX_INVOICE_FILE_SIZE
     file.file.seek(0, 2)  # Перейти в конец
     file_size = file.file.tell()
     file.file.seek(0)  # Вернуться в начало
@@ -98,39 +243,37 @@ async def upload_invoice_file(
                 detail="У вас нет прав для загрузки файлов в другой департамент"
             )
 
-        # Создаем директорию для хранения файлов
-        # Структура: uploads/invoices/{department_id}/{year}/{filename}
-        from datetime import datetime
-        year = datetime.now().year
-        upload_dir = Path(f"uploads/invoices/{target_department_id}/{year}")
-        upload_dir.mkdir(parents=True, exist_ok=True)
-
-        # Генерируем уникальное имя файла
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_filename = f"{timestamp}_{file.filename}"
-        file_path = upload_dir / safe_filename
-
-        # Сохраняем файл
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Сохраняем файл (вне event loop)
+        file_path = await asyncio.to_thread(
+            _store_invoice_file, target_department_id, file.filename, file.file
+        )
 
         logger.info(f"Файл сохранен: {file_path} для department_id={target_department_id}")
 
-        # Создаем запись в БД
-        processor = InvoiceProcessorService(db)
-        invoice = await processor.create_invoice_record(
-            file_path=str(file_path),
-            original_filename=file.filename,
-            file_size_kb=int(file_size / 1024),
-            department_id=target_department_id,
-            uploaded_by=current_user.id
+        # Создаем запись в БД (вне event loop)
+        invoice_ids = await asyncio.to_thread(
+            _create_invoice_records,
+            db,
+            target_department_id,
+            current_user.id,
+            [(file.filename, file_path, file_size)],
+            queued_at=datetime.utcnow() if auto_process else None,
         )
+        invoice_id = invoice_ids[0]
+        logger.info(f"Создана запись ProcessedInvoice ID={invoice_id} для файла {file.filename}")
+
+        if auto_process:
+            await invoice_queue.enqueue(invoice_ids)
 
         return InvoiceUploadResponse(
             success=True,
-            invoice_id=invoice.id,
+            invoice_id=invoice_id,
             filename=file.filename,
-            message=f"Файл успешно загружен. ID записи: {invoice.id}"
+            message=(
+                f"Файл успешно загружен и поставлен в очередь обработки. ID записи: {invoice_id}"
+                if auto_process
+                else f"Файл успешно загружен. ID записи: {invoice_id}"
+            )
         )
 
     except Exception as e:
@@ -141,8 +284,131 @@ async def upload_invoice_file(
         )
 
 
+@router.post("/upload-batch", response_model=InvoiceBatchUploadResponse, status_code=status.HTTP_201_CREATED)
+async def upload_invoice_batch(
+    files: List[UploadFile] = File(..., description="PDF/изображения счетов или ZIP-архивы с ними"),
+    department_id: Optional[int] = Query(None, description="Department ID (optional, defaults to user's department)"),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Пакетная загрузка счетов с фоновой обработкой
+
+    Process:
+    1. Сохранение файлов (ZIP-архивы распаковываются)
+    2. Создание записей PENDING одним коммитом
+    3. Постановка в очередь: OCR в пуле процессов, AI-парсинг с ограниченной конкурентностью
+    4. Возврат batch_id для отслеживания прогресса через GET /batch/{batch_id}
+    """
+    target_department_id = department_id if department_id is not None else current_user.department_id
+
+    if current_user.role == UserRoleEnum.USER and target_department_id != current_user.department_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="У вас нет прав для загрузки файлов в другой департамент"
+        )
+
+    try:
+        stored, skipped = await asyncio.to_thread(_store_batch_files, target_department_id, files)
+    except BatchTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    if not stored:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Нет файлов поддерживаемого формата. Поддерживаются: {', '.join(ALLOWED_INVOICE_EXTENSIONS)}"
+        )
+
+    batch_id = new_batch_id()
+    invoice_ids = await asyncio.to_thread(
+        _create_invoice_records,
+        db,
+        target_department_id,
+        current_user.id,
+        stored,
+        batch_id=batch_id,
+        queued_at=datetime.utcnow(),
+    )
+    await invoice_queue.enqueue(invoice_ids)
+
+    logger.info(
+        f"Пакет {batch_id}: {len(invoice_ids)} счетов поставлено в очередь "
+        f"(department_id={target_department_id}, пропущено {len(skipped)})"
+    )
+
+    return InvoiceBatchUploadResponse(
+        success=True,
+        batch_id=batch_id,
+        invoice_ids=invoice_ids,
+        accepted_files=len(invoice_ids),
+        skipped_files=skipped,
+        message=f"Принято {len(invoice_ids)} файлов, обработка запущена"
+    )
+
+
+@router.get("/batch/{batch_id}", response_model=InvoiceBatchStatusResponse)
+def get_invoice_batch_status(
+    batch_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Прогресс обработки пакета счетов"""
+    batch_department_id = get_batch_department(db, batch_id)
+    if batch_department_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Пакет {batch_id} не найден"
+        )
+
+    if current_user.role == UserRoleEnum.USER and batch_department_id != current_user.department_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Нет доступа к пакету другого отдела"
+        )
+
+    progress = get_batch_progress(db, batch_id)
+    return InvoiceBatchStatusResponse(
+        batch_id=batch_id,
+        queue_pending=invoice_queue.pending,
+        **progress
+    )
+
+
 # ==================== Process Invoice ====================
 
+def _claim_invoice_for_processing(db: Session, invoice_id: int, current_user: User) -> None:
+    """Проверить права и атомарно взять счет в обработку (вызывается вне event loop)"""
+    # Проверяем существование записи
+    invoice = db.query(ProcessedInvoice).filter(
+        ProcessedInvoice.id == invoice_id
+    ).first()
+
+    if not invoice:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Счет с ID {invoice_id} не найден"
+        )
+
+    # Проверка прав доступа
+    if current_user.role == UserRoleEnum.USER:
+        if invoice.department_id != current_user.department_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Нет доступа к счету другого отдела"
+            )
+
+    # Переобработка только из PENDING и ERROR; воркер очереди берет счет так же
+    if not claim_invoice(
+        db, invoice_id,
+        statuses=(InvoiceProcessingStatusEnum.PENDING, InvoiceProcessingStatusEnum.ERROR),
+    ):
+        logger.warning(f"Попытка повторной обработки invoice ID={invoice_id} в статусе {invoice.status}")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Счет уже обрабатывается или обработан (статус: {invoice.status.value})"
+        )
+
+
 @router.post("/process", response_model=InvoiceProcessResponse)
 async def process_invoice(
     request: InvoiceProcessRequest,
@@ -162,39 +428,28 @@ async def process_invoice(
     - PROCESSED - успешно
     - MANUAL_REVIEW - требует проверки
     - ERROR - ошибка
-    """
-    # Проверяем существование записи
-    invoice = db.query(ProcessedInvoice).filter(
-        ProcessedInvoice.id == request.invoice_id
-    ).first()
 
-    if not invoice:
+    Обрабатываются только счета в статусе PENDING или ERROR; иначе 409.
+    """
+    # Настройки AI проверяются до того, как счет будет взят в обработку
+    try:
+        processor = await asyncio.to_thread(InvoiceProcessorService, db)
+    except Exception as e:
+        logger.error(f"Ошибка при обработке invoice ID={request.invoice_id}: {e}", exc_info=True)
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Счет с ID {request.invoice_id} не найден"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при обработке: {str(e)}"
         )
 
-    # Проверка прав доступа
-    if current_user.role == UserRoleEnum.USER:
-        if invoice.department_id != current_user.department_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Нет доступа к счету другого отдела"
-            )
-
-    # Проверяем статус
-    if invoice.status not in [InvoiceProcessingStatusEnum.PENDING, InvoiceProcessingStatusEnum.ERROR]:
-        logger.warning(f"Попытка повторной обработки invoice ID={request.invoice_id} в статусе {invoice.status}")
-        # Разрешаем переобработку только для PENDING и ERROR
+    await asyncio.to_thread(_claim_invoice_for_processing, db, request.invoice_id, current_user)
 
     try:
-        processor = InvoiceProcessorService(db)
         result = await processor.process_invoice(request.invoice_id)
 
         return InvoiceProcessResponse(
             success=result["success"],
             invoice_id=request.invoice_id,
-            status=invoice.status.value,
+            status=result["status"],
             ocr_result=result.get("ocr_result"),
             parsed_data=result.get("parsed_data"),
             errors=result.get("errors", []),
@@ -204,6 +459,7 @@ async def process_invoice(
 
     except Exception as e:
         logger.error(f"Ошибка при обработке invoice ID={request.invoice_id}: {e}", exc_info=True)
+        await asyncio.to_thread(mark_invoice_failed, db, request.invoice_id, str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при обработке: {str(e)}"
@@ -216,7 +472,7 @@ async def process_invoice(
 # Move /cash-flow-categories here to avoid conflict with /{invoice_id}
 
 @router.get("/cash-flow-categories", response_model=List[CashFlowCategoryListItem])
-async def get_cash_flow_categories_for_selection(
+def get_cash_flow_categories_for_selection(
     department_id: Optional[int] = Query(None, description="Фильтр по отделу"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -258,7 +514,7 @@ async def get_cash_flow_categories_for_selection(
 
 
 @router.get("/", response_model=List[ProcessedInvoiceListItem])
-async def get_invoices(
+def get_invoices(
     department_id: Optional[int] = Query(None, description="Фильтр по отделу"),
     status: Optional[str] = Query(None, description="Фильтр по статусу"),
     skip: int = Query(0, ge=0),
@@ -328,7 +584,7 @@ async def get_invoices(
 
 
 @router.get("/{invoice_id}", response_model=ProcessedInvoiceDetail)
-async def get_invoice_detail(
+def get_invoice_detail(
     invoice_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -371,6 +627,7 @@ async def get_invoice_detail(
         ocr_text=invoice.ocr_text,
         ocr_confidence=invoice.ocr_confidence,
         ocr_processing_time_sec=invoice.ocr_processing_time_sec,
+        ocr_page_timings=invoice.ocr_page_timings,
         invoice_number=invoice.invoice_number,
         invoice_date=invoice.invoice_date,
         supplier_name=invoice.supplier_name,
@@ -406,7 +663,7 @@ async def get_invoice_detail(
 # ==================== Update & Delete ====================
 
 @router.put("/{invoice_id}", response_model=ProcessedInvoiceDetail)
-async def update_invoice(
+def update_invoice(
     invoice_id: int,
     update_data: ProcessedInvoiceUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -445,11 +702,11 @@ async def update_invoice(
     logger.info(f"Invoice ID={invoice_id} обновлен пользователем {current_user.id}")
 
     # Возвращаем обновленные данные
-    return await get_invoice_detail(invoice_id, current_user, db)
+    return get_invoice_detail(invoice_id, current_user, db)
 
 
 @router.delete("/{invoice_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_invoice(
+def delete_invoice(
     invoice_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -494,7 +751,7 @@ async def delete_invoice(
 # ==================== Create Expense ====================
 
 @router.post("/create-expense", response_model=CreateExpenseFromInvoiceResponse)
-async def create_expense_from_invoice(
+def create_expense_from_invoice(
     request: CreateExpenseFromInvoiceRequest,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -535,7 +792,7 @@ async def create_expense_from_invoice(
 
     try:
         processor = InvoiceProcessorService(db)
-        result = await processor.create_expense_from_invoice(
+        result = processor.create_expense_from_invoice(
             invoice_id=request.invoice_id,
             category_id=request.category_id,
             amount_override=request.amount_override,
@@ -564,7 +821,7 @@ async def create_expense_from_invoice(
 # ==================== Statistics ====================
 
 @router.get("/stats/summary", response_model=InvoiceProcessingStats)
-async def get_processing_stats(
+def get_processing_stats(
     department_id: Optional[int] = Query(None, description="Фильтр по отделу"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -637,7 +894,7 @@ async def get_processing_stats(
 # ==================== 1C Integration ====================
 
 @router.post("/{invoice_id}/suggest-category", response_model=SuggestCategoryResponse)
-async def suggest_cash_flow_category_for_invoice(
+def suggest_cash_flow_category_for_invoice(
     invoice_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -705,7 +962,7 @@ async def suggest_cash_flow_category_for_invoice(
 
 
 @router.put("/{invoice_id}/category")
-async def update_invoice_category(
+def update_invoice_category(
     invoice_id: int,
     request: InvoiceUpdateCategoryRequest,
     current_user: User = Depends(get_current_active_user),
@@ -754,7 +1011,7 @@ async def update_invoice_category(
 
 
 @router.post("/{invoice_id}/validate-for-1c", response_model=Invoice1CValidationResponse)
-async def validate_invoice_for_1c(
+def validate_invoice_for_1c(
     invoice_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -820,7 +1077,7 @@ async def validate_invoice_for_1c(
 
 
 @router.post("/{invoice_id}/create-1c-expense-request", response_model=Create1CExpenseRequestResponse)
-async def create_1c_expense_request_from_invoice(
+def create_1c_expense_request_from_invoice(
     invoice_id: int,
     request: Create1CExpenseRequestRequest,
     current_user: User = Depends(get_current_active_user),
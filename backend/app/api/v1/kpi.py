@@ -6,7 +6,7 @@ import io
 from typing import List, Optional, Dict
 from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_, Integer
+from sqlalchemy import func, and_, insert
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 import pandas as pd
@@ -45,6 +45,9 @@ from app.utils.auth import get_current_active_user
 from app.services.kpi_calculation_service import KPICalculationService
 from app.services.kpi_validation_service import KPIValidationService
 from app.services.kpi_audit_service import KPIAuditService
+from app.services.kpi_goal_assignment import GoalAssignment, assign_goals
+from app.services import kpi_analytics
+from app.services.kpi_analytics import invalidate_kpi_analytics_cache, load_kpi_analytics
 # TaskComplexityBonusCalculator removed - Tasks feature deprecated
 
 router = APIRouter(dependencies=[Depends(get_current_active_user)])
@@ -156,7 +159,7 @@ def to_decimal(value) -> Optional[Decimal]:
 # ==================== KPI Goals Endpoints ====================
 
 @router.get("/goals", response_model=List[KPIGoalInDB])
-async def list_kpi_goals(
+def list_kpi_goals(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     department_id: Optional[int] = None,
@@ -193,7 +196,7 @@ async def list_kpi_goals(
 
 
 @router.get("/goals/{goal_id}", response_model=KPIGoalInDB)
-async def get_kpi_goal(
+def get_kpi_goal(
     goal_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -219,7 +222,7 @@ async def get_kpi_goal(
 
 
 @router.post("/goals", response_model=KPIGoalInDB, status_code=status.HTTP_201_CREATED)
-async def create_kpi_goal(
+def create_kpi_goal(
     goal_data: KPIGoalCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -235,13 +238,14 @@ async def create_kpi_goal(
     goal = KPIGoal(**goal_data.model_dump())
     db.add(goal)
     db.commit()
+    invalidate_kpi_analytics_cache()
     db.refresh(goal)
 
     return goal
 
 
 @router.put("/goals/{goal_id}", response_model=KPIGoalInDB)
-async def update_kpi_goal(
+def update_kpi_goal(
     goal_id: int,
     goal_data: KPIGoalUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -271,13 +275,14 @@ async def update_kpi_goal(
 
     goal.updated_at = datetime.utcnow()
     db.commit()
+    invalidate_kpi_analytics_cache()
     db.refresh(goal)
 
     return goal
 
 
 @router.delete("/goals/{goal_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_kpi_goal(
+def delete_kpi_goal(
     goal_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -301,12 +306,13 @@ async def delete_kpi_goal(
 
     db.delete(goal)
     db.commit()
+    invalidate_kpi_analytics_cache()
 
 
 # ==================== Employee KPI Endpoints ====================
 
 @router.get("/employee-kpis", response_model=List[EmployeeKPIWithGoals])
-async def list_employee_kpis(
+def list_employee_kpis(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     department_id: Optional[int] = None,
@@ -343,7 +349,7 @@ async def list_employee_kpis(
 
 
 @router.get("/employee-kpis/{kpi_id}", response_model=EmployeeKPIWithGoals)
-async def get_employee_kpi(
+def get_employee_kpi(
     kpi_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -369,7 +375,7 @@ async def get_employee_kpi(
 
 
 @router.post("/employee-kpis", response_model=EmployeeKPIInDB, status_code=status.HTTP_201_CREATED)
-async def create_employee_kpi(
+def create_employee_kpi(
     kpi_data: EmployeeKPICreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -458,6 +464,7 @@ async def create_employee_kpi(
 
     db.add(kpi)
     db.commit()
+    invalidate_kpi_analytics_cache()
     db.refresh(kpi)
 
     # Audit logging
@@ -468,7 +475,7 @@ async def create_employee_kpi(
 
 
 @router.put("/employee-kpis/{kpi_id}", response_model=EmployeeKPIInDB)
-async def update_employee_kpi(
+def update_employee_kpi(
     kpi_id: int,
     kpi_data: EmployeeKPIUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -536,6 +543,7 @@ async def update_employee_kpi(
 
     kpi.updated_at = datetime.utcnow()
     db.commit()
+    invalidate_kpi_analytics_cache()
     db.refresh(kpi)
 
     # Audit logging
@@ -546,7 +554,7 @@ async def update_employee_kpi(
 
 
 @router.delete("/employee-kpis/{kpi_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_employee_kpi(
+def delete_employee_kpi(
     kpi_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -574,10 +582,11 @@ async def delete_employee_kpi(
 
     db.delete(kpi)
     db.commit()
+    invalidate_kpi_analytics_cache()
 
 
 @router.post("/employee-kpis/import", status_code=status.HTTP_200_OK)
-async def import_employee_kpis(
+def import_employee_kpis(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -602,7 +611,7 @@ async def import_employee_kpis(
             detail="File must be an Excel file (.xlsx or .xls)"
         )
 
-    content = await file.read()
+    content = file.file.read()
 
     if not content:
         raise HTTPException(
@@ -856,6 +865,7 @@ async def import_employee_kpis(
                 updated_count += 1
 
     db.commit()
+    invalidate_kpi_analytics_cache()
 
     return {
         "created": created_count,
@@ -870,7 +880,7 @@ async def import_employee_kpis(
 # ==================== Employee KPI Goals Endpoints ====================
 
 @router.get("/employee-kpi-goals", response_model=List[EmployeeKPIGoalWithDetails])
-async def list_employee_kpi_goals(
+def list_employee_kpi_goals(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     department_id: Optional[int] = None,
@@ -933,7 +943,7 @@ async def list_employee_kpi_goals(
 
 
 @router.post("/employee-kpi-goals", response_model=EmployeeKPIGoalInDB, status_code=status.HTTP_201_CREATED)
-async def create_employee_kpi_goal(
+def create_employee_kpi_goal(
     goal_data: EmployeeKPIGoalCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -974,13 +984,14 @@ async def create_employee_kpi_goal(
     goal_assignment = EmployeeKPIGoal(**goal_data.model_dump())
     db.add(goal_assignment)
     db.commit()
+    invalidate_kpi_analytics_cache()
     db.refresh(goal_assignment)
 
     return goal_assignment
 
 
 @router.post("/employee-kpi-goals/bulk-assign", response_model=BulkAssignGoalsResponse)
-async def bulk_assign_goals(
+def bulk_assign_goals(
     request: BulkAssignGoalsRequest,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -1014,7 +1025,7 @@ async def bulk_assign_goals(
     # Получаем всех сотрудников
     employees = db.query(Employee).filter(
         Employee.id.in_(request.employee_ids),
-        Employee.is_active == True
+        Employee.status == EmployeeStatusEnum.ACTIVE
     ).all()
 
     if not employees:
@@ -1036,13 +1047,13 @@ async def bulk_assign_goals(
         )
 
     # Счетчики
-    assigned_count = 0
     skipped_count = 0
     error_count = 0
     details = []
     errors = []
 
-    # Обрабатываем каждого сотрудника
+    # Отбираем сотрудников, которым можно назначить цель
+    assignable = []
     for employee in employees:
         employee_id = employee.id
 
@@ -1070,77 +1081,54 @@ async def bulk_assign_goals(
             })
             continue
 
-        # Проверяем существование дубликата
-        existing = db.query(EmployeeKPIGoal).filter(
-            and_(
-                EmployeeKPIGoal.employee_id == employee_id,
-                EmployeeKPIGoal.goal_id == request.goal_id,
-                EmployeeKPIGoal.year == request.year,
-                EmployeeKPIGoal.month == request.month
-            )
-        ).first()
+        assignable.append(employee)
+
+    # Дубликаты и новые назначения — одним anti-join, вставка одним multi-row INSERT
+    try:
+        assignment = assign_goals(
+            db,
+            {employee.id: None for employee in assignable},
+            [GoalAssignment(goal_id=request.goal_id, weight=request.weight, target_value=request.target_value)],
+            request.year,
+            request.month,
+            values={
+                "actual_value": None,
+                "achievement_percentage": None,
+                "notes": f"Bulk assigned by {current_user.full_name}"
+            }
+        )
+        db.commit()
+        invalidate_kpi_analytics_cache()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to commit bulk assignments: {str(e)}"
+        )
 
-        if existing:
+    for employee in assignable:
+        pair = (employee.id, request.goal_id)
+        if pair in assignment.skipped:
             skipped_count += 1
             details.append({
-                "employee_id": employee_id,
+                "employee_id": employee.id,
                 "employee_name": employee.full_name,
                 "status": "skipped",
                 "reason": "Goal already assigned for this period"
             })
-            continue
-
-        # Создаем назначение
-        try:
-            goal_assignment = EmployeeKPIGoal(
-                employee_id=employee_id,
-                goal_id=request.goal_id,
-                year=request.year,
-                month=request.month,
-                weight=request.weight,
-                target_value=request.target_value,
-                actual_value=None,
-                achievement_percentage=None,
-                notes=f"Bulk assigned by {current_user.full_name}"
-            )
-            db.add(goal_assignment)
-            db.flush()  # Flush для получения ID, но не commit ещё
-
-            assigned_count += 1
+        else:
             details.append({
-                "employee_id": employee_id,
+                "employee_id": employee.id,
                 "employee_name": employee.full_name,
-                "assignment_id": goal_assignment.id,
+                "assignment_id": assignment.created[pair],
                 "status": "assigned"
             })
 
-            logger.info(
-                f"Bulk assigned goal#{request.goal_id} to employee#{employee_id} "
-                f"for {request.year}-{request.month:02d}"
-            )
-
-        except Exception as e:
-            error_count += 1
-            error_msg = f"Employee {employee.full_name} (ID: {employee_id}): {str(e)}"
-            errors.append(error_msg)
-            details.append({
-                "employee_id": employee_id,
-                "employee_name": employee.full_name,
-                "status": "error",
-                "reason": str(e)
-            })
-            logger.error(f"Failed to bulk assign goal to employee#{employee_id}: {e}")
-
-    # Commit всех успешных назначений
-    if assigned_count > 0:
-        try:
-            db.commit()
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to commit bulk assignments: {str(e)}"
-            )
+    assigned_count = len(assignment.created)
+    logger.info(
+        f"Bulk assigned goal#{request.goal_id} to {assigned_count} employees "
+        f"for {request.year}-{request.month:02d} ({len(assignment.skipped)} already assigned)"
+    )
 
     # Формируем response
     success = assigned_count > 0
@@ -1159,7 +1147,7 @@ async def bulk_assign_goals(
 
 
 @router.put("/employee-kpi-goals/{assignment_id}", response_model=EmployeeKPIGoalInDB)
-async def update_employee_kpi_goal(
+def update_employee_kpi_goal(
     assignment_id: int,
     goal_data: EmployeeKPIGoalUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -1196,13 +1184,14 @@ async def update_employee_kpi_goal(
 
     assignment.updated_at = datetime.utcnow()
     db.commit()
+    invalidate_kpi_analytics_cache()
     db.refresh(assignment)
 
     return assignment
 
 
 @router.delete("/employee-kpi-goals/{assignment_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_employee_kpi_goal(
+def delete_employee_kpi_goal(
     assignment_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -1227,12 +1216,13 @@ async def delete_employee_kpi_goal(
 
     db.delete(assignment)
     db.commit()
+    invalidate_kpi_analytics_cache()
 
 
 # ==================== KPI Analytics Endpoints ====================
 
 @router.get("/analytics/employee-summary", response_model=List[KPIEmployeeSummary])
-async def get_employee_kpi_summary(
+def get_employee_kpi_summary(
     year: int,
     month: Optional[int] = None,
     department_id: Optional[int] = None,
@@ -1240,30 +1230,6 @@ async def get_employee_kpi_summary(
     db: Session = Depends(get_db)
 ):
     """Get KPI summary for employees"""
-    query = db.query(
-        EmployeeKPI.employee_id,
-        Employee.full_name.label('employee_name'),
-        Employee.position,
-        EmployeeKPI.year,
-        EmployeeKPI.month,
-        EmployeeKPI.kpi_percentage,
-        (EmployeeKPI.monthly_bonus_calculated +
-         EmployeeKPI.quarterly_bonus_calculated +
-         EmployeeKPI.annual_bonus_calculated).label('total_bonus_calculated'),
-        EmployeeKPI.monthly_bonus_calculated,
-        EmployeeKPI.quarterly_bonus_calculated,
-        EmployeeKPI.annual_bonus_calculated,
-        func.count(EmployeeKPIGoal.id).label('goals_count'),
-        func.sum(
-            func.cast(EmployeeKPIGoal.status == KPIGoalStatusEnum.ACHIEVED, Integer)
-        ).label('goals_achieved')
-    ).join(Employee).outerjoin(EmployeeKPIGoal).filter(
-        EmployeeKPI.year == year
-    )
-
-    if month is not None:
-        query = query.filter(EmployeeKPI.month == month)
-
     # Department filter
     if current_user.role == UserRoleEnum.USER:
         if not current_user.department_id:
@@ -1271,45 +1237,14 @@ async def get_employee_kpi_summary(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="User has no assigned department"
             )
-        query = query.filter(Employee.department_id == current_user.department_id)
-    elif department_id:
-        query = query.filter(Employee.department_id == department_id)
-
-    query = query.group_by(
-        EmployeeKPI.employee_id,
-        Employee.full_name,
-        Employee.position,
-        EmployeeKPI.year,
-        EmployeeKPI.month,
-        EmployeeKPI.kpi_percentage,
-        EmployeeKPI.monthly_bonus_calculated,
-        EmployeeKPI.quarterly_bonus_calculated,
-        EmployeeKPI.annual_bonus_calculated
-    )
+        department_id = current_user.department_id
 
-    results = query.all()
-
-    return [
-        KPIEmployeeSummary(
-            employee_id=r.employee_id,
-            employee_name=r.employee_name,
-            position=r.position,
-            year=r.year,
-            month=r.month,
-            kpi_percentage=r.kpi_percentage,
-            total_bonus_calculated=r.total_bonus_calculated or Decimal(0),
-            monthly_bonus_calculated=r.monthly_bonus_calculated or Decimal(0),
-            quarterly_bonus_calculated=r.quarterly_bonus_calculated or Decimal(0),
-            annual_bonus_calculated=r.annual_bonus_calculated or Decimal(0),
-            goals_count=r.goals_count or 0,
-            goals_achieved=r.goals_achieved or 0
-        )
-        for r in results
-    ]
+    analytics = load_kpi_analytics(db, year, department_id)
+    return [KPIEmployeeSummary(**row) for row in kpi_analytics.employee_summary(analytics, month)]
 
 
 @router.get("/analytics/department-summary", response_model=List[KPIDepartmentSummary])
-async def get_department_kpi_summary(
+def get_department_kpi_summary(
     year: int,
     month: Optional[int] = None,
     department_id: Optional[int] = None,
@@ -1317,69 +1252,21 @@ async def get_department_kpi_summary(
     db: Session = Depends(get_db)
 ):
     """Get KPI summary grouped by department"""
-    query = db.query(
-        Department.id.label('department_id'),
-        Department.name.label('department_name'),
-        EmployeeKPI.year,
-        EmployeeKPI.month,
-        func.avg(EmployeeKPI.kpi_percentage).label('avg_kpi_percentage'),
-        func.count(func.distinct(EmployeeKPI.employee_id)).label('total_employees'),
-        func.sum(
-            EmployeeKPI.monthly_bonus_calculated +
-            EmployeeKPI.quarterly_bonus_calculated +
-            EmployeeKPI.annual_bonus_calculated
-        ).label('total_bonus_calculated'),
-        func.count(func.distinct(EmployeeKPIGoal.id)).label('goals_count'),
-        func.sum(
-            func.cast(EmployeeKPIGoal.status == KPIGoalStatusEnum.ACHIEVED, Integer)
-        ).label('goals_achieved')
-    ).join(Employee, Employee.department_id == Department.id).join(
-        EmployeeKPI, EmployeeKPI.employee_id == Employee.id
-    ).outerjoin(EmployeeKPIGoal).filter(
-        EmployeeKPI.year == year
-    )
-
-    if month is not None:
-        query = query.filter(EmployeeKPI.month == month)
-
-    # Department filter based on user role
+    # Department filter
     if current_user.role == UserRoleEnum.USER:
         if not current_user.department_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="User has no assigned department"
             )
-        query = query.filter(Department.id == current_user.department_id)
-    elif department_id:
-        query = query.filter(Department.id == department_id)
+        department_id = current_user.department_id
 
-    query = query.group_by(
-        Department.id,
-        Department.name,
-        EmployeeKPI.year,
-        EmployeeKPI.month
-    )
-
-    results = query.all()
-
-    return [
-        KPIDepartmentSummary(
-            department_id=r.department_id,
-            department_name=r.department_name,
-            year=r.year,
-            month=r.month,
-            avg_kpi_percentage=r.avg_kpi_percentage or Decimal(0),
-            total_employees=r.total_employees or 0,
-            total_bonus_calculated=r.total_bonus_calculated or Decimal(0),
-            goals_count=r.goals_count or 0,
-            goals_achieved=r.goals_achieved or 0
-        )
-        for r in results
-    ]
+    analytics = load_kpi_analytics(db, year, department_id)
+    return [KPIDepartmentSummary(**row) for row in kpi_analytics.department_summary(analytics, month)]
 
 
 @router.get("/analytics/goal-progress", response_model=List[KPIGoalProgress])
-async def get_goal_progress(
+def get_goal_progress(
     year: int,
     month: Optional[int] = None,
     department_id: Optional[int] = None,
@@ -1387,36 +1274,6 @@ async def get_goal_progress(
     db: Session = Depends(get_db)
 ):
     """Get progress tracking for all KPI goals"""
-    query = db.query(
-        KPIGoal.id.label('goal_id'),
-        KPIGoal.name.label('goal_name'),
-        KPIGoal.category,
-        KPIGoal.target_value,
-        KPIGoal.metric_unit,
-        func.count(func.distinct(EmployeeKPIGoal.employee_id)).label('employees_assigned'),
-        func.sum(
-            func.cast(EmployeeKPIGoal.status == KPIGoalStatusEnum.ACHIEVED, Integer)
-        ).label('employees_achieved'),
-        func.avg(EmployeeKPIGoal.achievement_percentage).label('avg_achievement_percentage'),
-        func.sum(EmployeeKPIGoal.weight).label('total_weight')
-    ).outerjoin(
-        EmployeeKPIGoal,
-        and_(
-            EmployeeKPIGoal.goal_id == KPIGoal.id,
-            EmployeeKPIGoal.year == year
-        )
-    ).filter(
-        KPIGoal.year == year
-    )
-
-    if month is not None:
-        query = query.filter(
-            or_(
-                EmployeeKPIGoal.month == month,
-                EmployeeKPIGoal.month.is_(None)  # Include annual goals
-            )
-        )
-
     # Department filter
     if current_user.role == UserRoleEnum.USER:
         if not current_user.department_id:
@@ -1424,38 +1281,14 @@ async def get_goal_progress(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="User has no assigned department"
             )
-        query = query.filter(KPIGoal.department_id == current_user.department_id)
-    elif department_id:
-        query = query.filter(KPIGoal.department_id == department_id)
-
-    query = query.group_by(
-        KPIGoal.id,
-        KPIGoal.name,
-        KPIGoal.category,
-        KPIGoal.target_value,
-        KPIGoal.metric_unit
-    )
+        department_id = current_user.department_id
 
-    results = query.all()
-
-    return [
-        KPIGoalProgress(
-            goal_id=r.goal_id,
-            goal_name=r.goal_name,
-            category=r.category,
-            target_value=r.target_value,
-            metric_unit=r.metric_unit,
-            employees_assigned=r.employees_assigned or 0,
-            employees_achieved=r.employees_achieved or 0,
-            avg_achievement_percentage=r.avg_achievement_percentage or Decimal(0),
-            total_weight=r.total_weight or Decimal(0)
-        )
-        for r in results
-    ]
+    analytics = load_kpi_analytics(db, year, department_id)
+    return [KPIGoalProgress(**row) for row in kpi_analytics.goal_progress(analytics, month)]
 
 
 @router.get("/analytics/kpi-trends")
-async def get_kpi_trends(
+def get_kpi_trends(
     year: int,
     employee_id: Optional[int] = None,
     department_id: Optional[int] = None,
@@ -1463,19 +1296,6 @@ async def get_kpi_trends(
     db: Session = Depends(get_db)
 ):
     """Get KPI trends over months"""
-    query = db.query(
-        EmployeeKPI.month,
-        func.avg(EmployeeKPI.kpi_percentage).label('avg_kpi'),
-        func.min(EmployeeKPI.kpi_percentage).label('min_kpi'),
-        func.max(EmployeeKPI.kpi_percentage).label('max_kpi'),
-        func.count(func.distinct(EmployeeKPI.employee_id)).label('employee_count'),
-        func.sum(
-            EmployeeKPI.monthly_bonus_calculated +
-            EmployeeKPI.quarterly_bonus_calculated +
-            EmployeeKPI.annual_bonus_calculated
-        ).label('total_bonus')
-    ).filter(EmployeeKPI.year == year)
-
     # Department filter
     if current_user.role == UserRoleEnum.USER:
         if not current_user.department_id:
@@ -1483,32 +1303,14 @@ async def get_kpi_trends(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="User has no assigned department"
             )
-        query = query.filter(EmployeeKPI.department_id == current_user.department_id)
-    elif department_id:
-        query = query.filter(EmployeeKPI.department_id == department_id)
+        department_id = current_user.department_id
 
-    if employee_id:
-        query = query.filter(EmployeeKPI.employee_id == employee_id)
-
-    query = query.group_by(EmployeeKPI.month).order_by(EmployeeKPI.month)
-
-    results = query.all()
-
-    return [
-        {
-            "month": r.month,
-            "avg_kpi": float(r.avg_kpi or 0),
-            "min_kpi": float(r.min_kpi or 0),
-            "max_kpi": float(r.max_kpi or 0),
-            "employee_count": r.employee_count or 0,
-            "total_bonus": float(r.total_bonus or 0)
-        }
-        for r in results
-    ]
+    analytics = load_kpi_analytics(db, year, department_id)
+    return kpi_analytics.kpi_trends(analytics, employee_id)
 
 
 @router.get("/analytics/bonus-distribution")
-async def get_bonus_distribution(
+def get_bonus_distribution(
     year: int,
     month: Optional[int] = None,
     department_id: Optional[int] = None,
@@ -1522,25 +1324,6 @@ async def get_bonus_distribution(
     - MANAGER: Can only see their own department
     - ADMIN: Can see all departments or filter by department_id
     """
-    query = db.query(
-        Department.id.label('department_id'),
-        Department.name.label('department_name'),
-        func.sum(EmployeeKPI.monthly_bonus_calculated).label('monthly_total'),
-        func.sum(EmployeeKPI.quarterly_bonus_calculated).label('quarterly_total'),
-        func.sum(EmployeeKPI.annual_bonus_calculated).label('annual_total'),
-        func.sum(
-            EmployeeKPI.monthly_bonus_calculated +
-            EmployeeKPI.quarterly_bonus_calculated +
-            EmployeeKPI.annual_bonus_calculated
-        ).label('total_bonus'),
-        func.count(func.distinct(EmployeeKPI.employee_id)).label('employee_count')
-    ).join(Employee, Employee.department_id == Department.id).join(
-        EmployeeKPI, EmployeeKPI.employee_id == Employee.id
-    ).filter(EmployeeKPI.year == year)
-
-    if month is not None:
-        query = query.filter(EmployeeKPI.month == month)
-
     # Department filter based on role
     if current_user.role == UserRoleEnum.USER:
         if not current_user.department_id:
@@ -1548,7 +1331,7 @@ async def get_bonus_distribution(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="User has no assigned department"
             )
-        query = query.filter(Department.id == current_user.department_id)
+        department_id = current_user.department_id
     elif current_user.role == UserRoleEnum.MANAGER:
         if not current_user.department_id:
             raise HTTPException(
@@ -1556,32 +1339,17 @@ async def get_bonus_distribution(
                 detail="Manager has no assigned department"
             )
         # MANAGER can only see their own department
-        query = query.filter(Department.id == current_user.department_id)
-    elif current_user.role == UserRoleEnum.ADMIN:
-        # ADMIN can optionally filter by department
-        if department_id:
-            query = query.filter(Department.id == department_id)
-
-    query = query.group_by(Department.id, Department.name)
-
-    results = query.all()
+        department_id = current_user.department_id
+    elif current_user.role != UserRoleEnum.ADMIN:
+        # Only ADMIN can filter by department
+        department_id = None
 
-    return [
-        {
-            "department_id": r.department_id,
-            "department_name": r.department_name,
-            "monthly_total": float(r.monthly_total or 0),
-            "quarterly_total": float(r.quarterly_total or 0),
-            "annual_total": float(r.annual_total or 0),
-            "total_bonus": float(r.total_bonus or 0),
-            "employee_count": r.employee_count or 0
-        }
-        for r in results
-    ]
+    analytics = load_kpi_analytics(db, year, department_id)
+    return kpi_analytics.bonus_distribution(analytics, month)
 
 
 @router.post("/import", status_code=status.HTTP_200_OK)
-async def import_kpi_from_excel(
+def import_kpi_from_excel(
     file: UploadFile = File(...),
     year: int = Query(..., description="Year for KPI data"),
     month: int = Query(..., ge=1, le=12, description="Month for KPI data (1-12)"),
@@ -1626,7 +1394,7 @@ async def import_kpi_from_excel(
 
     try:
         # Read file content
-        content = await file.read()
+        content = file.file.read()
 
         # Validate file size (max 10MB)
         max_size = 10 * 1024 * 1024  # 10MB
@@ -1811,6 +1579,7 @@ async def import_kpi_from_excel(
 
         # Commit all changes
         db.commit()
+        invalidate_kpi_analytics_cache()
 
         return {
             "success": True,
@@ -2120,17 +1889,19 @@ def sync_kpi_to_payroll_period(
     department_id: int,
     year: int,
     month: Optional[int] = None,
+    target: str = Query("actual", regex="^(actual|plan)$"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
-    Массовая синхронизация EmployeeKPI → PayrollActual для отдела за период.
+    Массовая синхронизация EmployeeKPI → PayrollActual (или PayrollPlan) для отдела за период.
 
-    Создаёт или обновляет все записи PayrollActual на основе EmployeeKPI.
+    Создаёт или обновляет все записи зарплаты на основе EmployeeKPI в одной транзакции.
 
     - **department_id**: ID отдела
     - **year**: Год
     - **month**: Месяц (опционально, если не указан, синхронизируются все месяцы года)
+    - **target**: actual (PayrollActual, по умолчанию) или plan (бонусы в PayrollPlan)
     """
     from app.services.payroll_kpi_sync_service import PayrollKPISyncService
 
@@ -2151,7 +1922,11 @@ def sync_kpi_to_payroll_period(
     try:
         sync_service = PayrollKPISyncService(db)
 
-        stats = sync_service.sync_department_kpi_to_payroll(
+        sync_department = (
+            sync_service.sync_department_kpi_to_payroll_plan if target == "plan"
+            else sync_service.sync_department_kpi_to_payroll
+        )
+        stats = sync_department(
             department_id=department_id,
             year=year,
             month=month
@@ -2165,7 +1940,7 @@ def sync_kpi_to_payroll_period(
 
         return {
             "success": True,
-            "message": f"Synced {stats['success']} PayrollActual records{period_str}",
+            "message": f"Synced {stats['success']} {'PayrollPlan' if target == 'plan' else 'PayrollActual'} records{period_str}",
             "statistics": stats
         }
 
@@ -2177,6 +1952,50 @@ def sync_kpi_to_payroll_period(
         )
 
 
+@router.get("/sync-payroll-period/preview")
+def preview_kpi_to_payroll_period_sync(
+    department_id: int,
+    year: int,
+    month: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Пакетный предпросмотр синхронизации EmployeeKPI → PayrollActual для отдела за период.
+
+    Ничего не сохраняет; показывает, какие записи будут созданы или обновлены.
+
+    - **department_id**: ID отдела
+    - **year**: Год
+    - **month**: Месяц (опционально)
+    """
+    from app.services.payroll_kpi_sync_service import PayrollKPISyncService
+
+    if not check_department_access(current_user, department_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied to this department"
+        )
+
+    try:
+        preview = PayrollKPISyncService(db).get_department_sync_preview(
+            department_id=department_id,
+            year=year,
+            month=month
+        )
+
+        return {
+            "success": True,
+            "data": preview
+        }
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get sync preview: {str(e)}"
+        )
+
+
 @router.get("/employees/kpi/{employee_kpi_id}/sync-preview")
 def preview_kpi_to_payroll_sync(
     employee_kpi_id: int,
@@ -2273,6 +2092,7 @@ def submit_employee_kpi_for_review(
     employee_kpi.updated_at = datetime.utcnow()
 
     db.commit()
+    invalidate_kpi_analytics_cache()
     db.refresh(employee_kpi)
 
     return {
@@ -2342,6 +2162,7 @@ def approve_employee_kpi(
     employee_kpi.updated_at = datetime.utcnow()
 
     db.commit()
+    invalidate_kpi_analytics_cache()
     db.refresh(employee_kpi)
 
     # Audit logging
@@ -2448,6 +2269,7 @@ def reject_employee_kpi(
     employee_kpi.updated_at = datetime.utcnow()
 
     db.commit()
+    invalidate_kpi_analytics_cache()
     db.refresh(employee_kpi)
 
     # Audit logging
@@ -2527,6 +2349,7 @@ def return_employee_kpi_to_draft(
     employee_kpi.updated_at = datetime.utcnow()
 
     db.commit()
+    invalidate_kpi_analytics_cache()
     db.refresh(employee_kpi)
 
     return {
@@ -3001,86 +2824,101 @@ def apply_template_to_employees(
         )
 
     # Validate employees exist and are active
+    employee_ids = set(apply_request.employee_ids)
     employees = db.query(Employee).filter(
-        Employee.id.in_(apply_request.employee_ids),
-        Employee.is_active == True
+        Employee.id.in_(employee_ids),
+        Employee.status == EmployeeStatusEnum.ACTIVE
     ).all()
 
-    if len(employees) != len(apply_request.employee_ids):
+    if len(employees) != len(employee_ids):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="One or more employees not found or inactive"
         )
 
-    employees_updated = 0
-    goals_created = 0
-    errors = []
-
-    for employee in employees:
-        try:
-            # Get or create EmployeeKPI for this period
-            employee_kpi = db.query(EmployeeKPI).filter(
-                and_(
-                    EmployeeKPI.employee_id == employee.id,
-                    EmployeeKPI.year == apply_request.year,
-                    EmployeeKPI.month == apply_request.month
-                )
-            ).first()
-
-            if not employee_kpi:
-                # Create new EmployeeKPI
-                employee_kpi = EmployeeKPI(
-                    employee_id=employee.id,
-                    department_id=employee.department_id,
-                    year=apply_request.year,
-                    month=apply_request.month,
-                    status=EmployeeKPIStatusEnum.DRAFT
-                )
-                db.add(employee_kpi)
-                db.flush()
-
-            # Delete existing goals for this period (to replace with template)
-            db.query(EmployeeKPIGoal).filter(
-                EmployeeKPIGoal.employee_kpi_id == employee_kpi.id
-            ).delete()
-
-            # Create goals from template
-            for template_item in template.template_goals:
-                goal = EmployeeKPIGoal(
-                    employee_id=employee.id,
-                    employee_kpi_id=employee_kpi.id,
-                    goal_id=template_item.goal_id,
-                    year=apply_request.year,
-                    month=apply_request.month,
-                    target_value=template_item.default_target_value or template_item.goal.target_value,
-                    weight=template_item.weight,
-                    actual_value=0.0,
-                    achievement_percentage=0.0,
-                    status=KPIGoalStatusEnum.ACTIVE
-                )
-                db.add(goal)
-                goals_created += 1
-
-            employees_updated += 1
+    # Get or create EmployeeKPI of the period for all employees at once
+    employee_kpis = {
+        employee_id: kpi_id
+        for employee_id, kpi_id in db.query(EmployeeKPI.employee_id, func.min(EmployeeKPI.id)).filter(
+            EmployeeKPI.employee_id.in_(employee_ids),
+            EmployeeKPI.year == apply_request.year,
+            EmployeeKPI.month == apply_request.month
+        ).group_by(EmployeeKPI.employee_id)
+    }
+    missing = [employee for employee in employees if employee.id not in employee_kpis]
+    if missing:
+        new_ids = db.execute(
+            insert(EmployeeKPI).returning(EmployeeKPI.id, sort_by_parameter_order=True),
+            [
+                {
+                    "employee_id": employee.id,
+                    "department_id": employee.department_id,
+                    "year": apply_request.year,
+                    "month": apply_request.month,
+                    "status": EmployeeKPIStatusEnum.DRAFT
+                }
+                for employee in missing
+            ]
+        ).scalars().all()
+        employee_kpis.update(zip((employee.id for employee in missing), new_ids))
+
+    # Delete existing goals for this period (to replace with template)
+    db.query(EmployeeKPIGoal).filter(
+        EmployeeKPIGoal.employee_kpi_id.in_(list(employee_kpis.values()))
+    ).delete(synchronize_session=False)
+
+    # Create goals from template (goals already assigned for the period outside the KPI are skipped)
+    template_goals = db.query(
+        KPIGoalTemplateItem.goal_id,
+        KPIGoalTemplateItem.weight,
+        func.coalesce(KPIGoalTemplateItem.default_target_value, KPIGoal.target_value)
+    ).join(KPIGoal, KPIGoal.id == KPIGoalTemplateItem.goal_id).filter(
+        KPIGoalTemplateItem.template_id == template.id
+    ).all()
 
-        except Exception as e:
-            errors.append(f"Employee {employee.full_name}: {str(e)}")
+    assignment = assign_goals(
+        db,
+        employee_kpis,
+        [
+            GoalAssignment(goal_id=goal_id, weight=weight, target_value=target_value)
+            for goal_id, weight, target_value in template_goals
+        ],
+        apply_request.year,
+        apply_request.month,
+        values={
+            "actual_value": 0.0,
+            "achievement_percentage": 0.0,
+            "status": KPIGoalStatusEnum.ACTIVE
+        }
+    )
 
     db.commit()
+    invalidate_kpi_analytics_cache()
+
+    employees_updated = len(employee_kpis)
+    goals_created = len(assignment.created)
+    goals_skipped = len(assignment.skipped)
 
     return ApplyTemplateResponse(
-        success=len(errors) == 0,
-        message=f"Applied template to {employees_updated} employees, created {goals_created} goals",
+        success=True,
+        message=(
+            f"Applied template to {employees_updated} employees, created {goals_created} goals"
+            f"{f', skipped {goals_skipped} already assigned' if goals_skipped else ''}"
+        ),
         employees_updated=employees_updated,
         goals_created=goals_created,
-        errors=errors
+        goals_skipped=goals_skipped,
+        skipped=[
+            {"employee_id": employee_id, "goal_id": goal_id, "existing_goal_id": existing_id}
+            for (employee_id, goal_id), existing_id in sorted(assignment.skipped.items())
+        ]
     )
 
 
 # ============ Dashboard Analytics ============
 
 @router.get("/analytics/dashboard")
-async def get_kpi_dashboard(
+def get_kpi_dashboard(
     year: int = Query(..., description="Год для анализа"),
     department_id: Optional[int] = Query(None, description="ID отдела (опционально для ADMIN)"),
     current_user: User = Depends(get_current_active_user),
@@ -3113,157 +2951,8 @@ async def get_kpi_dashboard(
         # MANAGER видит только свой отдел
         target_department_id = current_user.department_id
 
-    # Base query для EmployeeKPI
-    kpi_query = db.query(EmployeeKPI).filter(EmployeeKPI.year == year)
-    if target_department_id:
-        kpi_query = kpi_query.filter(EmployeeKPI.department_id == target_department_id)
-
-    # 1. Общая статистика
-    total_kpis = kpi_query.count()
-
-    avg_kpi = db.query(func.avg(EmployeeKPI.kpi_percentage)).filter(
-        EmployeeKPI.year == year,
-        EmployeeKPI.kpi_percentage.isnot(None)
-    )
-    if target_department_id:
-        avg_kpi = avg_kpi.filter(EmployeeKPI.department_id == target_department_id)
-    avg_kpi_value = avg_kpi.scalar() or 0
-
-    total_bonuses = db.query(
-        func.sum(
-            EmployeeKPI.monthly_bonus_calculated +
-            EmployeeKPI.quarterly_bonus_calculated +
-            EmployeeKPI.annual_bonus_calculated
-        )
-    ).filter(EmployeeKPI.year == year)
-    if target_department_id:
-        total_bonuses = total_bonuses.filter(EmployeeKPI.department_id == target_department_id)
-    total_bonuses_value = total_bonuses.scalar() or 0
-
-    unique_employees = db.query(func.count(func.distinct(EmployeeKPI.employee_id))).filter(
-        EmployeeKPI.year == year
-    )
-    if target_department_id:
-        unique_employees = unique_employees.filter(EmployeeKPI.department_id == target_department_id)
-    unique_employees_count = unique_employees.scalar() or 0
-
-    # 2. Распределение по статусам
-    status_distribution = db.query(
-        EmployeeKPI.status,
-        func.count(EmployeeKPI.id).label('count')
-    ).filter(EmployeeKPI.year == year)
-    if target_department_id:
-        status_distribution = status_distribution.filter(EmployeeKPI.department_id == target_department_id)
-    status_distribution = status_distribution.group_by(EmployeeKPI.status).all()
-
-    status_stats = {
-        'DRAFT': 0,
-        'UNDER_REVIEW': 0,
-        'APPROVED': 0,
-        'REJECTED': 0
-    }
-    for status_item in status_distribution:
-        status_stats[status_item.status] = status_item.count
-
-    # 3. Динамика КПИ по месяцам (для линейного графика)
-    monthly_trends = db.query(
-        EmployeeKPI.month,
-        func.avg(EmployeeKPI.kpi_percentage).label('avg_kpi'),
-        func.count(func.distinct(EmployeeKPI.employee_id)).label('employee_count'),
-        func.sum(
-            EmployeeKPI.monthly_bonus_calculated +
-            EmployeeKPI.quarterly_bonus_calculated +
-            EmployeeKPI.annual_bonus_calculated
-        ).label('total_bonus')
-    ).filter(
-        EmployeeKPI.year == year,
-        EmployeeKPI.kpi_percentage.isnot(None)
-    )
-    if target_department_id:
-        monthly_trends = monthly_trends.filter(EmployeeKPI.department_id == target_department_id)
-    monthly_trends = monthly_trends.group_by(EmployeeKPI.month).order_by(EmployeeKPI.month).all()
-
-    trends_data = [
-        {
-            'month': trend.month,
-            'month_name': ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн',
-                          'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек'][trend.month - 1],
-            'avg_kpi': float(trend.avg_kpi or 0),
-            'employee_count': trend.employee_count,
-            'total_bonus': float(trend.total_bonus or 0)
-        }
-        for trend in monthly_trends
-    ]
-
-    # 4. Топ-10 сотрудников по среднему КПИ%
-    top_employees_query = db.query(
-        Employee.id,
-        Employee.full_name,
-        func.avg(EmployeeKPI.kpi_percentage).label('avg_kpi'),
-        func.count(EmployeeKPI.id).label('kpi_count'),
-        func.sum(
-            EmployeeKPI.monthly_bonus_calculated +
-            EmployeeKPI.quarterly_bonus_calculated +
-            EmployeeKPI.annual_bonus_calculated
-        ).label('total_bonus')
-    ).join(
-        EmployeeKPI, Employee.id == EmployeeKPI.employee_id
-    ).filter(
-        EmployeeKPI.year == year,
-        EmployeeKPI.kpi_percentage.isnot(None),
-        EmployeeKPI.status == EmployeeKPIStatusEnum.APPROVED
-    )
-    if target_department_id:
-        top_employees_query = top_employees_query.filter(Employee.department_id == target_department_id)
-
-    top_employees = top_employees_query.group_by(
-        Employee.id, Employee.full_name
-    ).order_by(
-        func.avg(EmployeeKPI.kpi_percentage).desc()
-    ).limit(10).all()
-
-    top_employees_data = [
-        {
-            'employee_id': emp.id,
-            'employee_name': emp.full_name,
-            'avg_kpi': float(emp.avg_kpi or 0),
-            'kpi_count': emp.kpi_count,
-            'total_bonus': float(emp.total_bonus or 0)
-        }
-        for emp in top_employees
-    ]
-
-    # 5. Статистика по целям
-    total_goals_query = db.query(func.count(func.distinct(KPIGoal.id)))
-    if target_department_id:
-        total_goals_query = total_goals_query.filter(KPIGoal.department_id == target_department_id)
-    total_goals = total_goals_query.scalar() or 0
-
-    active_goals_query = db.query(func.count(func.distinct(KPIGoal.id))).filter(
-        KPIGoal.is_active == True
-    )
-    if target_department_id:
-        active_goals_query = active_goals_query.filter(KPIGoal.department_id == target_department_id)
-    active_goals = active_goals_query.scalar() or 0
-
-    # Формируем response
-    dashboard_data = {
-        'overview': {
-            'total_kpis': total_kpis,
-            'avg_kpi_percentage': round(float(avg_kpi_value), 2),
-            'total_bonuses': round(float(total_bonuses_value), 2),
-            'unique_employees': unique_employees_count,
-            'total_goals': total_goals,
-            'active_goals': active_goals
-        },
-        'status_distribution': status_stats,
-        'monthly_trends': trends_data,
-        'top_employees': top_employees_data,
-        'filters': {
-            'year': year,
-            'department_id': target_department_id
-        }
-    }
+    analytics = load_kpi_analytics(db, year, target_department_id)
+    dashboard_data = kpi_analytics.dashboard(analytics)
 
     logger.info(f"Dashboard data generated for year {year}, department {target_department_id}")
 
@@ -234,7 +234,7 @@ def export_organizations(
 
 
 @router.post("/import", status_code=status.HTTP_200_OK)
-async def import_organizations(
+def import_organizations(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -253,7 +253,7 @@ async def import_organizations(
     try:
         # Read Excel file
         log_info(f"Starting organizations import from {file.filename}", "Import")
-        content = await file.read()
+        content = file.file.read()
 
         # Validate file size (max 10MB)
         max_size = 10 * 1024 * 1024  # 10MB
@@ -15,7 +15,8 @@ import io
 from app.db.session import get_db
 from app.utils.excel_export import encode_filename_header
 from app.db.models import (
-    PayrollPlan, PayrollActual, Employee, User, UserRoleEnum, Department, EmployeeKPI, EmployeeStatusEnum
+    PayrollPlan, PayrollActual, Employee, User, UserRoleEnum, Department, EmployeeStatusEnum,
+    PayrollTaxBreakdown, PayrollTaxSourceEnum
 )
 from app.schemas.payroll import (
     PayrollPlanCreate,
@@ -35,11 +36,22 @@ from app.schemas.payroll import (
     PayrollForecast,
 )
 from app.utils.auth import get_current_active_user
-from app.utils.ndfl_calculator import calculate_progressive_ndfl, calculate_gross_from_net
-from app.utils.social_contributions_calculator import (
-    calculate_social_contributions,
-    calculate_total_tax_burden
+from app.utils.ndfl_calculator import calculate_gross_from_net
+from app.services.salary_distribution import (
+    cached_distributions,
+    current_compensation_values,
+    invalidate_salary_distribution_cache,
+    planned_compensation_values,
 )
+from app.services.payroll_posting import (
+    expense_comments_by_department,
+    insert_rows,
+    kpis_by_employee,
+    organizations_by_department,
+    payroll_expense_number,
+    registered_payments,
+)
+from app.services.payroll_tax_breakdown import refresh_payroll_taxes
 
 router = APIRouter(dependencies=[Depends(get_current_active_user)])
 
@@ -63,7 +75,7 @@ def check_department_access(user: User, department_id: int) -> bool:
 # ==================== Payroll Plan Endpoints ====================
 
 @router.get("/plans", response_model=List[PayrollPlanWithEmployee])
-async def list_payroll_plans(
+def list_payroll_plans(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     department_id: Optional[int] = None,
@@ -107,7 +119,7 @@ async def list_payroll_plans(
 # ==================== Export Endpoints ====================
 
 @router.get("/plans/export")
-async def export_payroll_plans(
+def export_payroll_plans(
     year: Optional[int] = None,
     month: Optional[int] = None,
     department_id: Optional[int] = None,
@@ -174,7 +186,7 @@ async def export_payroll_plans(
 
 
 @router.get("/plans/{plan_id}", response_model=PayrollPlanWithEmployee)
-async def get_payroll_plan(
+def get_payroll_plan(
     plan_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -201,7 +213,7 @@ async def get_payroll_plan(
 
 
 @router.post("/plans", response_model=PayrollPlanInDB, status_code=status.HTTP_201_CREATED)
-async def create_payroll_plan(
+def create_payroll_plan(
     plan_data: PayrollPlanCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -261,14 +273,16 @@ async def create_payroll_plan(
         total_planned=total_planned
     )
     db.add(new_plan)
+    refresh_payroll_taxes(db, [(new_plan.employee_id, new_plan.year)])
     db.commit()
     db.refresh(new_plan)
+    invalidate_salary_distribution_cache()
 
     return new_plan
 
 
 @router.put("/plans/{plan_id}", response_model=PayrollPlanInDB)
-async def update_payroll_plan(
+def update_payroll_plan(
     plan_id: int,
     plan_data: PayrollPlanUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -300,6 +314,7 @@ async def update_payroll_plan(
         )
 
     # Update plan fields
+    previous_key = (plan.employee_id, plan.year)
     update_data = plan_data.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(plan, field, value)
@@ -313,14 +328,16 @@ async def update_payroll_plan(
         plan.other_payments
     )
 
+    refresh_payroll_taxes(db, [previous_key, (plan.employee_id, plan.year)])
     db.commit()
     db.refresh(plan)
+    invalidate_salary_distribution_cache()
 
     return plan
 
 
 @router.delete("/plans/{plan_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_payroll_plan(
+def delete_payroll_plan(
     plan_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -351,14 +368,16 @@ async def delete_payroll_plan(
         )
 
     db.delete(plan)
+    refresh_payroll_taxes(db, [(plan.employee_id, plan.year)])
     db.commit()
+    invalidate_salary_distribution_cache()
     return None
 
 
 # ==================== Payroll Actual Endpoints ====================
 
 @router.get("/actuals", response_model=List[PayrollActualWithEmployee])
-async def list_payroll_actuals(
+def list_payroll_actuals(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     department_id: Optional[int] = None,
@@ -400,7 +419,7 @@ async def list_payroll_actuals(
 
 
 @router.post("/actuals", response_model=PayrollActualInDB, status_code=status.HTTP_201_CREATED)
-async def create_payroll_actual(
+def create_payroll_actual(
     actual_data: PayrollActualCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -489,6 +508,7 @@ async def create_payroll_actual(
         total_paid=total_paid
     )
     db.add(new_actual)
+    refresh_payroll_taxes(db, [(new_actual.employee_id, new_actual.year)])
     db.commit()
     db.refresh(new_actual)
 
@@ -496,7 +516,7 @@ async def create_payroll_actual(
 
 
 @router.put("/actuals/{actual_id}", response_model=PayrollActualInDB)
-async def update_payroll_actual(
+def update_payroll_actual(
     actual_id: int,
     actual_data: PayrollActualUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -528,6 +548,7 @@ async def update_payroll_actual(
         )
 
     # Update actual fields
+    previous_key = (actual.employee_id, actual.year)
     update_data = actual_data.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(actual, field, value)
@@ -569,6 +590,7 @@ async def update_payroll_actual(
     actual.income_tax_amount = Decimal(str(ndfl_calc['tax_to_withhold']))
     actual.income_tax_rate = Decimal(str(ndfl_calc['monthly_effective_rate'])) / Decimal('100')
 
+    refresh_payroll_taxes(db, [previous_key, (actual.employee_id, actual.year)])
     db.commit()
     db.refresh(actual)
 
@@ -576,7 +598,7 @@ async def update_payroll_actual(
 
 
 @router.delete("/actuals/{actual_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_payroll_actual(
+def delete_payroll_actual(
     actual_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -607,6 +629,7 @@ async def delete_payroll_actual(
         )
 
     db.delete(actual)
+    refresh_payroll_taxes(db, [(actual.employee_id, actual.year)])
     db.commit()
     return None
 
@@ -614,7 +637,7 @@ async def delete_payroll_actual(
 # ==================== Analytics Endpoints ====================
 
 @router.get("/analytics/summary", response_model=List[PayrollSummary])
-async def get_payroll_summary(
+def get_payroll_summary(
     year: int = Query(..., ge=2000, le=2100),
     department_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
@@ -684,7 +707,7 @@ async def get_payroll_summary(
 
 
 @router.get("/actuals/export")
-async def export_payroll_actuals(
+def export_payroll_actuals(
     year: Optional[int] = None,
     month: Optional[int] = None,
     department_id: Optional[int] = None,
@@ -754,7 +777,7 @@ async def export_payroll_actuals(
 # ==================== Advanced Analytics Endpoints ====================
 
 @router.get("/analytics/salary-stats", response_model=SalaryStatistics)
-async def get_salary_statistics(
+def get_salary_statistics(
     department_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -762,7 +785,7 @@ async def get_salary_statistics(
     """
     Get salary distribution statistics including median and percentiles
     """
-    query = db.query(Employee)
+    dept_filter = None
 
     # Filter by department based on user role
     if current_user.role == UserRoleEnum.USER:
@@ -771,60 +794,49 @@ async def get_salary_statistics(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="User has no assigned department"
             )
-        query = query.filter(Employee.department_id == current_user.department_id)
+        dept_filter = current_user.department_id
     elif department_id:
-        query = query.filter(Employee.department_id == department_id)
+        dept_filter = department_id
 
-    # Get all employees and active employees
-    all_employees = query.all()
-    active_employees = [e for e in all_employees if e.status == 'ACTIVE']
+    # Percentiles of active employees' base salaries (computed in the database, cached)
+    key = (dept_filter, None, None)
+    stats = cached_distributions(
+        db,
+        "base_salary",
+        [key],
+        lambda keys: current_compensation_values(
+            department_ids=[dept_filter] if dept_filter else None,
+            by_department=dept_filter is not None,
+            base_salary_only=True
+        )
+    )[key]["statistics"]
 
-    if not active_employees:
+    if not stats["total_employees"]:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No active employees found"
         )
 
-    # Get salary values sorted
-    salaries = sorted([float(e.base_salary) for e in active_employees])
-    n = len(salaries)
-
-    # Calculate statistics
-    def percentile(data, p):
-        """Calculate percentile"""
-        if not data:
-            return 0
-        k = (len(data) - 1) * p / 100
-        f = int(k)
-        c = k - f
-        if f + 1 < len(data):
-            return data[f] + (data[f + 1] - data[f]) * c
-        return data[f]
-
-    median = percentile(salaries, 50)
-    p25 = percentile(salaries, 25)
-    p75 = percentile(salaries, 75)
-    p90 = percentile(salaries, 90)
-
-    total_payroll = sum(salaries)
-    avg_salary = total_payroll / n if n > 0 else 0
+    total_query = db.query(func.count(Employee.id))
+    if dept_filter:
+        total_query = total_query.filter(Employee.department_id == dept_filter)
 
     return SalaryStatistics(
-        total_employees=len(all_employees),
-        active_employees=n,
-        min_salary=Decimal(str(min(salaries))),
-        max_salary=Decimal(str(max(salaries))),
-        average_salary=Decimal(str(avg_salary)),
-        median_salary=Decimal(str(median)),
-        percentile_25=Decimal(str(p25)),
-        percentile_75=Decimal(str(p75)),
-        percentile_90=Decimal(str(p90)),
-        total_payroll=Decimal(str(total_payroll))
+        total_employees=total_query.scalar(),
+        active_employees=stats["total_employees"],
+        min_salary=Decimal(str(stats["min_salary"])),
+        max_salary=Decimal(str(stats["max_salary"])),
+        average_salary=Decimal(str(stats["avg_salary"])),
+        median_salary=Decimal(str(stats["median_salary"])),
+        percentile_25=Decimal(str(stats["percentile_25"])),
+        percentile_75=Decimal(str(stats["percentile_75"])),
+        percentile_90=Decimal(str(stats["percentile_90"])),
+        total_payroll=Decimal(str(stats["total_payroll"]))
     )
 
 
 @router.get("/analytics/structure", response_model=List[PayrollStructureMonth])
-async def get_payroll_structure(
+def get_payroll_structure(
     year: int = Query(..., ge=2000, le=2100),
     department_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
@@ -880,7 +892,7 @@ async def get_payroll_structure(
 
 
 @router.get("/analytics/dynamics", response_model=List[PayrollDynamics])
-async def get_payroll_dynamics(
+def get_payroll_dynamics(
     year: int = Query(..., ge=2000, le=2100),
     department_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
@@ -979,7 +991,7 @@ async def get_payroll_dynamics(
 
 
 @router.get("/analytics/forecast", response_model=List[PayrollForecast])
-async def get_payroll_forecast(
+def get_payroll_forecast(
     months_ahead: int = Query(3, ge=1, le=12, description="Number of months to forecast"),
     historical_months: int = Query(6, ge=3, le=12, description="Number of historical months to use"),
     department_id: Optional[int] = None,
@@ -1120,7 +1132,7 @@ async def get_payroll_forecast(
 # ==================== Import Endpoints ====================
 
 @router.post("/plans/import", status_code=status.HTTP_200_OK)
-async def import_payroll_plans(
+def import_payroll_plans(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -1167,7 +1179,7 @@ async def import_payroll_plans(
 
     try:
         # Read file content
-        content = await file.read()
+        content = file.file.read()
 
         # Validate file size (max 10MB)
         max_size = 10 * 1024 * 1024  # 10MB
@@ -1206,6 +1218,7 @@ async def import_payroll_plans(
         updated_count = 0
         skipped_count = 0
         errors = []
+        imported_keys = set()
         total_rows = len(df)
 
         for index, row in df.iterrows():
@@ -1271,6 +1284,7 @@ async def import_payroll_plans(
                 ).first()
 
                 total_planned = Decimal(str(base_salary)) + Decimal(str(bonus)) + Decimal(str(other_payments))
+                imported_keys.add((employee.id, year))
 
                 if existing_plan:
                     # Update existing plan
@@ -1303,7 +1317,9 @@ async def import_payroll_plans(
                 continue
 
         # Commit all changes
+        refresh_payroll_taxes(db, imported_keys)
         db.commit()
+        invalidate_salary_distribution_cache()
 
         return {
             "success": True,
@@ -1327,7 +1343,7 @@ async def import_payroll_plans(
 # ==================== Integration with Expenses ====================
 
 @router.post("/generate-payroll-expenses")
-async def generate_payroll_expenses(
+def generate_payroll_expenses(
     year: int = Query(..., ge=2020, le=2100),
     month: int = Query(..., ge=1, le=12),
     department_id: Optional[int] = None,
@@ -1350,7 +1366,7 @@ async def generate_payroll_expenses(
     Returns:
         Statistics about generated expenses and preview data
     """
-    from app.db.models import BudgetCategory, CategoryTypeEnum, Expense, ExpenseStatusEnum, EmployeeKPI
+    from app.db.models import BudgetCategory, ExpenseTypeEnum, Expense, ExpenseStatusEnum
 
     # Check permissions
     if current_user.role not in [UserRoleEnum.ADMIN, UserRoleEnum.MANAGER]:
@@ -1371,7 +1387,7 @@ async def generate_payroll_expenses(
     # Find or create "Заработная плата" category
     salary_category = db.query(BudgetCategory).filter(
         BudgetCategory.name == "Заработная плата",
-        BudgetCategory.type == CategoryTypeEnum.OPEX
+        BudgetCategory.type == ExpenseTypeEnum.OPEX
     ).first()
 
     if not salary_category:
@@ -1386,7 +1402,7 @@ async def generate_payroll_expenses(
         # Create for first department (can be enhanced later)
         salary_category = BudgetCategory(
             name="Заработная плата",
-            type=CategoryTypeEnum.OPEX,
+            type=ExpenseTypeEnum.OPEX,
             description="Автоматически созданная категория для учета зарплаты сотрудников",
             is_active=True,
             department_id=departments[0].id
@@ -1394,8 +1410,10 @@ async def generate_payroll_expenses(
         db.add(salary_category)
         db.flush()  # Get ID without committing
 
-    # Query payroll plans
-    query = db.query(PayrollPlan).join(Employee).filter(
+    # Query payroll plans with their employees (one query)
+    query = db.query(PayrollPlan, Employee).join(
+        Employee, PayrollPlan.employee_id == Employee.id
+    ).filter(
         PayrollPlan.year == year,
         PayrollPlan.month == month,
         Employee.status == EmployeeStatusEnum.ACTIVE
@@ -1412,44 +1430,33 @@ async def generate_payroll_expenses(
             detail=f"No payroll plans found for {year}-{month:02d}"
         )
 
-    # Prepare expense data
+    # Preload KPI data and existing salary expenses of the period (one query each)
+    kpis = kpis_by_employee(db, (plan.employee_id for plan, _ in payroll_plans), year, month)
+    existing_comments = expense_comments_by_department(db, salary_category.id, year, month, department_id)
+    organizations = organizations_by_department(db, (plan.department_id for plan, _ in payroll_plans))
+
+    # Prepare expense data (same computation for dry run and for creation)
     expenses_to_create = []
+    expense_rows = []
     total_amount = Decimal(0)
     employee_count = 0
+    requester = current_user.full_name or current_user.username
 
-    for plan in payroll_plans:
-        # Get employee
-        employee = db.query(Employee).filter(Employee.id == plan.employee_id).first()
-        if not employee:
-            continue
-
-        # Get KPI data for the same period
-        kpi_data = db.query(EmployeeKPI).filter(
-            EmployeeKPI.employee_id == plan.employee_id,
-            EmployeeKPI.year == year,
-            EmployeeKPI.month == month
-        ).first()
+    for plan, employee in payroll_plans:
+        kpi_data = kpis.get(plan.employee_id)
 
         # Calculate total salary: base salary + bonuses from KPI
-        total_salary = plan.base_salary or Decimal(0)
-
-        if kpi_data:
-            # Add KPI bonuses
-            total_salary += (kpi_data.monthly_bonus_calculated or Decimal(0))
-            total_salary += (kpi_data.quarterly_bonus_calculated or Decimal(0))
-            total_salary += (kpi_data.annual_bonus_calculated or Decimal(0))
-
-        # Check if expense already exists
-        existing = db.query(Expense).filter(
-            Expense.department_id == plan.department_id,
-            Expense.category_id == salary_category.id,
-            func.extract('year', Expense.request_date) == year,
-            func.extract('month', Expense.request_date) == month,
-            Expense.comment.ilike(f"%{employee.full_name}%")
-        ).first()
-
-        if existing:
-            continue  # Skip if already exists
+        kpi_bonuses = (
+            (kpi_data.monthly_bonus_calculated or Decimal(0)) +
+            (kpi_data.quarterly_bonus_calculated or Decimal(0)) +
+            (kpi_data.annual_bonus_calculated or Decimal(0))
+        ) if kpi_data else Decimal(0)
+        total_salary = (plan.base_salary or Decimal(0)) + kpi_bonuses
+
+        # Skip if expense already exists
+        employee_name = employee.full_name.lower()
+        if any(employee_name in comment for comment in existing_comments.get(plan.department_id, [])):
+            continue
 
         # Prepare expense data
         expense_data = {
@@ -1458,11 +1465,7 @@ async def generate_payroll_expenses(
             "position": employee.position,
             "base_salary": plan.base_salary or Decimal(0),
             "kpi_percentage": kpi_data.kpi_percentage if kpi_data else None,
-            "kpi_bonuses": (
-                (kpi_data.monthly_bonus_calculated or Decimal(0)) +
-                (kpi_data.quarterly_bonus_calculated or Decimal(0)) +
-                (kpi_data.annual_bonus_calculated or Decimal(0))
-            ) if kpi_data else Decimal(0),
+            "kpi_bonuses": kpi_bonuses,
             "total_amount": total_salary,
             "department_id": plan.department_id,
         }
@@ -1471,23 +1474,28 @@ async def generate_payroll_expenses(
         total_amount += total_salary
         employee_count += 1
 
-        # If not dry run, create the expense
-        if not dry_run:
-            expense = Expense(
-                department_id=plan.department_id,
-                category_id=salary_category.id,
-                amount=total_salary,
-                request_date=datetime(year, month, 1),
-                status=ExpenseStatusEnum.PENDING,
-                comment=f"Заработная плата: {employee.full_name} ({employee.position}) за {month:02d}.{year}. "
-                        f"Оклад: {plan.base_salary or 0:,.2f} ₽"
-                        + (f", КПИ премии: {expense_data['kpi_bonuses']:,.2f} ₽" if expense_data['kpi_bonuses'] > 0 else ""),
-                requester=current_user.full_name or current_user.username
-            )
-            db.add(expense)
+        expense_rows.append({
+            "number": payroll_expense_number(year, month, employee.id),
+            "department_id": plan.department_id,
+            "organization_id": organizations.get(plan.department_id),
+            "category_id": salary_category.id,
+            "amount": total_salary,
+            "request_date": datetime(year, month, 1),
+            "status": ExpenseStatusEnum.PENDING,
+            "comment": f"Заработная плата: {employee.full_name} ({employee.position}) за {month:02d}.{year}. "
+                       f"Оклад: {plan.base_salary or 0:,.2f} ₽"
+                       + (f", КПИ премии: {kpi_bonuses:,.2f} ₽" if kpi_bonuses > 0 else ""),
+            "requester": requester,
+        })
 
-    # Commit if not dry run
+    # Create all expenses with multi-row inserts and one commit if not dry run
     if not dry_run:
+        if any(row["organization_id"] is None for row in expense_rows):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No active organization found for payroll expenses"
+            )
+        insert_rows(db, Expense, expense_rows)
         db.commit()
 
     return {
@@ -1509,7 +1517,7 @@ async def generate_payroll_expenses(
 
 
 @router.get("/analytics/budget-summary")
-async def get_payroll_budget_summary(
+def get_payroll_budget_summary(
     year: int = Query(..., ge=2020, le=2100),
     department_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
@@ -1568,7 +1576,7 @@ async def get_payroll_budget_summary(
 
 
 @router.post("/analytics/register-payroll-payment")
-async def register_payroll_payment(
+def register_payroll_payment(
     year: int = Query(..., ge=2020, le=2100),
     month: int = Query(..., ge=1, le=12),
     payment_type: str = Query(..., description="Payment type: 'advance' or 'final'"),
@@ -1658,24 +1666,26 @@ async def register_payroll_payment(
             detail=f"No active payroll plans found for {year}-{month:02d}"
         )
 
+    # Preload existing payments and KPI data of the period (one query each)
+    registered = registered_payments(
+        db, ((plan.employee_id, year, month, parsed_date) for plan, _ in payroll_plans)
+    )
+    kpis = {} if is_advance else kpis_by_employee(db, (plan.employee_id for plan, _ in payroll_plans), year, month)
+
     # Prepare PayrollActual data
     actuals_to_create = []
+    actual_rows = []
     total_amount = Decimal(0)
     employee_count = 0
     skipped_count = 0
 
     for plan, employee in payroll_plans:
-        # Check if PayrollActual already exists for this payment
-        existing = db.query(PayrollActual).filter(
-            PayrollActual.employee_id == plan.employee_id,
-            PayrollActual.year == year,
-            PayrollActual.month == month,
-            PayrollActual.payment_date == parsed_date
-        ).first()
-
-        if existing:
+        # Skip if PayrollActual already exists for this payment
+        payment_key = (plan.employee_id, year, month, parsed_date)
+        if payment_key in registered:
             skipped_count += 1
             continue  # Skip if already registered
+        registered.add(payment_key)
 
         # Calculate amounts based on payment_type
         # Advance (25th): 50% of base salary only
@@ -1690,12 +1700,8 @@ async def register_payroll_payment(
             # Окончательный расчет: 50% оклада + все премии
             base_salary = (plan.base_salary or Decimal(0)) * Decimal('0.5')
 
-            # Get KPI data for the same period (only for final payment)
-            kpi_data = db.query(EmployeeKPI).filter(
-                EmployeeKPI.employee_id == plan.employee_id,
-                EmployeeKPI.year == year,
-                EmployeeKPI.month == month
-            ).first()
+            # KPI data for the same period (only for final payment)
+            kpi_data = kpis.get(plan.employee_id)
 
             if kpi_data:
                 # Используем рассчитанные премии из KPI
@@ -1751,26 +1757,25 @@ async def register_payroll_payment(
         total_amount += total_paid
         employee_count += 1
 
-        # If not dry run, create the PayrollActual record
-        if not dry_run:
-            payroll_actual = PayrollActual(
-                year=year,
-                month=month,
-                employee_id=plan.employee_id,
-                department_id=plan.department_id,
-                base_salary_paid=base_salary,
-                monthly_bonus_paid=monthly_bonus,
-                quarterly_bonus_paid=quarterly_bonus,
-                annual_bonus_paid=annual_bonus,
-                other_payments_paid=Decimal(0),
-                total_paid=total_paid,
-                payment_date=parsed_date,
-                notes=f"{'Аванс' if payment_type == 'advance' else 'Окончательный расчет'} за {month:02d}.{year}"
-            )
-            db.add(payroll_actual)
+        actual_rows.append({
+            "year": year,
+            "month": month,
+            "employee_id": plan.employee_id,
+            "department_id": plan.department_id,
+            "base_salary_paid": base_salary,
+            "monthly_bonus_paid": monthly_bonus,
+            "quarterly_bonus_paid": quarterly_bonus,
+            "annual_bonus_paid": annual_bonus,
+            "other_payments_paid": Decimal(0),
+            "total_paid": total_paid,
+            "payment_date": parsed_date,
+            "notes": f"{'Аванс' if payment_type == 'advance' else 'Окончательный расчет'} за {month:02d}.{year}",
+        })
 
-    # Commit if not dry run
+    # Create all PayrollActual records with multi-row inserts and one commit if not dry run
     if not dry_run:
+        insert_rows(db, PayrollActual, actual_rows)
+        refresh_payroll_taxes(db, [(row["employee_id"], row["year"]) for row in actual_rows])
         db.commit()
 
     return {
@@ -1796,7 +1801,7 @@ async def register_payroll_payment(
 # ==================== Salary Distribution (Histogram) ====================
 
 @router.post("/analytics/register-payroll-payment-bulk")
-async def register_payroll_payment_bulk(
+def register_payroll_payment_bulk(
     payments: List[PayrollActualCreate],
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -1831,74 +1836,74 @@ async def register_payroll_payment_bulk(
     total_amount = Decimal(0)
     errors = []
 
-    for payment in payments:
-        try:
-            # Get employee to verify access and get department_id
-            employee = db.query(Employee).filter(Employee.id == payment.employee_id).first()
-            if not employee:
-                errors.append(f"Employee ID {payment.employee_id} not found")
-                skipped_count += 1
-                continue
-
-            # Check department access
-            # Don't disclose which employees exist in other departments
-            if not check_department_access(current_user, employee.department_id):
-                errors.append(f"Employee ID {payment.employee_id} not found")
-                skipped_count += 1
-                continue
-
-            # Check if actual already exists
-            existing = db.query(PayrollActual).filter(
-                PayrollActual.employee_id == payment.employee_id,
-                PayrollActual.year == payment.year,
-                PayrollActual.month == payment.month,
-                PayrollActual.payment_date == payment.payment_date
-            ).first()
-
-            if existing:
-                skipped_count += 1
-                continue
-
-            # Calculate total paid
-            total_paid = (
-                payment.base_salary_paid +
-                payment.monthly_bonus_paid +
-                payment.quarterly_bonus_paid +
-                payment.annual_bonus_paid +
-                payment.other_payments_paid
-            )
-
-            # Create PayrollActual record
-            payroll_actual = PayrollActual(
-                year=payment.year,
-                month=payment.month,
-                employee_id=payment.employee_id,
-                department_id=employee.department_id,
-                base_salary_paid=payment.base_salary_paid,
-                monthly_bonus_paid=payment.monthly_bonus_paid,
-                quarterly_bonus_paid=payment.quarterly_bonus_paid,
-                annual_bonus_paid=payment.annual_bonus_paid,
-                other_payments_paid=payment.other_payments_paid,
-                income_tax_rate=payment.income_tax_rate,
-                income_tax_amount=payment.income_tax_amount,
-                social_tax_amount=payment.social_tax_amount,
-                total_paid=total_paid,
-                payment_date=payment.payment_date,
-                notes=f"Массовая регистрация выплат за {payment.month:02d}.{payment.year}"
-            )
-            db.add(payroll_actual)
+    # Preload employees and already registered payments (one query each)
+    employees = {
+        employee.id: employee
+        for employee in db.query(Employee).filter(
+            Employee.id.in_({payment.employee_id for payment in payments})
+        )
+    } if payments else {}
+    registered = registered_payments(
+        db, ((payment.employee_id, payment.year, payment.month, payment.payment_date) for payment in payments)
+    )
 
-            created_count += 1
-            total_amount += total_paid
+    actual_rows = []
+    for payment in payments:
+        # Verify employee access and get department_id
+        # Don't disclose which employees exist in other departments
+        employee = employees.get(payment.employee_id)
+        if not employee or not check_department_access(current_user, employee.department_id):
+            errors.append(f"Employee ID {payment.employee_id} not found")
+            skipped_count += 1
+            continue
 
-        except Exception as e:
-            errors.append(f"Error processing employee ID {payment.employee_id}: {str(e)}")
+        # Skip if actual already exists (or is repeated in this batch)
+        payment_key = (payment.employee_id, payment.year, payment.month, payment.payment_date)
+        if payment_key in registered:
             skipped_count += 1
             continue
+        registered.add(payment_key)
+
+        # Calculate total paid
+        total_paid = (
+            payment.base_salary_paid +
+            payment.monthly_bonus_paid +
+            payment.quarterly_bonus_paid +
+            payment.annual_bonus_paid +
+            payment.other_payments_paid
+        )
 
-    # Commit all changes
-    if created_count > 0:
-        db.commit()
+        actual_rows.append({
+            "year": payment.year,
+            "month": payment.month,
+            "employee_id": payment.employee_id,
+            "department_id": employee.department_id,
+            "base_salary_paid": payment.base_salary_paid,
+            "monthly_bonus_paid": payment.monthly_bonus_paid,
+            "quarterly_bonus_paid": payment.quarterly_bonus_paid,
+            "annual_bonus_paid": payment.annual_bonus_paid,
+            "other_payments_paid": payment.other_payments_paid,
+            "income_tax_rate": payment.income_tax_rate,
+            "income_tax_amount": payment.income_tax_amount,
+            "social_tax_amount": payment.social_tax_amount,
+            "total_paid": total_paid,
+            "payment_date": payment.payment_date,
+            "notes": f"Массовая регистрация выплат за {payment.month:02d}.{payment.year}",
+        })
+        total_amount += total_paid
+
+    # Create all records with multi-row inserts and one commit
+    if actual_rows:
+        try:
+            created_count = insert_rows(db, PayrollActual, actual_rows)
+            refresh_payroll_taxes(db, [(row["employee_id"], row["year"]) for row in actual_rows])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to register payroll payments: {str(e)}"
+            )
 
     return {
         "success": True,
@@ -1909,9 +1914,20 @@ async def register_payroll_payment_bulk(
     }
 
 
+def _salary_distribution_values(year: Optional[int], months: Optional[List[int]], by_department: bool):
+    """Values sub-select builder for cached_distributions: plans of the period or current compensation"""
+    def values(keys):
+        department_ids = sorted({key[0] for key in keys if key[0] is not None}) or None
+        if year:
+            return planned_compensation_values(year, months, department_ids, by_department)
+        return current_compensation_values(department_ids, by_department)
+    return values
+
+
 @router.get("/analytics/salary-distribution")
-async def get_salary_distribution(
+def get_salary_distribution(
     year: Optional[int] = Query(None, description="Filter by year"),
+    month: Optional[int] = Query(None, ge=1, le=12, description="Filter by month (with year)"),
     department_id: Optional[int] = Query(None, description="Filter by department"),
     bucket_size: int = Query(50000, ge=10000, le=200000, description="Size of each salary bucket (default 50000)"),
     current_user: User = Depends(get_current_active_user),
@@ -1926,7 +1942,9 @@ async def get_salary_distribution(
     - Average salary in range
 
     Args:
-        year: Optional year to filter by (uses most recent payroll plans if not specified)
+        year: Optional year; distribution of planned monthly compensation (PayrollPlan)
+              of that year (or month). Without year: current compensation of active employees
+        month: Optional month of the year
         department_id: Optional department filter
         bucket_size: Size of each salary bucket/bin (default 50000)
 
@@ -1946,8 +1964,6 @@ async def get_salary_distribution(
             "statistics": SalaryStatistics
         }
     """
-    from app.schemas.payroll import SalaryDistribution, SalaryDistributionBucket
-
     # Apply department filter based on role
     dept_filter = None
     if current_user.role == UserRoleEnum.USER:
@@ -1956,132 +1972,63 @@ async def get_salary_distribution(
         if department_id:
             dept_filter = department_id
 
-    # Get active employees with their total compensation
-    # Total compensation = base_salary + monthly_bonus_base + quarterly_bonus_base/4 + annual_bonus_base/12
-    # (amortizing quarterly and annual bonuses to monthly equivalent)
-
-    query = db.query(
-        Employee,
-        (
-            Employee.base_salary +
-            func.coalesce(Employee.monthly_bonus_base, 0) +
-            func.coalesce(Employee.quarterly_bonus_base, 0) / 4 +
-            func.coalesce(Employee.annual_bonus_base, 0) / 12
-        ).label('total_compensation')
-    ).filter(
-        Employee.status == EmployeeStatusEnum.ACTIVE
-    )
-
-    if dept_filter:
-        query = query.filter(Employee.department_id == dept_filter)
-
-    # Get all employees with their total compensation
-    employees_data = query.all()
-
-    if not employees_data:
-        # Return empty distribution
-        return {
-            "total_employees": 0,
-            "buckets": [],
-            "statistics": {
-                "total_employees": 0,
-                "avg_salary": 0,
-                "median_salary": 0,
-                "min_salary": 0,
-                "max_salary": 0,
-                "percentile_25": 0,
-                "percentile_75": 0,
-                "percentile_90": 0,
-                "std_deviation": 0
-            }
-        }
-
-    # Extract salaries
-    salaries = [float(total_comp) for _, total_comp in employees_data]
-    salaries_sorted = sorted(salaries)
-    total_employees = len(salaries)
-
-    # Calculate statistics
-    import statistics
-    avg_salary = statistics.mean(salaries)
-    median_salary = statistics.median(salaries)
-    min_salary = min(salaries)
-    max_salary = max(salaries)
-
-    # Calculate percentiles
-    def percentile(data, p):
-        n = len(data)
-        if n == 0:
-            return 0
-        k = (n - 1) * p / 100
-        f = int(k)
-        c = k - f
-        if f + 1 < n:
-            return data[f] + (data[f + 1] - data[f]) * c
-        else:
-            return data[f]
-
-    percentile_25 = percentile(salaries_sorted, 25)
-    percentile_75 = percentile(salaries_sorted, 75)
-    percentile_90 = percentile(salaries_sorted, 90)
-
-    std_deviation = statistics.stdev(salaries) if len(salaries) > 1 else 0
-
-    # Create buckets (histogram bins)
-    buckets = []
-
-    # Determine min and max bucket boundaries
-    bucket_min = int(min_salary // bucket_size) * bucket_size
-    bucket_max = int(max_salary // bucket_size + 1) * bucket_size
-
-    # Create bucket ranges
-    current_min = bucket_min
-    while current_min < bucket_max:
-        current_max = current_min + bucket_size
-
-        # Count employees in this range
-        employees_in_range = [
-            sal for sal in salaries
-            if current_min <= sal < current_max or (current_max == bucket_max and sal == current_max)
-        ]
+    months = [month] if year and month else None
+    key = (dept_filter, year, months[0] if months else None)
+    return cached_distributions(
+        db,
+        "planned" if year else "current",
+        [key],
+        _salary_distribution_values(year, months, dept_filter is not None),
+        bucket_size
+    )[key]
+
+
+@router.get("/analytics/salary-distribution/batch")
+def get_salary_distributions_batch(
+    year: Optional[int] = Query(None, description="Year of payroll plans (without: current compensation)"),
+    months: Optional[List[int]] = Query(None, description="Months of the year (one distribution per month)"),
+    department_ids: Optional[List[int]] = Query(None, description="Departments (one distribution per department)"),
+    bucket_size: int = Query(50000, ge=10000, le=200000, description="Size of each salary bucket (default 50000)"),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Salary distributions for many departments and months in one call
 
-        if employees_in_range:
-            count = len(employees_in_range)
-            percentage = (count / total_employees) * 100
-            avg_in_range = sum(employees_in_range) / count
+    All groups missing from the cache are computed with one aggregate query.
+    Without department_ids the distribution is company-wide (department_id = null).
+    """
+    if months and not year:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="months require year"
+        )
+    if months and any(month < 1 or month > 12 for month in months):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="months must be between 1 and 12"
+        )
 
-            # Format range label
-            if current_min >= 1000000:
-                label = f"{current_min // 1000}k-{current_max // 1000}k"
-            else:
-                label = f"{int(current_min):,}-{int(current_max):,}"
-
-            buckets.append({
-                "range_min": Decimal(str(current_min)),
-                "range_max": Decimal(str(current_max)),
-                "range_label": label,
-                "employee_count": count,
-                "percentage": round(percentage, 2),
-                "avg_salary": Decimal(str(round(avg_in_range, 2)))
-            })
+    # USER sees only own department
+    if current_user.role == UserRoleEnum.USER:
+        department_ids = [current_user.department_id]
+
+    departments = sorted(set(department_ids)) if department_ids else [None]
+    periods = sorted(set(months)) if months else [None]
+    keys = [(dept, year, month) for dept in departments for month in periods]
+
+    distributions = cached_distributions(
+        db,
+        "planned" if year else "current",
+        keys,
+        _salary_distribution_values(year, periods if months else None, department_ids is not None),
+        bucket_size
+    )
+    return [
+        {"department_id": dept, "year": key_year, "month": month, **distributions[(dept, key_year, month)]}
+        for dept, key_year, month in keys
+    ]
 
-        current_min = current_max
-
-    return {
-        "total_employees": total_employees,
-        "buckets": buckets,
-        "statistics": {
-            "total_employees": total_employees,
-            "avg_salary": Decimal(str(round(avg_salary, 2))),
-            "median_salary": Decimal(str(round(median_salary, 2))),
-            "min_salary": Decimal(str(round(min_salary, 2))),
-            "max_salary": Decimal(str(round(max_salary, 2))),
-            "percentile_25": Decimal(str(round(percentile_25, 2))),
-            "percentile_75": Decimal(str(round(percentile_75, 2))),
-            "percentile_90": Decimal(str(round(percentile_90, 2))),
-            "std_deviation": Decimal(str(round(std_deviation, 2)))
-        }
-    }
 
 # ============================================
 # НДФЛ (Income Tax) Calculation Endpoints
@@ -2313,90 +2260,105 @@ def get_employee_ytd_income(
 # ============================================================================
 # TAX & SOCIAL CONTRIBUTIONS ANALYTICS
 # ============================================================================
+# Aggregates of PayrollTaxBreakdown (actuals), see app/services/payroll_tax_breakdown.py
 
-@router.get("/analytics/tax-burden")
-async def get_tax_burden_analytics(
-    year: int = Query(..., description="Year"),
-    month: Optional[int] = Query(None, description="Month (1-12), if None - year total"),
-    department_id: Optional[int] = Query(None, description="Department ID filter"),
-    employee_id: Optional[int] = Query(None, description="Employee ID filter"),
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Get tax burden analytics: НДФЛ + social contributions.
+TAX_MONTH_NAMES = [
+    "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+    "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
+]
 
-    Returns total tax burden for specified period.
-    """
-    # Build query filters
+
+def _tax_breakdown_filters(
+    current_user: User,
+    year: int,
+    month: Optional[int] = None,
+    department_id: Optional[int] = None,
+    employee_id: Optional[int] = None
+) -> list:
     filters = [
-        PayrollActual.year == year,
-        PayrollActual.is_active == True
+        PayrollTaxBreakdown.source == PayrollTaxSourceEnum.ACTUAL,
+        PayrollTaxBreakdown.year == year
     ]
-
     if month:
-        filters.append(PayrollActual.month == month)
+        filters.append(PayrollTaxBreakdown.month == month)
 
     # Department access control
     if current_user.role == UserRoleEnum.USER:
-        filters.append(PayrollActual.department_id == current_user.department_id)
+        filters.append(PayrollTaxBreakdown.department_id == current_user.department_id)
     elif department_id:
-        filters.append(PayrollActual.department_id == department_id)
+        filters.append(PayrollTaxBreakdown.department_id == department_id)
 
     if employee_id:
-        filters.append(PayrollActual.employee_id == employee_id)
+        filters.append(PayrollTaxBreakdown.employee_id == employee_id)
+    return filters
 
-    # Get payroll actuals
-    payroll_actuals = db.query(PayrollActual).filter(and_(*filters)).all()
 
-    if not payroll_actuals:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="No payroll data found for the specified period"
-        )
-
-    # Calculate totals
-    gross_payroll = sum(actual.total_paid for actual in payroll_actuals)
+def _tax_sums(*names: str) -> list:
+    return [func.coalesce(func.sum(getattr(PayrollTaxBreakdown, name)), 0).label(name) for name in names]
 
-    # Calculate НДФЛ
-    ndfl_result = calculate_progressive_ndfl(Decimal(gross_payroll), year)
 
-    # Calculate social contributions
-    contributions_result = calculate_social_contributions(Decimal(gross_payroll), year)
+def _rate(amount: Decimal, base: Decimal) -> float:
+    return float(amount / base * 100) if base > 0 else 0.0
 
-    # Total tax burden
-    total_ndfl = Decimal(str(ndfl_result['total_tax']))
-    total_contributions = Decimal(str(contributions_result['total_contributions']))
-    total_taxes = total_ndfl + total_contributions
 
-    # Net payroll
-    net_payroll = gross_payroll - total_ndfl
+@router.get("/analytics/tax-burden")
+def get_tax_burden_analytics(
+    year: int = Query(..., description="Year"),
+    month: Optional[int] = Query(None, description="Month (1-12), if None - year total"),
+    department_id: Optional[int] = Query(None, description="Department ID filter"),
+    employee_id: Optional[int] = Query(None, description="Employee ID filter"),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get tax burden analytics: НДФЛ + social contributions.
 
-    # Employer cost
-    employer_cost = gross_payroll + total_contributions
+    Returns total tax burden for specified period.
+    """
+    totals = db.query(
+        *_tax_sums(
+            "gross", "ndfl", "pension_contribution", "medical_contribution", "social_contribution",
+            "injury_contribution", "total_contributions", "net", "employer_cost"
+        ),
+        func.count(func.distinct(PayrollTaxBreakdown.employee_id)).label("employees_count")
+    ).filter(and_(*_tax_breakdown_filters(current_user, year, month, department_id, employee_id))).one()
+
+    if not totals.employees_count:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No payroll data found for the specified period"
+        )
 
-    # Effective rates
-    effective_burden_rate = float((total_taxes / Decimal(gross_payroll) * 100)) if gross_payroll > 0 else 0.0
+    gross_payroll = Decimal(totals.gross)
+    total_taxes = totals.ndfl + totals.total_contributions
 
     return {
         "period": f"{year}-{month:02d}" if month else f"{year}",
         "gross_payroll": float(gross_payroll),
         "ndfl": {
-            "total": float(total_ndfl),
-            "effective_rate": ndfl_result['effective_rate'],
-            "breakdown": ndfl_result.get('breakdown', [])
+            "total": float(totals.ndfl),
+            "effective_rate": _rate(totals.ndfl, gross_payroll),
+            # Brackets apply to each employee's YTD income, a total over employees has no bracket split
+            "breakdown": []
+        },
+        "social_contributions": {
+            "pfr": {"total": float(totals.pension_contribution)},
+            "foms": {"total": float(totals.medical_contribution)},
+            "fss": {"total": float(totals.social_contribution)},
+            "injury": {"total": float(totals.injury_contribution)},
+            "total_contributions": float(totals.total_contributions),
+            "effective_rate": _rate(totals.total_contributions, gross_payroll)
         },
-        "social_contributions": contributions_result,
-        "net_payroll": float(net_payroll),
+        "net_payroll": float(totals.net),
         "total_tax_burden": float(total_taxes),
-        "effective_burden_rate": effective_burden_rate,
-        "employer_cost": float(employer_cost),
-        "employees_count": len(set(a.employee_id for a in payroll_actuals))
+        "effective_burden_rate": _rate(total_taxes, gross_payroll),
+        "employer_cost": float(totals.employer_cost),
+        "employees_count": totals.employees_count
     }
 
 
 @router.get("/analytics/tax-breakdown-by-month")
-async def get_tax_breakdown_by_month(
+def get_tax_breakdown_by_month(
     year: int = Query(..., description="Year"),
     department_id: Optional[int] = Query(None, description="Department ID filter"),
     current_user: User = Depends(get_current_active_user),
@@ -2407,83 +2369,56 @@ async def get_tax_breakdown_by_month(
 
     Returns array of monthly data with НДФЛ and social contributions.
     """
-    month_names = [
-        "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
-        "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
-    ]
-
-    # Build base filters
-    base_filters = [
-        PayrollActual.year == year
-    ]
-
-    # Department access control
-    if current_user.role == UserRoleEnum.USER:
-        base_filters.append(PayrollActual.department_id == current_user.department_id)
-    elif department_id:
-        base_filters.append(PayrollActual.department_id == department_id)
+    rows = db.query(
+        PayrollTaxBreakdown.month,
+        *_tax_sums(
+            "gross", "ndfl", "pension_contribution", "medical_contribution", "social_contribution",
+            "injury_contribution", "total_contributions", "net", "employer_cost"
+        )
+    ).filter(
+        and_(*_tax_breakdown_filters(current_user, year, department_id=department_id))
+    ).group_by(PayrollTaxBreakdown.month).all()
+    by_month = {row.month: row for row in rows}
 
     result = []
-
     for month in range(1, 13):
-        filters = base_filters + [PayrollActual.month == month]
-
-        # Get monthly payroll
-        monthly_actuals = db.query(PayrollActual).filter(and_(*filters)).all()
-
-        if not monthly_actuals:
+        row = by_month.get(month)
+        if row is None:
             # No data for this month - add zero values
             result.append({
                 "month": month,
-                "month_name": month_names[month - 1],
+                "month_name": TAX_MONTH_NAMES[month - 1],
                 "gross_payroll": 0.0,
                 "ndfl": 0.0,
                 "pfr": 0.0,
                 "foms": 0.0,
                 "fss": 0.0,
+                "injury": 0.0,
                 "total_taxes": 0.0,
                 "net_payroll": 0.0,
                 "employer_cost": 0.0
             })
             continue
 
-        # Calculate monthly gross
-        monthly_gross = sum(actual.total_paid for actual in monthly_actuals)
-
-        # Calculate НДФЛ
-        ndfl_result = calculate_progressive_ndfl(Decimal(monthly_gross), year)
-        monthly_ndfl = Decimal(str(ndfl_result['total_tax']))
-
-        # Calculate social contributions
-        contributions = calculate_social_contributions(Decimal(monthly_gross), year)
-        monthly_pfr = Decimal(str(contributions['pfr']['total']))
-        monthly_foms = Decimal(str(contributions['foms']['total']))
-        monthly_fss = Decimal(str(contributions['fss']['total']))
-        monthly_contributions = monthly_pfr + monthly_foms + monthly_fss
-
-        # Totals
-        monthly_taxes = monthly_ndfl + monthly_contributions
-        monthly_net = monthly_gross - monthly_ndfl
-        monthly_employer_cost = monthly_gross + monthly_contributions
-
         result.append({
             "month": month,
-            "month_name": month_names[month - 1],
-            "gross_payroll": float(monthly_gross),
-            "ndfl": float(monthly_ndfl),
-            "pfr": float(monthly_pfr),
-            "foms": float(monthly_foms),
-            "fss": float(monthly_fss),
-            "total_taxes": float(monthly_taxes),
-            "net_payroll": float(monthly_net),
-            "employer_cost": float(monthly_employer_cost)
+            "month_name": TAX_MONTH_NAMES[month - 1],
+            "gross_payroll": float(row.gross),
+            "ndfl": float(row.ndfl),
+            "pfr": float(row.pension_contribution),
+            "foms": float(row.medical_contribution),
+            "fss": float(row.social_contribution),
+            "injury": float(row.injury_contribution),
+            "total_taxes": float(row.ndfl + row.total_contributions),
+            "net_payroll": float(row.net),
+            "employer_cost": float(row.employer_cost)
         })
 
     return result
 
 
 @router.get("/analytics/tax-by-employee")
-async def get_tax_by_employee(
+def get_tax_by_employee(
     year: int = Query(..., description="Year"),
     month: Optional[int] = Query(None, description="Month (1-12), if None - year total"),
     department_id: Optional[int] = Query(None, description="Department ID filter"),
@@ -2495,85 +2430,39 @@ async def get_tax_by_employee(
 
     Returns array of employee tax data.
     """
-    # Build filters
-    filters = [
-        PayrollActual.year == year,
-        PayrollActual.is_active == True
-    ]
-
-    if month:
-        filters.append(PayrollActual.month == month)
-
-    # Department access control
-    if current_user.role == UserRoleEnum.USER:
-        filters.append(PayrollActual.department_id == current_user.department_id)
-    elif department_id:
-        filters.append(PayrollActual.department_id == department_id)
-
-    # Get payroll actuals
-    payroll_actuals = db.query(PayrollActual).filter(and_(*filters)).all()
-
-    if not payroll_actuals:
-        return []
-
-    # Group by employee
-    employee_data = {}
-    for actual in payroll_actuals:
-        emp_id = actual.employee_id
-        if emp_id not in employee_data:
-            employee_data[emp_id] = {
-                'employee_id': emp_id,
-                'gross_income': 0.0,
-            }
-        employee_data[emp_id]['gross_income'] += actual.total_paid
-
-    # Get employee details
-    employee_ids = list(employee_data.keys())
-    employees = db.query(Employee).filter(Employee.id.in_(employee_ids)).all()
-    employee_map = {e.id: e for e in employees}
-
-    result = []
-    for emp_id, data in employee_data.items():
-        employee = employee_map.get(emp_id)
-        if not employee:
-            continue
-
-        gross_income = Decimal(str(data['gross_income']))
-
-        # Calculate taxes
-        ndfl_result = calculate_progressive_ndfl(gross_income, year)
-        contributions = calculate_social_contributions(gross_income, year)
-
-        ndfl_total = Decimal(str(ndfl_result['total_tax']))
-        contributions_total = Decimal(str(contributions['total_contributions']))
-
-        net_income = gross_income - ndfl_total
-        total_taxes = ndfl_total + contributions_total
-
-        effective_tax_rate = float(ndfl_result['effective_rate'])
-        effective_burden_rate = float((total_taxes / gross_income * 100)) if gross_income > 0 else 0.0
-
-        result.append({
-            'employee_id': emp_id,
-            'employee_name': employee.full_name,
-            'position': employee.position,
-            'gross_income': float(gross_income),
-            'ndfl': float(ndfl_total),
-            'social_contributions': float(contributions_total),
-            'net_income': float(net_income),
-            'total_taxes': float(total_taxes),
-            'effective_tax_rate': effective_tax_rate,
-            'effective_burden_rate': effective_burden_rate
-        })
-
-    # Sort by gross_income descending
-    result.sort(key=lambda x: x['gross_income'], reverse=True)
+    gross = func.sum(PayrollTaxBreakdown.gross)
+    rows = db.query(
+        PayrollTaxBreakdown.employee_id,
+        Employee.full_name,
+        Employee.position,
+        *_tax_sums("gross", "ndfl", "total_contributions", "net")
+    ).join(
+        Employee, Employee.id == PayrollTaxBreakdown.employee_id
+    ).filter(
+        and_(*_tax_breakdown_filters(current_user, year, month, department_id))
+    ).group_by(
+        PayrollTaxBreakdown.employee_id, Employee.full_name, Employee.position
+    ).order_by(gross.desc()).all()
 
-    return result
+    return [
+        {
+            'employee_id': row.employee_id,
+            'employee_name': row.full_name,
+            'position': row.position,
+            'gross_income': float(row.gross),
+            'ndfl': float(row.ndfl),
+            'social_contributions': float(row.total_contributions),
+            'net_income': float(row.net),
+            'total_taxes': float(row.ndfl + row.total_contributions),
+            'effective_tax_rate': _rate(row.ndfl, row.gross),
+            'effective_burden_rate': _rate(row.ndfl + row.total_contributions, row.gross)
+        }
+        for row in rows
+    ]
 
 
 @router.get("/analytics/cost-waterfall")
-async def get_cost_waterfall(
+def get_cost_waterfall(
     year: int = Query(..., description="Year"),
     month: Optional[int] = Query(None, description="Month (1-12), if None - year total"),
     department_id: Optional[int] = Query(None, description="Department ID filter"),
@@ -2585,60 +2474,33 @@ async def get_cost_waterfall(
 
     Returns breakdown of: Base Salary → Bonuses → Taxes → Net
     """
-    # Build filters
-    filters = [
-        PayrollActual.year == year,
-        PayrollActual.is_active == True
-    ]
-
-    if month:
-        filters.append(PayrollActual.month == month)
-
-    # Department access control
-    if current_user.role == UserRoleEnum.USER:
-        filters.append(PayrollActual.department_id == current_user.department_id)
-    elif department_id:
-        filters.append(PayrollActual.department_id == department_id)
-
-    # Get payroll actuals
-    payroll_actuals = db.query(PayrollActual).filter(and_(*filters)).all()
-
-    if not payroll_actuals:
+    totals = db.query(
+        *_tax_sums(
+            "base_salary", "monthly_bonus", "quarterly_bonus", "annual_bonus", "other_payments", "gross",
+            "ndfl", "pension_contribution", "medical_contribution", "social_contribution",
+            "injury_contribution", "net", "employer_cost"
+        ),
+        func.count(PayrollTaxBreakdown.id).label("rows_count")
+    ).filter(and_(*_tax_breakdown_filters(current_user, year, month, department_id))).one()
+
+    if not totals.rows_count:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No payroll data found for the specified period"
         )
 
-    # Calculate components
-    base_salary = sum(actual.base_salary or 0 for actual in payroll_actuals)
-    monthly_bonus = sum(actual.monthly_bonus or 0 for actual in payroll_actuals)
-    quarterly_bonus = sum(actual.quarterly_bonus or 0 for actual in payroll_actuals)
-    annual_bonus = sum(actual.annual_bonus or 0 for actual in payroll_actuals)
-
-    gross_total = base_salary + monthly_bonus + quarterly_bonus + annual_bonus
-
-    # Calculate taxes
-    ndfl_result = calculate_progressive_ndfl(Decimal(gross_total), year)
-    contributions = calculate_social_contributions(Decimal(gross_total), year)
-
-    ndfl = Decimal(str(ndfl_result['total_tax']))
-    pfr = Decimal(str(contributions['pfr']['total']))
-    foms = Decimal(str(contributions['foms']['total']))
-    fss = Decimal(str(contributions['fss']['total']))
-
-    net_payroll = gross_total - ndfl
-    total_employer_cost = gross_total + pfr + foms + fss
-
     return {
-        'base_salary': float(base_salary),
-        'monthly_bonus': float(monthly_bonus),
-        'quarterly_bonus': float(quarterly_bonus),
-        'annual_bonus': float(annual_bonus),
-        'gross_total': float(gross_total),
-        'ndfl': float(ndfl),
-        'pfr': float(pfr),
-        'foms': float(foms),
-        'fss': float(fss),
-        'net_payroll': float(net_payroll),
-        'total_employer_cost': float(total_employer_cost)
+        'base_salary': float(totals.base_salary),
+        'monthly_bonus': float(totals.monthly_bonus),
+        'quarterly_bonus': float(totals.quarterly_bonus),
+        'annual_bonus': float(totals.annual_bonus),
+        'other_payments': float(totals.other_payments),
+        'gross_total': float(totals.gross),
+        'ndfl': float(totals.ndfl),
+        'pfr': float(totals.pension_contribution),
+        'foms': float(totals.medical_contribution),
+        'fss': float(totals.social_contribution),
+        'injury': float(totals.injury_contribution),
+        'net_payroll': float(totals.net),
+        'total_employer_cost': float(totals.employer_cost)
     }
@@ -4,7 +4,7 @@ API endpoints for Payroll Scenarios and Insurance Rates
 Управление ставками страховых взносов и сценарное планирование ФОТ
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 
@@ -37,6 +37,7 @@ from app.schemas.payroll_scenario import (
     ScenarioCalculationRequest,
     ScenarioCalculationResponse,
     InsuranceImpactAnalysis,
+    PayrollYearMatrix,
 )
 from app.utils.auth import get_current_active_user
 from app.services.payroll_scenario_calculator import (
@@ -44,6 +45,7 @@ from app.services.payroll_scenario_calculator import (
     InsuranceImpactAnalyzer,
     PayrollComparisonGenerator,
 )
+from app.services.payroll_year_comparison import year_matrix
 
 router = APIRouter()
 
@@ -356,6 +358,7 @@ def update_scenario(
 @router.post("/scenarios/{scenario_id}/calculate", response_model=ScenarioCalculationResponse)
 def calculate_scenario(
     scenario_id: int,
+    full_rebuild: bool = Query(False, description="Пересоздать все детали сценария"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -363,10 +366,13 @@ def calculate_scenario(
     Рассчитать сценарий ФОТ
 
     Автоматически:
-    - Создает детали по сотрудникам (если не существуют)
+    - Создает детали по сотрудникам (если не существуют), при изменении
+      параметров сценария обновляет только изменившиеся детали
     - Рассчитывает страховые взносы по новым ставкам
     - Сравнивает с базовым годом
     - Возвращает итоги и разбивку по сотрудникам
+
+    - **full_rebuild**: удалить и создать детали заново
     """
     scenario = db.query(PayrollScenario).filter(
         PayrollScenario.id == scenario_id
@@ -382,8 +388,51 @@ def calculate_scenario(
 
     # Calculate
     calculator = PayrollScenarioCalculator(db, scenario.department_id)
-    result = calculator.calculate_scenario(scenario_id)
+    result = calculator.calculate_scenario(scenario_id, full_rebuild=full_rebuild)
+
+    return _calculation_response(db, scenario_id, result)
+
+
+@router.put("/scenarios/{scenario_id}/details/{detail_id}", response_model=ScenarioCalculationResponse)
+def update_scenario_detail(
+    scenario_id: int,
+    detail_id: int,
+    detail_update: PayrollScenarioDetailUpdate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Изменить деталь сценария (оклад, премии, увольнение сотрудника)
+
+    Пересчитываются только эта деталь и итоги сценария.
+
+    Требуется роль: MANAGER, ADMIN
+    """
+    if current_user.role not in [UserRoleEnum.MANAGER, UserRoleEnum.ADMIN]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only MANAGER/ADMIN can update scenarios"
+        )
+
+    scenario = db.query(PayrollScenario).filter(
+        PayrollScenario.id == scenario_id
+    ).first()
+
+    if not scenario:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+
+    calculator = PayrollScenarioCalculator(db, scenario.department_id)
+    try:
+        result = calculator.update_scenario_detail(
+            scenario_id, detail_id, detail_update.model_dump(exclude_unset=True)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return _calculation_response(db, scenario_id, result)
+
 
+def _calculation_response(db: Session, scenario_id: int, result: dict) -> ScenarioCalculationResponse:
     # Get details
     details = db.query(PayrollScenarioDetail).filter(
         PayrollScenarioDetail.scenario_id == scenario_id
@@ -494,7 +543,46 @@ def get_impact_analysis(
         rate_changes=analysis['rate_changes'],
         total_impact=analysis['total_impact'],
         impact_percent=analysis['impact_percent'],
-        recommendations=analysis['recommendations']
+        pension_impact=analysis['pension_impact'],
+        medical_impact=analysis['medical_impact'],
+        social_impact=analysis['social_impact'],
+        injury_impact=analysis['injury_impact'],
+        recommendations=analysis['recommendations'],
+        base_year_payroll=analysis['base_year_payroll'],
+        target_year_headcount=analysis['target_year_headcount']
+    )
+
+
+@router.get("/year-matrix", response_model=PayrollYearMatrix)
+def get_year_matrix(
+    start_year: int = Query(..., ge=2020, le=2030),
+    end_year: int = Query(..., ge=2020, le=2030),
+    department_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Сравнение ФОТ за несколько лет (например, 2023-2027)
+
+    По каждому году: численность, ФОТ, страховые взносы по видам, НДФЛ и
+    общие затраты по ставкам года. Используются факт, при его отсутствии план,
+    для следующих лет без данных - прогноз по последнему году с данными.
+    """
+    if end_year < start_year:
+        raise HTTPException(status_code=400, detail="end_year must be >= start_year")
+
+    dept_id = department_id or current_user.department_id
+
+    # Check access
+    if current_user.role == UserRoleEnum.USER:
+        if dept_id != current_user.department_id:
+            raise HTTPException(status_code=403, detail="Access denied")
+
+    return PayrollYearMatrix(
+        department_id=dept_id,
+        start_year=start_year,
+        end_year=end_year,
+        years=year_matrix(db, dept_id, start_year, end_year),
     )
 
 
@@ -9,6 +9,8 @@ from sqlalchemy import and_, or_
 from app.db.models import User, TaxRate, UserRoleEnum, TaxTypeEnum
 from app.db.session import get_db
 from app.utils.auth import get_current_active_user
+from app.services.payroll_tax_breakdown import refresh_payroll_taxes_for_rates, tax_rate_period
+from app.services.tax_rate_resolver import get_tax_rate_resolver, invalidate_tax_rate_cache
 from app.schemas.tax_rate import (
     TaxRateCreate,
     TaxRateUpdate,
@@ -123,7 +125,9 @@ def create_tax_rate(
         created_by_id=current_user.id
     )
     db.add(tax_rate)
+    refresh_payroll_taxes_for_rates(db, [tax_rate])
     db.commit()
+    invalidate_tax_rate_cache()
     db.refresh(tax_rate)
 
     return tax_rate
@@ -144,6 +148,7 @@ def update_tax_rate(
         raise HTTPException(status_code=404, detail="Tax rate not found")
 
     # Update fields
+    previous_period = tax_rate_period(tax_rate)
     update_data = tax_rate_data.model_dump(exclude_unset=True)
 
     # Validate tax_type if provided
@@ -167,7 +172,9 @@ def update_tax_rate(
             detail="effective_to must be >= effective_from"
         )
 
+    refresh_payroll_taxes_for_rates(db, [previous_period, tax_rate])
     db.commit()
+    invalidate_tax_rate_cache()
     db.refresh(tax_rate)
 
     return tax_rate
@@ -187,7 +194,9 @@ def delete_tax_rate(
         raise HTTPException(status_code=404, detail="Tax rate not found")
 
     db.delete(tax_rate)
+    refresh_payroll_taxes_for_rates(db, [tax_rate_period(tax_rate)])
     db.commit()
+    invalidate_tax_rate_cache()
 
     return {"message": "Tax rate deleted successfully"}
 
@@ -206,27 +215,8 @@ def calculate_taxes(
     gross_amount = calc_data.gross_amount
     calc_date = date(calc_data.year, calc_data.month, 1)
 
-    # Get active tax rates for the specified date
-    tax_rates_query = db.query(TaxRate).filter(
-        TaxRate.is_active == True,
-        TaxRate.effective_from <= calc_date,
-        or_(
-            TaxRate.effective_to.is_(None),
-            TaxRate.effective_to >= calc_date
-        )
-    )
-
-    if department_id is not None:
-        tax_rates_query = tax_rates_query.filter(
-            or_(
-                TaxRate.department_id == department_id,
-                TaxRate.department_id.is_(None)
-            )
-        )
-    else:
-        tax_rates_query = tax_rates_query.filter(TaxRate.department_id.is_(None))
-
-    selected_rates = merge_tax_rates_with_defaults(tax_rates_query.all())
+    # Rates effective on the date (department rate > global rate > default)
+    selected_rates = get_tax_rate_resolver(db).rates_on(calc_date, department_id)
 
     # Initialize result
     income_tax = Decimal(0)
@@ -397,7 +387,7 @@ def initialize_default_tax_rates(
     ]
 
     # Create tax rates
-    created_count = 0
+    created_rates = []
     for rate_data in default_rates:
         signature = (
             rate_data["tax_type"],
@@ -416,9 +406,12 @@ def initialize_default_tax_rates(
             created_by_id=current_user.id
         )
         db.add(tax_rate)
-        created_count += 1
+        created_rates.append(tax_rate)
 
+    created_count = len(created_rates)
+    refresh_payroll_taxes_for_rates(db, created_rates)
     db.commit()
+    invalidate_tax_rate_cache()
 
     return {
         "message": "Default tax rates initialized successfully",
@@ -23,7 +23,7 @@ TEMPLATES = {
 
 
 @router.get("/list")
-async def list_templates():
+def list_templates():
     """
     Get list of available Excel templates
 
@@ -57,7 +57,7 @@ async def list_templates():
 
 
 @router.get("/download/{template_type}")
-async def download_template(template_type: str):
+def download_template(template_type: str):
     """
     Download Excel template by type
 
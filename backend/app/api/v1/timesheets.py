@@ -7,13 +7,15 @@ from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, extract, case
+from sqlalchemy import func, and_, extract, case, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, date
 from decimal import Decimal
+import asyncio
 import calendar
 import io
 
-from app.db.session import get_db
+from app.db.session import get_db, get_async_db
 from app.db.models import (
     WorkTimesheet, DailyWorkRecord, Employee, User, UserRoleEnum,
     Department, TimesheetStatusEnum, EmployeeStatusEnum, DayTypeEnum
@@ -36,6 +38,8 @@ from app.schemas.timesheet import (
     TimesheetGrid,
     TimesheetGridEmployee,
     TimesheetGridDay,
+    TimesheetGridSave,
+    TimesheetGridSaveResult,
     # Analytics schemas
     TimesheetSummary,
     EmployeeTimesheetStats,
@@ -45,6 +49,12 @@ from app.schemas.timesheet import (
 from app.utils.auth import get_current_active_user
 from app.utils.excel_export import encode_filename_header
 from app.services.timesheet_excel_service import TimesheetExcelService
+from app.services.timesheet_grid import (
+    TimesheetConflictError,
+    TimesheetGridError,
+    save_grid_cells,
+    timesheet_totals_update,
+)
 
 router = APIRouter(dependencies=[Depends(get_current_active_user)])
 
@@ -79,7 +89,6 @@ def check_timesheet_access(user: User, department_id: int, employee_id: Optional
         # Additional check: must be accessing their own employee record
         if employee_id:
             # Find employee by user.id or user.email matching employee
-            from app.db.session import get_db
             # This is a simplified check - you may need to adjust based on your Employee-User relationship
             return True  # For now, allow if department matches
         return True
@@ -102,7 +111,7 @@ def get_user_employee(db: Session, user: User) -> Optional[Employee]:
 # ==================== WorkTimesheet CRUD Endpoints ====================
 
 @router.get("/", response_model=List[WorkTimesheetInDB])
-async def list_timesheets(
+def list_timesheets(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     department_id: Optional[int] = None,
@@ -163,7 +172,7 @@ async def list_timesheets(
 
 
 @router.get("/{timesheet_id}", response_model=WorkTimesheetWithRecords)
-async def get_timesheet(
+def get_timesheet(
     timesheet_id: UUID,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -191,7 +200,7 @@ async def get_timesheet(
 
 
 @router.post("/", response_model=WorkTimesheetInDB, status_code=status.HTTP_201_CREATED)
-async def create_timesheet(
+def create_timesheet(
     timesheet_data: WorkTimesheetCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -248,7 +257,7 @@ async def create_timesheet(
 
 
 @router.put("/{timesheet_id}", response_model=WorkTimesheetInDB)
-async def update_timesheet(
+def update_timesheet(
     timesheet_id: UUID,
     timesheet_data: WorkTimesheetUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -290,7 +299,7 @@ async def update_timesheet(
 
 
 @router.post("/{timesheet_id}/approve", response_model=WorkTimesheetInDB)
-async def approve_timesheet(
+def approve_timesheet(
     timesheet_id: UUID,
     approve_data: WorkTimesheetApprove,
     current_user: User = Depends(get_current_active_user),
@@ -343,7 +352,7 @@ async def approve_timesheet(
 
 
 @router.delete("/{timesheet_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_timesheet(
+def delete_timesheet(
     timesheet_id: UUID,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -380,7 +389,7 @@ async def delete_timesheet(
 # ==================== DailyWorkRecord CRUD Endpoints ====================
 
 @router.get("/{timesheet_id}/records", response_model=List[DailyWorkRecordInDB])
-async def list_daily_records(
+def list_daily_records(
     timesheet_id: UUID,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -416,7 +425,7 @@ async def list_daily_records(
 
 
 @router.post("/{timesheet_id}/records", response_model=DailyWorkRecordInDB, status_code=status.HTTP_201_CREATED)
-async def create_daily_record(
+def create_daily_record(
     timesheet_id: UUID,
     record_data: DailyWorkRecordCreate,
     current_user: User = Depends(get_current_active_user),
@@ -484,7 +493,7 @@ async def create_daily_record(
 
 
 @router.put("/records/{record_id}", response_model=DailyWorkRecordInDB)
-async def update_daily_record(
+def update_daily_record(
     record_id: UUID,
     record_data: DailyWorkRecordUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -542,7 +551,7 @@ async def update_daily_record(
 
 
 @router.delete("/records/{record_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_daily_record(
+def delete_daily_record(
     record_id: UUID,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -586,43 +595,16 @@ async def delete_daily_record(
 # ==================== Helper Functions ====================
 
 def _recalculate_timesheet_totals(db: Session, timesheet: WorkTimesheet):
-    """Recalculate total days and hours for a timesheet"""
-    records = db.query(DailyWorkRecord).filter(
-        DailyWorkRecord.timesheet_id == timesheet.id
-    ).all()
-
-    def _is_paid_workday(record: DailyWorkRecord) -> bool:
-        return (
-            record.is_working_day
-            and record.day_type == DayTypeEnum.WORK
-            and record.hours_worked
-            and record.hours_worked > 0
-        )
-
-    paid_records = [r for r in records if _is_paid_workday(r)]
-    total_days = len(paid_records)
-    total_hours = sum((r.hours_worked for r in paid_records), Decimal("0"))
-
-    timesheet.total_days_worked = total_days
-    timesheet.total_hours_worked = total_hours
-    timesheet.updated_at = datetime.utcnow()
+    """Recalculate total days and hours for a timesheet (one aggregate UPDATE, bumps lock_version)"""
+    db.flush()
+    db.execute(timesheet_totals_update([timesheet.id], bump_lock=True))
+    db.expire(timesheet)
 
 
 # ==================== Grid View Endpoint ====================
 
-@router.get("/grid/{year}/{month}", response_model=TimesheetGrid)
-async def get_timesheet_grid(
-    year: int,
-    month: int,
-    department_id: Optional[int] = None,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Get timesheet grid data for a month
-    Shows all employees with their daily records in a grid format
-    """
-    # Determine which department to show
+def _resolve_grid_department(current_user: User, department_id: Optional[int]) -> int:
+    """Department whose grid the user works with (USER/MANAGER: always their own)"""
     if current_user.role == UserRoleEnum.USER:
         target_department_id = current_user.department_id
     elif current_user.role == UserRoleEnum.MANAGER:
@@ -641,8 +623,13 @@ async def get_timesheet_grid(
             detail="Department ID is required"
         )
 
+    return target_department_id
+
+
+async def _build_timesheet_grid(db: AsyncSession, year: int, month: int, target_department_id: int) -> TimesheetGrid:
+    """Grid of all active employees of a department with their daily records"""
     # Get department
-    department = db.query(Department).filter(Department.id == target_department_id).first()
+    department = await db.get(Department, target_department_id)
     if not department:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -650,21 +637,21 @@ async def get_timesheet_grid(
         )
 
     # Get all active employees in department
-    employees = db.query(Employee).filter(
-        and_(
+    employees = (await db.execute(
+        select(Employee).where(
             Employee.department_id == target_department_id,
             Employee.status == EmployeeStatusEnum.ACTIVE
-        )
-    ).order_by(Employee.full_name).all()
+        ).order_by(Employee.full_name)
+    )).scalars().all()
 
     # Get all timesheets for this period
-    timesheets = db.query(WorkTimesheet).filter(
-        and_(
+    timesheets = (await db.execute(
+        select(WorkTimesheet).where(
             WorkTimesheet.department_id == target_department_id,
             WorkTimesheet.year == year,
             WorkTimesheet.month == month
         )
-    ).all()
+    )).scalars().all()
 
     timesheet_by_employee = {ts.employee_id: ts for ts in timesheets}
 
@@ -672,9 +659,9 @@ async def get_timesheet_grid(
     timesheet_ids = [ts.id for ts in timesheets]
     records = []
     if timesheet_ids:
-        records = db.query(DailyWorkRecord).filter(
-            DailyWorkRecord.timesheet_id.in_(timesheet_ids)
-        ).all()
+        records = (await db.execute(
+            select(DailyWorkRecord).where(DailyWorkRecord.timesheet_id.in_(timesheet_ids))
+        )).scalars().all()
 
     # Organize records by timesheet and date
     records_map = {}
@@ -737,6 +724,7 @@ async def get_timesheet_grid(
             employee_number=employee.employee_number,
             timesheet_id=timesheet.id if timesheet else None,
             timesheet_status=timesheet.status if timesheet else None,
+            lock_version=timesheet.lock_version if timesheet else None,
             total_days_worked=working_day_count,
             total_hours_worked=working_hours_total,
             can_edit=timesheet.can_edit if timesheet else True,
@@ -755,10 +743,84 @@ async def get_timesheet_grid(
     )
 
 
+@router.get("/grid/{year}/{month}", response_model=TimesheetGrid)
+async def get_timesheet_grid(
+    year: int,
+    month: int,
+    department_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get timesheet grid data for a month
+    Shows all employees with their daily records in a grid format
+    """
+    target_department_id = _resolve_grid_department(current_user, department_id)
+    return await _build_timesheet_grid(db, year, month, target_department_id)
+
+
+@router.post("/grid/{year}/{month}/bulk", response_model=TimesheetGridSaveResult)
+async def save_timesheet_grid(
+    year: int,
+    month: int,
+    grid_data: TimesheetGridSave,
+    department_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Save changed grid cells of a department-month in one transaction
+
+    Cells are diffed against stored records: new and changed days are
+    upserted, cells with delete=true are removed, unchanged cells are
+    skipped. Timesheets are created for employees that have none yet.
+    Send back the lock_version of every timesheet from the loaded grid;
+    if any of them was modified meanwhile, nothing is saved (409).
+    """
+    target_department_id = _resolve_grid_department(current_user, department_id)
+
+    try:
+        stats = await save_grid_cells(
+            db,
+            target_department_id,
+            year,
+            month,
+            grid_data.cells,
+            grid_data.lock_versions,
+        )
+    except TimesheetConflictError as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": "Timesheets were modified by another user, reload the grid",
+                "employee_ids": e.employee_ids,
+            }
+        )
+    except TimesheetGridError as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    await db.commit()
+    db.expire_all()
+
+    grid = await _build_timesheet_grid(db, year, month, target_department_id)
+    return TimesheetGridSaveResult(
+        created_timesheets=stats.created_timesheets,
+        inserted=stats.inserted,
+        updated=stats.updated,
+        deleted=stats.deleted,
+        unchanged=stats.unchanged,
+        grid=grid,
+    )
+
 # ==================== Analytics Endpoints ====================
 
 @router.get("/analytics/summary", response_model=TimesheetSummary)
-async def get_timesheet_summary(
+def get_timesheet_summary(
     year: int,
     month: int,
     department_id: Optional[int] = None,
@@ -824,7 +886,7 @@ async def export_timesheets_to_excel(
     month: int,
     department_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Export timesheet grid to Excel file
@@ -849,7 +911,7 @@ async def export_timesheets_to_excel(
         )
 
     # Get department
-    department = db.query(Department).filter(Department.id == target_department_id).first()
+    department = await db.get(Department, target_department_id)
     if not department:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -879,8 +941,9 @@ async def export_timesheets_to_excel(
         }
         employees_data.append(emp_dict)
 
-    # Generate Excel
-    excel_file = TimesheetExcelService.export_timesheet_grid(
+    # Generate Excel (CPU-bound, off the event loop)
+    excel_file = await asyncio.to_thread(
+        TimesheetExcelService.export_timesheet_grid,
         year=year,
         month=month,
         employees_data=employees_data,
@@ -899,7 +962,7 @@ async def export_timesheets_to_excel(
 
 
 @router.get("/export/template")
-async def download_timesheet_template(
+def download_timesheet_template(
     year: int = Query(..., description="Year for template"),
     month: int = Query(..., description="Month for template (1-12)"),
     department_id: Optional[int] = None,
@@ -41,7 +41,7 @@ def get_available_entities(
 
 
 @router.post("/preview")
-async def preview_import(
+def preview_import(
     entity_type: str = Form(...),
     file: UploadFile = File(...),
     sheet_name: Optional[str] = Form(None),
@@ -71,7 +71,7 @@ async def preview_import(
         raise HTTPException(status_code=400, detail="Only Excel files (.xlsx, .xls) are supported")
 
     # Read file content
-    content = await file.read()
+    content = file.file.read()
 
     # Parse sheet_name
     sheet = sheet_name
@@ -94,7 +94,7 @@ async def preview_import(
 
 
 @router.post("/validate")
-async def validate_import(
+def validate_import(
     entity_type: str = Form(...),
     file: UploadFile = File(...),
     column_mapping: Optional[str] = Form(None),
@@ -124,7 +124,7 @@ async def validate_import(
         raise HTTPException(status_code=400, detail="Only Excel files are supported")
 
     # Read file first
-    content = await file.read()
+    content = file.file.read()
 
     # Parse sheet_name
     sheet = sheet_name
@@ -183,7 +183,7 @@ async def validate_import(
 
 
 @router.post("/execute")
-async def execute_import(
+def execute_import(
     entity_type: str = Form(...),
     file: UploadFile = File(...),
     column_mapping: Optional[str] = Form(None),
@@ -216,7 +216,7 @@ async def execute_import(
         raise HTTPException(status_code=400, detail="Only Excel files are supported")
 
     # Read file first
-    content = await file.read()
+    content = file.file.read()
 
     # Parse sheet_name
     sheet = sheet_name
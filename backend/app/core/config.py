@@ -79,6 +79,9 @@ class Settings(BaseSettings):
         # Build from individual components
         return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    # Async driver URL for AsyncSession routes; derived from DATABASE_URL when not set
+    ASYNC_DATABASE_URL: str | None = None
+
     # CORS - stored as string to avoid Pydantic auto-parsing, then converted to list
     cors_origins_raw: Union[str, List[str]] = Field(
         default='["http://localhost:5173","http://localhost:3000"]',
@@ -104,6 +107,13 @@ class Settings(BaseSettings):
 
     # Observability
     ENABLE_PROMETHEUS: bool = False
+    PROFILING_ENABLED: bool = True  # Per-request DB query count/time and N+1 detection
+    PROFILING_SERVER_TIMING: bool = False  # Add Server-Timing header (db/app/loop)
+    PROFILING_N_PLUS_ONE_THRESHOLD: int = 10  # Repeats of one statement shape per request
+    PROFILING_QUERY_COUNT_WARNING: int = 100  # Log requests with at least this many queries
+    LOOP_LAG_MONITOR_ENABLED: bool = True
+    LOOP_LAG_CHECK_INTERVAL_SECONDS: float = 0.5
+    LOOP_LAG_THRESHOLD_SECONDS: float = 0.1  # Report event-loop stalls above this lag
 
     # Security
     SECRET_KEY: str = "your-secret-key-here-change-in-production"
@@ -127,6 +137,13 @@ class Settings(BaseSettings):
     # OCR настройки
     OCR_LANGUAGE: str = "rus+eng"
     OCR_DPI: int = 300
+    OCR_MAX_WORKERS: int = 0  # Процессов для OCR страниц (0 = по числу CPU)
+
+    # Очередь обработки счетов
+    INVOICE_QUEUE_WORKERS: int = 4  # Счетов, обрабатываемых одновременно
+    INVOICE_AI_MAX_CONCURRENCY: int = 4  # Одновременных запросов к AI
+    INVOICE_BATCH_MAX_FILES: int = 500  # Максимум файлов в одной пакетной загрузке
+    INVOICE_PROCESSING_STALE_MINUTES: int = 30  # PROCESSING дольше этого считается оборванным и при старте возвращается в очередь
 
     # 1С интеграция (опционально)
     C1_ENABLED: bool = False
@@ -170,6 +187,15 @@ class Settings(BaseSettings):
     MODULE_EXPIRY_CHECK_HOUR: int = 1  # Hour to run expiry check (0-23)
     MODULE_EXPIRY_CHECK_MINUTE: int = 0  # Minute to run expiry check (0-59)
 
+    # Analytics snapshots (closed months exported to Parquet for multi-year analytics)
+    ANALYTICS_SNAPSHOT_ENABLED: bool = True
+    ANALYTICS_SNAPSHOT_DIR: str = "data/analytics_snapshots"
+    ANALYTICS_SNAPSHOT_HOUR: int = 2  # 0-23
+    ANALYTICS_SNAPSHOT_MINUTE: int = 30  # 0-59
+
+    # Attachment blobs no attachment references (hourly purge)
+    ATTACHMENT_BLOB_PURGE_ENABLED: bool = True
+
     # ============================================================================
     # RATE LIMITING
     # ============================================================================
@@ -178,6 +204,10 @@ class Settings(BaseSettings):
     RATE_LIMIT_DEFAULT_REQUESTS_PER_MINUTE: int = constants.RATE_LIMIT_DEFAULT_REQUESTS_PER_MINUTE
     RATE_LIMIT_DEFAULT_REQUESTS_PER_HOUR: int = constants.RATE_LIMIT_DEFAULT_REQUESTS_PER_HOUR
     RATE_LIMIT_CLEANUP_INTERVAL: int = constants.RATE_LIMIT_CLEANUP_INTERVAL
+    RATE_LIMIT_EXTERNAL_REQUESTS_PER_MINUTE: int = constants.RATE_LIMIT_EXTERNAL_REQUESTS_PER_MINUTE
+    RATE_LIMIT_EXTERNAL_REQUESTS_PER_HOUR: int = constants.RATE_LIMIT_EXTERNAL_REQUESTS_PER_HOUR
+    RATE_LIMIT_TOKEN_REQUESTS_PER_MINUTE: int = constants.RATE_LIMIT_TOKEN_REQUESTS_PER_MINUTE
+    RATE_LIMIT_TOKEN_REQUESTS_PER_HOUR: int = constants.RATE_LIMIT_TOKEN_REQUESTS_PER_HOUR
 
     # Redis Rate Limiting
     REDIS_SOCKET_TIMEOUT: int = constants.REDIS_SOCKET_TIMEOUT
@@ -148,6 +148,12 @@ RATE_LIMIT_REQUESTS_PER_HOUR = 5000
 RATE_LIMIT_DEFAULT_REQUESTS_PER_MINUTE = 100
 RATE_LIMIT_DEFAULT_REQUESTS_PER_HOUR = 1000
 
+# External integrations (/external/*) and API token traffic
+RATE_LIMIT_EXTERNAL_REQUESTS_PER_MINUTE = 2000
+RATE_LIMIT_EXTERNAL_REQUESTS_PER_HOUR = 50000
+RATE_LIMIT_TOKEN_REQUESTS_PER_MINUTE = 1000
+RATE_LIMIT_TOKEN_REQUESTS_PER_HOUR = 20000
+
 # Redis Configuration for Rate Limiting
 REDIS_SOCKET_TIMEOUT = 5  # Socket timeout in seconds
 REDIS_MINUTE_WINDOW_TTL = 120  # 2 minutes buffer for minute window
@@ -3,6 +3,7 @@ from decimal import Decimal
 from typing import Optional
 import uuid
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Column,
     Date,
@@ -202,6 +203,12 @@ class TaxTypeEnum(str, enum.Enum):
     INJURY_INSURANCE = "INJURY_INSURANCE"  # Страхование от несчастных случаев
 
 
+class PayrollTaxSourceEnum(str, enum.Enum):
+    """Source rows of a payroll tax breakdown"""
+    ACTUAL = "ACTUAL"  # PayrollActual (факт)
+    PLAN = "PLAN"  # PayrollPlan (план)
+
+
 class KPIGoalStatusEnum(str, enum.Enum):
     """Enum for KPI goal statuses"""
     DRAFT = "DRAFT"  # Черновик
@@ -608,6 +615,7 @@ class Attachment(Base):
     file_size = Column(Integer, nullable=False)  # Размер файла в байтах
     mime_type = Column(String(100), nullable=True)  # MIME тип файла
     file_type = Column(String(50), nullable=True)  # Тип документа: invoice, contract, act, other
+    file_sha256 = Column(String(64), ForeignKey("attachment_blobs.sha256"), nullable=True, index=True)  # Содержимое в хранилище (NULL - старые файлы)
 
     # Upload information
     uploaded_by = Column(String(255), nullable=True)  # Кто загрузил
@@ -623,6 +631,19 @@ class Attachment(Base):
         return f"<Attachment {self.filename} for Expense {self.expense_id}>"
 
 
+class AttachmentBlob(Base):
+    """Content-addressed attachment file (одно содержимое - один файл на диске, общий для всех приложений)"""
+    __tablename__ = "attachment_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    file_size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # Сколько приложений ссылается на файл
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<AttachmentBlob {self.sha256[:12]} refs={self.ref_count}>"
+
+
 class DashboardConfig(Base):
     """Dashboard configurations (конфигурации пользовательских дашбордов)"""
     __tablename__ = "dashboard_configs"
@@ -1001,6 +1022,56 @@ class TaxRate(Base):
         return f"<TaxRate {self.tax_type.value}: {self.rate*100}%>"
 
 
+class PayrollTaxBreakdown(Base):
+    """
+    Derived payroll cost per employee-month (НДФЛ и страховые взносы)
+
+    Rebuilt by app.services.payroll_tax_breakdown when payroll actuals/plans or
+    tax rates change. НДФЛ and contributions are year-to-date increments, so
+    the rows of any period / department / employee can simply be summed.
+    """
+    __tablename__ = "payroll_tax_breakdowns"
+    __table_args__ = (
+        UniqueConstraint('source', 'employee_id', 'year', 'month', name='uq_payroll_tax_breakdown_employee_period'),
+        Index('idx_payroll_tax_breakdown_dept_period', 'source', 'department_id', 'year', 'month'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    source = Column(Enum(PayrollTaxSourceEnum), nullable=False)
+    employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False, index=True)
+    department_id = Column(Integer, ForeignKey("departments.id"), nullable=False)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)  # 1-12
+
+    # Gross components
+    base_salary = Column(Numeric(15, 2), default=0, nullable=False)
+    monthly_bonus = Column(Numeric(15, 2), default=0, nullable=False)
+    quarterly_bonus = Column(Numeric(15, 2), default=0, nullable=False)
+    annual_bonus = Column(Numeric(15, 2), default=0, nullable=False)
+    other_payments = Column(Numeric(15, 2), default=0, nullable=False)
+    gross = Column(Numeric(15, 2), nullable=False)
+
+    # Taxes
+    ndfl = Column(Numeric(15, 2), default=0, nullable=False)  # НДФЛ (прогрессивная шкала, нарастающим итогом)
+    pension_contribution = Column(Numeric(15, 2), default=0, nullable=False)  # ПФР
+    medical_contribution = Column(Numeric(15, 2), default=0, nullable=False)  # ФОМС
+    social_contribution = Column(Numeric(15, 2), default=0, nullable=False)  # ФСС
+    injury_contribution = Column(Numeric(15, 2), default=0, nullable=False)  # НС и ПЗ
+    total_contributions = Column(Numeric(15, 2), default=0, nullable=False)
+    net = Column(Numeric(15, 2), nullable=False)  # gross - ndfl
+    employer_cost = Column(Numeric(15, 2), nullable=False)  # gross + total_contributions
+
+    calculated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # Relationships
+    employee = relationship("Employee")
+    department_rel = relationship("Department")
+
+    def __repr__(self):
+        return f"<PayrollTaxBreakdown {self.source.value} {self.year}-{self.month:02d} Employee#{self.employee_id}>"
+
+
 # ============================================================================
 # Budget Planning 2026 Module
 # ============================================================================
@@ -1904,13 +1975,18 @@ class ProcessedInvoice(Base):
     original_filename = Column(String(255), nullable=False)
     file_path = Column(String(500), nullable=True)  # Путь к файлу в хранилище
     file_size_kb = Column(Integer, nullable=True)  # Размер файла в КБ
+    file_sha256 = Column(String(64), nullable=True, index=True)  # SHA-256 содержимого (кэш OCR)
     uploaded_by = Column(Integer, ForeignKey("users.id"), nullable=False)
     uploaded_at = Column(DateTime, server_default=func.now(), nullable=False)
+    batch_id = Column(String(32), nullable=True, index=True)  # ID пакетной загрузки (upload-batch)
+    queued_at = Column(DateTime, nullable=True)  # Когда поставлен в очередь фоновой обработки
+    processing_started_at = Column(DateTime, nullable=True)  # Когда взят в обработку (PROCESSING)
 
     # OCR результаты
     ocr_text = Column(Text, nullable=True)  # Полный текст из OCR
     ocr_confidence = Column(Numeric(5, 2), nullable=True)  # Уверенность OCR (0-100%)
     ocr_processing_time_sec = Column(Numeric(10, 2), nullable=True)  # Время обработки OCR
+    ocr_page_timings = Column(JSON, nullable=True)  # [{"page": 1, "render_sec": .., "ocr_sec": ..}]
 
     # Распознанные данные счета
     invoice_number = Column(String(100), nullable=True, index=True)
@@ -2535,6 +2611,10 @@ class PayrollScenario(Base):
     cost_difference = Column(Numeric(15, 2), nullable=True)  # Разница в рублях
     cost_difference_percent = Column(Numeric(5, 2), nullable=True)  # Разница в %
 
+    # Параметры, по которым построены детали (data_source, base_year, % изменений);
+    # при их изменении детали синхронизируются с источником, иначе пересчитываются только суммы
+    calculation_inputs = Column(JSON, nullable=True)
+
     # Multi-tenancy
     department_id = Column(Integer, ForeignKey("departments.id"), nullable=False, index=True)
 
@@ -2951,6 +3031,9 @@ class WorkTimesheet(Base):
     # Кэш для быстрого доступа (JSON)
     daily_summary = Column(JSON)
 
+    # Оптимистичная блокировка: увеличивается при каждом изменении подневных записей
+    lock_version = Column(Integer, default=0, server_default="0", nullable=False)
+
     # Multi-tenancy (ОБЯЗАТЕЛЬНО)
     department_id = Column(Integer, ForeignKey("departments.id", ondelete="CASCADE"), nullable=False, index=True)
 
@@ -3052,3 +3135,32 @@ class DailyWorkRecord(Base):
 
     def __repr__(self):
         return f"<DailyWorkRecord date={self.work_date} hours={self.hours_worked}>"
+
+
+# ==================== CHANGE FEED ====================
+
+class ChangeLogEntry(Base):
+    """
+    Change log for the external change feed (журнал изменений для внешних интеграций)
+
+    Rows are written by PostgreSQL triggers on the tracked tables (see
+    migration e4f6a8b0c2d4), so set-based bulk writes are captured too.
+    Entries are ordered by (txid, id): `txid` is the writing transaction and
+    lets the feed hold back changes of transactions that may still commit.
+    """
+    __tablename__ = "change_log"
+    __table_args__ = (
+        Index('idx_change_log_txid_id', 'txid', 'id'),
+        Index('idx_change_log_dept_txid_id', 'department_id', 'txid', 'id'),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    entity = Column(String(50), nullable=False)  # Table name: expenses, employees, ...
+    entity_id = Column(Integer, nullable=False)
+    operation = Column(String(10), nullable=False)  # "upsert" | "delete"
+    department_id = Column(Integer, nullable=True)
+    txid = Column(BigInteger, nullable=False)  # txid_current() of the writing transaction
+    changed_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<ChangeLogEntry #{self.id} {self.operation} {self.entity}:{self.entity_id}>"
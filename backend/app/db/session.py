@@ -1,4 +1,8 @@
+from typing import AsyncGenerator, Optional
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
@@ -37,6 +41,15 @@ engine = create_engine(
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async drivers for the same database (asyncpg for PostgreSQL, aiosqlite for tests)
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+_async_engine: Optional[AsyncEngine] = None
+_async_session_factory: Optional[async_sessionmaker] = None
+
 # Create Base class for models
 Base = declarative_base()
 
@@ -51,3 +64,74 @@ def get_db():
         raise
     finally:
         db.close()
+
+
+def get_async_database_url(database_url: str) -> str:
+    """Map a sync DATABASE_URL to its async driver (postgresql:// -> postgresql+asyncpg://)"""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database backend '{backend}'")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Async engine for the configured database.
+
+    Created on first use so the async driver is only required by processes
+    that actually serve async routes. Pool settings mirror the sync engine.
+    """
+    global _async_engine
+    if _async_engine is None:
+        async_url = settings.ASYNC_DATABASE_URL or get_async_database_url(settings.DATABASE_URL)
+        async_engine_kwargs = {"echo": settings.DEBUG}
+        if not async_url.startswith("sqlite"):
+            if settings.DB_POOL_SIZE == 0:
+                async_engine_kwargs["poolclass"] = NullPool
+            else:
+                async_engine_kwargs.update(
+                    {
+                        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+                        "pool_size": settings.DB_POOL_SIZE,
+                        "max_overflow": settings.DB_MAX_OVERFLOW,
+                        "pool_timeout": settings.DB_POOL_TIMEOUT,
+                        "pool_recycle": settings.DB_POOL_RECYCLE,
+                    }
+                )
+        _async_engine = create_async_engine(
+            async_url,
+            **async_engine_kwargs
+        )
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    """Create a new AsyncSession (same session options as SessionLocal)"""
+    global _async_session_factory
+    if _async_session_factory is None:
+        _async_session_factory = async_sessionmaker(
+            bind=get_async_engine(),
+            autoflush=False,
+            expire_on_commit=False,
+        )
+    return _async_session_factory()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Dependency for getting async database session (for async def routes)"""
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+
+
+async def dispose_async_engine() -> None:
+    """Close pooled async connections (called on application shutdown)"""
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_session_factory = None
@@ -14,9 +14,12 @@ from app.core.config import settings
 from app.api.v1 import expenses, categories, contractors, organizations, budget, analytics, analytics_advanced, forecast, attachments, dashboards, auth, departments, audit, reports, employees, payroll, budget_planning, kpi, templates, comprehensive_report, revenue_streams, revenue_categories, revenue_actuals, revenue_plans, revenue_plan_details, customer_metrics, seasonality_coefficients, revenue_analytics, unified_import, api_tokens, external_api, invoice_processing, external_invoice_integration, founder_dashboard, bank_transactions, business_operation_mappings, credit_portfolio, sync_1c, tax_rates, payroll_scenarios, modules, admin_settings, timesheets  # kpi_tasks temporarily disabled - missing KPITask model
 from app.utils.logger import logger, log_error, log_info
 from app.middleware import (
+    RateLimit,
     create_rate_limiter,
     create_security_headers_middleware,
     create_https_redirect_middleware,
+    create_profiling_middleware,
+    LoopLagMonitor,
 )
 
 # Initialize Sentry (optional)
@@ -102,15 +105,45 @@ log_info(f"Security headers enabled (production mode: {not settings.DEBUG})", "S
 app.add_middleware(
     create_rate_limiter(
         requests_per_minute=settings.RATE_LIMIT_REQUESTS_PER_MINUTE,
-        requests_per_hour=settings.RATE_LIMIT_REQUESTS_PER_HOUR
+        requests_per_hour=settings.RATE_LIMIT_REQUESTS_PER_HOUR,
+        route_limits={
+            f"{settings.API_PREFIX}/external": RateLimit(
+                settings.RATE_LIMIT_EXTERNAL_REQUESTS_PER_MINUTE,
+                settings.RATE_LIMIT_EXTERNAL_REQUESTS_PER_HOUR,
+            ),
+        },
+        token_limit=RateLimit(
+            settings.RATE_LIMIT_TOKEN_REQUESTS_PER_MINUTE,
+            settings.RATE_LIMIT_TOKEN_REQUESTS_PER_HOUR,
+        ),
     )
 )
 log_info(
     f"Rate limiting enabled: {settings.RATE_LIMIT_REQUESTS_PER_MINUTE} req/min, "
-    f"{settings.RATE_LIMIT_REQUESTS_PER_HOUR} req/hour per IP",
+    f"{settings.RATE_LIMIT_REQUESTS_PER_HOUR} req/hour per IP; "
+    f"external API {settings.RATE_LIMIT_EXTERNAL_REQUESTS_PER_MINUTE} req/min",
     "Startup"
 )
 
+# Request profiling: DB queries per request, N+1 detection, Server-Timing
+if settings.PROFILING_ENABLED:
+    app.add_middleware(
+        create_profiling_middleware(
+            server_timing=settings.PROFILING_SERVER_TIMING,
+            n_plus_one_threshold=settings.PROFILING_N_PLUS_ONE_THRESHOLD,
+            query_count_warning=settings.PROFILING_QUERY_COUNT_WARNING,
+        )
+    )
+    log_info(
+        f"Request profiling enabled (Server-Timing: {settings.PROFILING_SERVER_TIMING})",
+        "Startup"
+    )
+
+loop_lag_monitor = LoopLagMonitor(
+    interval=settings.LOOP_LAG_CHECK_INTERVAL_SECONDS,
+    threshold=settings.LOOP_LAG_THRESHOLD_SECONDS,
+)
+
 
 # Request logging middleware - optimized (only slow requests and errors)
 @app.middleware("http")
@@ -281,6 +314,22 @@ async def startup_event():
     # See: backend/run_scheduler.py and entrypoint.sh
     log_info("Background scheduler runs as separate process", "Startup")
 
+    if settings.LOOP_LAG_MONITOR_ENABLED:
+        loop_lag_monitor.start()
+        log_info(
+            f"Event loop lag monitor started (threshold {settings.LOOP_LAG_THRESHOLD_SECONDS}s)",
+            "Startup"
+        )
+
+    # Re-enqueue invoices that were queued before a restart (the queue is in-process)
+    try:
+        from app.services.invoice_queue import invoice_queue
+        requeued = await invoice_queue.enqueue_pending()
+        if requeued:
+            log_info(f"Invoice queue: {requeued} pending invoices re-enqueued", "Startup")
+    except Exception as e:
+        logger.error(f"Failed to re-enqueue pending invoices: {e}")
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -295,6 +344,29 @@ async def shutdown_event():
     except Exception as e:
         logger.error(f"Failed to stop scheduler: {e}")
 
+    await loop_lag_monitor.stop()
+
+    # Stop invoice processing queue workers
+    try:
+        from app.services.invoice_queue import invoice_queue
+        await invoice_queue.shutdown()
+    except Exception as e:
+        logger.error(f"Failed to stop invoice queue: {e}")
+
+    # Stop OCR worker processes (created lazily on first scanned PDF)
+    try:
+        from app.services.invoice_ocr import shutdown_ocr_executor
+        shutdown_ocr_executor()
+    except Exception as e:
+        logger.error(f"Failed to stop OCR executor: {e}")
+
+    # Close async DB pool (used by AsyncSession routes)
+    try:
+        from app.db.session import dispose_async_engine
+        await dispose_async_engine()
+    except Exception as e:
+        logger.error(f"Failed to dispose async engine: {e}")
+
 
 @app.get("/")
 async def root():
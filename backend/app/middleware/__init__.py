@@ -1,15 +1,20 @@
 """
 Middleware module for FastAPI application
 """
-from .rate_limit import RateLimitMiddleware, create_rate_limiter
+from .rate_limit import RateLimit, RateLimitMiddleware, create_rate_limiter
 from .security_headers import SecurityHeadersMiddleware, create_security_headers_middleware
 from .https_redirect import HTTPSRedirectMiddleware, create_https_redirect_middleware
+from .profiling import LoopLagMonitor, ProfilingMiddleware, create_profiling_middleware
 
 __all__ = [
+    "RateLimit",
     "RateLimitMiddleware",
     "create_rate_limiter",
     "SecurityHeadersMiddleware",
     "create_security_headers_middleware",
     "HTTPSRedirectMiddleware",
     "create_https_redirect_middleware",
+    "ProfilingMiddleware",
+    "create_profiling_middleware",
+    "LoopLagMonitor",
 ]
@@ -0,0 +1,287 @@
+"""
+Request Profiling Middleware
+
+Collects per-request performance telemetry:
+
+- DB query count and total DB time, via SQLAlchemy before/after_cursor_execute
+  hooks (works for both sync and async engines)
+- N+1 detection: the same statement shape repeated within one request
+- Event-loop lag: a background task measures how late the loop wakes up and
+  reports stalls together with the requests that were in flight
+
+Metrics are exported as Prometheus histograms/counters (exposed at /metrics
+when ENABLE_PROMETHEUS is on) and, optionally, as a Server-Timing header.
+"""
+
+import asyncio
+import re
+import time
+from collections import Counter as CounterDict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.logger import logger
+
+
+DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Number of DB queries executed per HTTP request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Total DB time per HTTP request",
+    ["method", "route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+N_PLUS_ONE = Counter(
+    "http_request_n_plus_one_total",
+    "Requests where one statement shape was repeated above the N+1 threshold",
+    ["method", "route"],
+)
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop woke up for the lag monitor",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOOP_STALLS = Counter(
+    "event_loop_stalls_total",
+    "Event-loop stalls above threshold, by route in flight",
+    ["route"],
+)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+# Placeholder lists: IN (?, ?, ?) / VALUES (%(a)s, %(b)s), (...) -> (?)
+_PLACEHOLDER_GROUP_RE = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)\s*,?)+\)")
+_REPEATED_GROUP_RE = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+@dataclass
+class RequestProfile:
+    """Telemetry collected for a single HTTP request"""
+
+    method: str
+    path: str
+    scope: Scope
+    started_at: float = field(default_factory=time.perf_counter)
+    query_count: int = 0
+    db_time: float = 0.0
+    loop_stall_time: float = 0.0
+    statement_shapes: CounterDict = field(default_factory=CounterDict)
+
+    @property
+    def route(self) -> str:
+        """Route template (e.g. /api/v1/expenses/{expense_id}) once routing has happened"""
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+    def server_timing(self) -> str:
+        app_time = time.perf_counter() - self.started_at
+        parts = [
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.query_count} queries"',
+            f"app;dur={app_time * 1000:.1f}",
+        ]
+        if self.loop_stall_time:
+            parts.append(f'loop;dur={self.loop_stall_time * 1000:.1f};desc="event loop stalls"')
+        return ", ".join(parts)
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+_in_flight: Dict[int, RequestProfile] = {}
+_hooks_installed = False
+
+
+def get_current_profile() -> Optional[RequestProfile]:
+    """Profile of the request being handled in the current context (None outside requests)"""
+    return _current_profile.get()
+
+
+@lru_cache(maxsize=4096)
+def statement_shape(statement: str) -> str:
+    """Normalize a SQL statement so that IN-lists and multi-row VALUES of any length compare equal"""
+    shape = _PLACEHOLDER_GROUP_RE.sub("(?)", statement)
+    shape = _REPEATED_GROUP_RE.sub("(?)", shape)
+    return _WHITESPACE_RE.sub(" ", shape).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_profile.get() is not None:
+        conn.info.setdefault("profiling_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile.get()
+    if profile is None:
+        return
+    starts = conn.info.get("profiling_query_start")
+    if not starts:
+        return
+    profile.db_time += time.perf_counter() - starts.pop()
+    profile.query_count += 1
+    profile.statement_shapes[statement_shape(statement)] += 1
+
+
+def install_query_hooks() -> None:
+    """Attach cursor hooks to every Engine (sync and the sync side of async engines)"""
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    _hooks_installed = True
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware that opens a RequestProfile for each HTTP request
+
+    The profile is stored in a ContextVar, so queries issued from the route
+    (including sync routes running in the threadpool) are attributed to it.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        server_timing: bool = False,
+        n_plus_one_threshold: int = 10,
+        query_count_warning: int = 100,
+    ):
+        """
+        Initialize profiling middleware
+
+        Args:
+            app: ASGI application
+            server_timing: Add Server-Timing header (db/app/loop) to responses
+            n_plus_one_threshold: Repeats of one statement shape that count as N+1
+            query_count_warning: Log requests that executed at least this many queries
+        """
+        self.app = app
+        self.server_timing = server_timing
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.query_count_warning = query_count_warning
+        install_query_hooks()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(method=scope["method"], path=scope["path"], scope=scope)
+        token = _current_profile.set(profile)
+        _in_flight[id(profile)] = profile
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start" and self.server_timing:
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", profile.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _in_flight.pop(id(profile), None)
+            _current_profile.reset(token)
+            self._record(profile)
+
+    def _record(self, profile: RequestProfile) -> None:
+        route = profile.route
+        DB_QUERIES.labels(profile.method, route).observe(profile.query_count)
+        DB_DURATION.labels(profile.method, route).observe(profile.db_time)
+
+        if profile.query_count >= self.query_count_warning:
+            logger.warning(
+                f"Query-heavy request: {profile.method} {route} - "
+                f"{profile.query_count} queries, DB time {profile.db_time:.3f}s"
+            )
+
+        if profile.statement_shapes:
+            shape, repeats = profile.statement_shapes.most_common(1)[0]
+            if repeats >= self.n_plus_one_threshold:
+                N_PLUS_ONE.labels(profile.method, route).inc()
+                logger.warning(
+                    f"Possible N+1: {profile.method} {route} - statement repeated {repeats} times: "
+                    f"{shape[:200]}"
+                )
+
+
+class LoopLagMonitor:
+    """
+    Background task that detects event-loop stalls
+
+    Sleeps for `interval` seconds and measures how late it wakes up. A lag
+    above `threshold` means something ran on the loop without yielding;
+    the requests in flight at that moment are reported as suspects.
+    """
+
+    def __init__(self, interval: float = 0.5, threshold: float = 0.1):
+        self.interval = interval
+        self.threshold = threshold
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                self._report_stall(lag)
+
+    def _report_stall(self, lag: float) -> None:
+        suspects: List[RequestProfile] = sorted(_in_flight.values(), key=lambda p: p.started_at)
+        for profile in suspects:
+            profile.loop_stall_time += lag
+            LOOP_STALLS.labels(profile.route).inc()
+        if not suspects:
+            LOOP_STALLS.labels("<none>").inc()
+
+        in_flight = ", ".join(f"{p.method} {p.route}" for p in suspects[:5]) or "none"
+        logger.warning(f"Event loop stalled for {lag * 1000:.0f}ms; requests in flight: {in_flight}")
+
+
+def create_profiling_middleware(
+    server_timing: bool = False,
+    n_plus_one_threshold: int = 10,
+    query_count_warning: int = 100,
+):
+    """
+    Factory function to create profiling middleware
+
+    Example:
+        app.add_middleware(
+            create_profiling_middleware(
+                server_timing=settings.PROFILING_SERVER_TIMING,
+                n_plus_one_threshold=settings.PROFILING_N_PLUS_ONE_THRESHOLD,
+            )
+        )
+    """
+    def middleware(app):
+        return ProfilingMiddleware(
+            app,
+            server_timing=server_timing,
+            n_plus_one_threshold=n_plus_one_threshold,
+            query_count_warning=query_count_warning,
+        )
+    return middleware
@@ -1,24 +1,123 @@
 """
 Rate limiting middleware for API protection with Redis support
+
+Pure ASGI middleware using GCRA (generic cell rate algorithm): each limit is
+a single "theoretical arrival time" per key, so both backends keep O(1)
+state per client and a check is one arithmetic comparison.
+
+Backends:
+1. Redis (distributed) - one atomic Lua script (EVALSHA) per request
+2. In-memory (local) - dict of TATs per key, for development or single server
+
+Limits are resolved per request:
+- route groups (path prefix -> limit), e.g. a higher budget for /external/*
+- API token traffic (Bearer itb_...) is keyed by token instead of IP and can
+  have its own budget, once the token has passed verification (see
+  app.utils.api_token.is_verified_token); unverified tokens use the IP bucket
+- everything else uses the default per-IP limit
 """
+import json
+import math
 import time
-from collections import defaultdict
-from typing import Dict, Tuple, Optional
-from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.api_token import is_verified_token, token_fingerprint
 from app.utils.logger import log_warning, log_info
 from app.core.config import settings
 
 # Optional Redis import
 try:
-    import redis
+    import redis.asyncio as redis_asyncio
     REDIS_AVAILABLE = True
 except ImportError:
     REDIS_AVAILABLE = False
-    redis = None
+    redis_asyncio = None
+
+
+EXEMPT_PATHS = {"/health", "/api/v1/health", "/docs", "/redoc", "/openapi.json"}
+
+# KEYS: one TAT key per window. ARGV: now, then (emission interval, burst) per key.
+# Checks every window and stores new TATs only if all of them allow the request.
+# Returns {allowed, retry_after, remaining...} (floats as strings: Lua numbers are truncated)
+GCRA_LUA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local allowed = 1
+local retry_after = 0
+local new_tats = {}
+local remaining = {}
+for i = 1, #KEYS do
+    local interval = tonumber(ARGV[2 * i])
+    local burst = tonumber(ARGV[2 * i + 1])
+    local tat = tonumber(redis.call('GET', KEYS[i]))
+    if tat == nil or tat < now then
+        tat = now
+    end
+    local new_tat = tat + interval
+    local allow_at = new_tat - burst * interval
+    if allow_at > now then
+        allowed = 0
+        retry_after = math.max(retry_after, allow_at - now)
+        remaining[i] = 0
+    else
+        remaining[i] = math.floor((now - allow_at) / interval)
+    end
+    new_tats[i] = new_tat
+end
+if allowed == 1 then
+    for i = 1, #KEYS do
+        redis.call('SET', KEYS[i], tostring(new_tats[i]), 'PX', math.ceil((new_tats[i] - now) * 1000))
+    end
+end
+local result = {allowed, tostring(retry_after)}
+for i = 1, #KEYS do
+    result[#result + 1] = remaining[i]
+end
+return result
+"""
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Per-key budget: requests per minute and per hour"""
+
+    requests_per_minute: int
+    requests_per_hour: int
+
+    @property
+    def windows(self) -> Tuple[Tuple[str, float, int], ...]:
+        """(window name, emission interval in seconds, burst) for GCRA"""
+        return (
+            ("minute", 60.0 / self.requests_per_minute, self.requests_per_minute),
+            ("hour", 3600.0 / self.requests_per_hour, self.requests_per_hour),
+        )
 
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    retry_after: float
+    remaining_minute: int
+
+
+def gcra_check(tat: Optional[float], now: float, interval: float, burst: int) -> Tuple[bool, float, float, int]:
+    """
+    One GCRA step.
+
+    Returns:
+        (allowed, new_tat, retry_after, remaining); new_tat must only be stored if allowed
+    """
+    tat = max(tat or now, now)
+    new_tat = tat + interval
+    allow_at = new_tat - burst * interval
+    if allow_at > now:
+        return False, new_tat, allow_at - now, 0
+    return True, new_tat, 0.0, int((now - allow_at) // interval)
+
+
+class RateLimitMiddleware:
     """
     Rate limiting middleware to prevent API abuse
 
@@ -31,277 +130,231 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
 
     def __init__(
         self,
-        app,
+        app: ASGIApp,
         requests_per_minute: int = None,
-        requests_per_hour: int = None
+        requests_per_hour: int = None,
+        route_limits: Optional[Dict[str, RateLimit]] = None,
+        token_limit: Optional[RateLimit] = None,
     ):
-        super().__init__(app)
+        """
+        Initialize rate limiting middleware
+
+        Args:
+            app: ASGI application
+            requests_per_minute: Default maximum requests per minute per IP
+            requests_per_hour: Default maximum requests per hour per IP
+            route_limits: Path prefix -> limit (longest prefix wins); each group has its own buckets
+            token_limit: Limit for verified API token (Bearer itb_...) traffic outside route groups
+        """
+        self.app = app
         self.requests_per_minute = requests_per_minute or settings.RATE_LIMIT_DEFAULT_REQUESTS_PER_MINUTE
         self.requests_per_hour = requests_per_hour or settings.RATE_LIMIT_DEFAULT_REQUESTS_PER_HOUR
+        self.default_limit = RateLimit(self.requests_per_minute, self.requests_per_hour)
+        self.token_limit = token_limit
+        self.route_limits: List[Tuple[str, RateLimit]] = sorted(
+            (route_limits or {}).items(), key=lambda item: len(item[0]), reverse=True
+        )
 
-        # Initialize Redis if enabled and available
+        # Redis client is async; connection is checked lazily on first use
         self.use_redis = settings.USE_REDIS and REDIS_AVAILABLE
-        self.redis_client: Optional[redis.Redis] = None
+        self.redis_client = None
+        self._redis_script = None
 
         if self.use_redis:
-            try:
-                self.redis_client = redis.Redis(
-                    host=settings.REDIS_HOST,
-                    port=settings.REDIS_PORT,
-                    db=settings.REDIS_DB,
-                    password=settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
-                    decode_responses=True,
-                    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
-                    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
-                )
-                # Test connection
-                self.redis_client.ping()
-                log_info(f"Rate limiting using Redis at {settings.REDIS_HOST}:{settings.REDIS_PORT}", "RateLimit")
-            except Exception as e:
-                log_warning(f"Failed to connect to Redis, falling back to in-memory: {e}", "RateLimit")
-                self.use_redis = False
-                self.redis_client = None
-
-        # In-memory storage (fallback or when Redis not enabled)
-        if not self.use_redis:
+            self.redis_client = redis_asyncio.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB,
+                password=settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
+                decode_responses=True,
+                socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            )
+            self._redis_script = self.redis_client.register_script(GCRA_LUA_SCRIPT)
+            log_info(f"Rate limiting using Redis at {settings.REDIS_HOST}:{settings.REDIS_PORT}", "RateLimit")
+        else:
             log_info("Rate limiting using in-memory storage (not distributed)", "RateLimit")
-            self.request_times: Dict[str, list] = defaultdict(list)
-            self.cleanup_interval = settings.RATE_LIMIT_CLEANUP_INTERVAL
-            self.last_cleanup = time.time()
 
-    def _get_client_ip(self, request: Request) -> str:
+        # In-memory storage (fallback or when Redis not enabled): key -> TAT per window
+        self._tats: Dict[str, List[float]] = {}
+        self.cleanup_interval = settings.RATE_LIMIT_CLEANUP_INTERVAL
+        self.last_cleanup = time.time()
+
+    # ========== KEY & LIMIT RESOLUTION ==========
+
+    @staticmethod
+    def _get_client_ip(scope: Scope, headers: Dict[str, str]) -> str:
         """Extract client IP from request, considering proxies"""
         # Check X-Forwarded-For header (for proxied requests)
-        forwarded = request.headers.get("X-Forwarded-For")
+        forwarded = headers.get("x-forwarded-for")
         if forwarded:
             # Take the first IP in the chain
             return forwarded.split(",")[0].strip()
 
         # Check X-Real-IP header (nginx)
-        real_ip = request.headers.get("X-Real-IP")
+        real_ip = headers.get("x-real-ip")
         if real_ip:
             return real_ip
 
         # Fall back to direct connection IP
-        if request.client:
-            return request.client.host
+        client = scope.get("client")
+        if client:
+            return client[0]
 
         return "unknown"
 
-    # ========== REDIS BACKEND ==========
-
-    def _is_rate_limited_redis(self, ip: str) -> Tuple[bool, str]:
-        """Check rate limit using Redis backend"""
-        current_time = int(time.time())
-
-        # Keys for minute and hour windows
-        minute_key = f"ratelimit:{ip}:minute:{current_time // 60}"
-        hour_key = f"ratelimit:{ip}:hour:{current_time // 3600}"
-
-        try:
-            # Increment counters (atomic operations)
-            minute_count = self.redis_client.incr(minute_key)
-            hour_count = self.redis_client.incr(hour_key)
-
-            # Set expiration on first increment (TTL)
-            if minute_count == 1:
-                self.redis_client.expire(minute_key, settings.REDIS_MINUTE_WINDOW_TTL)
-            if hour_count == 1:
-                self.redis_client.expire(hour_key, settings.REDIS_HOUR_WINDOW_TTL)
-
-            # Check limits
-            if minute_count > self.requests_per_minute:
-                return True, f"Rate limit exceeded: {minute_count} requests in last minute (max {self.requests_per_minute})"
-
-            if hour_count > self.requests_per_hour:
-                return True, f"Rate limit exceeded: {hour_count} requests in last hour (max {self.requests_per_hour})"
-
-            return False, ""
-
-        except Exception as e:
-            log_warning(f"Redis error in rate limiting: {e}, allowing request", "RateLimit")
-            # Fail open - allow request on Redis errors
-            return False, ""
-
-    def _get_retry_after_redis(self, ip: str) -> int:
-        """Calculate seconds until rate limit resets (Redis backend)"""
-        current_time = int(time.time())
-
-        minute_key = f"ratelimit:{ip}:minute:{current_time // 60}"
-        hour_key = f"ratelimit:{ip}:hour:{current_time // 3600}"
+    @staticmethod
+    def _get_api_token(headers: Dict[str, str]) -> Optional[str]:
+        authorization = headers.get("authorization", "")
+        scheme, _, credentials = authorization.partition(" ")
+        if scheme.lower() == "bearer" and credentials.startswith("itb_"):
+            return credentials
+        return None
+
+    def _resolve(self, scope: Scope) -> Tuple[str, RateLimit]:
+        """Bucket key and limit for this request"""
+        headers = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope.get("headers", [])
+        }
+        api_token = self._get_api_token(headers)
+        if api_token and not is_verified_token(api_token):
+            # Unknown token: anyone can send one, keep it on the IP bucket
+            api_token = None
+        if api_token:
+            identity = "token:" + token_fingerprint(api_token)
+        else:
+            identity = "ip:" + self._get_client_ip(scope, headers)
 
-        try:
-            minute_count = int(self.redis_client.get(minute_key) or 0)
-            hour_count = int(self.redis_client.get(hour_key) or 0)
+        path = scope["path"]
+        for prefix, limit in self.route_limits:
+            if path.startswith(prefix):
+                return f"{prefix}|{identity}", limit
 
-            # If minute limit exceeded, return seconds until next minute
-            if minute_count >= self.requests_per_minute:
-                return 60 - (current_time % 60)
+        if api_token and self.token_limit:
+            return f"token|{identity}", self.token_limit
+        return f"default|{identity}", self.default_limit
 
-            # If hour limit exceeded, return seconds until next hour
-            if hour_count >= self.requests_per_hour:
-                return 3600 - (current_time % 3600)
+    # ========== REDIS BACKEND ==========
 
-            return 0
-        except Exception:
-            return 60  # Default retry after 1 minute on error
+    async def _check_redis(self, key: str, limit: RateLimit, now: float) -> RateLimitDecision:
+        """Check and consume using one atomic Lua script call"""
+        windows = limit.windows
+        keys = [f"ratelimit:gcra:{key}:{name}" for name, _, _ in windows]
+        args: List = [now]
+        for _, interval, burst in windows:
+            args.extend([interval, burst])
+
+        result = await self._redis_script(keys=keys, args=args)
+        return RateLimitDecision(
+            allowed=int(result[0]) == 1,
+            retry_after=float(result[1]),
+            remaining_minute=int(result[2]),
+        )
 
     # ========== IN-MEMORY BACKEND ==========
 
-    def _cleanup_old_requests(self):
-        """Remove old request timestamps to prevent memory bloat (in-memory backend)"""
-        current_time = time.time()
-
-        # Only cleanup periodically
-        if current_time - self.last_cleanup < self.cleanup_interval:
+    def _cleanup_expired(self, now: float):
+        """Drop keys whose every TAT is in the past (they are equivalent to fresh keys)"""
+        if now - self.last_cleanup < self.cleanup_interval:
             return
-
-        hour_ago = current_time - 3600
-
-        # Remove old timestamps and empty IP entries
-        ips_to_remove = []
-        for ip, timestamps in self.request_times.items():
-            # Keep only timestamps from last hour
-            self.request_times[ip] = [t for t in timestamps if t > hour_ago]
-
-            # Mark empty entries for removal
-            if not self.request_times[ip]:
-                ips_to_remove.append(ip)
-
-        # Remove empty entries
-        for ip in ips_to_remove:
-            del self.request_times[ip]
-
-        self.last_cleanup = current_time
-
-    def _is_rate_limited_memory(self, ip: str) -> Tuple[bool, str]:
-        """Check rate limit using in-memory backend"""
-        current_time = time.time()
-        timestamps = self.request_times[ip]
-
-        # Count requests in last minute
-        minute_ago = current_time - 60
-        requests_last_minute = sum(1 for t in timestamps if t > minute_ago)
-
-        if requests_last_minute >= self.requests_per_minute:
-            return True, f"Rate limit exceeded: {requests_last_minute} requests in last minute (max {self.requests_per_minute})"
-
-        # Count requests in last hour
-        hour_ago = current_time - 3600
-        requests_last_hour = sum(1 for t in timestamps if t > hour_ago)
-
-        if requests_last_hour >= self.requests_per_hour:
-            return True, f"Rate limit exceeded: {requests_last_hour} requests in last hour (max {self.requests_per_hour})"
-
-        return False, ""
-
-    def _get_retry_after_memory(self, ip: str) -> int:
-        """Calculate seconds until rate limit resets (in-memory backend)"""
-        current_time = time.time()
-        timestamps = self.request_times[ip]
-
-        if not timestamps:
-            return 0
-
-        # Find oldest timestamp in the last minute
-        minute_ago = current_time - 60
-        minute_timestamps = [t for t in timestamps if t > minute_ago]
-
-        if len(minute_timestamps) >= self.requests_per_minute:
-            # Rate limited by minute - return seconds until oldest request expires
-            oldest_in_minute = min(minute_timestamps)
-            return int(60 - (current_time - oldest_in_minute)) + 1
-
-        # Rate limited by hour - return seconds until we're under the limit
-        hour_ago = current_time - 3600
-        hour_timestamps = [t for t in timestamps if t > hour_ago]
-
-        if len(hour_timestamps) >= self.requests_per_hour:
-            oldest_in_hour = min(hour_timestamps)
-            return int(3600 - (current_time - oldest_in_hour)) + 1
-
-        return 0
+        expired = [key for key, tats in self._tats.items() if max(tats) <= now]
+        for key in expired:
+            del self._tats[key]
+        self.last_cleanup = now
+
+    def _check_memory(self, key: str, limit: RateLimit, now: float) -> RateLimitDecision:
+        """Check and consume using local GCRA state (O(1) per key)"""
+        self._cleanup_expired(now)
+        tats = self._tats.get(key)
+
+        new_tats = []
+        allowed = True
+        retry_after = 0.0
+        remaining_minute = 0
+        for index, (_, interval, burst) in enumerate(limit.windows):
+            ok, new_tat, wait, remaining = gcra_check(tats[index] if tats else None, now, interval, burst)
+            allowed = allowed and ok
+            retry_after = max(retry_after, wait)
+            if index == 0:
+                remaining_minute = remaining
+            new_tats.append(new_tat)
+
+        if allowed:
+            self._tats[key] = new_tats
+        return RateLimitDecision(allowed, retry_after, remaining_minute)
 
     # ========== UNIFIED INTERFACE ==========
 
-    def _is_rate_limited(self, ip: str) -> Tuple[bool, str]:
-        """Check if IP has exceeded rate limits (unified interface)"""
+    async def _check(self, key: str, limit: RateLimit) -> RateLimitDecision:
+        now = time.time()
         if self.use_redis:
-            return self._is_rate_limited_redis(ip)
-        else:
-            return self._is_rate_limited_memory(ip)
-
-    def _get_retry_after(self, ip: str) -> int:
-        """Calculate seconds until rate limit resets (unified interface)"""
-        if self.use_redis:
-            return self._get_retry_after_redis(ip)
-        else:
-            return self._get_retry_after_memory(ip)
-
-    def _record_request(self, ip: str):
-        """Record this request (backend-specific)"""
-        if self.use_redis:
-            # Already recorded in _is_rate_limited_redis (incr operations)
-            pass
-        else:
-            # In-memory: append timestamp
-            current_time = time.time()
-            self.request_times[ip].append(current_time)
+            try:
+                return await self._check_redis(key, limit, now)
+            except Exception as e:
+                log_warning(f"Redis error in rate limiting: {e}, using in-memory limiter", "RateLimit")
+        return self._check_memory(key, limit, now)
 
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """Process request with rate limiting"""
+        # Skip rate limiting for non-HTTP traffic, health check and docs
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
 
-        # Skip rate limiting for health check and static files
-        if request.url.path in ["/health", "/api/v1/health", "/docs", "/redoc", "/openapi.json"]:
-            return await call_next(request)
-
-        # Get client IP
-        client_ip = self._get_client_ip(request)
-
-        # Periodic cleanup (in-memory only)
-        if not self.use_redis:
-            self._cleanup_old_requests()
-
-        # Check rate limit
-        is_limited, reason = self._is_rate_limited(client_ip)
-
-        if is_limited:
-            retry_after = self._get_retry_after(client_ip)
-            log_warning(f"Rate limit exceeded for IP {client_ip}: {reason}", "RateLimit")
+        key, limit = self._resolve(scope)
+        decision = await self._check(key, limit)
 
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail={
-                    "error": "Rate limit exceeded",
-                    "message": reason,
-                    "retry_after": retry_after
-                },
-                headers={"Retry-After": str(retry_after)}
+        if not decision.allowed:
+            retry_after = max(1, math.ceil(decision.retry_after))
+            reason = (
+                f"Rate limit exceeded: max {limit.requests_per_minute} requests per minute, "
+                f"{limit.requests_per_hour} per hour"
             )
+            log_warning(f"Rate limit exceeded for {key}: {reason}", "RateLimit")
+            await self._send_limited(send, reason, retry_after)
+            return
 
-        # Record this request
-        self._record_request(client_ip)
-
-        # Process request
-        response = await call_next(request)
-
-        # Add rate limit headers to response (best effort for in-memory)
-        if not self.use_redis:
-            current_time = time.time()
-            minute_ago = current_time - 60
-            requests_last_minute = sum(1 for t in self.request_times[client_ip] if t > minute_ago)
-
-            response.headers["X-RateLimit-Limit-Minute"] = str(self.requests_per_minute)
-            response.headers["X-RateLimit-Remaining-Minute"] = str(max(0, self.requests_per_minute - requests_last_minute))
-            response.headers["X-RateLimit-Limit-Hour"] = str(self.requests_per_hour)
-
-        return response
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.extend([
+                    (b"x-ratelimit-limit-minute", str(limit.requests_per_minute).encode()),
+                    (b"x-ratelimit-remaining-minute", str(decision.remaining_minute).encode()),
+                    (b"x-ratelimit-limit-hour", str(limit.requests_per_hour).encode()),
+                ])
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    @staticmethod
+    async def _send_limited(send: Send, reason: str, retry_after: int) -> None:
+        body = json.dumps({
+            "detail": {
+                "error": "Rate limit exceeded",
+                "message": reason,
+                "retry_after": retry_after,
+            }
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
 
 
 # Factory function
 def create_rate_limiter(
     requests_per_minute: int = 100,
-    requests_per_hour: int = 1000
+    requests_per_hour: int = 1000,
+    route_limits: Optional[Dict[str, RateLimit]] = None,
+    token_limit: Optional[RateLimit] = None,
 ) -> RateLimitMiddleware:
     """
     Create a rate limiter middleware instance
@@ -309,11 +362,19 @@ def create_rate_limiter(
     Args:
         requests_per_minute: Maximum requests per minute per IP
         requests_per_hour: Maximum requests per hour per IP
+        route_limits: Path prefix -> RateLimit for route groups (e.g. /api/v1/external)
+        token_limit: RateLimit for verified API token traffic outside route groups
 
     Returns:
         RateLimitMiddleware instance
     """
     def _middleware_factory(app):
-        return RateLimitMiddleware(app, requests_per_minute, requests_per_hour)
+        return RateLimitMiddleware(
+            app,
+            requests_per_minute,
+            requests_per_hour,
+            route_limits=route_limits,
+            token_limit=token_limit,
+        )
 
     return _middleware_factory
@@ -95,6 +95,7 @@ from .budget_planning import (
     BudgetScenarioInDB,
     # Version
     BudgetVersionCreate,
+    BudgetVersionCopyYearRequest,
     BudgetVersionUpdate,
     BudgetVersionInDB,
     BudgetVersionWithDetails,
@@ -276,6 +277,9 @@ from .timesheet import (
     TimesheetGridDay,
     TimesheetGridEmployee,
     TimesheetGrid,
+    TimesheetGridCell,
+    TimesheetGridSave,
+    TimesheetGridSaveResult,
     # Analytics
     TimesheetSummary,
     EmployeeTimesheetStats,
@@ -403,6 +407,7 @@ __all__ = [
     "BudgetScenarioInDB",
     # Budget 2026 - Versions
     "BudgetVersionCreate",
+    "BudgetVersionCopyYearRequest",
     "BudgetVersionUpdate",
     "BudgetVersionInDB",
     "BudgetVersionWithDetails",
@@ -566,6 +571,9 @@ __all__ = [
     "TimesheetGridDay",
     "TimesheetGridEmployee",
     "TimesheetGrid",
+    "TimesheetGridCell",
+    "TimesheetGridSave",
+    "TimesheetGridSaveResult",
     # Timesheet - Analytics
     "TimesheetSummary",
     "EmployeeTimesheetStats",
@@ -80,6 +80,18 @@ class BudgetVersionCreate(BudgetVersionBase):
     auto_calculate: bool = Field(False, description="Auto-calculate from previous year")
 
 
+class BudgetVersionCopyYearRequest(BaseModel):
+    """Schema for copying baseline versions of a year into new DRAFT versions (many departments at once)"""
+    source_year: int = Field(..., description="Year whose baseline version is copied")
+    target_year: int = Field(..., description="Year of the new versions")
+    department_ids: Optional[List[int]] = Field(None, description="Departments to copy (MANAGER/ADMIN); default: own department")
+    coefficient: float = Field(1.0, gt=0, description="Multiplier for planned amounts (1.1 = +10%)")
+    seasonality: Optional[List[float]] = Field(
+        None, min_length=12, max_length=12,
+        description="Optional monthly factors (12 values) applied on top of coefficient"
+    )
+
+
 class BudgetVersionUpdate(BaseModel):
     """Schema for updating budget version"""
     version_name: Optional[str] = Field(None, max_length=100)
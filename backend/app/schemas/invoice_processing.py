@@ -2,7 +2,7 @@
 Pydantic schemas for invoice processing with AI OCR and parsing
 """
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import date as DateType, datetime
 from decimal import Decimal
 
@@ -104,6 +104,37 @@ class InvoiceUploadResponse(BaseModel):
     message: str
 
 
+class InvoiceBatchUploadResponse(BaseModel):
+    """Ответ при пакетной загрузке счетов"""
+    success: bool
+    batch_id: str = Field(..., description="ID пакета для отслеживания прогресса")
+    invoice_ids: List[int] = Field(default_factory=list)
+    accepted_files: int = 0
+    skipped_files: List[str] = Field(default_factory=list, description="Файлы неподдерживаемого формата")
+    message: str
+
+
+class InvoiceBatchItemStatus(BaseModel):
+    """Статус счета в пакете"""
+    invoice_id: int
+    filename: str
+    status: str
+    invoice_number: Optional[str] = None
+    total_amount: Optional[Decimal] = None
+    has_errors: bool = False
+
+
+class InvoiceBatchStatusResponse(BaseModel):
+    """Прогресс обработки пакета счетов"""
+    batch_id: str
+    total: int
+    finished: int
+    is_complete: bool
+    queue_pending: int = Field(0, description="Счетов в очереди этого воркера")
+    status_counts: Dict[str, int] = Field(default_factory=dict)
+    items: List[InvoiceBatchItemStatus] = Field(default_factory=list)
+
+
 class InvoiceProcessRequest(BaseModel):
     """Запрос на обработку счета"""
     invoice_id: int = Field(..., description="ID загруженного счета")
@@ -191,6 +222,7 @@ class ProcessedInvoiceDetail(BaseModel):
     ocr_text: Optional[str] = None
     ocr_confidence: Optional[Decimal] = None
     ocr_processing_time_sec: Optional[Decimal] = None
+    ocr_page_timings: Optional[List[Dict[str, Any]]] = None
 
     # Parsed data
     invoice_number: Optional[str] = None
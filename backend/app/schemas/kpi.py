@@ -1,7 +1,7 @@
 from __future__ import annotations
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional, List
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field
 from app.db.models import BonusTypeEnum, KPIGoalStatusEnum, EmployeeKPIStatusEnum
 
@@ -372,6 +372,8 @@ class ApplyTemplateResponse(BaseModel):
     message: str
     employees_updated: int
     goals_created: int
+    goals_skipped: int = 0  # Goals already assigned for the period
+    skipped: List[Dict[str, Any]] = []
     errors: List[str] = []
 
 
@@ -295,10 +295,17 @@ class InsuranceImpactAnalysis(BaseModel):
     rate_changes: Dict[str, Dict[str, Decimal]]  # {"PENSION_FUND": {"from": 22, "to": 30}}
     total_impact: Decimal  # Total cost increase in rubles
     impact_percent: Decimal  # Impact as percentage
+    pension_impact: Decimal = Decimal(0)
+    medical_impact: Decimal = Decimal(0)
+    social_impact: Decimal = Decimal(0)
+    injury_impact: Decimal = Decimal(0)
     recommendations: List[Dict[str, Any]]  # Recommendations for optimization
+    base_year_payroll: Optional[Dict[str, Any]] = None  # source, headcount, total_salary, total_insurance, total_cost
+    target_year_headcount: Optional[int] = None
 
     # Serialize Decimal fields as floats (numbers) instead of strings
-    @field_serializer('total_impact', 'impact_percent')
+    @field_serializer('total_impact', 'impact_percent', 'pension_impact', 'medical_impact',
+                      'social_impact', 'injury_impact')
     def serialize_decimal(self, value: Optional[Decimal], _info) -> Optional[float]:
         return decimal_to_float(value)
     
@@ -313,4 +320,30 @@ class InsuranceImpactAnalysis(BaseModel):
                 for inner_key, inner_value in inner_dict.items()
             }
             for key, inner_dict in value.items()
-        }
\ No newline at end of file
+        }
+
+
+class PayrollYearMatrixRow(BaseModel):
+    """Payroll figures of one year of the multi-year comparison"""
+    year: int
+    source: Optional[str]  # actual / plan / projection
+    headcount: int
+    total_salary: float
+    pension: float
+    medical: float
+    social: float
+    injury: float
+    total_insurance: float
+    ndfl: float
+    total_cost: float
+    cost_change: Optional[float]
+    cost_change_percent: Optional[float]
+    rates: Dict[str, float]  # {"PENSION_FUND": 22.0, ...}
+
+
+class PayrollYearMatrix(BaseModel):
+    """Multi-year payroll comparison of a department"""
+    department_id: int
+    start_year: int
+    end_year: int
+    years: List[PayrollYearMatrixRow]
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from datetime import datetime, date
 from decimal import Decimal
-from typing import Optional, List
+from typing import Dict, Optional, List
 from uuid import UUID
 from pydantic import BaseModel, Field
 from app.db.models import TimesheetStatusEnum, DayTypeEnum
@@ -51,6 +51,7 @@ class WorkTimesheetInDB(WorkTimesheetBase):
     """Schema for work timesheet in database"""
     id: UUID
     department_id: int
+    lock_version: int = Field(0, description="Версия табеля для оптимистичной блокировки")
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -160,6 +161,7 @@ class TimesheetGridEmployee(BaseModel):
     employee_number: Optional[str] = None
     timesheet_id: Optional[UUID] = None
     timesheet_status: Optional[TimesheetStatusEnum] = None
+    lock_version: Optional[int] = Field(None, description="Версия табеля (передаётся обратно при сохранении сетки)")
     total_days_worked: int = 0
     total_hours_worked: Decimal = 0
     can_edit: bool = False
@@ -177,6 +179,36 @@ class TimesheetGrid(BaseModel):
     calendar_days_in_month: int
 
 
+TIMESHEET_GRID_MAX_CELLS = 20000
+
+
+class TimesheetGridCell(DailyWorkRecordBase):
+    """Changed grid cell: full state of one employee-day (delete=True clears the cell)"""
+    employee_id: int
+    delete: bool = Field(False, description="Удалить запись за этот день")
+
+
+class TimesheetGridSave(BaseModel):
+    """Bulk save of changed grid cells for one department-month
+
+    lock_versions maps employee_id -> lock_version of the employee's timesheet
+    as it was when the grid was loaded. Every existing timesheet touched by
+    the save must be listed; if any of them changed since, nothing is saved.
+    """
+    cells: List[TimesheetGridCell] = Field(..., min_length=1, max_length=TIMESHEET_GRID_MAX_CELLS)
+    lock_versions: Dict[int, int] = Field(default_factory=dict)
+
+
+class TimesheetGridSaveResult(BaseModel):
+    """Result of a bulk grid save with the refreshed grid"""
+    created_timesheets: int
+    inserted: int
+    updated: int
+    deleted: int
+    unchanged: int
+    grid: TimesheetGrid
+
+
 # ============ Analytics Schemas ============
 
 class TimesheetSummary(BaseModel):
@@ -1,10 +1,11 @@
 """
 AI-powered forecast service using external AI API
 """
+import asyncio
 import httpx
 import logging
 import math
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import func, extract, and_
@@ -900,25 +901,14 @@ class AIForecastService:
 
         return prompt
 
-    async def generate_ai_forecast(
+    def _load_forecast_data(
         self,
         department_id: int,
         year: int,
         month: int,
-        category_id: Optional[int] = None,
-    ) -> Dict:
-        """
-        Generate AI-powered expense forecast
-
-        Args:
-            department_id: Department ID
-            year: Target year
-            month: Target month
-            category_id: Optional category filter
-
-        Returns:
-            Dict with AI forecast data
-        """
+        category_id: Optional[int],
+    ) -> Tuple[List[Dict], Dict, Dict, Optional[str]]:
+        """History, statistics, approved plans and category name for the forecast prompt"""
         # Get historical data (24 months обеспечивает лучшую сезонность и тренды)
         historical_expenses = self.get_historical_expenses(
             department_id=department_id,
@@ -939,6 +929,39 @@ class AIForecastService:
             category_id=category_id,
         )
 
+        # Get category name if provided
+        category_name = None
+        if category_id:
+            category = self.db.query(BudgetCategory).filter_by(id=category_id).first()
+            if category:
+                category_name = category.name
+
+        return historical_expenses, statistics, approved_plans, category_name
+
+    async def generate_ai_forecast(
+        self,
+        department_id: int,
+        year: int,
+        month: int,
+        category_id: Optional[int] = None,
+    ) -> Dict:
+        """
+        Generate AI-powered expense forecast
+
+        Args:
+            department_id: Department ID
+            year: Target year
+            month: Target month
+            category_id: Optional category filter
+
+        Returns:
+            Dict with AI forecast data
+        """
+        # DB reads are synchronous: run them in a worker thread, off the event loop
+        historical_expenses, statistics, approved_plans, category_name = await asyncio.to_thread(
+            self._load_forecast_data, department_id, year, month, category_id
+        )
+
         # Baselines, anomalies и события для использования в промпте и последующем UI
         baseline_metrics = self.calculate_baseline_metrics(statistics, year, month)
         anomaly_summary = self.detect_anomalies(statistics)
@@ -983,13 +1006,6 @@ class AIForecastService:
                 "plan_context": formatted_plan_context,
             }
 
-        # Get category name if provided
-        category_name = None
-        if category_id:
-            category = self.db.query(BudgetCategory).filter_by(id=category_id).first()
-            if category:
-                category_name = category.name
-
         # Build AI prompt
         prompt = self.build_ai_prompt(
             historical_data=historical_expenses,
@@ -0,0 +1,465 @@
+"""
+Columnar analytics snapshots
+
+Closed months (everything before the first day of the current month) of the
+large fact tables are exported to Parquet, partitioned Hive-style:
+
+    <ANALYTICS_SNAPSHOT_DIR>/<dataset>/department_id=<id>/year=<yyyy>/data.parquet
+
+Multi-year analytics query them with DuckDB through query_facts(), which
+exposes a `facts` relation = snapshot rows before `closed_before` UNION ALL
+live rows from the database from `closed_before` on. The open month therefore
+always comes from the database, and a refresh that lags behind a month
+rollover only makes the live part larger.
+
+refresh_snapshots() is run nightly by the scheduler. It compares a cheap
+per-partition fingerprint (row count, sums, max(updated_at)) with the one
+stored in manifest.json and rewrites only partitions that changed, so late
+edits to closed months are picked up on the next run.
+"""
+import json
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Select, case, extract, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import (
+    BankTransaction,
+    BudgetCategory,
+    Expense,
+    FinExpense,
+    FinExpenseDetail,
+    FinReceipt,
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+PARTITION_FILE = "data.parquet"
+
+PRINCIPAL_PAYMENT_TYPE = "Погашение долга"
+INTEREST_PAYMENT_TYPE = "Уплата процентов"
+
+
+@dataclass(frozen=True)
+class SnapshotDataset:
+    """
+    Fact table exported to snapshots
+
+    `select` must return labeled columns named after `schema` fields,
+    including department_id, `date_column`, `checksum` columns and updated_at.
+    """
+    name: str
+    schema: pa.Schema
+    date_column: str
+    select: Callable[[], Select]
+    checksum: Tuple[str, ...] = ("amount",)
+
+
+def _expense_select() -> Select:
+    return select(
+        Expense.id.label("id"),
+        Expense.department_id.label("department_id"),
+        Expense.category_id.label("category_id"),
+        BudgetCategory.type.label("category_type"),
+        Expense.contractor_id.label("contractor_id"),
+        Expense.amount.label("amount"),
+        Expense.status.label("status"),
+        Expense.request_date.label("request_date"),
+        Expense.created_at.label("created_at"),
+        Expense.updated_at.label("updated_at"),
+    ).outerjoin(BudgetCategory, Expense.category_id == BudgetCategory.id)
+
+
+def _bank_transaction_select() -> Select:
+    return select(
+        BankTransaction.id.label("id"),
+        BankTransaction.department_id.label("department_id"),
+        BankTransaction.transaction_date.label("transaction_date"),
+        BankTransaction.transaction_type.label("transaction_type"),
+        BankTransaction.amount.label("amount"),
+        BankTransaction.category_id.label("category_id"),
+        BankTransaction.expense_id.label("expense_id"),
+        BankTransaction.counterparty_inn.label("counterparty_inn"),
+        BankTransaction.status.label("status"),
+        BankTransaction.is_active.label("is_active"),
+        BankTransaction.updated_at.label("updated_at"),
+    )
+
+
+def _fin_receipt_select() -> Select:
+    return select(
+        FinReceipt.id.label("id"),
+        FinReceipt.department_id.label("department_id"),
+        FinReceipt.document_date.label("document_date"),
+        FinReceipt.amount.label("amount"),
+        FinReceipt.organization_id.label("organization_id"),
+        FinReceipt.contract_id.label("contract_id"),
+        FinReceipt.is_active.label("is_active"),
+        FinReceipt.updated_at.label("updated_at"),
+    ).where(FinReceipt.document_date.isnot(None))
+
+
+def _fin_expense_payment_select() -> Select:
+    """One row per credit payment with its principal/interest split"""
+    details = select(
+        FinExpenseDetail.expense_operation_id.label("operation_id"),
+        func.sum(case(
+            (FinExpenseDetail.payment_type == PRINCIPAL_PAYMENT_TYPE, FinExpenseDetail.payment_amount),
+            else_=0,
+        )).label("principal"),
+        func.sum(case(
+            (FinExpenseDetail.payment_type == INTEREST_PAYMENT_TYPE, FinExpenseDetail.payment_amount),
+            else_=0,
+        )).label("interest"),
+    ).group_by(FinExpenseDetail.expense_operation_id).subquery()
+
+    return select(
+        FinExpense.id.label("id"),
+        FinExpense.department_id.label("department_id"),
+        FinExpense.document_date.label("document_date"),
+        FinExpense.amount.label("amount"),
+        func.coalesce(details.c.principal, 0).label("principal"),
+        func.coalesce(details.c.interest, 0).label("interest"),
+        FinExpense.organization_id.label("organization_id"),
+        FinExpense.contract_id.label("contract_id"),
+        FinExpense.is_active.label("is_active"),
+        FinExpense.updated_at.label("updated_at"),
+    ).outerjoin(
+        details, FinExpense.operation_id == details.c.operation_id
+    ).where(FinExpense.document_date.isnot(None))
+
+
+_MONEY = pa.decimal128(18, 2)
+
+DATASETS: Dict[str, SnapshotDataset] = {
+    dataset.name: dataset
+    for dataset in (
+        SnapshotDataset(
+            name="expenses",
+            schema=pa.schema([
+                ("id", pa.int64()),
+                ("department_id", pa.int32()),
+                ("category_id", pa.int32()),
+                ("category_type", pa.string()),
+                ("contractor_id", pa.int32()),
+                ("amount", _MONEY),
+                ("status", pa.string()),
+                ("request_date", pa.timestamp("us")),
+                ("created_at", pa.timestamp("us")),
+                ("updated_at", pa.timestamp("us")),
+            ]),
+            date_column="request_date",
+            select=_expense_select,
+        ),
+        SnapshotDataset(
+            name="bank_transactions",
+            schema=pa.schema([
+                ("id", pa.int64()),
+                ("department_id", pa.int32()),
+                ("transaction_date", pa.date32()),
+                ("transaction_type", pa.string()),
+                ("amount", _MONEY),
+                ("category_id", pa.int32()),
+                ("expense_id", pa.int64()),
+                ("counterparty_inn", pa.string()),
+                ("status", pa.string()),
+                ("is_active", pa.bool_()),
+                ("updated_at", pa.timestamp("us")),
+            ]),
+            date_column="transaction_date",
+            select=_bank_transaction_select,
+        ),
+        SnapshotDataset(
+            name="fin_receipts",
+            schema=pa.schema([
+                ("id", pa.int64()),
+                ("department_id", pa.int32()),
+                ("document_date", pa.date32()),
+                ("amount", _MONEY),
+                ("organization_id", pa.int32()),
+                ("contract_id", pa.int32()),
+                ("is_active", pa.bool_()),
+                ("updated_at", pa.timestamp("us")),
+            ]),
+            date_column="document_date",
+            select=_fin_receipt_select,
+        ),
+        SnapshotDataset(
+            name="fin_expense_payments",
+            schema=pa.schema([
+                ("id", pa.int64()),
+                ("department_id", pa.int32()),
+                ("document_date", pa.date32()),
+                ("amount", _MONEY),
+                ("principal", _MONEY),
+                ("interest", _MONEY),
+                ("organization_id", pa.int32()),
+                ("contract_id", pa.int32()),
+                ("is_active", pa.bool_()),
+                ("updated_at", pa.timestamp("us")),
+            ]),
+            date_column="document_date",
+            select=_fin_expense_payment_select,
+            checksum=("amount", "principal", "interest"),
+        ),
+    )
+}
+
+
+def snapshot_dir() -> Path:
+    return Path(settings.ANALYTICS_SNAPSHOT_DIR)
+
+
+def _manifest_path() -> Path:
+    return snapshot_dir() / "manifest.json"
+
+
+def _partition_path(dataset: SnapshotDataset, department_id: int, year: int) -> Path:
+    return snapshot_dir() / dataset.name / f"department_id={department_id}" / f"year={year}" / PARTITION_FILE
+
+
+def load_manifest() -> Optional[dict]:
+    """Current manifest, or None if there is no (compatible) snapshot yet"""
+    if not settings.ANALYTICS_SNAPSHOT_ENABLED:
+        return None
+    try:
+        manifest = json.loads(_manifest_path().read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def _write_atomic(path: Path, write: Callable[[Path], None]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.tmp")
+    write(temp_path)
+    os.replace(temp_path, path)
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+# ---------------------------------------------------------------------------
+# Arrow conversion
+# ---------------------------------------------------------------------------
+
+def _to_arrow(schema: pa.Schema, rows: Sequence[Sequence[Any]]) -> pa.Table:
+    columns = []
+    for index, field in enumerate(schema):
+        values = [row[index] for row in rows]
+        if pa.types.is_decimal(field.type):
+            exponent = Decimal(1).scaleb(-field.type.scale)
+            values = [
+                None if value is None else Decimal(str(value)).quantize(exponent)
+                for value in values
+            ]
+        elif pa.types.is_string(field.type):
+            values = [value.value if isinstance(value, Enum) else value for value in values]
+        elif pa.types.is_date32(field.type):
+            values = [value.date() if isinstance(value, datetime) else value for value in values]
+        columns.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+# ---------------------------------------------------------------------------
+# Refresh
+# ---------------------------------------------------------------------------
+
+def _fingerprints(db: Session, dataset: SnapshotDataset, closed_before: date) -> Dict[str, List[str]]:
+    source = dataset.select().subquery()
+    date_column = source.c[dataset.date_column]
+    year = extract("year", date_column)
+    statement = select(
+        source.c.department_id,
+        year,
+        func.count(),
+        *[func.sum(source.c[name]) for name in dataset.checksum],
+        func.max(source.c.updated_at),
+    ).where(date_column < closed_before).group_by(source.c.department_id, year)
+
+    return {
+        f"{department_id}/{int(year_value)}": [str(value) for value in rest]
+        for department_id, year_value, *rest in db.execute(statement)
+    }
+
+
+def _export_partition(
+    db: Session,
+    dataset: SnapshotDataset,
+    department_id: int,
+    year: int,
+    closed_before: date,
+) -> int:
+    source = dataset.select().subquery()
+    date_column = source.c[dataset.date_column]
+    statement = select(*[source.c[name] for name in dataset.schema.names]).where(
+        source.c.department_id == department_id,
+        date_column >= date(year, 1, 1),
+        date_column < min(date(year + 1, 1, 1), closed_before),
+    ).order_by(date_column, source.c.id)
+
+    table = _to_arrow(dataset.schema, db.execute(statement).all())
+    # department_id lives in the partition path
+    table = table.drop(["department_id"])
+    _write_atomic(
+        _partition_path(dataset, department_id, year),
+        lambda path: pq.write_table(table, path, compression="zstd"),
+    )
+    return table.num_rows
+
+
+def refresh_snapshots(db: Session, today: Optional[date] = None) -> Dict[str, int]:
+    """
+    Export closed months to Parquet, rewriting only partitions whose fingerprint changed
+
+    Returns:
+        Number of rewritten partitions per dataset
+    """
+    closed_before = _month_start(today or date.today())
+    previous = load_manifest() or {}
+    previous_datasets = previous.get("datasets", {})
+    manifest_datasets = {}
+    rewritten = {}
+
+    for dataset in DATASETS.values():
+        old = previous_datasets.get(dataset.name, {})
+        current = _fingerprints(db, dataset, closed_before)
+        rewritten[dataset.name] = 0
+
+        for key, fingerprint in current.items():
+            department_id, year = (int(part) for part in key.split("/"))
+            if old.get(key) == fingerprint and _partition_path(dataset, department_id, year).exists():
+                continue
+            rows = _export_partition(db, dataset, department_id, year, closed_before)
+            rewritten[dataset.name] += 1
+            logger.info(f"Snapshot {dataset.name} {key}: {rows} rows")
+
+        for key in old.keys() - current.keys():
+            department_id, year = key.split("/")
+            shutil.rmtree(_partition_path(dataset, int(department_id), int(year)).parent, ignore_errors=True)
+
+        manifest_datasets[dataset.name] = current
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "closed_before": closed_before.isoformat(),
+        "refreshed_at": datetime.utcnow().isoformat(),
+        "datasets": manifest_datasets,
+    }
+    _write_atomic(_manifest_path(), lambda path: path.write_text(json.dumps(manifest)))
+    return rewritten
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+def _live_rows(
+    db: Session,
+    dataset: SnapshotDataset,
+    closed_before: Optional[date],
+    department_id: Optional[int],
+    date_from: Optional[date],
+    date_before: Optional[date],
+) -> pa.Table:
+    source = dataset.select().subquery()
+    date_column = source.c[dataset.date_column]
+    statement = select(*[source.c[name] for name in dataset.schema.names])
+    if closed_before:
+        statement = statement.where(date_column >= closed_before)
+    if department_id is not None:
+        statement = statement.where(source.c.department_id == department_id)
+    if date_from:
+        statement = statement.where(date_column >= date_from)
+    if date_before:
+        statement = statement.where(date_column < date_before)
+    return _to_arrow(dataset.schema, db.execute(statement).all())
+
+
+def query_facts(
+    db: Session,
+    dataset_name: str,
+    sql: str,
+    params: Sequence[Any] = (),
+    *,
+    department_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_before: Optional[date] = None,
+) -> List[tuple]:
+    """
+    Run a DuckDB query over a dataset (closed months from Parquet + open months live)
+
+    Args:
+        db: Database session for the live part
+        dataset_name: Key of DATASETS
+        sql: Query selecting from `facts` (columns of the dataset schema); may start with its own WITH
+        params: Positional `?` parameters of `sql`
+        department_id: Restrict facts to one department
+        date_from: Inclusive lower bound on the dataset date column
+        date_before: Exclusive upper bound on the dataset date column
+
+    Returns:
+        Result rows as tuples
+    """
+    dataset = DATASETS[dataset_name]
+    manifest = load_manifest()
+    closed_before = None
+    if manifest and manifest["datasets"].get(dataset.name):
+        closed_before = date.fromisoformat(manifest["closed_before"])
+
+    columns = ", ".join(dataset.schema.names)
+    parts = []
+    facts_params: List[Any] = []
+
+    if closed_before and (date_from is None or date_from < closed_before):
+        glob = snapshot_dir() / dataset.name / "*" / "*" / PARTITION_FILE
+        conditions = [f"{dataset.date_column} < ?"]
+        facts_params.append(closed_before)
+        if department_id is not None:
+            conditions.append("department_id = ?")
+            facts_params.append(department_id)
+        if date_from:
+            conditions += ["year >= ?", f"{dataset.date_column} >= ?"]
+            facts_params += [date_from.year, date_from]
+        if date_before:
+            conditions += ["year <= ?", f"{dataset.date_column} < ?"]
+            facts_params += [date_before.year, date_before]
+        parts.append(
+            f"SELECT {columns} FROM read_parquet('{glob}', hive_partitioning = true, "
+            f"hive_types = {{'department_id': INTEGER, 'year': INTEGER}}) "
+            f"WHERE {' AND '.join(conditions)}"
+        )
+
+    live = _live_rows(db, dataset, closed_before, department_id, date_from, date_before)
+    parts.append(f"SELECT {columns} FROM live_rows")
+
+    facts = f"facts AS ({' UNION ALL '.join(parts)})"
+    sql = sql.strip()
+    if sql[:4].upper() == "WITH":
+        # Caller's own CTEs follow `facts` in the same WITH clause
+        statement = f"WITH {facts},{sql[4:]}"
+    else:
+        statement = f"WITH {facts} {sql}"
+
+    connection = duckdb.connect()
+    try:
+        connection.register("live_rows", live)
+        return connection.execute(statement, [*facts_params, *params]).fetchall()
+    finally:
+        connection.close()
@@ -0,0 +1,257 @@
+"""
+Content-addressed attachment storage
+
+Uploads are copied to disk in chunks (in a worker thread) while their
+SHA-256 is computed, then moved to blobs/<aa>/<bb>/<sha256>. Identical
+files share one blob; attachment_blobs.ref_count tracks how many
+attachments use it. Uploads increment it, deletes of attachments decrement
+it in a trigger (migration f1a3c5e7b9d2), so attachments removed by an
+expense cascade release their blobs too.
+
+Unreferenced blobs are removed by purge_unreferenced_blobs, after the
+deleting transaction has committed (right after a delete and in a periodic
+sweep). Ordering with concurrent uploads of the same content is handled by
+the blob row lock: an upload increments ref_count (upsert) *before* moving
+its file into place, and the purge removes the file while still holding the
+lock on the row it is about to delete. An upload whose attachment row fails
+to commit releases its blob the same way (release_unpublished_blob).
+
+Downloads support ETag/If-None-Match and single byte ranges (Range/If-Range).
+"""
+import hashlib
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db.models import AttachmentBlob
+from app.utils.excel_export import encode_filename_header
+
+UPLOAD_DIR = Path(__file__).parent.parent / "uploads"
+BLOB_DIR = UPLOAD_DIR / "blobs"
+CHUNK_SIZE = 1024 * 1024
+PURGE_BATCH_SIZE = 1000
+
+_DIALECT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class FileTooLargeError(ValueError):
+    """Upload exceeds the configured size limit"""
+
+
+@dataclass
+class SpooledBlob:
+    """Upload written to a temporary file, not yet published to the blob store"""
+    temp_path: Path
+    sha256: str
+    size: int
+
+
+def blob_path(sha256: str) -> Path:
+    return BLOB_DIR / sha256[:2] / sha256[2:4] / sha256
+
+
+def spool_upload(source: BinaryIO, max_size: int) -> SpooledBlob:
+    """
+    Copy an upload to a temp file in chunks, hashing as it goes (blocking: run in a thread)
+
+    Raises:
+        FileTooLargeError: If more than max_size bytes are read
+    """
+    BLOB_DIR.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, name = tempfile.mkstemp(dir=BLOB_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as target:
+            while chunk := source.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(f"File exceeds {max_size} bytes")
+                digest.update(chunk)
+                target.write(chunk)
+    except BaseException:
+        os.unlink(name)
+        raise
+    return SpooledBlob(temp_path=Path(name), sha256=digest.hexdigest(), size=size)
+
+
+def publish_blob(spooled: SpooledBlob) -> Path:
+    """Move a spooled upload to its content address (atomic; replaces an identical blob)"""
+    path = blob_path(spooled.sha256)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(spooled.temp_path, path)
+    return path
+
+
+def discard_spooled(spooled: SpooledBlob) -> None:
+    try:
+        os.unlink(spooled.temp_path)
+    except FileNotFoundError:
+        pass
+
+
+async def acquire_blob(db: AsyncSession, sha256: str, size: int) -> None:
+    """Register one more reference to a blob (row stays locked until commit)"""
+    dialect_insert = _DIALECT_INSERTS[db.get_bind().dialect.name]
+    statement = dialect_insert(AttachmentBlob).values(sha256=sha256, file_size=size, ref_count=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[AttachmentBlob.sha256],
+        set_={"ref_count": AttachmentBlob.ref_count + 1},
+    )
+    await db.execute(statement)
+
+
+async def release_unpublished_blob(db: AsyncSession, sha256: str, size: int) -> None:
+    """
+    Undo publish_blob after the attachment transaction was rolled back
+
+    The rollback also dropped our ref_count increment, so a blob nobody else
+    references has no row (or ref_count 0) and its file would never be swept.
+    A zero-reference row is inserted if missing and purged under its lock;
+    a concurrent upload of the same content keeps the row referenced.
+    """
+    dialect_insert = _DIALECT_INSERTS[db.get_bind().dialect.name]
+    statement = dialect_insert(AttachmentBlob).values(sha256=sha256, file_size=size, ref_count=0)
+    await db.execute(statement.on_conflict_do_nothing(index_elements=[AttachmentBlob.sha256]))
+    await db.run_sync(purge_unreferenced_blobs, [sha256])
+
+
+def purge_unreferenced_blobs(db: Session, sha256s: Optional[Iterable[str]] = None) -> int:
+    """
+    Remove blobs no attachment references any more (rows and files), then commit
+
+    Run outside the transaction that deleted the attachments. The rows are
+    locked (SKIP LOCKED) while their files are removed, so a concurrent upload
+    of the same content waits and re-creates the blob after us. If the commit
+    fails, only unreferenced rows without files are left for the next sweep.
+
+    Args:
+        db: Database session
+        sha256s: Only these blobs (default: any unreferenced blob, up to PURGE_BATCH_SIZE)
+
+    Returns:
+        Number of blobs removed
+    """
+    statement = (
+        select(AttachmentBlob.sha256)
+        .where(AttachmentBlob.ref_count <= 0)
+        .limit(PURGE_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    if sha256s is not None:
+        statement = statement.where(AttachmentBlob.sha256.in_(list(sha256s)))
+    hashes = db.execute(statement).scalars().all()
+
+    for sha256 in hashes:
+        try:
+            os.remove(blob_path(sha256))
+        except FileNotFoundError:
+            pass
+    if hashes:
+        db.execute(delete(AttachmentBlob).where(AttachmentBlob.sha256.in_(hashes)))
+    db.commit()
+    return len(hashes)
+
+
+# ---------------------------------------------------------------------------
+# Downloads
+# ---------------------------------------------------------------------------
+
+def _iter_file_range(path: Path, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _parse_range(header: str, size: int) -> Optional[tuple]:
+    """Single "bytes=" range -> (start, end) inclusive; None if unsupported/ignored, () if unsatisfiable"""
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None  # multiple or malformed ranges: serve the whole file
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return ()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return ()
+    return start, end
+
+
+def file_download_response(
+    request: Request,
+    path: Path,
+    filename: str,
+    media_type: Optional[str],
+    etag: str,
+) -> Response:
+    """
+    Serve a file with ETag, conditional GET and single byte-range support
+
+    Args:
+        request: Incoming request (Range / If-None-Match / If-Range headers)
+        path: File on disk
+        filename: Name for Content-Disposition
+        media_type: MIME type (defaults to application/octet-stream)
+        etag: Strong validator for the file content (without quotes)
+    """
+    quoted_etag = f'"{etag}"'
+    media_type = media_type or "application/octet-stream"
+    headers = {
+        "ETag": quoted_etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=86400",
+        **encode_filename_header(filename),
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and quoted_etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    size = path.stat().st_size
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == quoted_etag):
+        byte_range = _parse_range(range_header, size)
+        if byte_range == ():
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            return StreamingResponse(
+                _iter_file_range(path, start, length),
+                status_code=206,
+                media_type=media_type,
+                headers={
+                    **headers,
+                    "Content-Range": f"bytes {start}-{end}/{size}",
+                    "Content-Length": str(length),
+                },
+            )
+
+    return FileResponse(path=path, media_type=media_type, headers=headers)
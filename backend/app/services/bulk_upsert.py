@@ -0,0 +1,481 @@
+"""
+Bulk set-based import engine for the external API
+
+An import is described by a BulkImportSpec (target model, accepted fields,
+natural keys, foreign keys). bulk_upsert() then:
+
+1. validates and normalizes every row up front; invalid rows are reported
+   as per-row errors and never reach the database
+2. checks foreign keys with one IN query per referenced model
+3. resolves natural keys (INN, name, (employee_id, year, month), ...) with
+   one IN query per key type; rows whose keys point to different records, or
+   would take a unique value of another record, become per-row errors
+4. writes new rows with multi-row INSERTs and matched rows with multi-row
+   INSERT ... ON CONFLICT (id) DO UPDATE, in chunks
+
+Request bodies may be a JSON array or NDJSON, optionally gzip-compressed
+(see decode_import_body).
+"""
+import json
+import zlib
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+BULK_WRITE_CHUNK_SIZE = 1000
+BULK_IMPORT_MAX_ROWS = 200000
+BULK_IMPORT_MAX_BYTES = 256 * 1024 * 1024  # decompressed body size
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+_DIALECT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+class ImportPayloadError(ValueError):
+    """Request body cannot be decoded into a list of rows"""
+
+
+# ---------------------------------------------------------------------------
+# Field converters (raise ValueError with a readable message)
+# ---------------------------------------------------------------------------
+
+def to_str(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def to_decimal(value: Any) -> Optional[Decimal]:
+    if value is None or value == "":
+        return None
+    try:
+        return Decimal(str(value).replace(" ", "").replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"invalid number {value!r}")
+
+
+def to_datetime(value: Any) -> Optional[datetime]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"invalid date {value!r}, expected ISO format (YYYY-MM-DD)")
+
+
+def to_enum(enum_class: Type[Enum]) -> Callable[[Any], Optional[Enum]]:
+    def convert(value: Any) -> Optional[Enum]:
+        if value is None or value == "":
+            return None
+        try:
+            return enum_class(str(value).upper())
+        except ValueError:
+            allowed = ", ".join(member.value for member in enum_class)
+            raise ValueError(f"invalid value {value!r}, expected one of: {allowed}")
+    return convert
+
+
+def to_int(value: Any) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"invalid integer {value!r}")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid integer {value!r}")
+
+
+# ---------------------------------------------------------------------------
+# Spec and result
+# ---------------------------------------------------------------------------
+
+@dataclass
+class BulkImportSpec:
+    """
+    Description of one import endpoint
+
+    Attributes:
+        model: Target ORM model
+        fields: Accepted payload fields -> converter (None = pass through)
+        required: Fields that must be present and non-empty
+        match_on: Natural keys tried in order to find an existing row; empty = insert only
+        unique: Other table-wide unique keys; rows that would collide with another record become errors
+        aliases: Payload field -> model column (e.g. category_type -> type)
+        references: FK field -> (referenced model, check that it belongs to the department)
+        department_scoped: Natural-key lookup is limited to the token's department
+        prepare: Hook run on each normalized row (derived columns, cross-field checks)
+    """
+    model: Any
+    fields: Dict[str, Optional[Callable[[Any], Any]]]
+    required: Tuple[str, ...] = ()
+    match_on: Tuple[Tuple[str, ...], ...] = ()
+    unique: Tuple[Tuple[str, ...], ...] = ()
+    aliases: Dict[str, str] = field(default_factory=dict)
+    references: Dict[str, Tuple[Any, bool]] = field(default_factory=dict)
+    department_scoped: bool = True
+    prepare: Optional[Callable[[Dict[str, Any]], None]] = None
+
+
+@dataclass
+class BulkImportResult:
+    created_count: int = 0
+    updated_count: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    def add_error(self, index: int, error: str, data: Any) -> None:
+        self.errors.append({"index": index, "error": error, "data": data})
+
+
+# ---------------------------------------------------------------------------
+# Engine
+# ---------------------------------------------------------------------------
+
+def _normalize(spec: BulkImportSpec, item: Any) -> Dict[str, Any]:
+    """Validate one payload row and map it to model columns (raises ValueError)"""
+    if not isinstance(item, dict):
+        raise ValueError("row must be a JSON object")
+
+    unknown = set(item) - set(spec.fields)
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+
+    missing = [name for name in spec.required if item.get(name) in (None, "")]
+    if missing:
+        raise ValueError(f"missing required fields: {', '.join(missing)}")
+
+    row: Dict[str, Any] = {}
+    for name, value in item.items():
+        convert = spec.fields[name]
+        try:
+            converted = convert(value) if convert else value
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}")
+        row[spec.aliases.get(name, name)] = converted
+
+    if spec.prepare:
+        spec.prepare(row)
+    return row
+
+
+def _check_references(
+    db: Session,
+    spec: BulkImportSpec,
+    rows: Dict[int, Dict[str, Any]],
+    department_id: Optional[int],
+    result: BulkImportResult,
+    payload: Sequence[Any],
+) -> None:
+    """One IN query per FK field; rows pointing to missing ids become errors"""
+    for column, (ref_model, scoped) in spec.references.items():
+        ids = {row[column] for row in rows.values() if row.get(column) is not None}
+        if not ids:
+            continue
+        query = select(ref_model.id).where(ref_model.id.in_(ids))
+        if scoped and department_id:
+            query = query.where(ref_model.department_id == department_id)
+        valid = set(db.execute(query).scalars())
+
+        for index in [i for i, row in rows.items() if row.get(column) is not None and row[column] not in valid]:
+            result.add_error(index, f"{column}: invalid foreign key", payload[index])
+            del rows[index]
+
+
+def _key_of(row: Dict[str, Any], key: Tuple[str, ...]) -> Optional[Tuple[Any, ...]]:
+    values = tuple(row.get(column) for column in key)
+    return None if any(value is None for value in values) else values
+
+
+def _insert_required_columns(table) -> List[str]:
+    """NOT NULL columns without any default: an INSERT must always provide them"""
+    return [
+        column.name for column in table.c
+        if not column.nullable and not column.primary_key
+        and column.default is None and column.server_default is None
+    ]
+
+
+def _key_condition(table, key: Tuple[str, ...], values: Iterable[Tuple[Any, ...]]):
+    key_columns = [table.c[column] for column in key]
+    if len(key) == 1:
+        return key_columns[0].in_({k[0] for k in values})
+    return tuple_(*key_columns).in_(set(values))
+
+
+def _resolve_existing(
+    db: Session,
+    spec: BulkImportSpec,
+    rows: Dict[int, Dict[str, Any]],
+    department_id: Optional[int],
+    result: BulkImportResult,
+    payload: Sequence[Any],
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Map payload index -> existing row, one IN query per natural key
+
+    The existing row carries its id and current values of the insert-required
+    columns: PostgreSQL checks NOT NULL on the proposed row of
+    INSERT ... ON CONFLICT DO UPDATE before resolving the conflict.
+
+    A row matched by a later key whose earlier key differs from the found
+    record (new INN with the name of another organization) becomes an error.
+    """
+    table = spec.model.__table__
+    carried = [table.c.id] + [table.c[name] for name in _insert_required_columns(table)]
+
+    matched: Dict[int, Dict[str, Any]] = {}
+    for position, key in enumerate(spec.match_on):
+        pending = {i: k for i, row in rows.items() if i not in matched and (k := _key_of(row, key)) is not None}
+        if not pending:
+            continue
+
+        earlier = list(dict.fromkeys(
+            column for previous in spec.match_on[:position] for column in previous if column not in key
+        ))
+        labelled = [table.c[column].label(f"_key_{column}") for column in (*key, *earlier)]
+        query = select(*carried, *labelled).where(_key_condition(table, key, pending.values())).order_by(table.c.id)
+        if spec.department_scoped and department_id:
+            query = query.where(table.c.department_id == department_id)
+
+        existing: Dict[Tuple[Any, ...], Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+        for found in db.execute(query).mappings():
+            k = tuple(found[f"_key_{column}"] for column in key)
+            existing.setdefault(k, (
+                {column.name: found[column.name] for column in carried},
+                {column: found[f"_key_{column}"] for column in earlier},
+            ))
+
+        for index, k in pending.items():
+            if k not in existing:
+                continue
+            found, earlier_values = existing[k]
+            conflicts = [
+                column for column, value in earlier_values.items()
+                if value is not None and rows[index].get(column) is not None and rows[index][column] != value
+            ]
+            if conflicts:
+                result.add_error(
+                    index,
+                    f"{', '.join(key)}: belongs to record id={found['id']} with a different {', '.join(conflicts)}",
+                    payload[index],
+                )
+                del rows[index]
+            else:
+                matched[index] = found
+    return matched
+
+
+def _check_unique(
+    db: Session,
+    spec: BulkImportSpec,
+    rows: Dict[int, Dict[str, Any]],
+    matched: Dict[int, Dict[str, Any]],
+    result: BulkImportResult,
+    payload: Sequence[Any],
+) -> None:
+    """One IN query per unique key; rows taking a value held by another record become errors"""
+    table = spec.model.__table__
+    for key in spec.unique:
+        values = {i: k for i, row in rows.items() if (k := _key_of(row, key)) is not None}
+        if not values:
+            continue
+
+        query = select(table.c.id, *[table.c[column] for column in key]).where(_key_condition(table, key, values.values()))
+        holders = {tuple(found[column] for column in key): found["id"] for found in db.execute(query).mappings()}
+
+        # The record each row ends up in: matched id, or the new row it is merged into
+        claimed: Dict[Tuple[Any, ...], Any] = {}
+        for index, k in values.items():
+            if index in matched:
+                owner = matched[index]["id"]
+            else:
+                first_key = next((nk for mk in spec.match_on if (nk := _key_of(rows[index], mk)) is not None), None)
+                owner = ("new", first_key if first_key is not None else index)
+
+            if k in holders and holders[k] != owner:
+                result.add_error(index, f"{', '.join(key)}: already used by record id={holders[k]}", payload[index])
+                del rows[index]
+            elif claimed.setdefault(k, owner) != owner:
+                result.add_error(index, f"{', '.join(key)}: already used by another row of the payload", payload[index])
+                del rows[index]
+
+
+def _chunks(items: List[Any], size: int) -> Iterable[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _write_inserts(db: Session, table, rows: List[Dict[str, Any]]) -> None:
+    # Multi-row VALUES need one column list: group rows by the columns they set
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for group in groups.values():
+        for chunk in _chunks(group, BULK_WRITE_CHUNK_SIZE):
+            db.execute(insert(table).values(chunk))
+
+
+def _write_updates(db: Session, spec: BulkImportSpec, updates: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+    """updates: (existing row, payload columns to set)"""
+    table = spec.model.__table__
+    now = datetime.utcnow()
+    extra = {"updated_at": now} if "updated_at" in table.c else {}
+    dialect_insert = _DIALECT_INSERTS.get(db.get_bind().dialect.name)
+
+    groups: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[Dict[str, Any]]] = {}
+    for existing, changes in updates:
+        changes = {**changes, **extra}
+        values = {**existing, **changes}
+        groups.setdefault((tuple(sorted(values)), tuple(sorted(changes))), []).append(values)
+
+    for (_, set_columns), group in groups.items():
+        for chunk in _chunks(group, BULK_WRITE_CHUNK_SIZE):
+            if dialect_insert is None:
+                # No ON CONFLICT support: ORM bulk UPDATE by primary key
+                db.execute(update(spec.model), [{"id": row["id"], **{c: row[c] for c in set_columns}} for row in chunk])
+                continue
+            statement = dialect_insert(table).values(chunk)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.id],
+                set_={column: statement.excluded[column] for column in set_columns},
+            )
+            db.execute(statement)
+
+
+def bulk_upsert(
+    db: Session,
+    spec: BulkImportSpec,
+    payload: Sequence[Any],
+    department_id: Optional[int],
+    insert_values: Optional[Dict[str, Any]] = None,
+) -> BulkImportResult:
+    """
+    Validate and write a whole import payload set-based
+
+    The session is not committed: the caller commits (or rolls back) the
+    whole batch.
+
+    Args:
+        db: Database session
+        spec: Import description
+        payload: Rows as received from the client
+        department_id: Department of the API token
+        insert_values: Columns set on newly created rows only (department_id, created_by, ...)
+
+    Returns:
+        BulkImportResult with created/updated counts and per-row errors
+        ({"index", "error", "data"})
+    """
+    result = BulkImportResult()
+
+    rows: Dict[int, Dict[str, Any]] = {}
+    for index, item in enumerate(payload):
+        try:
+            rows[index] = _normalize(spec, item)
+        except ValueError as e:
+            result.add_error(index, str(e), item)
+
+    _check_references(db, spec, rows, department_id, result, payload)
+    matched = _resolve_existing(db, spec, rows, department_id, result, payload)
+    _check_unique(db, spec, rows, matched, result, payload)
+
+    # Rows repeating a natural key are merged into the first one (later values win)
+    updates: Dict[int, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+    new_by_key: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    to_insert: List[Dict[str, Any]] = []
+    for index, row in rows.items():
+        if index in matched:
+            existing = matched[index]
+            if existing["id"] in updates:
+                updates[existing["id"]][1].update(row)
+            else:
+                updates[existing["id"]] = (existing, dict(row))
+            result.updated_count += 1
+            continue
+
+        first_key = next((k for key in spec.match_on if (k := _key_of(row, key)) is not None), None)
+        if first_key is not None and first_key in new_by_key:
+            new_by_key[first_key].update(row)
+            result.updated_count += 1
+            continue
+
+        new_row = {**(insert_values or {}), **row}
+        if first_key is not None:
+            new_by_key[first_key] = new_row
+        to_insert.append(new_row)
+        result.created_count += 1
+
+    _write_inserts(db, spec.model.__table__, to_insert)
+    _write_updates(db, spec, list(updates.values()))
+    result.errors.sort(key=lambda error: error["index"])
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Request body decoding
+# ---------------------------------------------------------------------------
+
+async def decode_import_body(
+    chunks: AsyncIterator[bytes],
+    content_type: Optional[str],
+    content_encoding: Optional[str],
+) -> List[Any]:
+    """
+    Read an import body: JSON array or NDJSON (one object per line), optionally gzip
+
+    Decompression is incremental and bounded by BULK_IMPORT_MAX_BYTES.
+
+    Raises:
+        ImportPayloadError: If the body is not valid JSON/NDJSON or is too large
+    """
+    encoding = (content_encoding or "").strip().lower()
+    if encoding not in ("", "identity", "gzip"):
+        raise ImportPayloadError(f"Unsupported Content-Encoding: {content_encoding}")
+    decompressor = zlib.decompressobj(wbits=47) if encoding == "gzip" else None  # 47: gzip or zlib header
+
+    body = bytearray()
+    try:
+        async for chunk in chunks:
+            body += decompressor.decompress(chunk, BULK_IMPORT_MAX_BYTES + 1 - len(body)) if decompressor else chunk
+            if len(body) > BULK_IMPORT_MAX_BYTES or (decompressor and decompressor.unconsumed_tail):
+                raise ImportPayloadError(f"Request body exceeds {BULK_IMPORT_MAX_BYTES} bytes")
+        if decompressor:
+            body += decompressor.flush()
+    except zlib.error as e:
+        raise ImportPayloadError(f"Invalid gzip body: {e}")
+
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+    if media_type in NDJSON_CONTENT_TYPES:
+        rows = []
+        for line_number, line in enumerate(body.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError as e:
+                raise ImportPayloadError(f"Invalid JSON on line {line_number}: {e}")
+    else:
+        try:
+            rows = json.loads(body) if body.strip() else []
+        except ValueError as e:
+            raise ImportPayloadError(f"Invalid JSON body: {e}")
+        if not isinstance(rows, list):
+            raise ImportPayloadError("Request body must be a JSON array of objects")
+
+    if len(rows) > BULK_IMPORT_MAX_ROWS:
+        raise ImportPayloadError(f"Too many rows: {len(rows)} (max {BULK_IMPORT_MAX_ROWS})")
+    return rows
@@ -1,25 +1,43 @@
 """
 Service for automatic creation of EmployeeKPI records
 
-Automatically creates EmployeeKPI records for active employees at the start of each month
+Automatically creates EmployeeKPI records for active employees at the start of each month.
+The rollover is set-based and runs in one transaction:
+
+1. all missing EmployeeKPI rows of the period: one INSERT ... SELECT ... WHERE NOT EXISTS
+2. goals of the previous period (not cancelled): one INSERT ... SELECT
+3. KPIs that got no goals: department's active KPIGoals with equal weights,
+   one more INSERT ... SELECT
 """
 import logging
 from datetime import datetime
-from typing import List, Dict
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import and_, case, cast, exists, func, insert, literal, select, Numeric
 
 from app.db.models import (
     Employee,
     EmployeeKPI,
     EmployeeKPIGoal,
     KPIGoal,
-    Department,
-    EmployeeKPIStatusEnum
+    BonusTypeEnum,
+    EmployeeKPIStatusEnum,
+    EmployeeStatusEnum,
+    KPIGoalStatusEnum,
 )
+from app.services.kpi_analytics import invalidate_kpi_analytics_cache
 
 logger = logging.getLogger(__name__)
 
+GOALS_FROM_PREVIOUS_MONTH = "previous_month"
+GOALS_FROM_DEPARTMENT = "department_defaults"
+
+
+def _typed(value: Any, column) -> Any:
+    """Literal cast to the column type (enums, numerics) for INSERT ... SELECT"""
+    return cast(literal(value, type_=column.type), column.type)
+
 
 class EmployeeKPIAutoCreator:
     """Service for automatic creation of EmployeeKPI records"""
@@ -32,7 +50,7 @@ class EmployeeKPIAutoCreator:
         year: int,
         month: int,
         department_id: int = None
-    ) -> Dict[str, int]:
+    ) -> Dict[str, Any]:
         """
         Create EmployeeKPI records for all active employees for specified year/month
 
@@ -42,187 +60,236 @@ class EmployeeKPIAutoCreator:
             department_id: Optional department filter (None = all departments)
 
         Returns:
-            dict: Statistics of created records
+            dict: Statistics of created records and a per-employee report
         """
         logger.info(
             f"Starting automatic EmployeeKPI creation for {year}-{month:02d}"
             f"{f' (department_id={department_id})' if department_id else ' (all departments)'}"
         )
 
-        # Query active employees
-        employee_query = self.db.query(Employee).filter(Employee.is_active == True)
+        try:
+            result = self._rollover(year, month, department_id)
+            self.db.commit()
+            invalidate_kpi_analytics_cache()
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error creating EmployeeKPI records for {year}-{month:02d}: {e}", exc_info=True)
+            raise
+
+        logger.info(
+            f"EmployeeKPI auto-creation completed: {result['created']} created, "
+            f"{result['skipped']} skipped, {result['errors']} errors"
+        )
+
+        return result
 
+    def _rollover(self, year: int, month: int, department_id: Optional[int]) -> Dict[str, Any]:
+        employee_filter = [Employee.status == EmployeeStatusEnum.ACTIVE]
         if department_id:
-            employee_query = employee_query.filter(Employee.department_id == department_id)
+            employee_filter.append(Employee.department_id == department_id)
 
-        active_employees = employee_query.all()
+        has_kpi = exists().where(
+            EmployeeKPI.employee_id == Employee.id,
+            EmployeeKPI.year == year,
+            EmployeeKPI.month == month
+        )
+
+        active_employees = self.db.execute(
+            select(Employee.id, Employee.full_name)
+            .where(*employee_filter)
+            .order_by(Employee.id)
+        ).all()
 
         logger.info(f"Found {len(active_employees)} active employees")
 
-        created_count = 0
-        skipped_count = 0
-        error_count = 0
+        created = self._create_employee_kpis(year, month, employee_filter, has_kpi)
+        kpi_ids = list(created.values())
 
-        for employee in active_employees:
-            try:
-                # Check if EmployeeKPI already exists for this employee/year/month
-                existing_kpi = self.db.query(EmployeeKPI).filter(
-                    and_(
-                        EmployeeKPI.employee_id == employee.id,
-                        EmployeeKPI.year == year,
-                        EmployeeKPI.month == month
-                    )
-                ).first()
-
-                if existing_kpi:
-                    logger.debug(
-                        f"EmployeeKPI already exists for employee {employee.id} "
-                        f"({employee.full_name}) for {year}-{month:02d}"
-                    )
-                    skipped_count += 1
-                    continue
-
-                # Create new EmployeeKPI record
-                new_kpi = self._create_employee_kpi(employee, year, month)
-
-                # Copy goals from previous month or create default goals
-                self._copy_or_create_goals(employee, new_kpi, year, month)
-
-                self.db.commit()
-
-                logger.info(
-                    f"Created EmployeeKPI for employee {employee.id} ({employee.full_name}) "
-                    f"for {year}-{month:02d}"
-                )
-                created_count += 1
+        copied_goals = self._copy_previous_goals(created, year, month)
+        default_goals = self._create_default_goals(kpi_ids, year, month)
 
-            except Exception as e:
-                logger.error(
-                    f"Error creating EmployeeKPI for employee {employee.id} ({employee.full_name}): {e}",
-                    exc_info=True
-                )
-                self.db.rollback()
-                error_count += 1
+        goal_counts = self._goal_counts(kpi_ids)
+        copied_counts = {kpi_id: count for kpi_id, count in goal_counts.items() if kpi_id in copied_goals}
 
-        result = {
+        employees: List[Dict[str, Any]] = []
+        for employee in active_employees:
+            kpi_id = created.get(employee.id)
+            if kpi_id is None:
+                employees.append({
+                    "employee_id": employee.id,
+                    "full_name": employee.full_name,
+                    "status": "skipped",
+                    "goals": 0,
+                    "goals_source": None,
+                })
+                continue
+
+            goals = goal_counts.get(kpi_id, 0)
+            if not goals:
+                logger.warning(
+                    f"No goals found for employee {employee.id} ({employee.full_name}). "
+                    f"EmployeeKPI created without goals."
+                )
+            employees.append({
+                "employee_id": employee.id,
+                "full_name": employee.full_name,
+                "status": "created",
+                "goals": goals,
+                "goals_source": (
+                    GOALS_FROM_PREVIOUS_MONTH if kpi_id in copied_counts
+                    else GOALS_FROM_DEPARTMENT if goals else None
+                ),
+            })
+
+        return {
             "total_employees": len(active_employees),
-            "created": created_count,
-            "skipped": skipped_count,
-            "errors": error_count
+            "created": len(created),
+            "skipped": len(active_employees) - len(created),
+            "errors": 0,
+            "goals_copied": sum(copied_counts.values()),
+            "goals_default": default_goals,
+            "employees": employees,
         }
 
-        logger.info(
-            f"EmployeeKPI auto-creation completed: {created_count} created, "
-            f"{skipped_count} skipped, {error_count} errors"
-        )
-
-        return result
-
-    def _create_employee_kpi(
-        self,
-        employee: Employee,
-        year: int,
-        month: int
-    ) -> EmployeeKPI:
-        """Create new EmployeeKPI record"""
-        new_kpi = EmployeeKPI(
-            employee_id=employee.id,
-            department_id=employee.department_id,
-            year=year,
-            month=month,
-            status=EmployeeKPIStatusEnum.DRAFT,
+    def _create_employee_kpis(self, year: int, month: int, employee_filter: list, has_kpi) -> Dict[int, int]:
+        """INSERT ... SELECT a DRAFT EmployeeKPI for every active employee without one; returns employee_id -> kpi id"""
+        now = datetime.utcnow()
+        columns = EmployeeKPI.__table__.c
+        values = {
+            "employee_id": Employee.id,
+            "department_id": Employee.department_id,
+            "year": literal(year),
+            "month": literal(month),
+            "status": _typed(EmployeeKPIStatusEnum.DRAFT, columns.status),
+            "depremium_threshold": _typed(Decimal("10.00"), columns.depremium_threshold),
+            "depremium_applied": literal(False),
             # Bonus fields will be calculated when goals are set and approved
-            monthly_bonus_performance=0.0,
-            quarterly_bonus_performance=0.0,
-            annual_bonus_performance=0.0,
-            kpi_percentage_performance=0.0
-        )
-
-        self.db.add(new_kpi)
-        self.db.flush()  # Get ID for new_kpi
-
-        return new_kpi
-
-    def _copy_or_create_goals(
-        self,
-        employee: Employee,
-        new_kpi: EmployeeKPI,
-        year: int,
-        month: int
-    ):
+            "monthly_bonus_type": _typed(BonusTypeEnum.PERFORMANCE_BASED, columns.monthly_bonus_type),
+            "quarterly_bonus_type": _typed(BonusTypeEnum.PERFORMANCE_BASED, columns.quarterly_bonus_type),
+            "annual_bonus_type": _typed(BonusTypeEnum.PERFORMANCE_BASED, columns.annual_bonus_type),
+            "monthly_bonus_base": _typed(Decimal("0"), columns.monthly_bonus_base),
+            "quarterly_bonus_base": _typed(Decimal("0"), columns.quarterly_bonus_base),
+            "annual_bonus_base": _typed(Decimal("0"), columns.annual_bonus_base),
+            "created_at": literal(now),
+            "updated_at": literal(now),
+        }
+        source = select(*values.values()).where(*employee_filter, ~has_kpi)
+        rows = self.db.execute(
+            insert(EmployeeKPI)
+            .from_select(list(values), source)
+            .returning(EmployeeKPI.employee_id, EmployeeKPI.id)
+        ).all()
+        return {employee_id: kpi_id for employee_id, kpi_id in rows}
+
+    def _copy_previous_goals(self, created: Dict[int, int], year: int, month: int) -> set:
         """
-        Copy goals from previous month or create default goals for employee
+        Copy goals of the previous month's KPI (without actual values); returns ids of KPIs that got goals
 
-        Logic:
-        1. Try to find EmployeeKPI from previous month
-        2. If found, copy goals (without actual values)
-        3. If not found, get default goals for employee's department
+        If an employee has several KPI records for the previous month, the latest one is used.
         """
-        # Find previous month's KPI
+        if not created:
+            return set()
+
         previous_month = month - 1 if month > 1 else 12
         previous_year = year if month > 1 else year - 1
 
-        previous_kpi = self.db.query(EmployeeKPI).filter(
-            and_(
-                EmployeeKPI.employee_id == employee.id,
+        previous_kpis = self.db.execute(
+            select(func.max(EmployeeKPI.id), EmployeeKPI.employee_id)
+            .where(
+                EmployeeKPI.employee_id.in_(list(created)),
                 EmployeeKPI.year == previous_year,
                 EmployeeKPI.month == previous_month
             )
-        ).first()
+            .group_by(EmployeeKPI.employee_id)
+        ).all()
+        kpi_map = {previous_kpi_id: created[employee_id] for previous_kpi_id, employee_id in previous_kpis}
+        if not kpi_map:
+            return set()
+
+        now = datetime.utcnow()
+        columns = EmployeeKPIGoal.__table__.c
+        values = {
+            "employee_id": EmployeeKPIGoal.employee_id,
+            "goal_id": EmployeeKPIGoal.goal_id,
+            "employee_kpi_id": case(kpi_map, value=EmployeeKPIGoal.employee_kpi_id),
+            "year": literal(year),
+            "month": literal(month),
+            "target_value": EmployeeKPIGoal.target_value,
+            "weight": EmployeeKPIGoal.weight,
+            "actual_value": _typed(Decimal("0"), columns.actual_value),  # Reset actual value
+            "achievement_percentage": _typed(Decimal("0"), columns.achievement_percentage),  # Reset achievement
+            "status": _typed(KPIGoalStatusEnum.ACTIVE, columns.status),
+            "created_at": literal(now),
+            "updated_at": literal(now),
+        }
+        source = (
+            select(*values.values())
+            .join(KPIGoal, KPIGoal.id == EmployeeKPIGoal.goal_id)
+            .where(
+                EmployeeKPIGoal.employee_kpi_id.in_(list(kpi_map)),
+                EmployeeKPIGoal.status != KPIGoalStatusEnum.CANCELLED,
+                KPIGoal.status != KPIGoalStatusEnum.CANCELLED
+            )
+        )
+        rows = self.db.execute(
+            insert(EmployeeKPIGoal).from_select(list(values), source).returning(EmployeeKPIGoal.employee_kpi_id)
+        ).scalars().all()
 
-        if previous_kpi:
-            # Copy goals from previous month
-            previous_goals = self.db.query(EmployeeKPIGoal).filter(
-                EmployeeKPIGoal.employee_kpi_id == previous_kpi.id
-            ).all()
+        logger.debug(f"Copied {len(rows)} goals from previous month ({previous_year}-{previous_month:02d})")
+        return set(rows)
 
-            logger.debug(
-                f"Copying {len(previous_goals)} goals from previous month "
-                f"({previous_year}-{previous_month:02d})"
-            )
+    def _create_default_goals(self, kpi_ids: List[int], year: int, month: int) -> int:
+        """Give KPIs without goals the department's active KPI goals with equal weights"""
+        if not kpi_ids:
+            return 0
 
-            for prev_goal in previous_goals:
-                new_goal = EmployeeKPIGoal(
-                    employee_kpi_id=new_kpi.id,
-                    kpi_goal_id=prev_goal.kpi_goal_id,
-                    target_value=prev_goal.target_value,
-                    weight=prev_goal.weight,
-                    actual_value=0.0,  # Reset actual value
-                    achievement_percentage=0.0  # Reset achievement
-                )
-                self.db.add(new_goal)
+        new_kpi = aliased(EmployeeKPI)
 
-        else:
-            # No previous KPI - create default goals from department's active KPI goals
-            logger.debug(
-                f"No previous KPI found, creating default goals for department {employee.department_id}"
+        def default_goal(goal):
+            return and_(
+                goal.department_id == new_kpi.department_id,
+                goal.status == KPIGoalStatusEnum.ACTIVE,
+                goal.year == year
             )
 
-            default_goals = self.db.query(KPIGoal).filter(
-                and_(
-                    KPIGoal.department_id == employee.department_id,
-                    KPIGoal.is_active == True
-                )
-            ).all()
-
-            # If there are default goals, distribute weights equally
-            if default_goals:
-                weight_per_goal = 100.0 / len(default_goals)
-
-                for kpi_goal in default_goals:
-                    new_goal = EmployeeKPIGoal(
-                        employee_kpi_id=new_kpi.id,
-                        kpi_goal_id=kpi_goal.id,
-                        target_value=0.0,  # Manager will set this
-                        weight=weight_per_goal,
-                        actual_value=0.0,
-                        achievement_percentage=0.0
-                    )
-                    self.db.add(new_goal)
-
-                logger.debug(f"Created {len(default_goals)} default goals with weight {weight_per_goal:.2f}%")
-            else:
-                logger.warning(
-                    f"No active KPI goals found for department {employee.department_id}. "
-                    f"EmployeeKPI created without goals."
-                )
+        counted_goal = aliased(KPIGoal)
+        department_goal_count = (
+            select(func.count(counted_goal.id)).where(default_goal(counted_goal)).scalar_subquery()
+        )
+
+        now = datetime.utcnow()
+        columns = EmployeeKPIGoal.__table__.c
+        values = {
+            "employee_id": new_kpi.employee_id,
+            "goal_id": KPIGoal.id,
+            "employee_kpi_id": new_kpi.id,
+            "year": literal(year),
+            "month": literal(month),
+            "target_value": _typed(Decimal("0"), columns.target_value),  # Manager will set this
+            "weight": func.round(cast(100, Numeric(15, 6)) / department_goal_count, 2),
+            "actual_value": _typed(Decimal("0"), columns.actual_value),
+            "achievement_percentage": _typed(Decimal("0"), columns.achievement_percentage),
+            "status": _typed(KPIGoalStatusEnum.ACTIVE, columns.status),
+            "created_at": literal(now),
+            "updated_at": literal(now),
+        }
+        has_goals = exists().where(EmployeeKPIGoal.employee_kpi_id == new_kpi.id)
+        source = (
+            select(*values.values())
+            .select_from(new_kpi)
+            .join(KPIGoal, default_goal(KPIGoal))
+            .where(new_kpi.id.in_(kpi_ids), ~has_goals)
+        )
+        created = self.db.execute(insert(EmployeeKPIGoal).from_select(list(values), source)).rowcount
+        logger.debug(f"Created {created} default goals from department KPI goals")
+        return created
+
+    def _goal_counts(self, kpi_ids: List[int]) -> Dict[int, int]:
+        if not kpi_ids:
+            return {}
+        rows = self.db.execute(
+            select(EmployeeKPIGoal.employee_kpi_id, func.count(EmployeeKPIGoal.id))
+            .where(EmployeeKPIGoal.employee_kpi_id.in_(kpi_ids))
+            .group_by(EmployeeKPIGoal.employee_kpi_id)
+        ).all()
+        return {kpi_id: count for kpi_id, count in rows}
@@ -0,0 +1,191 @@
+"""
+Streaming exports for the external API
+
+Rows are read through a server-side cursor (AsyncSession.stream with
+yield_per) and encoded incrementally as CSV, NDJSON or a JSON document, with
+optional gzip. Memory stays flat and the first byte is sent as soon as the
+first batch is fetched, regardless of export size.
+
+Pagination is keyset-based: rows are ordered by id and `after_id`/`limit`
+select the page; the next page starts after the last id received.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+
+from app.db.session import AsyncSessionLocal
+from app.utils.logger import log_info
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MAX_LIMIT = 100000
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+def paginate(statement: Select, id_column, after_id: Optional[int], limit: Optional[int]) -> Select:
+    """Keyset pagination: ORDER BY id, WHERE id > after_id, LIMIT limit"""
+    if after_id is not None:
+        statement = statement.where(id_column > after_id)
+    statement = statement.order_by(id_column)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+async def iter_export_rows(
+    statement: Select,
+    serialize: Callable[[Any], Dict[str, Any]],
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield serialized rows from a server-side cursor
+
+    Uses its own session: the stream outlives the request dependencies.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(statement.execution_options(yield_per=batch_size))
+        async for row in result:
+            yield serialize(row)
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, "value"):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def _encode_csv(rows: AsyncIterator[Dict[str, Any]], fields: List[str]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    count = 0
+    async for row in rows:
+        writer.writerow([row.get(field) for field in fields])
+        count += 1
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+async def _encode_ndjson(rows: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    lines: List[str] = []
+    async for row in rows:
+        lines.append(json.dumps(row, default=_json_default, ensure_ascii=False))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+async def _encode_json(rows: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """{"data": [...], "count": N, "next_after_id": id} with data streamed item by item"""
+    yield '{"data": ['
+    count = 0
+    last_id = None
+    chunk: List[str] = []
+    async for row in rows:
+        prefix = "," if count else ""
+        chunk.append(prefix + json.dumps(row, default=_json_default, ensure_ascii=False))
+        count += 1
+        last_id = row.get("id", last_id)
+        if len(chunk) >= EXPORT_BATCH_SIZE:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+    yield f'], "count": {count}, "next_after_id": {json.dumps(last_id)}}}'
+
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def _encode_bytes(chunks: AsyncIterator[str], on_done: Callable[[], None]) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        yield chunk.encode("utf-8")
+    on_done()
+
+
+def export_response(
+    rows: AsyncIterator[Dict[str, Any]],
+    fields: List[str],
+    format: str,
+    filename: str,
+    gzip: bool = False,
+    log_context: str = "",
+) -> StreamingResponse:
+    """Build a StreamingResponse encoding rows as csv / ndjson / json"""
+    counted = _CountingIterator(rows)
+    if format == "csv":
+        chunks = _encode_csv(counted, fields)
+    elif format == "ndjson":
+        chunks = _encode_ndjson(counted)
+    else:
+        chunks = _encode_json(counted)
+
+    body = _encode_bytes(
+        chunks,
+        lambda: log_info(f"External API: Exported {counted.count} {filename}", context=log_context),
+    )
+    headers: Dict[str, str] = {}
+    if format != "json":
+        extension = "csv" if format == "csv" else "ndjson"
+        headers["Content-Disposition"] = (
+            f"attachment; filename={filename}_{datetime.now().strftime('%Y%m%d')}.{extension}"
+        )
+    if gzip:
+        body = _gzip(body)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+
+    return StreamingResponse(body, media_type=MEDIA_TYPES[format], headers=headers)
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """True if Accept-Encoding allows gzip (q=0 disables it)"""
+    if not accept_encoding:
+        return False
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+class _CountingIterator:
+    """Async iterator wrapper counting rows for the completion log"""
+
+    def __init__(self, rows: AsyncIterator[Dict[str, Any]]):
+        self._rows = rows
+        self.count = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        row = await self._rows.__anext__()
+        self.count += 1
+        return row
@@ -0,0 +1,426 @@
+"""
+Set-based forecast generation engine
+
+Builds ForecastExpense rows for one or many (department, month) pairs:
+1. Regular expenses: (category, contractor, organization) groups repeating
+   within the last 3 months
+2. Category averages for non-regular expenses over the last 6 months
+3. Payroll (ФОТ) forecasts from PayrollPlan
+
+Per-group average amount, average payment day and latest non-empty comment
+are resolved with a single windowed query per target month (all departments
+at once) instead of one Expense query per group. Forecasts are written with
+one bulk DELETE and one bulk INSERT per call.
+"""
+import calendar
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, case, delete, extract, func, insert, or_
+from sqlalchemy.orm import Session
+
+from app.db.models import (
+    BudgetCategory,
+    Expense,
+    ForecastExpense,
+    Organization,
+    PayrollPlan,
+)
+
+logger = logging.getLogger(__name__)
+
+FORECAST_EXPENSE_STATUSES = ('PAID', 'PENDING')
+
+REGULAR_LOOKBACK_DAYS = 90
+REGULAR_MIN_COUNT = 3
+AVERAGE_LOOKBACK_DAYS = 180
+AVERAGE_MIN_COUNT = 2
+
+# Доли ФОТ: аванс 40%, оклад + премия 47%, НДФЛ 13%
+PAYROLL_ADVANCE_SHARE = 0.40
+PAYROLL_SALARY_SHARE = 0.47
+PAYROLL_NDFL_SHARE = 0.13
+PAYROLL_ADVANCE_DAY = 10
+PAYROLL_SALARY_DAY = 25
+
+
+def is_weekend(date_obj: date) -> bool:
+    """Проверяет, является ли дата выходным днем (суббота=5, воскресенье=6)"""
+    return date_obj.weekday() in (5, 6)
+
+
+def get_previous_workday(date_obj: date) -> date:
+    """Возвращает предыдущий рабочий день (пропускает выходные)"""
+    current = date_obj
+    while True:
+        current = current - timedelta(days=1)
+        if not is_weekend(current):
+            return current
+
+
+def adjust_to_workday(date_obj: date) -> date:
+    """
+    Переносит дату на рабочий день согласно правилам:
+    - Если дата попадает на выходные (суббота или воскресенье) - переносит на предыдущий рабочий день
+    - Если дата - рабочий день, оставляет как есть
+    """
+    if is_weekend(date_obj):
+        return get_previous_workday(date_obj)
+
+    return date_obj
+
+
+def round_to_hundreds(amount: Decimal) -> Decimal:
+    """
+    Округляет сумму до сотен (например: 12345 -> 12300, 12380 -> 12400)
+    """
+    amount_float = float(amount)
+    rounded = round(amount_float / 100) * 100
+    return Decimal(str(rounded))
+
+
+def month_bounds(year: int, month: int) -> Tuple[date, date]:
+    """Return [first day of month, first day of next month)."""
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+@dataclass(frozen=True)
+class ExpenseGroupStats:
+    """Aggregated history of one expense group within a lookback window."""
+    department_id: int
+    category_id: int
+    contractor_id: Optional[int]
+    organization_id: int
+    avg_amount: Decimal
+    avg_day: float
+    latest_comment: Optional[str]
+
+
+class ForecastGenerator:
+    """Generate forecasts for many departments and months in one call"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def generate(
+        self,
+        department_ids: Sequence[int],
+        periods: Sequence[Tuple[int, int]],
+        include_regular: bool = True,
+        include_average: bool = True,
+        include_payroll: bool = True,
+    ) -> Dict[Tuple[int, int, int], int]:
+        """
+        Replace forecasts for every (department, year, month) combination.
+
+        Args:
+            department_ids: Departments to generate forecasts for
+            periods: (year, month) pairs
+            include_regular: Include regular expenses
+            include_average: Include category averages for non-regular expenses
+            include_payroll: Include payroll (ФОТ) forecasts
+
+        Returns:
+            dict: (department_id, year, month) -> number of created forecasts.
+            Caller is responsible for commit.
+        """
+        department_ids = sorted(set(department_ids))
+        periods = sorted(set(periods))
+        created: Dict[Tuple[int, int, int], int] = {
+            (dept_id, year, month): 0
+            for dept_id in department_ids
+            for year, month in periods
+        }
+        if not department_ids or not periods:
+            return created
+
+        self._delete_existing(department_ids, periods)
+
+        category_names: Optional[Dict[int, str]] = None
+        rows: List[dict] = []
+
+        for year, month in periods:
+            target_date = date(year, month, 1)
+            regular_categories: Dict[int, set] = defaultdict(set)
+
+            if include_regular:
+                for stats in self._load_group_stats(
+                    department_ids,
+                    target_date,
+                    REGULAR_LOOKBACK_DAYS,
+                    REGULAR_MIN_COUNT,
+                    by_contractor=True,
+                ):
+                    regular_categories[stats.department_id].add(stats.category_id)
+                    rows.append(self._build_row(
+                        stats,
+                        year,
+                        month,
+                        comment=stats.latest_comment or "Регулярная оплата",
+                        is_regular=True,
+                    ))
+                    created[(stats.department_id, year, month)] += 1
+
+            if include_average:
+                for stats in self._load_group_stats(
+                    department_ids,
+                    target_date,
+                    AVERAGE_LOOKBACK_DAYS,
+                    AVERAGE_MIN_COUNT,
+                    by_contractor=False,
+                ):
+                    # Пропускаем категории, уже попавшие в регулярные
+                    if stats.category_id in regular_categories[stats.department_id]:
+                        continue
+
+                    comment = stats.latest_comment
+                    if not comment:
+                        if category_names is None:
+                            category_names = self._load_category_names(department_ids)
+                        comment = category_names.get(stats.category_id, "Прочие расходы")
+
+                    rows.append(self._build_row(
+                        stats,
+                        year,
+                        month,
+                        comment=comment,
+                        is_regular=False,
+                    ))
+                    created[(stats.department_id, year, month)] += 1
+
+        if include_payroll:
+            for row in self._build_payroll_rows(department_ids, periods):
+                rows.append(row)
+                forecast_date = row["forecast_date"]
+                created[(row["department_id"], forecast_date.year, forecast_date.month)] += 1
+
+        if rows:
+            self.db.execute(insert(ForecastExpense), rows)
+
+        logger.info(
+            "Generated %s forecasts for %s departments x %s months",
+            len(rows),
+            len(department_ids),
+            len(periods),
+        )
+        return created
+
+    def _delete_existing(
+        self,
+        department_ids: Sequence[int],
+        periods: Iterable[Tuple[int, int]],
+    ) -> None:
+        """Remove existing forecasts with one range-based DELETE (index friendly)."""
+        ranges = []
+        for year, month in periods:
+            start, end = month_bounds(year, month)
+            ranges.append(and_(
+                ForecastExpense.forecast_date >= start,
+                ForecastExpense.forecast_date < end,
+            ))
+
+        self.db.execute(
+            delete(ForecastExpense)
+            .where(
+                ForecastExpense.department_id.in_(department_ids),
+                or_(*ranges),
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    def _load_group_stats(
+        self,
+        department_ids: Sequence[int],
+        target_date: date,
+        lookback_days: int,
+        min_count: int,
+        by_contractor: bool,
+    ) -> List[ExpenseGroupStats]:
+        """
+        Aggregate expense groups with window functions in a single query.
+
+        ROW_NUMBER orders rows with a non-empty comment first (most recent
+        first), so the first row of every partition carries the latest
+        non-empty comment, while COUNT/AVG OVER give the group statistics.
+        """
+        partition = [Expense.department_id, Expense.category_id, Expense.organization_id]
+        if by_contractor:
+            partition.insert(2, Expense.contractor_id)
+
+        clean_comment = func.nullif(func.trim(Expense.comment), '')
+        window = dict(partition_by=partition)
+
+        ranked = (
+            self.db.query(
+                Expense.department_id.label('department_id'),
+                Expense.category_id.label('category_id'),
+                Expense.contractor_id.label('contractor_id'),
+                Expense.organization_id.label('organization_id'),
+                clean_comment.label('comment'),
+                func.row_number().over(
+                    order_by=[
+                        case((clean_comment.is_(None), 1), else_=0),
+                        Expense.request_date.desc(),
+                        Expense.id.desc(),
+                    ],
+                    **window,
+                ).label('rn'),
+                func.count(Expense.id).over(**window).label('cnt'),
+                func.avg(Expense.amount).over(**window).label('avg_amount'),
+                func.avg(extract('day', Expense.request_date)).over(**window).label('avg_day'),
+            )
+            .filter(
+                Expense.department_id.in_(department_ids),
+                Expense.category_id.is_not(None),
+                Expense.request_date >= target_date - timedelta(days=lookback_days),
+                Expense.request_date < target_date,
+                Expense.status.in_(FORECAST_EXPENSE_STATUSES),
+            )
+            .subquery()
+        )
+
+        result = self.db.query(ranked).filter(
+            ranked.c.rn == 1,
+            ranked.c.cnt >= min_count,
+        ).all()
+
+        return [
+            ExpenseGroupStats(
+                department_id=row.department_id,
+                category_id=row.category_id,
+                contractor_id=row.contractor_id if by_contractor else None,
+                organization_id=row.organization_id,
+                avg_amount=Decimal(str(row.avg_amount)),
+                avg_day=float(row.avg_day),
+                latest_comment=row.comment,
+            )
+            for row in result
+        ]
+
+    def _build_row(
+        self,
+        stats: ExpenseGroupStats,
+        year: int,
+        month: int,
+        comment: str,
+        is_regular: bool,
+    ) -> dict:
+        max_day = calendar.monthrange(year, month)[1]
+        day_of_month = min(max(round(stats.avg_day), 1), max_day)
+        now = datetime.utcnow()
+
+        return {
+            "department_id": stats.department_id,
+            "category_id": stats.category_id,
+            "contractor_id": stats.contractor_id,
+            "organization_id": stats.organization_id,
+            "forecast_date": adjust_to_workday(date(year, month, day_of_month)),
+            "amount": round_to_hundreds(stats.avg_amount),
+            "is_regular": is_regular,
+            "comment": comment,
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    def _load_category_names(self, department_ids: Sequence[int]) -> Dict[int, str]:
+        return dict(
+            self.db.query(BudgetCategory.id, BudgetCategory.name)
+            .filter(BudgetCategory.department_id.in_(department_ids))
+            .all()
+        )
+
+    def _build_payroll_rows(
+        self,
+        department_ids: Sequence[int],
+        periods: Sequence[Tuple[int, int]],
+    ) -> List[dict]:
+        """Build advance / salary / NDFL forecasts from PayrollPlan totals."""
+        totals = self.db.query(
+            PayrollPlan.department_id,
+            PayrollPlan.year,
+            PayrollPlan.month,
+            func.sum(PayrollPlan.total_planned).label('total'),
+        ).filter(
+            PayrollPlan.department_id.in_(department_ids),
+            or_(*[
+                and_(PayrollPlan.year == year, PayrollPlan.month == month)
+                for year, month in periods
+            ]),
+        ).group_by(
+            PayrollPlan.department_id,
+            PayrollPlan.year,
+            PayrollPlan.month,
+        ).all()
+
+        totals = [row for row in totals if row.total and float(row.total) > 0]
+        if not totals:
+            return []
+
+        fot_categories = self._resolve_payroll_categories({row.department_id for row in totals})
+
+        default_org = self.db.query(Organization.id).filter(
+            Organization.is_active == True
+        ).order_by(Organization.id).first()
+        org_id = default_org.id if default_org else 1
+
+        rows = []
+        now = datetime.utcnow()
+        for row in totals:
+            category_id = fot_categories.get(row.department_id)
+            if not category_id:
+                continue
+
+            total_payroll = float(row.total)
+            max_day = calendar.monthrange(row.year, row.month)[1]
+            advance_date = adjust_to_workday(date(row.year, row.month, min(PAYROLL_ADVANCE_DAY, max_day)))
+            salary_date = adjust_to_workday(date(row.year, row.month, min(PAYROLL_SALARY_DAY, max_day)))
+
+            for forecast_date, share, comment in (
+                (advance_date, PAYROLL_ADVANCE_SHARE, "Аванс сотрудникам"),
+                (salary_date, PAYROLL_SALARY_SHARE, "Оклад и премии сотрудникам"),
+                (salary_date, PAYROLL_NDFL_SHARE, "НДФЛ с заработной платы"),
+            ):
+                rows.append({
+                    "department_id": row.department_id,
+                    "category_id": category_id,
+                    "contractor_id": None,
+                    "organization_id": org_id,
+                    "forecast_date": forecast_date,
+                    "amount": round_to_hundreds(Decimal(str(total_payroll * share))),
+                    "is_regular": True,
+                    "comment": comment,
+                    "created_at": now,
+                    "updated_at": now,
+                })
+
+        return rows
+
+    def _resolve_payroll_categories(self, department_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        Pick the "ФОТ" category per department, falling back to the first
+        active category. One query for all departments.
+        """
+        categories = self.db.query(
+            BudgetCategory.id,
+            BudgetCategory.department_id,
+            BudgetCategory.name,
+            BudgetCategory.is_active,
+        ).filter(
+            BudgetCategory.department_id.in_(list(department_ids))
+        ).order_by(BudgetCategory.id).all()
+
+        fot: Dict[int, int] = {}
+        fallback: Dict[int, int] = {}
+        for category in categories:
+            if category.name and "фот" in category.name.lower():
+                fot.setdefault(category.department_id, category.id)
+            if category.is_active:
+                fallback.setdefault(category.department_id, category.id)
+
+        return {**fallback, **fot}
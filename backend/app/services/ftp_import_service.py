@@ -2,13 +2,16 @@
 Service for importing expenses from FTP Excel files
 """
 import asyncio
+import re
 import aioftp
+import openpyxl
 import pandas as pd
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Dict, Optional, Tuple, Set
+from typing import List, Dict, Optional, Tuple, Set, Iterator
 from sqlalchemy.orm import Session
-from sqlalchemy import extract, and_, or_
+from sqlalchemy import extract, and_, or_, insert, update
+from sqlalchemy.exc import SQLAlchemyError
 from io import BytesIO
 import logging
 
@@ -17,6 +20,221 @@ from app.services.baseline_bus import baseline_bus
 
 logger = logging.getLogger(__name__)
 
+# Rows per multi-row INSERT/UPDATE and per IN (...) lookup in bulk import
+BULK_CHUNK_SIZE = 1000
+
+# Files larger than this are read with openpyxl in read-only mode and
+# normalized chunk by chunk instead of being loaded into one DataFrame
+EXCEL_STREAM_THRESHOLD_BYTES = 5 * 1024 * 1024
+EXCEL_CHUNK_ROWS = 5000
+
+# Map column names based on actual Excel structure
+FTP_COLUMN_MAPPING = {
+    'Заявка на расходование денежных средств': 'number',
+    'Желательная дата платежа': 'request_date',
+    'Статья ДДС': 'category_name',
+    'Получатель': 'contractor_name',
+    'Организация': 'organization_name',
+    'Подразделение': 'subdivision_name',  # FTP subdivision field
+    'Сумма документа': 'amount',
+    'Дата оплаты': 'payment_date',
+    'Статус': 'status',
+    'Комментарий': 'comment',
+    'Кто заявил': 'requester',
+    'Назначение платежа': 'purpose',  # For keyword matching
+}
+
+EXPENSE_NUMBER_PATTERN = r'([А-ЯA-Z0-9]{2,4}0В-\d{6})'
+
+# Russian FTP statuses -> English enum values
+FTP_STATUS_MAPPING = {
+    'К оплате': 'PENDING',
+    'Оплачена': 'PAID',
+    'Оплачено': 'PAID',
+    'Черновик': 'DRAFT',
+    'Отклонена': 'REJECTED',
+    'Закрыта': 'CLOSED',
+}
+
+STATUS_ENUM_LOOKUP = {
+    'ЧЕРНОВИК': ExpenseStatusEnum.DRAFT,
+    'DRAFT': ExpenseStatusEnum.DRAFT,
+    'К ОПЛАТЕ': ExpenseStatusEnum.PENDING,
+    'PENDING': ExpenseStatusEnum.PENDING,
+    'ОПЛАЧЕНА': ExpenseStatusEnum.PAID,
+    'PAID': ExpenseStatusEnum.PAID,
+    'ОТКЛОНЕНА': ExpenseStatusEnum.REJECTED,
+    'REJECTED': ExpenseStatusEnum.REJECTED,
+    'ЗАКРЫТА': ExpenseStatusEnum.CLOSED,
+    'CLOSED': ExpenseStatusEnum.CLOSED,
+}
+
+# Keyword mapping to category names (earlier keywords win)
+CATEGORY_KEYWORD_MAPPING = {
+    # Техника
+    'техника': ['Техника'],
+    'сканер': ['Техника Склад'],
+    'склад': ['Техника Склад'],
+    'краснодар': ['Техника Краснодар'],
+    'логистик': ['Техника Логистика'],
+    'москв': ['Техника Москва'],
+    'спб': ['Техника ОП СПб'],
+    'сервис': ['Техника Сервис'],
+    'вэд': ['Техника ВЭД'],
+    'юр': ['Техника Юр. отдел'],
+    'маркетинг': ['Техника отдел маркетинга'],
+
+    # Обслуживание
+    'обслуживание': ['Обслуживание оргтехники', 'Ремонты и тех обслуживание'],
+    'ремонт': ['Ремонты и тех обслуживание', 'Обслуживание и ремонт'],
+    'заправка': ['Заправка картриджей'],
+    'картридж': ['Заправка картриджей'],
+    'расходн': ['Расходные материалы'],
+
+    # Связь
+    'интернет': ['Связь (телефон/интернет)', 'Связь и коммуникации'],
+    'телефон': ['Связь (телефон/интернет)', 'Связь и коммуникации'],
+    'связь': ['Связь (телефон/интернет)', 'Связь и коммуникации'],
+    'мобильн': ['Связь (телефон/интернет)'],
+
+    # Серверы и хостинг
+    'сервер': ['Сервер 1с', 'Серверы и хостинг', 'Почтовый Сервер'],
+    'хостинг': ['Хостинг CRM', 'Серверы и хостинг'],
+    'почтов': ['Почтовый Сервер'],
+    '1с': ['1с', '1с(лицензии)', 'Сервер 1с'],
+
+    # Разработка
+    'разработк': ['Битрикс 24 Разработка', 'Приложение визитов(разработка)', 'Разработка и настройка'],
+    'битрикс': ['Битрикс 24 Разработка', 'Битрикс 24(настройка)', 'Битрикс24(лицензии)'],
+    'настройк': ['Битрикс 24(настройка)', 'Разработка и настройка'],
+    'интеграц': ['Интегарции телефонии чатов и пр'],
+    'приложение': ['Приложение визитов(разработка)'],
+
+    # Прочее
+    'аутсорс': ['Аутсорс'],
+    'принтер': ['Покупка принтеров и прочей орг техники(обновление)'],
+    'лицензи': ['Лицензии и ПО', '1с(лицензии)', 'Битрикс24(лицензии)'],
+    'покупка по': ['Покупка ПО', 'Лицензии и ПО'],
+    'аналитик': ['Аналитика данных'],
+}
+
+DEFAULT_CATEGORY_NAME = "Прочие расходы"
+
+
+def _normalize_text_column(series: pd.Series) -> pd.Series:
+    """Strip surrounding whitespace from string values; blank strings become None"""
+    is_str = series.map(type) == str
+    stripped = series.where(~is_str, series[is_str].str.strip())
+    return stripped.where(~is_str | (stripped != ''), None)
+
+
+def _normalize_date_column(series: pd.Series) -> pd.Series:
+    """
+    Parse dates column-wise: strings as dd.mm.yyyy, Excel datetimes as is.
+    Time is set to 12:00 (noon) to avoid timezone conversion issues (prevents day shift).
+    Unparseable strings become None.
+    """
+    kinds = series.map(type)
+    is_str = kinds == str
+    is_datetime = kinds.isin([pd.Timestamp, datetime])
+    if not (is_str.any() or is_datetime.any()):
+        return series
+
+    parsed = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    if is_str.any():
+        parsed[is_str] = pd.to_datetime(series[is_str], format='%d.%m.%Y', errors='coerce')
+    if is_datetime.any():
+        parsed[is_datetime] = pd.to_datetime(series[is_datetime], errors='coerce')
+    parsed = parsed.dt.normalize() + pd.Timedelta(hours=12)
+
+    # Python datetimes (astype(object) would give Timestamps); DatetimeArray.to_pydatetime
+    # returns an ndarray, unlike the deprecated Series.dt.to_pydatetime
+    converted = pd.Series(parsed.array.to_pydatetime(), index=series.index, dtype=object)
+    converted = converted.where(parsed.notna(), None)
+    return series.where(~(is_str | is_datetime), converted)
+
+
+class CategoryKeywordMatcher:
+    """
+    Keyword -> BudgetCategory matcher built once from the active categories.
+
+    All keywords are compiled into a single lookahead alternation, so one
+    findall per text returns every keyword occurrence; the winner is the
+    keyword with the highest priority in CATEGORY_KEYWORD_MAPPING that
+    resolves to an existing category.
+    """
+
+    def __init__(self, categories: List[BudgetCategory]):
+        self._categories = [(category.name.lower(), category) for category in categories]
+        self._name_cache: Dict[str, Optional[BudgetCategory]] = {}
+
+        self._priority: Dict[str, int] = {}
+        self._keyword_category: Dict[str, BudgetCategory] = {}
+        for priority, (keyword, category_names) in enumerate(CATEGORY_KEYWORD_MAPPING.items()):
+            self._priority[keyword] = priority
+            for cat_name in category_names:
+                category = self.find_by_name(cat_name)
+                if category:
+                    self._keyword_category[keyword] = category
+                    break
+
+        # Longest alternative wins at a given position; keywords that are a
+        # prefix of the matched one are implied by it
+        keywords = sorted(self._keyword_category, key=len, reverse=True)
+        self._implied = {
+            keyword: [other for other in keywords if other != keyword and keyword.startswith(other)]
+            for keyword in keywords
+        }
+        self._pattern = (
+            re.compile("(?=(" + "|".join(re.escape(keyword) for keyword in keywords) + "))")
+            if keywords else None
+        )
+        self._default = self.find_by_name(DEFAULT_CATEGORY_NAME)
+
+    @classmethod
+    def from_db(cls, db: Session) -> "CategoryKeywordMatcher":
+        categories = db.query(BudgetCategory).filter(
+            BudgetCategory.is_active == True
+        ).order_by(BudgetCategory.id).all()
+        return cls(categories)
+
+    def find_by_name(self, name: str) -> Optional[BudgetCategory]:
+        """First active category whose name contains `name` (case-insensitive)"""
+        needle = name.lower()
+        if needle not in self._name_cache:
+            self._name_cache[needle] = next(
+                (category for lowered, category in self._categories if needle in lowered),
+                None
+            )
+        return self._name_cache[needle]
+
+    def _resolve(self, found: List[str], dds_category: Optional[str]) -> Optional[BudgetCategory]:
+        if found:
+            matched = set(found)
+            for keyword in found:
+                matched.update(self._implied[keyword])
+            keyword = min(matched, key=self._priority.__getitem__)
+            return self._keyword_category[keyword]
+
+        # Fallback: try match with DDS category
+        if dds_category:
+            category = self.find_by_name(dds_category)
+            if category:
+                return category
+
+        # Last resort: default category "Прочие расходы"
+        return self._default
+
+    def match(
+        self,
+        comment: Optional[str] = None,
+        purpose: Optional[str] = None,
+        dds_category: Optional[str] = None
+    ) -> Optional[BudgetCategory]:
+        search_text = " ".join(filter(None, [comment or "", purpose or "", dds_category or ""])).lower()
+        found = self._pattern.findall(search_text) if self._pattern else []
+        return self._resolve(found, dds_category)
+
 
 class FTPImportService:
     """Service for importing expenses from FTP server"""
@@ -32,6 +250,7 @@ class FTPImportService:
         self.username = username
         self.password = password
         self.port = port
+        self._category_matcher: Optional[CategoryKeywordMatcher] = None
 
     async def download_file(self, remote_path: str) -> bytes:
         """Download file from FTP server"""
@@ -94,121 +313,110 @@ class FTPImportService:
             raise Exception(f"Excel parsing error: {str(e)}")
 
     def normalize_expense_data(self, df: pd.DataFrame) -> List[Dict]:
-        """Normalize DataFrame to expense format"""
-        expenses = []
-
-        # Map column names based on actual Excel structure
-        column_mapping = {
-            'Заявка на расходование денежных средств': 'number',
-            'Желательная дата платежа': 'request_date',
-            'Статья ДДС': 'category_name',
-            'Получатель': 'contractor_name',
-            'Организация': 'organization_name',
-            'Подразделение': 'subdivision_name',  # FTP subdivision field
-            'Сумма документа': 'amount',
-            'Дата оплаты': 'payment_date',
-            'Статус': 'status',
-            'Комментарий': 'comment',
-            'Кто заявил': 'requester',
-            'Назначение платежа': 'purpose',  # For keyword matching
+        """Normalize DataFrame to expense format (column-wise)"""
+        present = {
+            excel_col: db_col
+            for excel_col, db_col in FTP_COLUMN_MAPPING.items()
+            if excel_col in df.columns
         }
+        if 'number' not in present.values() or df.empty:
+            logger.info("Normalized 0 expenses from Excel")
+            return []
+
+        frame = df[list(present)].rename(columns=present).astype(object)
+        frame = frame.where(frame.notna(), None)
+
+        # Extract number from full string
+        # Example: "Заявка на расходование ДС ВГ0В-000019 от 21.07.2025 15:28:39"
+        # Extract: "ВГ0В-000019"
+        raw_numbers = frame['number'].where(frame['number'].map(type) == str)
+        numbers = raw_numbers.str.extract(EXPENSE_NUMBER_PATTERN, expand=False)
+        unmatched = raw_numbers.notna() & (raw_numbers != '') & numbers.isna()
+        if unmatched.any():
+            logger.warning(
+                f"Could not extract number from {int(unmatched.sum())} rows, "
+                f"e.g.: {raw_numbers[unmatched].iloc[0]}"
+            )
+        frame['number'] = numbers
+        frame = frame[numbers.notna()]
+
+        # Normalize status (Russian statuses -> English enum values)
+        if 'status' in frame.columns:
+            frame['status'] = frame['status'].map(FTP_STATUS_MAPPING).fillna('PENDING')
+        else:
+            frame['status'] = 'PENDING'
+
+        if 'subdivision_name' in frame.columns:
+            frame['subdivision_name'] = _normalize_text_column(frame['subdivision_name'])
+
+        for date_column in ('request_date', 'payment_date'):
+            if date_column in frame.columns:
+                frame[date_column] = _normalize_date_column(frame[date_column])
+
+        # Parse amount - IMPORTANT: Skip if amount is empty/invalid/zero/negative
+        if 'amount' not in frame.columns:
+            logger.warning(f"Skipping {len(frame)} expenses with empty amount")
+            return []
+        raw_amounts = frame['amount']
+        numeric_amounts = pd.to_numeric(raw_amounts, errors='coerce')
+        valid_amount = raw_amounts.notna() & (raw_amounts != '') & (numeric_amounts > 0)
+        if not valid_amount.all():
+            logger.warning(f"Skipping {int((~valid_amount).sum())} expenses with empty/invalid/non-positive amount")
+        frame = frame[valid_amount].copy()
+        frame['amount'] = frame['amount'].map(lambda value: Decimal(str(value)))
+
+        expenses = frame.astype(object).where(frame.notna(), None).to_dict('records')
+        logger.info(f"Normalized {len(expenses)} expenses from Excel")
+        return expenses
 
-        for _, row in df.iterrows():
-            try:
-                expense = {}
-
-                # Map columns
-                for excel_col, db_col in column_mapping.items():
-                    if excel_col in row:
-                        value = row[excel_col]
-                        # Handle NaN/None values
-                        if pd.isna(value):
-                            expense[db_col] = None
-                        else:
-                            expense[db_col] = value
-
-                # Extract number from full string
-                # Example: "Заявка на расходование ДС ВГ0В-000019 от 21.07.2025 15:28:39"
-                # Extract: "ВГ0В-000019"
-                if expense.get('number'):
-                    import re
-                    match = re.search(r'([А-ЯA-Z0-9]{2,4}0В-\d{6})', expense['number'])
-                    if match:
-                        expense['number'] = match.group(1)
-                    else:
-                        # Fallback: use as is if pattern not found
-                        logger.warning(f"Could not extract number from: {expense['number']}")
-                        continue
-
-                # Skip if no number
-                if not expense.get('number'):
-                    continue
+    def iter_excel_chunks(self, file_data: bytes, chunk_rows: int = EXCEL_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        """Stream the first sheet as DataFrames of at most chunk_rows rows (openpyxl read-only mode)"""
+        try:
+            workbook = openpyxl.load_workbook(BytesIO(file_data), read_only=True, data_only=True)
+        except Exception as e:
+            logger.error(f"Failed to parse Excel: {e}")
+            raise Exception(f"Excel parsing error: {str(e)}")
 
-                # Normalize status
-                # Map Russian statuses to English enum values
-                status_mapping = {
-                    'К оплате': 'PENDING',
-                    'Оплачена': 'PAID',
-                    'Оплачено': 'PAID',
-                    'Черновик': 'DRAFT',
-                    'Отклонена': 'REJECTED',
-                    'Закрыта': 'CLOSED',
-                }
-                if expense.get('status') and expense['status'] in status_mapping:
-                    expense['status'] = status_mapping[expense['status']]
-                else:
-                    expense['status'] = 'PENDING'  # Default status
-
-                # Parse dates (format: dd.mm.yyyy)
-                # Set time to 12:00 (noon) to avoid timezone conversion issues
-                if expense.get('request_date'):
-                    if isinstance(expense['request_date'], str):
-                        # Parse date in format dd.mm.yyyy
-                        expense['request_date'] = pd.to_datetime(expense['request_date'], format='%d.%m.%Y', errors='coerce')
-                        if pd.notna(expense['request_date']):
-                            # Set time to 12:00 to avoid timezone issues (prevents day shift)
-                            dt = expense['request_date'].to_pydatetime()
-                            expense['request_date'] = dt.replace(hour=12, minute=0, second=0, microsecond=0)
-                    elif isinstance(expense['request_date'], pd.Timestamp):
-                        dt = expense['request_date'].to_pydatetime()
-                        expense['request_date'] = dt.replace(hour=12, minute=0, second=0, microsecond=0)
-
-                if expense.get('payment_date'):
-                    if isinstance(expense['payment_date'], str):
-                        # Parse date in format dd.mm.yyyy
-                        expense['payment_date'] = pd.to_datetime(expense['payment_date'], format='%d.%m.%Y', errors='coerce')
-                        if pd.notna(expense['payment_date']):
-                            # Set time to 12:00 to avoid timezone issues (prevents day shift)
-                            dt = expense['payment_date'].to_pydatetime()
-                            expense['payment_date'] = dt.replace(hour=12, minute=0, second=0, microsecond=0)
-                    elif isinstance(expense['payment_date'], pd.Timestamp):
-                        dt = expense['payment_date'].to_pydatetime()
-                        expense['payment_date'] = dt.replace(hour=12, minute=0, second=0, microsecond=0)
-
-                # Parse amount - IMPORTANT: Skip if amount is empty/invalid
-                if expense.get('amount') is not None and expense.get('amount') != '':
-                    try:
-                        expense['amount'] = Decimal(str(expense['amount']))
-                        # Skip if amount is 0 or negative
-                        if expense['amount'] <= 0:
-                            logger.warning(f"Skipping expense {expense.get('number')} with zero/negative amount: {expense['amount']}")
-                            continue
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"Skipping expense {expense.get('number')} with invalid amount: {expense.get('amount')}")
-                        continue
-                else:
-                    logger.warning(f"Skipping expense {expense.get('number')} with empty amount")
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [
+                name if name is not None else f"Unnamed: {index}"
+                for index, name in enumerate(header)
+            ]
+
+            chunk: List[tuple] = []
+            for row in rows:
+                if all(value is None for value in row):
                     continue
-
-                expenses.append(expense)
-
-            except Exception as e:
-                logger.warning(f"Failed to parse row: {e}")
-                continue
-
-        logger.info(f"Normalized {len(expenses)} expenses from Excel")
+                chunk.append(row[:len(columns)])
+                if len(chunk) >= chunk_rows:
+                    yield pd.DataFrame(chunk, columns=columns)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame(chunk, columns=columns)
+        finally:
+            workbook.close()
+
+    def load_expense_data(self, file_data: bytes) -> List[Dict]:
+        """Parse and normalize an Excel file, streaming it in chunks when it is large"""
+        if len(file_data) <= EXCEL_STREAM_THRESHOLD_BYTES:
+            return self.normalize_expense_data(self.parse_excel(file_data))
+
+        expenses: List[Dict] = []
+        for index, chunk in enumerate(self.iter_excel_chunks(file_data)):
+            logger.info(f"Normalizing Excel chunk {index + 1}: {len(chunk)} rows")
+            expenses.extend(self.normalize_expense_data(chunk))
         return expenses
 
+    def get_category_matcher(self, db: Session) -> "CategoryKeywordMatcher":
+        """Keyword matcher over active categories, built once per service instance"""
+        if self._category_matcher is None:
+            self._category_matcher = CategoryKeywordMatcher.from_db(db)
+        return self._category_matcher
+
     def find_category_by_keywords(
         self,
         db: Session,
@@ -217,91 +425,7 @@ class FTPImportService:
         dds_category: str = None
     ) -> Optional[BudgetCategory]:
         """Find category by keywords in comment, purpose, or DDS category"""
-
-        # Combine all text for keyword search
-        search_text = " ".join(filter(None, [comment or "", purpose or "", dds_category or ""])).lower()
-
-        # Keyword mapping to category names
-        keyword_mapping = {
-            # Техника
-            'техника': ['Техника'],
-            'сканер': ['Техника Склад'],
-            'склад': ['Техника Склад'],
-            'краснодар': ['Техника Краснодар'],
-            'логистик': ['Техника Логистика'],
-            'москв': ['Техника Москва'],
-            'спб': ['Техника ОП СПб'],
-            'сервис': ['Техника Сервис'],
-            'вэд': ['Техника ВЭД'],
-            'юр': ['Техника Юр. отдел'],
-            'маркетинг': ['Техника отдел маркетинга'],
-
-            # Обслуживание
-            'обслуживание': ['Обслуживание оргтехники', 'Ремонты и тех обслуживание'],
-            'ремонт': ['Ремонты и тех обслуживание', 'Обслуживание и ремонт'],
-            'заправка': ['Заправка картриджей'],
-            'картридж': ['Заправка картриджей'],
-            'расходн': ['Расходные материалы'],
-
-            # Связь
-            'интернет': ['Связь (телефон/интернет)', 'Связь и коммуникации'],
-            'телефон': ['Связь (телефон/интернет)', 'Связь и коммуникации'],
-            'связь': ['Связь (телефон/интернет)', 'Связь и коммуникации'],
-            'мобильн': ['Связь (телефон/интернет)'],
-
-            # Серверы и хостинг
-            'сервер': ['Сервер 1с', 'Серверы и хостинг', 'Почтовый Сервер'],
-            'хостинг': ['Хостинг CRM', 'Серверы и хостинг'],
-            'почтов': ['Почтовый Сервер'],
-            '1с': ['1с', '1с(лицензии)', 'Сервер 1с'],
-
-            # Разработка
-            'разработк': ['Битрикс 24 Разработка', 'Приложение визитов(разработка)', 'Разработка и настройка'],
-            'битрикс': ['Битрикс 24 Разработка', 'Битрикс 24(настройка)', 'Битрикс24(лицензии)'],
-            'настройк': ['Битрикс 24(настройка)', 'Разработка и настройка'],
-            'интеграц': ['Интегарции телефонии чатов и пр'],
-            'приложение': ['Приложение визитов(разработка)'],
-
-            # Прочее
-            'аутсорс': ['Аутсорс'],
-            'принтер': ['Покупка принтеров и прочей орг техники(обновление)'],
-            'лицензи': ['Лицензии и ПО', '1с(лицензии)', 'Битрикс24(лицензии)'],
-            'покупка по': ['Покупка ПО', 'Лицензии и ПО'],
-            'аналитик': ['Аналитика данных'],
-        }
-
-        # Try to find by keywords
-        for keyword, category_names in keyword_mapping.items():
-            if keyword in search_text:
-                for cat_name in category_names:
-                    category = db.query(BudgetCategory).filter(
-                        BudgetCategory.name.ilike(f"%{cat_name}%"),
-                        BudgetCategory.is_active == True
-                    ).first()
-                    if category:
-                        logger.info(f"Matched category '{category.name}' by keyword '{keyword}'")
-                        return category
-
-        # Fallback: try exact match with DDS category
-        if dds_category:
-            category = db.query(BudgetCategory).filter(
-                BudgetCategory.name.ilike(f"%{dds_category}%"),
-                BudgetCategory.is_active == True
-            ).first()
-            if category:
-                return category
-
-        # Last resort: return default category "Прочие расходы"
-        default_category = db.query(BudgetCategory).filter(
-            BudgetCategory.name.ilike("%Прочие расходы%"),
-            BudgetCategory.is_active == True
-        ).first()
-
-        if default_category:
-            logger.warning(f"No matching category found, using default: {default_category.name}")
-            return default_category
-
-        return None
+        return self.get_category_matcher(db).match(comment, purpose, dds_category)
 
     def find_or_create_category(
         self,
@@ -412,23 +536,7 @@ class FTPImportService:
         """Map status string to ExpenseStatusEnum"""
         if not status_str:
             return ExpenseStatusEnum.DRAFT
-
-        status_str = str(status_str).upper().strip()
-
-        status_mapping = {
-            'ЧЕРНОВИК': ExpenseStatusEnum.DRAFT,
-            'DRAFT': ExpenseStatusEnum.DRAFT,
-            'К ОПЛАТЕ': ExpenseStatusEnum.PENDING,
-            'PENDING': ExpenseStatusEnum.PENDING,
-            'ОПЛАЧЕНА': ExpenseStatusEnum.PAID,
-            'PAID': ExpenseStatusEnum.PAID,
-            'ОТКЛОНЕНА': ExpenseStatusEnum.REJECTED,
-            'REJECTED': ExpenseStatusEnum.REJECTED,
-            'ЗАКРЫТА': ExpenseStatusEnum.CLOSED,
-            'CLOSED': ExpenseStatusEnum.CLOSED,
-        }
-
-        return status_mapping.get(status_str, ExpenseStatusEnum.DRAFT)
+        return STATUS_ENUM_LOOKUP.get(str(status_str).upper().strip(), ExpenseStatusEnum.DRAFT)
 
     def delete_expenses_from_month(
         self,
@@ -679,6 +787,371 @@ class FTPImportService:
         return created, updated, skipped
 
 
+    def import_expenses_bulk(
+        self,
+        db: Session,
+        expenses_data: List[Dict],
+        skip_duplicates: bool = True,
+        default_department_id: Optional[int] = None,
+        chunk_size: int = BULK_CHUNK_SIZE
+    ) -> Tuple[int, int, int]:
+        """
+        Set-based variant of import_expenses for large files
+
+        Reference data (existing numbers, departments, categories, contractors,
+        organizations) is loaded once for the whole file into dicts, missing
+        contractors are created with one multi-row INSERT, new expenses are
+        written with multi-row INSERTs and existing ones with bulk UPDATE by
+        primary key. Each chunk runs in a SAVEPOINT: a chunk that fails is
+        retried row by row, so a bad row is skipped instead of rolling back
+        the whole file. Everything is committed in one transaction.
+
+        Matching rules are the same as in import_expenses; rows repeating the
+        same number are collapsed (the last row wins and counts as an update).
+
+        Returns:
+            Tuple of (created, updated, skipped) counts
+        """
+        created = 0
+        updated = 0
+        skipped = 0
+        impacted_cache_keys: Set[Tuple[int, int, int]] = set()
+
+        def track_cache_invalidation(
+            category_id: Optional[int],
+            department_id: Optional[int],
+            request_date_value: Optional[datetime],
+        ) -> None:
+            if category_id is None or department_id is None or request_date_value is None:
+                return
+            impacted_cache_keys.add(
+                (category_id, department_id, request_date_value.year)
+            )
+
+        # 1. Validate rows and collapse repeated numbers (last row wins)
+        rows_by_number: Dict[str, Dict] = {}
+        occurrences: Dict[str, int] = {}
+        for idx, expense_data in enumerate(expenses_data):
+            number = expense_data.get('number')
+            if not number:
+                logger.warning(f"Skipping expense without number at index {idx}")
+                skipped += 1
+                continue
+            if not expense_data.get('amount'):
+                logger.warning(f"Skipping expense {number} without amount")
+                skipped += 1
+                continue
+            occurrences[number] = occurrences.get(number, 0) + 1
+            rows_by_number[number] = expense_data
+
+        if not rows_by_number:
+            return created, updated, skipped
+
+        # 2. Preload reference data in one pass
+        existing_by_number = self._load_existing_expenses(db, list(rows_by_number), chunk_size)
+        resolve_department = self._build_department_resolver(db)
+        resolve_organization = self._build_organization_resolver(db)
+        active_categories = {
+            row.id for row in db.query(BudgetCategory.id).filter(BudgetCategory.is_active == True).all()
+        }
+
+        # 3. Resolve departments and collect contractors to find/create
+        resolved: List[Tuple[Dict, Department, Organization]] = []
+        contractor_requests: Dict[str, Tuple[str, int]] = {}
+        for number, expense_data in rows_by_number.items():
+            department = resolve_department(expense_data.get('subdivision_name'))
+            if not department:
+                logger.warning(f"Fallback 'Общий' department not found, skipping expense {number}")
+                skipped += 1
+                continue
+
+            organization = resolve_organization(expense_data.get('organization_name'))
+            if not organization:
+                logger.warning(f"No organization found, skipping expense {number}")
+                skipped += 1
+                continue
+
+            contractor_name = expense_data.get('contractor_name')
+            if contractor_name:
+                contractor_requests.setdefault(
+                    str(contractor_name).lower(), (str(contractor_name), department.id)
+                )
+
+            resolved.append((expense_data, department, organization))
+
+        contractor_ids = self._resolve_contractors_bulk(db, contractor_requests)
+
+        # 4. Build insert/update payloads
+        to_insert: List[Dict] = []
+        to_update: List[Dict] = []
+        update_numbers: List[str] = []
+        now = datetime.utcnow()
+        critical_fields = ['status', 'is_paid', 'is_closed', 'amount', 'payment_date', 'comment']
+
+        for expense_data, department, organization in resolved:
+            status = self.map_status(expense_data.get('status'))
+            category_id = (
+                department.default_category_id
+                if department.default_category_id in active_categories
+                else None
+            )
+            contractor_name = expense_data.get('contractor_name')
+
+            expense_fields = {
+                'number': expense_data.get('number'),
+                'department_id': department.id,
+                'category_id': category_id,
+                'contractor_id': contractor_ids.get(str(contractor_name).lower()) if contractor_name else None,
+                'organization_id': organization.id,
+                'amount': expense_data.get('amount'),
+                'request_date': expense_data.get('request_date') or datetime.now(),
+                'payment_date': expense_data.get('payment_date'),
+                'status': status,
+                'is_paid': status == ExpenseStatusEnum.PAID,
+                'is_closed': status == ExpenseStatusEnum.CLOSED,
+                'comment': expense_data.get('comment'),
+                'requester': expense_data.get('requester'),
+                'imported_from_ftp': True,
+                'needs_review': True,
+            }
+
+            number = expense_fields['number']
+            existing = existing_by_number.get(number)
+            if existing:
+                track_cache_invalidation(existing.category_id, existing.department_id, existing.request_date)
+                if skip_duplicates:
+                    payload = {field: expense_fields[field] for field in critical_fields}
+                else:
+                    payload = dict(expense_fields)
+                payload['id'] = existing.id
+                payload['updated_at'] = now
+                to_update.append(payload)
+                update_numbers.append(number)
+            else:
+                to_insert.append({**expense_fields, 'created_at': now, 'updated_at': now})
+
+            track_cache_invalidation(
+                expense_fields['category_id'],
+                expense_fields['department_id'],
+                expense_fields['request_date'],
+            )
+
+        # 5. Write in SAVEPOINT chunks, failed rows are skipped
+        try:
+            failed_inserts = self._execute_in_savepoints(
+                db, insert(Expense), to_insert, [row['number'] for row in to_insert], chunk_size
+            )
+            failed_updates = self._execute_in_savepoints(
+                db, update(Expense), to_update, update_numbers, chunk_size
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        for index, row in enumerate(to_insert):
+            if index in failed_inserts:
+                skipped += occurrences[row['number']]
+            else:
+                created += 1
+                updated += occurrences[row['number']] - 1
+        for index, number in enumerate(update_numbers):
+            if index in failed_updates:
+                skipped += occurrences[number]
+            else:
+                updated += occurrences[number]
+
+        logger.info(f"Bulk import: {created} created, {updated} updated, {skipped} skipped")
+
+        for category_id, department_id, year in impacted_cache_keys:
+            baseline_bus.invalidate(
+                category_id=category_id,
+                department_id=department_id,
+                year=year,
+            )
+
+        return created, updated, skipped
+
+    def _execute_in_savepoints(
+        self,
+        db: Session,
+        statement,
+        rows: List[Dict],
+        numbers: List[str],
+        chunk_size: int
+    ) -> Set[int]:
+        """
+        Execute a multi-row statement chunk by chunk, each chunk in a SAVEPOINT
+
+        A chunk that fails is rolled back to its savepoint and retried row by
+        row, so only the bad rows are lost.
+
+        Returns:
+            Indexes (in rows) of the rows that could not be written
+        """
+        failed: Set[int] = set()
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            try:
+                with db.begin_nested():
+                    db.execute(statement, chunk)
+                continue
+            except SQLAlchemyError as e:
+                logger.warning(f"Bulk chunk at row {start} failed, retrying row by row: {e}")
+
+            for index in range(start, start + len(chunk)):
+                try:
+                    with db.begin_nested():
+                        db.execute(statement, [rows[index]])
+                except SQLAlchemyError as e:
+                    logger.error(f"Failed to import expense {numbers[index]}: {e}")
+                    failed.add(index)
+        return failed
+
+    def _load_existing_expenses(
+        self,
+        db: Session,
+        numbers: List[str],
+        chunk_size: int
+    ) -> Dict[str, object]:
+        """Existing expenses by number (lowest id wins, as .first() did)"""
+        existing: Dict[str, object] = {}
+        for start in range(0, len(numbers), chunk_size):
+            rows = db.query(
+                Expense.id,
+                Expense.number,
+                Expense.category_id,
+                Expense.department_id,
+                Expense.request_date,
+            ).filter(
+                Expense.number.in_(numbers[start:start + chunk_size])
+            ).order_by(Expense.id.desc()).all()
+            for row in rows:
+                existing[row.number] = row
+        return existing
+
+    def _build_department_resolver(self, db: Session):
+        """
+        Subdivision -> Department resolver over active departments loaded once
+
+        Exact ftp_subdivision_name match first, then case-insensitive partial
+        match, then the fallback 'Общий' department.
+        """
+        departments = db.query(Department).filter(
+            Department.is_active == True
+        ).order_by(Department.id).all()
+
+        exact: Dict[str, Department] = {}
+        for department in departments:
+            if department.ftp_subdivision_name:
+                exact.setdefault(department.ftp_subdivision_name, department)
+        fallback = next((d for d in departments if d.name == 'Общий'), None)
+        cache: Dict[Optional[str], Optional[Department]] = {}
+
+        def resolve(subdivision_name: Optional[str]) -> Optional[Department]:
+            if subdivision_name in cache:
+                return cache[subdivision_name]
+
+            department = None
+            if subdivision_name:
+                department = exact.get(subdivision_name)
+                if department is None:
+                    needle = str(subdivision_name).lower()
+                    department = next(
+                        (
+                            d for d in departments
+                            if d.ftp_subdivision_name and needle in d.ftp_subdivision_name.lower()
+                        ),
+                        None,
+                    )
+            if department is None:
+                logger.info(f"No department mapping found for subdivision '{subdivision_name}', using fallback 'Общий' department")
+                department = fallback
+
+            cache[subdivision_name] = department
+            return department
+
+        return resolve
+
+    def _build_organization_resolver(self, db: Session):
+        """Organization name -> Organization with the same partial-match rules"""
+        organizations = db.query(Organization).order_by(Organization.id).all()
+        exact = {}
+        for organization in organizations:
+            exact.setdefault(organization.name.lower(), organization)
+        default = organizations[0] if organizations else None
+        cache: Dict[Optional[str], Optional[Organization]] = {}
+
+        def resolve(organization_name: Optional[str]) -> Optional[Organization]:
+            if organization_name in cache:
+                return cache[organization_name]
+
+            organization = None
+            if organization_name:
+                needle = str(organization_name).lower()
+                organization = exact.get(needle) or next(
+                    (o for o in organizations if needle in o.name.lower()),
+                    None,
+                )
+
+            cache[organization_name] = organization or default
+            return cache[organization_name]
+
+        return resolve
+
+    def _resolve_contractors_bulk(
+        self,
+        db: Session,
+        requests: Dict[str, Tuple[str, int]]
+    ) -> Dict[str, int]:
+        """
+        Resolve contractor ids for all distinct names, creating missing ones
+
+        Args:
+            requests: lowercased name -> (original name, department_id for creation)
+
+        Returns:
+            lowercased name -> contractor id
+        """
+        if not requests:
+            return {}
+
+        contractors = db.query(Contractor.id, Contractor.name).order_by(Contractor.id).all()
+        exact: Dict[str, int] = {}
+        for contractor in contractors:
+            exact.setdefault(contractor.name.lower(), contractor.id)
+
+        resolved: Dict[str, int] = {}
+        missing: List[Dict] = []
+        for key, (name, department_id) in requests.items():
+            contractor_id = exact.get(key)
+            if contractor_id is None:
+                contractor_id = next(
+                    (c.id for c in contractors if key in c.name.lower()),
+                    None,
+                )
+            if contractor_id is None:
+                missing.append({
+                    'name': name,
+                    'department_id': department_id,
+                    'is_active': True,
+                    'created_at': datetime.utcnow(),
+                })
+            else:
+                resolved[key] = contractor_id
+
+        if missing:
+            created_rows = db.execute(
+                insert(Contractor).returning(Contractor.id, Contractor.name),
+                missing,
+            ).all()
+            for row in created_rows:
+                resolved[row.name.lower()] = row.id
+            logger.info(f"Created {len(created_rows)} new contractors")
+
+        return resolved
+
+
 async def import_from_ftp(
     db: Session,
     host: str,
@@ -688,7 +1161,8 @@ async def import_from_ftp(
     delete_from_year: Optional[int] = None,
     delete_from_month: Optional[int] = None,
     skip_duplicates: bool = True,
-    default_department_id: Optional[int] = None
+    default_department_id: Optional[int] = None,
+    bulk: bool = True
 ) -> Dict:
     """
     Main function to import expenses from FTP
@@ -704,6 +1178,7 @@ async def import_from_ftp(
         skip_duplicates: If True, updates only critical fields (status, amount, payment_date) for existing expenses.
                         If False, performs full update of all fields.
         default_department_id: Default department ID if no mapping found
+        bulk: Use set-based import (import_expenses_bulk) instead of row-by-row
 
     Returns:
         Dict with import statistics
@@ -713,11 +1188,33 @@ async def import_from_ftp(
     # Download file
     file_data = await service.download_file(remote_path)
 
-    # Parse Excel
-    df = service.parse_excel(file_data)
+    # Parsing and the DB writes are synchronous: keep them off the event loop
+    return await asyncio.to_thread(
+        _import_expense_file,
+        service,
+        db,
+        file_data,
+        delete_from_year,
+        delete_from_month,
+        skip_duplicates,
+        default_department_id,
+        bulk,
+    )
+
 
-    # Normalize data
-    expenses_data = service.normalize_expense_data(df)
+def _import_expense_file(
+    service: FTPImportService,
+    db: Session,
+    file_data: bytes,
+    delete_from_year: Optional[int],
+    delete_from_month: Optional[int],
+    skip_duplicates: bool,
+    default_department_id: Optional[int],
+    bulk: bool,
+) -> Dict:
+    """Parse a downloaded expense file and write it to the database"""
+    # Parse Excel and normalize data (large files are streamed in chunks)
+    expenses_data = service.load_expense_data(file_data)
 
     # Delete old expenses (only if parameters are provided)
     deleted = 0
@@ -725,7 +1222,8 @@ async def import_from_ftp(
         deleted = service.delete_expenses_from_month(db, delete_from_year, delete_from_month)
 
     # Import expenses
-    created, updated, skipped = service.import_expenses(
+    import_expenses = service.import_expenses_bulk if bulk else service.import_expenses
+    created, updated, skipped = import_expenses(
         db,
         expenses_data,
         skip_duplicates,
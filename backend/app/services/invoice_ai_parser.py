@@ -2,9 +2,9 @@
 AI Parser Service for invoice data extraction
 Uses VseGPT API (OpenAI-compatible) to extract structured data from OCR text
 """
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 import json
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from loguru import logger
 from datetime import datetime
 from decimal import Decimal
@@ -44,6 +44,9 @@ class InvoiceAIParser:
             base_url=base_url
         )
         self.model = model
+        self._api_key = api_key
+        self._base_url = base_url
+        self._async_client: Optional[AsyncOpenAI] = None
 
     def parse_invoice(self, ocr_text: str, filename: str = "") -> ParsedInvoiceData:
         """
@@ -59,26 +62,60 @@ class InvoiceAIParser:
         Raises:
             Exception: При ошибке парсинга или валидации
         """
-        prompt = self._build_prompt(ocr_text)
-
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Ты эксперт по обработке российских бухгалтерских документов. "
-                                  "Ты всегда возвращаешь только валидный JSON без дополнительного текста."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
+                messages=self._build_messages(ocr_text),
+                temperature=0.1,
+                max_tokens=4000
+            )
+        except Exception as e:
+            logger.error(f"Ошибка парсинга через AI: {e}")
+            raise
+
+        return self._parse_response(response.choices[0].message.content, filename)
+
+    async def parse_invoice_async(self, ocr_text: str, filename: str = "") -> ParsedInvoiceData:
+        """
+        Асинхронный вариант parse_invoice (не блокирует event loop)
+
+        Используется очередью обработки счетов, где несколько запросов к AI
+        выполняются параллельно с ограничением конкурентности.
+        """
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=self._api_key,
+                base_url=self._base_url
+            )
+
+        try:
+            response = await self._async_client.chat.completions.create(
+                model=self.model,
+                messages=self._build_messages(ocr_text),
                 temperature=0.1,
                 max_tokens=4000
             )
+        except Exception as e:
+            logger.error(f"Ошибка парсинга через AI: {e}")
+            raise
+
+        return self._parse_response(response.choices[0].message.content, filename)
 
-            response_text = response.choices[0].message.content
-            logger.info(f"Получен ответ от AI для файла {filename}")
+    def _build_messages(self, ocr_text: str) -> List[Dict[str, str]]:
+        return [
+            {
+                "role": "system",
+                "content": "Ты эксперт по обработке российских бухгалтерских документов. "
+                          "Ты всегда возвращаешь только валидный JSON без дополнительного текста."
+            },
+            {"role": "user", "content": self._build_prompt(ocr_text)}
+        ]
 
+    def _parse_response(self, response_text: str, filename: str) -> ParsedInvoiceData:
+        """Разбор ответа AI в ParsedInvoiceData"""
+        logger.info(f"Получен ответ от AI для файла {filename}")
+
+        try:
             # Извлекаем JSON из ответа (может быть обернут в ```json```)
             json_text = self._extract_json(response_text)
 
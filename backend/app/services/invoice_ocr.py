@@ -1,16 +1,107 @@
 """
 OCR Service for invoice text recognition
 Uses Tesseract OCR to extract text from PDF and images
+
+Scanned PDFs are rendered one page at a time (first_page/last_page) inside
+worker processes, so pages are OCRed in parallel and never held in memory
+all at once. The SHA-256 of the file is returned with the text: invoices
+store it, so a re-uploaded file reuses the stored text (see
+InvoiceProcessorService._run_ocr).
 """
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
 import pytesseract
 from pdf2image import convert_from_path
 from PIL import Image
-import io
-from typing import Union
-from pathlib import Path
 from loguru import logger
+
 from app.core.config import settings
 
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+@dataclass
+class OCRRunResult:
+    """Результат распознавания файла с метриками"""
+    text: str
+    file_sha256: str
+    page_timings: List[dict] = field(default_factory=list)
+    cached: bool = False
+
+
+def compute_file_sha256(file_path: Union[str, Path]) -> str:
+    """SHA-256 содержимого файла (читается блоками)"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _ocr_pdf_page(pdf_path: str, page_number: int, dpi: int, tesseract_config: str) -> dict:
+    """
+    Рендер и OCR одной страницы PDF (выполняется в процессе пула).
+
+    Возвращает сам текст и время рендера/распознавания страницы.
+    """
+    render_start = time.perf_counter()
+    images = convert_from_path(
+        pdf_path,
+        dpi=dpi,
+        first_page=page_number,
+        last_page=page_number,
+    )
+    render_time = time.perf_counter() - render_start
+
+    ocr_start = time.perf_counter()
+    text = "".join(
+        pytesseract.image_to_string(image, config=tesseract_config)
+        for image in images
+    )
+    ocr_time = time.perf_counter() - ocr_start
+
+    return {
+        "page": page_number,
+        "text": text,
+        "render_sec": round(render_time, 3),
+        "ocr_sec": round(ocr_time, 3),
+    }
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Общий пул процессов для OCR (создается лениво)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = settings.OCR_MAX_WORKERS or os.cpu_count() or 1
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            logger.info(f"OCR process pool started: {workers} workers")
+        return _executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def shutdown_ocr_executor() -> None:
+    """Остановить пул процессов OCR (при завершении приложения)"""
+    _reset_executor()
+
 
 class InvoiceOCRService:
     """Сервис распознавания текста из PDF и изображений счетов"""
@@ -25,6 +116,10 @@ class InvoiceOCRService:
         Извлечение текста из PDF
         Сначала пробует извлечь текстовый слой, если не получается - использует OCR
         """
+        return self._extract_pdf(pdf_path)[0]
+
+    def _extract_pdf(self, pdf_path: Union[str, Path]) -> Tuple[str, List[dict]]:
+        """Текст PDF и время по страницам (пустое, если взят текстовый слой)"""
         try:
             # Сначала пробуем извлечь текстовый слой
             import pypdf
@@ -32,6 +127,7 @@ class InvoiceOCRService:
 
             with open(pdf_path, 'rb') as file:
                 pdf_reader = pypdf.PdfReader(file)
+                page_count = len(pdf_reader.pages)
                 text = ""
                 for page in pdf_reader.pages:
                     text += page.extract_text()
@@ -48,37 +144,61 @@ class InvoiceOCRService:
                             f"Текст извлечен, но кириллицы мало ({cyrillic_ratio:.1%}). "
                             f"Возможна проблема с кодировкой, используем OCR"
                         )
-                        return self._ocr_from_pdf(pdf_path)
+                        return self._ocr_pdf_pages(pdf_path, page_count)
 
                     logger.info(f"Текст извлечен из PDF напрямую: {len(text)} символов (кириллица: {cyrillic_ratio:.1%})")
-                    return text
+                    return text, []
 
             # Если текста нет - используем OCR
             logger.info("Текстовый слой не найден, используем OCR")
-            return self._ocr_from_pdf(pdf_path)
+            return self._ocr_pdf_pages(pdf_path, page_count)
 
         except Exception as e:
             logger.error(f"Ошибка при извлечении текста из PDF: {e}")
             # Fallback на OCR
-            return self._ocr_from_pdf(pdf_path)
+            return self._ocr_pdf_pages(pdf_path)
+
+    def _get_page_count(self, pdf_path: Union[str, Path]) -> int:
+        from pdf2image import pdfinfo_from_path
+
+        return int(pdfinfo_from_path(str(pdf_path))["Pages"])
 
-    def _ocr_from_pdf(self, pdf_path: Union[str, Path]) -> str:
-        """OCR распознавание PDF"""
+    def _ocr_pdf_pages(
+        self, pdf_path: Union[str, Path], page_count: Optional[int] = None
+    ) -> Tuple[str, List[dict]]:
+        """
+        OCR распознавание PDF: текст и время рендера/распознавания по страницам
+
+        Каждая страница рендерится и распознается отдельной задачей в пуле
+        процессов, поэтому в памяти одновременно не больше страниц, чем воркеров.
+        """
         try:
-            # Конвертируем PDF в изображения
-            images = convert_from_path(pdf_path, dpi=self.dpi)
+            if page_count is None:
+                page_count = self._get_page_count(pdf_path)
+
+            pages = list(range(1, page_count + 1))
+            args = (str(pdf_path), self.dpi, self.tesseract_config)
+
+            if page_count <= 1:
+                results = [_ocr_pdf_page(args[0], page, *args[1:]) for page in pages]
+            else:
+                try:
+                    executor = _get_executor()
+                    futures = [executor.submit(_ocr_pdf_page, args[0], page, *args[1:]) for page in pages]
+                    results = [future.result() for future in futures]
+                except BrokenProcessPool:
+                    logger.warning("OCR process pool is broken, falling back to sequential OCR")
+                    _reset_executor()
+                    results = [_ocr_pdf_page(args[0], page, *args[1:]) for page in pages]
 
             text = ""
-            for i, image in enumerate(images):
-                logger.info(f"Обработка страницы {i+1}/{len(images)}")
-                page_text = pytesseract.image_to_string(
-                    image,
-                    config=self.tesseract_config
-                )
-                text += page_text + "\n\n"
+            page_timings = []
+            for result in results:
+                text += result.pop("text") + "\n\n"
+                page_timings.append(result)
 
-            logger.info(f"OCR завершен: {len(text)} символов")
-            return text
+            logger.info(f"OCR завершен: {page_count} страниц, {len(text)} символов")
+            return text, page_timings
 
         except Exception as e:
             logger.error(f"Ошибка OCR для PDF: {e}")
@@ -86,14 +206,24 @@ class InvoiceOCRService:
 
     def extract_text_from_image(self, image_path: Union[str, Path]) -> str:
         """Извлечение текста из изображения"""
+        return self._ocr_image(image_path)[0]
+
+    def _ocr_image(self, image_path: Union[str, Path]) -> Tuple[str, List[dict]]:
+        """Текст изображения и время распознавания"""
         try:
+            ocr_start = time.perf_counter()
             image = Image.open(image_path)
             text = pytesseract.image_to_string(
                 image,
                 config=self.tesseract_config
             )
+            page_timings = [{
+                "page": 1,
+                "render_sec": 0.0,
+                "ocr_sec": round(time.perf_counter() - ocr_start, 3),
+            }]
             logger.info(f"Текст извлечен из изображения: {len(text)} символов")
-            return text
+            return text, page_timings
 
         except Exception as e:
             logger.error(f"Ошибка при OCR изображения: {e}")
@@ -104,14 +234,36 @@ class InvoiceOCRService:
         Универсальный метод обработки файла
         Автоматически определяет формат и использует соответствующий метод
         """
+        return self.process_file_with_stats(file_path).text
+
+    def process_file_with_stats(
+        self, file_path: Union[str, Path], file_sha256: Optional[str] = None
+    ) -> OCRRunResult:
+        """
+        Обработка файла с замером времени по страницам
+
+        Args:
+            file_path: Путь к файлу
+            file_sha256: SHA-256 файла, если уже посчитан (иначе считается здесь)
+        """
         file_path = Path(file_path)
         extension = file_path.suffix.lower()
 
+        if extension != '.pdf' and extension not in ['.jpg', '.jpeg', '.png', '.tiff', '.bmp']:
+            raise ValueError(f"Неподдерживаемый формат файла: {extension}")
+
+        if file_sha256 is None:
+            file_sha256 = compute_file_sha256(file_path)
+
         logger.info(f"Начинаю OCR обработку файла: {file_path.name}")
 
         if extension == '.pdf':
-            return self.extract_text_from_pdf(file_path)
-        elif extension in ['.jpg', '.jpeg', '.png', '.tiff', '.bmp']:
-            return self.extract_text_from_image(file_path)
+            text, page_timings = self._extract_pdf(file_path)
         else:
-            raise ValueError(f"Неподдерживаемый формат файла: {extension}")
+            text, page_timings = self._ocr_image(file_path)
+
+        return OCRRunResult(
+            text=text,
+            file_sha256=file_sha256,
+            page_timings=page_timings,
+        )
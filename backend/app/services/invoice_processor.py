@@ -2,6 +2,7 @@
 Invoice Processor - Orchestrator service for invoice processing workflow
 Coordinates: File upload → OCR → AI Parsing → Database storage → Expense creation
 """
+import asyncio
 import time
 from pathlib import Path
 from typing import Optional, List, Dict, Any
@@ -16,8 +17,21 @@ from app.schemas.invoice_processing import (
     OCRResult,
     ProcessingError
 )
-from app.services.invoice_ocr import InvoiceOCRService
+from app.services.invoice_ocr import InvoiceOCRService, OCRRunResult, compute_file_sha256
 from app.services.invoice_ai_parser import InvoiceAIParser
+from app.core.config import settings
+
+_ai_semaphores: Dict[int, asyncio.Semaphore] = {}
+
+
+def _ai_semaphore() -> asyncio.Semaphore:
+    """Ограничение одновременных запросов к AI (отдельно на каждый event loop)"""
+    loop_id = id(asyncio.get_running_loop())
+    semaphore = _ai_semaphores.get(loop_id)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(settings.INVOICE_AI_MAX_CONCURRENCY)
+        _ai_semaphores[loop_id] = semaphore
+    return semaphore
 
 
 class InvoiceProcessorService:
@@ -88,17 +102,11 @@ class InvoiceProcessorService:
                 - errors: List[ProcessingError]
                 - warnings: List[ProcessingError]
                 - processing_time_sec: float
-        """
-        invoice = self.db.query(ProcessedInvoice).filter(
-            ProcessedInvoice.id == invoice_id
-        ).first()
+                - status: str - итоговый статус счета
 
-        if not invoice:
-            raise ValueError(f"ProcessedInvoice с ID {invoice_id} не найден")
-
-        # Обновляем статус
-        invoice.status = InvoiceProcessingStatusEnum.PROCESSING
-        self.db.commit()
+        Работа с БД (sync Session) выполняется в потоках, чтобы не блокировать event loop.
+        """
+        invoice = await asyncio.to_thread(self._start_processing, invoice_id)
 
         errors: List[ProcessingError] = []
         warnings: List[ProcessingError] = []
@@ -111,8 +119,11 @@ class InvoiceProcessorService:
             # Шаг 1: OCR
             logger.info(f"Начинаю OCR для invoice ID={invoice_id}")
             ocr_start = time.time()
-            ocr_text = self.ocr_service.process_file(invoice.file_path)
+            ocr_run = await self._run_ocr(invoice)
+            ocr_text = ocr_run.text
             ocr_time = time.time() - ocr_start
+            invoice.file_sha256 = ocr_run.file_sha256
+            invoice.ocr_page_timings = ocr_run.page_timings or None
 
             if len(ocr_text.strip()) < 50:
                 errors.append(ProcessingError(
@@ -122,20 +133,20 @@ class InvoiceProcessorService:
                 ))
                 invoice.status = InvoiceProcessingStatusEnum.ERROR
                 invoice.errors = [e.model_dump() for e in errors]
-                self.db.commit()
+                await asyncio.to_thread(self.db.commit)
                 return {
                     "success": False,
                     "ocr_result": None,
                     "parsed_data": None,
                     "errors": errors,
                     "warnings": warnings,
-                    "processing_time_sec": time.time() - start_time
+                    "processing_time_sec": time.time() - start_time,
+                    "status": InvoiceProcessingStatusEnum.ERROR.value
                 }
 
-            # Сохраняем OCR результат
+            # Сохраняем OCR результат (коммит вместе с итогом обработки)
             invoice.ocr_text = ocr_text
             invoice.ocr_processing_time_sec = Decimal(str(round(ocr_time, 2)))
-            self.db.commit()
 
             ocr_result = OCRResult(
                 text=ocr_text,
@@ -146,7 +157,8 @@ class InvoiceProcessorService:
             # Шаг 2: AI парсинг
             logger.info(f"Начинаю AI парсинг для invoice ID={invoice_id}")
             ai_start = time.time()
-            parsed_data = self.ai_parser.parse_invoice(ocr_text, invoice.original_filename)
+            async with _ai_semaphore():
+                parsed_data = await self.ai_parser.parse_invoice_async(ocr_text, invoice.original_filename)
             ai_time = time.time() - ai_start
 
             # Сохраняем распознанные данные
@@ -166,9 +178,11 @@ class InvoiceProcessorService:
             invoice.processed_at = datetime.utcnow()
             invoice.errors = [e.model_dump() for e in errors] if errors else None
             invoice.warnings = [w.model_dump() for w in warnings] if warnings else None
-            self.db.commit()
+            # После коммита атрибуты истекают: статус читаем до него
+            final_status = invoice.status
+            await asyncio.to_thread(self.db.commit)
 
-            logger.info(f"Обработка invoice ID={invoice_id} завершена успешно. Статус: {invoice.status}")
+            logger.info(f"Обработка invoice ID={invoice_id} завершена успешно. Статус: {final_status}")
 
             return {
                 "success": len([e for e in errors if e.severity == "error"]) == 0,
@@ -176,7 +190,8 @@ class InvoiceProcessorService:
                 "parsed_data": parsed_data,
                 "errors": errors,
                 "warnings": warnings,
-                "processing_time_sec": time.time() - start_time
+                "processing_time_sec": time.time() - start_time,
+                "status": final_status.value
             }
 
         except Exception as e:
@@ -189,7 +204,7 @@ class InvoiceProcessorService:
             )
             errors.append(error)
             invoice.errors = [e.model_dump() for e in errors]
-            self.db.commit()
+            await asyncio.to_thread(self.db.commit)
 
             return {
                 "success": False,
@@ -197,9 +212,61 @@ class InvoiceProcessorService:
                 "parsed_data": parsed_data,
                 "errors": errors,
                 "warnings": warnings,
-                "processing_time_sec": time.time() - start_time
+                "processing_time_sec": time.time() - start_time,
+                "status": InvoiceProcessingStatusEnum.ERROR.value
             }
 
+    def _start_processing(self, invoice_id: int) -> ProcessedInvoice:
+        """Загрузить счет и перевести его в PROCESSING (вызывается вне event loop)"""
+        invoice = self.db.query(ProcessedInvoice).filter(
+            ProcessedInvoice.id == invoice_id
+        ).first()
+
+        if not invoice:
+            raise ValueError(f"ProcessedInvoice с ID {invoice_id} не найден")
+
+        if invoice.status != InvoiceProcessingStatusEnum.PROCESSING:
+            invoice.status = InvoiceProcessingStatusEnum.PROCESSING
+            invoice.processing_started_at = datetime.utcnow()
+        self.db.commit()
+        # Загружаем атрибуты здесь, а не ленивым запросом из event loop
+        self.db.refresh(invoice)
+        return invoice
+
+    def _find_previous_ocr(self, invoice_id: int, file_sha256: str):
+        """Ранее распознанный текст файла с тем же SHA-256 (вызывается вне event loop)"""
+        return self.db.query(
+            ProcessedInvoice.ocr_text,
+            ProcessedInvoice.ocr_page_timings,
+        ).filter(
+            ProcessedInvoice.file_sha256 == file_sha256,
+            ProcessedInvoice.id != invoice_id,
+            ProcessedInvoice.ocr_text.isnot(None),
+        ).order_by(ProcessedInvoice.id.desc()).first()
+
+    async def _run_ocr(self, invoice: ProcessedInvoice) -> OCRRunResult:
+        """
+        OCR файла счета с повторным использованием ранее распознанного текста
+
+        Если счет с тем же SHA-256 уже распознан, его текст используется без
+        OCR. Файл хэшируется один раз; хэширование, запрос и OCR выполняются вне event loop.
+        """
+        file_sha256 = await asyncio.to_thread(compute_file_sha256, invoice.file_path)
+        previous = await asyncio.to_thread(self._find_previous_ocr, invoice.id, file_sha256)
+
+        if previous:
+            logger.info(f"OCR текст для invoice ID={invoice.id} взят из ранее обработанного файла")
+            return OCRRunResult(
+                text=previous.ocr_text,
+                file_sha256=file_sha256,
+                page_timings=previous.ocr_page_timings or [],
+                cached=True,
+            )
+
+        return await asyncio.to_thread(
+            self.ocr_service.process_file_with_stats, invoice.file_path, file_sha256
+        )
+
     def _save_parsed_data(
         self,
         invoice: ProcessedInvoice,
@@ -288,7 +355,7 @@ class InvoiceProcessorService:
 
         return errors
 
-    async def create_expense_from_invoice(
+    def create_expense_from_invoice(
         self,
         invoice_id: int,
         category_id: int,
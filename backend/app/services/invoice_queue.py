@@ -0,0 +1,240 @@
+"""
+Invoice processing queue
+
+Uploaded invoices are enqueued and processed in the background by a fixed
+number of asyncio workers. Each job uses its own DB session; OCR runs off the
+event loop (thread + OCR process pool) and AI parsing goes through the async
+client with bounded concurrency (see InvoiceProcessorService).
+
+The queue lives in the process, so queued invoices are marked with
+ProcessedInvoice.queued_at: those still PENDING are re-enqueued on startup.
+Every API worker does this, a worker takes an invoice only by switching it
+from PENDING to PROCESSING (claim_invoice), so each is processed once.
+Invoices left in PROCESSING by a crashed process are returned to PENDING on
+startup once they are older than INVOICE_PROCESSING_STALE_MINUTES (the
+threshold keeps other API workers' in-flight invoices untouched).
+
+Workers use a sync Session: all DB work (claim, processor setup, commits)
+runs in threads via asyncio.to_thread.
+
+Batches are stored as ProcessedInvoice.batch_id; progress is read from
+ProcessedInvoice.status.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import InvoiceProcessingStatusEnum, ProcessedInvoice
+from app.db.session import SessionLocal
+
+FINISHED_STATUSES = {
+    InvoiceProcessingStatusEnum.PROCESSED,
+    InvoiceProcessingStatusEnum.MANUAL_REVIEW,
+    InvoiceProcessingStatusEnum.ERROR,
+    InvoiceProcessingStatusEnum.EXPENSE_CREATED,
+}
+
+
+class InvoiceProcessingQueue:
+    """In-process async queue of invoice ids awaiting OCR + AI parsing"""
+
+    def __init__(self, workers: int):
+        self._workers_count = max(1, workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def _ensure_started(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [
+                asyncio.create_task(self._worker(index))
+                for index in range(self._workers_count)
+            ]
+            logger.info(f"Invoice processing queue started with {self._workers_count} workers")
+        return self._queue
+
+    async def enqueue(self, invoice_ids: List[int]) -> None:
+        """Поставить счета в очередь обработки (должно вызываться из event loop)"""
+        queue = self._ensure_started()
+        for invoice_id in invoice_ids:
+            queue.put_nowait(invoice_id)
+
+    async def enqueue_pending(self) -> int:
+        """Поставить в очередь счета, оставшиеся PENDING или оборванные в PROCESSING после перезапуска"""
+        def load() -> List[int]:
+            db = SessionLocal()
+            try:
+                reset = reset_stale_processing(
+                    db, timedelta(minutes=settings.INVOICE_PROCESSING_STALE_MINUTES)
+                )
+                if reset:
+                    logger.warning(f"{reset} invoices stuck in PROCESSING were returned to the queue")
+                return queued_pending_ids(db)
+            finally:
+                db.close()
+
+        invoice_ids = await asyncio.to_thread(load)
+        if invoice_ids:
+            await self.enqueue(invoice_ids)
+        return len(invoice_ids)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def shutdown(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    async def _worker(self, index: int) -> None:
+        from app.services.invoice_processor import InvoiceProcessorService
+
+        queue = self._queue
+        while True:
+            invoice_id = await queue.get()
+            db = SessionLocal()
+            try:
+                if not await asyncio.to_thread(claim_invoice, db, invoice_id):
+                    logger.info(f"Queue worker {index}: invoice ID={invoice_id} is not pending, skipped")
+                    continue
+                processor = await asyncio.to_thread(InvoiceProcessorService, db)
+                result = await processor.process_invoice(invoice_id)
+                logger.info(
+                    f"Queue worker {index}: invoice ID={invoice_id} processed "
+                    f"(success={result['success']}, {result['processing_time_sec']:.1f}s)"
+                )
+            except Exception as e:
+                logger.error(f"Queue worker {index}: invoice ID={invoice_id} failed: {e}", exc_info=True)
+                await asyncio.to_thread(mark_invoice_failed, db, invoice_id, str(e))
+            finally:
+                db.close()
+                queue.task_done()
+
+
+def mark_invoice_failed(db: Session, invoice_id: int, message: str) -> None:
+    """Отметить счет ошибкой, если обработка упала до InvoiceProcessorService"""
+    try:
+        db.rollback()
+        db.query(ProcessedInvoice).filter(ProcessedInvoice.id == invoice_id).update(
+            {
+                ProcessedInvoice.status: InvoiceProcessingStatusEnum.ERROR,
+                ProcessedInvoice.errors: [{
+                    "field": "processing",
+                    "message": f"Критическая ошибка: {message}",
+                    "severity": "error",
+                }],
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+    except Exception as e:
+        logger.error(f"Не удалось отметить ошибку для invoice ID={invoice_id}: {e}")
+        db.rollback()
+
+
+def queued_pending_ids(db: Session) -> List[int]:
+    """Счета, поставленные в очередь, но еще не взятые в обработку"""
+    rows = db.query(ProcessedInvoice.id).filter(
+        ProcessedInvoice.queued_at.isnot(None),
+        ProcessedInvoice.status == InvoiceProcessingStatusEnum.PENDING,
+        ProcessedInvoice.is_active == True,
+    ).order_by(ProcessedInvoice.id).all()
+    return [row.id for row in rows]
+
+
+def claim_invoice(
+    db: Session,
+    invoice_id: int,
+    statuses: Iterable[InvoiceProcessingStatusEnum] = (InvoiceProcessingStatusEnum.PENDING,),
+) -> bool:
+    """Атомарно перевести счет из statuses в PROCESSING; False - его уже взял другой воркер"""
+    claimed = db.query(ProcessedInvoice).filter(
+        ProcessedInvoice.id == invoice_id,
+        ProcessedInvoice.status.in_(list(statuses)),
+    ).update(
+        {
+            ProcessedInvoice.status: InvoiceProcessingStatusEnum.PROCESSING,
+            ProcessedInvoice.processing_started_at: datetime.utcnow(),
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    return claimed == 1
+
+
+def reset_stale_processing(db: Session, older_than: timedelta) -> int:
+    """Вернуть в очередь счета, оставшиеся в PROCESSING после падения процесса"""
+    now = datetime.utcnow()
+    reset = db.query(ProcessedInvoice).filter(
+        ProcessedInvoice.status == InvoiceProcessingStatusEnum.PROCESSING,
+        ProcessedInvoice.is_active == True,
+        # Без отметки - взяты в обработку до появления processing_started_at
+        (ProcessedInvoice.processing_started_at.is_(None))
+        | (ProcessedInvoice.processing_started_at < now - older_than),
+    ).update(
+        {
+            ProcessedInvoice.status: InvoiceProcessingStatusEnum.PENDING,
+            ProcessedInvoice.processing_started_at: None,
+            ProcessedInvoice.queued_at: now,
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    return reset
+
+
+def new_batch_id() -> str:
+    return uuid.uuid4().hex
+
+
+def get_batch_department(db: Session, batch_id: str) -> Optional[int]:
+    """Отдел пакета или None, если пакета нет"""
+    row = db.query(ProcessedInvoice.department_id).filter(
+        ProcessedInvoice.batch_id == batch_id
+    ).first()
+    return row.department_id if row else None
+
+
+def get_batch_progress(db: Session, batch_id: str) -> Dict:
+    """Прогресс пакета по статусам ProcessedInvoice (один запрос)"""
+    rows = db.query(
+        ProcessedInvoice.id,
+        ProcessedInvoice.original_filename,
+        ProcessedInvoice.status,
+        ProcessedInvoice.invoice_number,
+        ProcessedInvoice.total_amount,
+        ProcessedInvoice.errors,
+    ).filter(ProcessedInvoice.batch_id == batch_id).order_by(ProcessedInvoice.id).all()
+
+    counts: Dict[str, int] = {status.value: 0 for status in InvoiceProcessingStatusEnum}
+    items = []
+    for row in rows:
+        counts[row.status.value] += 1
+        items.append({
+            "invoice_id": row.id,
+            "filename": row.original_filename,
+            "status": row.status.value,
+            "invoice_number": row.invoice_number,
+            "total_amount": row.total_amount,
+            "has_errors": bool(row.errors),
+        })
+
+    finished = sum(1 for row in rows if row.status in FINISHED_STATUSES)
+    return {
+        "total": len(rows),
+        "finished": finished,
+        "is_complete": finished == len(rows),
+        "status_counts": counts,
+        "items": items,
+    }
+
+
+invoice_queue = InvoiceProcessingQueue(workers=settings.INVOICE_QUEUE_WORKERS)
@@ -0,0 +1,516 @@
+"""
+KPI analytics served from a per-(department, employee, year, month) fact set
+
+load_kpi_analytics() reads everything the KPI analytics endpoints need for
+one (department, year) with three grouped queries:
+
+1. KPI facts: employee_kpis (with a per-KPI goal count sub-select) grouped by
+   department, employee, year and month; statuses, approved-only and
+   with-KPI% figures are FILTER (WHERE ...) aggregates of the same scan
+2. goal facts: employee_kpi_goals per (goal, employee, month) for goal progress
+3. goal catalog counts (total / active) of the department
+
+The bundle is cached for a short time per (department, year) in the shared
+cache and dropped by invalidate_kpi_analytics_cache() on KPI writes; the
+endpoints only aggregate the facts in memory.
+"""
+from dataclasses import asdict, dataclass, fields
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from app.db.models import (
+    Department,
+    Employee,
+    EmployeeKPI,
+    EmployeeKPIGoal,
+    EmployeeKPIStatusEnum,
+    KPIGoal,
+    KPIGoalStatusEnum,
+)
+from app.services.cache import cache_service
+
+KPI_ANALYTICS_CACHE_NAMESPACE = "kpi_analytics"
+KPI_ANALYTICS_CACHE_TTL_SECONDS = 60
+
+MONTH_NAMES = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
+
+
+def invalidate_kpi_analytics_cache() -> None:
+    """Drop cached KPI fact sets after EmployeeKPI / goal writes"""
+    cache_service.invalidate_namespace(KPI_ANALYTICS_CACHE_NAMESPACE)
+
+
+def _decimal_fields(cls) -> List[str]:
+    return [field.name for field in fields(cls) if field.type in (Decimal, Optional[Decimal])]
+
+
+@dataclass
+class KPIFact:
+    """KPI figures of one employee in one month"""
+    department_id: int
+    department_name: Optional[str]
+    employee_id: int
+    employee_name: str
+    position: str
+    year: int
+    month: int
+    kpi_count: int
+    kpi_values: int  # KPI records with kpi_percentage
+    kpi_sum: Decimal
+    kpi_min: Optional[Decimal]
+    kpi_max: Optional[Decimal]
+    draft: int
+    under_review: int
+    approved: int
+    rejected: int
+    approved_kpi_values: int
+    approved_kpi_sum: Decimal
+    approved_bonus: Decimal  # bonuses of approved KPIs with kpi_percentage
+    monthly_bonus: Decimal
+    quarterly_bonus: Decimal
+    annual_bonus: Decimal
+    kpi_bonus: Decimal  # bonuses of KPIs with kpi_percentage
+    goals_count: int
+    goals_achieved: int
+
+    @property
+    def total_bonus(self) -> Decimal:
+        return self.monthly_bonus + self.quarterly_bonus + self.annual_bonus
+
+    @property
+    def kpi_percentage(self) -> Optional[Decimal]:
+        return self.kpi_sum / self.kpi_values if self.kpi_values else None
+
+
+@dataclass
+class KPIGoalFact:
+    """Assignments of one goal to one employee in one month (employee_id None: goal without assignments)"""
+    goal_id: int
+    goal_name: str
+    category: Optional[str]
+    target_value: Optional[Decimal]
+    metric_unit: Optional[str]
+    employee_id: Optional[int]
+    month: Optional[int]
+    assignments: int
+    achieved: int
+    achievement_sum: Decimal
+    achievement_values: int
+    weight_sum: Decimal
+
+
+@dataclass
+class KPIAnalytics:
+    department_id: Optional[int]
+    year: int
+    facts: List[KPIFact]
+    goals: List[KPIGoalFact]
+    total_goals: int
+    active_goals: int
+
+    def month_facts(self, month: Optional[int] = None) -> List[KPIFact]:
+        return [fact for fact in self.facts if month is None or fact.month == month]
+
+
+def _zero(value: Any) -> Any:
+    return value if value is not None else Decimal(0)
+
+
+def _kpi_facts(db: Session, year: int, department_id: Optional[int]) -> List[KPIFact]:
+    goal_counts = (
+        select(
+            EmployeeKPIGoal.employee_kpi_id,
+            func.count(EmployeeKPIGoal.id).label("goals_count"),
+            func.count(EmployeeKPIGoal.id).filter(
+                EmployeeKPIGoal.status == KPIGoalStatusEnum.ACHIEVED
+            ).label("goals_achieved")
+        )
+        .where(EmployeeKPIGoal.employee_kpi_id.isnot(None), EmployeeKPIGoal.year == year)
+        .group_by(EmployeeKPIGoal.employee_kpi_id)
+        .subquery()
+    )
+
+    bonus = (
+        func.coalesce(EmployeeKPI.monthly_bonus_calculated, 0) +
+        func.coalesce(EmployeeKPI.quarterly_bonus_calculated, 0) +
+        func.coalesce(EmployeeKPI.annual_bonus_calculated, 0)
+    )
+    has_kpi = EmployeeKPI.kpi_percentage.isnot(None)
+    is_approved = EmployeeKPI.status == EmployeeKPIStatusEnum.APPROVED
+
+    def status_count(status):
+        return func.count(EmployeeKPI.id).filter(EmployeeKPI.status == status)
+
+    group = (
+        EmployeeKPI.department_id, Department.name, EmployeeKPI.employee_id,
+        Employee.full_name, Employee.position, EmployeeKPI.year, EmployeeKPI.month
+    )
+    query = (
+        select(
+            *group,
+            func.count(EmployeeKPI.id),
+            func.count(EmployeeKPI.kpi_percentage),
+            func.sum(EmployeeKPI.kpi_percentage),
+            func.min(EmployeeKPI.kpi_percentage),
+            func.max(EmployeeKPI.kpi_percentage),
+            status_count(EmployeeKPIStatusEnum.DRAFT),
+            status_count(EmployeeKPIStatusEnum.UNDER_REVIEW),
+            status_count(EmployeeKPIStatusEnum.APPROVED),
+            status_count(EmployeeKPIStatusEnum.REJECTED),
+            func.count(EmployeeKPI.kpi_percentage).filter(is_approved),
+            func.sum(EmployeeKPI.kpi_percentage).filter(is_approved),
+            func.sum(bonus).filter(and_(is_approved, has_kpi)),
+            func.sum(func.coalesce(EmployeeKPI.monthly_bonus_calculated, 0)),
+            func.sum(func.coalesce(EmployeeKPI.quarterly_bonus_calculated, 0)),
+            func.sum(func.coalesce(EmployeeKPI.annual_bonus_calculated, 0)),
+            func.sum(bonus).filter(has_kpi),
+            func.coalesce(func.sum(goal_counts.c.goals_count), 0),
+            func.coalesce(func.sum(goal_counts.c.goals_achieved), 0),
+        )
+        .join(Employee, Employee.id == EmployeeKPI.employee_id)
+        .outerjoin(Department, Department.id == EmployeeKPI.department_id)
+        .outerjoin(goal_counts, goal_counts.c.employee_kpi_id == EmployeeKPI.id)
+        .where(EmployeeKPI.year == year)
+        .group_by(*group)
+        .order_by(EmployeeKPI.month, EmployeeKPI.employee_id, EmployeeKPI.department_id)
+    )
+    if department_id:
+        query = query.where(EmployeeKPI.department_id == department_id)
+
+    facts = []
+    for row in db.execute(query):
+        facts.append(KPIFact(
+            *row[:9],
+            kpi_sum=_zero(row[9]), kpi_min=row[10], kpi_max=row[11],
+            draft=row[12], under_review=row[13], approved=row[14], rejected=row[15],
+            approved_kpi_values=row[16], approved_kpi_sum=_zero(row[17]), approved_bonus=_zero(row[18]),
+            monthly_bonus=_zero(row[19]), quarterly_bonus=_zero(row[20]), annual_bonus=_zero(row[21]),
+            kpi_bonus=_zero(row[22]), goals_count=int(row[23]), goals_achieved=int(row[24]),
+        ))
+    return facts
+
+
+def _goal_facts(db: Session, year: int, department_id: Optional[int]) -> List[KPIGoalFact]:
+    group = (
+        KPIGoal.id, KPIGoal.name, KPIGoal.category, KPIGoal.target_value, KPIGoal.metric_unit,
+        EmployeeKPIGoal.employee_id, EmployeeKPIGoal.month
+    )
+    query = (
+        select(
+            *group,
+            func.count(EmployeeKPIGoal.id),
+            func.count(EmployeeKPIGoal.id).filter(EmployeeKPIGoal.status == KPIGoalStatusEnum.ACHIEVED),
+            func.sum(EmployeeKPIGoal.achievement_percentage),
+            func.count(EmployeeKPIGoal.achievement_percentage),
+            func.sum(EmployeeKPIGoal.weight),
+        )
+        .outerjoin(EmployeeKPIGoal, and_(
+            EmployeeKPIGoal.goal_id == KPIGoal.id,
+            EmployeeKPIGoal.year == year
+        ))
+        .where(KPIGoal.year == year)
+        .group_by(*group)
+        .order_by(KPIGoal.id)
+    )
+    if department_id:
+        query = query.where(KPIGoal.department_id == department_id)
+
+    return [
+        KPIGoalFact(
+            *row[:7],
+            assignments=row[7], achieved=row[8], achievement_sum=_zero(row[9]),
+            achievement_values=row[10], weight_sum=_zero(row[11]),
+        )
+        for row in db.execute(query)
+    ]
+
+
+def _goal_catalog(db: Session, department_id: Optional[int]) -> Dict[str, int]:
+    query = select(
+        func.count(KPIGoal.id),
+        func.count(KPIGoal.id).filter(KPIGoal.status == KPIGoalStatusEnum.ACTIVE)
+    )
+    if department_id:
+        query = query.where(KPIGoal.department_id == department_id)
+    total, active = db.execute(query).one()
+    return {"total_goals": total, "active_goals": active}
+
+
+def _restore(cls, data: Dict[str, Any]):
+    decimals = _decimal_fields(cls)
+    return cls(**{
+        name: Decimal(value) if name in decimals and value is not None else value
+        for name, value in data.items()
+    })
+
+
+def load_kpi_analytics(db: Session, year: int, department_id: Optional[int] = None) -> KPIAnalytics:
+    """KPI and goal facts of a (department, year); all departments if department_id is None"""
+    key = cache_service.build_key(department_id, year)
+    cached = cache_service.get(KPI_ANALYTICS_CACHE_NAMESPACE, key)
+    if cached is not None:
+        return KPIAnalytics(
+            department_id=department_id,
+            year=year,
+            facts=[_restore(KPIFact, fact) for fact in cached["facts"]],
+            goals=[_restore(KPIGoalFact, goal) for goal in cached["goals"]],
+            total_goals=cached["total_goals"],
+            active_goals=cached["active_goals"],
+        )
+
+    analytics = KPIAnalytics(
+        department_id=department_id,
+        year=year,
+        facts=_kpi_facts(db, year, department_id),
+        goals=_goal_facts(db, year, department_id),
+        **_goal_catalog(db, department_id),
+    )
+    cache_service.set(
+        KPI_ANALYTICS_CACHE_NAMESPACE,
+        key,
+        {
+            "facts": [asdict(fact) for fact in analytics.facts],
+            "goals": [asdict(goal) for goal in analytics.goals],
+            "total_goals": analytics.total_goals,
+            "active_goals": analytics.active_goals,
+        },
+        ttl_seconds=KPI_ANALYTICS_CACHE_TTL_SECONDS,
+    )
+    return analytics
+
+
+# ==================== Aggregations ====================
+
+def _avg(total: Decimal, count: int) -> Optional[Decimal]:
+    return total / count if count else None
+
+
+def employee_summary(analytics: KPIAnalytics, month: Optional[int] = None) -> List[Dict[str, Any]]:
+    return [
+        {
+            "employee_id": fact.employee_id,
+            "employee_name": fact.employee_name,
+            "position": fact.position,
+            "year": fact.year,
+            "month": fact.month,
+            "kpi_percentage": fact.kpi_percentage,
+            "total_bonus_calculated": fact.total_bonus,
+            "monthly_bonus_calculated": fact.monthly_bonus,
+            "quarterly_bonus_calculated": fact.quarterly_bonus,
+            "annual_bonus_calculated": fact.annual_bonus,
+            "goals_count": fact.goals_count,
+            "goals_achieved": fact.goals_achieved,
+        }
+        for fact in analytics.month_facts(month)
+    ]
+
+
+def department_summary(analytics: KPIAnalytics, month: Optional[int] = None) -> List[Dict[str, Any]]:
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for fact in analytics.month_facts(month):
+        group = groups.setdefault((fact.department_id, fact.year, fact.month), {
+            "department_id": fact.department_id,
+            "department_name": fact.department_name,
+            "year": fact.year,
+            "month": fact.month,
+            "kpi_sum": Decimal(0),
+            "kpi_values": 0,
+            "employees": set(),
+            "total_bonus_calculated": Decimal(0),
+            "goals_count": 0,
+            "goals_achieved": 0,
+        })
+        group["kpi_sum"] += fact.kpi_sum
+        group["kpi_values"] += fact.kpi_values
+        group["employees"].add(fact.employee_id)
+        group["total_bonus_calculated"] += fact.total_bonus
+        group["goals_count"] += fact.goals_count
+        group["goals_achieved"] += fact.goals_achieved
+
+    return [
+        {
+            "department_id": group["department_id"],
+            "department_name": group["department_name"],
+            "year": group["year"],
+            "month": group["month"],
+            "avg_kpi_percentage": _avg(group["kpi_sum"], group["kpi_values"]) or Decimal(0),
+            "total_employees": len(group["employees"]),
+            "total_bonus_calculated": group["total_bonus_calculated"],
+            "goals_count": group["goals_count"],
+            "goals_achieved": group["goals_achieved"],
+        }
+        for group in groups.values()
+    ]
+
+
+def goal_progress(analytics: KPIAnalytics, month: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Per goal; with month: assignments of that month and annual (month is NULL) assignments"""
+    goals: Dict[int, Dict[str, Any]] = {}
+    for fact in analytics.goals:
+        if month is not None and fact.month not in (month, None):
+            continue
+        goal = goals.setdefault(fact.goal_id, {
+            "goal_id": fact.goal_id,
+            "goal_name": fact.goal_name,
+            "category": fact.category,
+            "target_value": fact.target_value,
+            "metric_unit": fact.metric_unit,
+            "employees": set(),
+            "employees_achieved": 0,
+            "achievement_sum": Decimal(0),
+            "achievement_values": 0,
+            "total_weight": Decimal(0),
+        })
+        if fact.employee_id is not None:
+            goal["employees"].add(fact.employee_id)
+        goal["employees_achieved"] += fact.achieved
+        goal["achievement_sum"] += fact.achievement_sum
+        goal["achievement_values"] += fact.achievement_values
+        goal["total_weight"] += fact.weight_sum
+
+    return [
+        {
+            "goal_id": goal["goal_id"],
+            "goal_name": goal["goal_name"],
+            "category": goal["category"],
+            "target_value": goal["target_value"],
+            "metric_unit": goal["metric_unit"],
+            "employees_assigned": len(goal["employees"]),
+            "employees_achieved": goal["employees_achieved"],
+            "avg_achievement_percentage": _avg(goal["achievement_sum"], goal["achievement_values"]) or Decimal(0),
+            "total_weight": goal["total_weight"],
+        }
+        for goal in goals.values()
+    ]
+
+
+def kpi_trends(analytics: KPIAnalytics, employee_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    months: Dict[int, List[KPIFact]] = {}
+    for fact in analytics.facts:
+        if employee_id and fact.employee_id != employee_id:
+            continue
+        months.setdefault(fact.month, []).append(fact)
+
+    trends = []
+    for month in sorted(months):
+        facts = months[month]
+        with_kpi = [fact for fact in facts if fact.kpi_values]
+        trends.append({
+            "month": month,
+            "avg_kpi": float(_avg(sum(fact.kpi_sum for fact in facts), sum(fact.kpi_values for fact in facts)) or 0),
+            "min_kpi": float(min((fact.kpi_min for fact in with_kpi), default=0)),
+            "max_kpi": float(max((fact.kpi_max for fact in with_kpi), default=0)),
+            "employee_count": len({fact.employee_id for fact in facts}),
+            "total_bonus": float(sum(fact.total_bonus for fact in facts)),
+        })
+    return trends
+
+
+def bonus_distribution(analytics: KPIAnalytics, month: Optional[int] = None) -> List[Dict[str, Any]]:
+    departments: Dict[int, Dict[str, Any]] = {}
+    for fact in analytics.month_facts(month):
+        department = departments.setdefault(fact.department_id, {
+            "department_id": fact.department_id,
+            "department_name": fact.department_name,
+            "monthly_total": Decimal(0),
+            "quarterly_total": Decimal(0),
+            "annual_total": Decimal(0),
+            "employees": set(),
+        })
+        department["monthly_total"] += fact.monthly_bonus
+        department["quarterly_total"] += fact.quarterly_bonus
+        department["annual_total"] += fact.annual_bonus
+        department["employees"].add(fact.employee_id)
+
+    return [
+        {
+            "department_id": department["department_id"],
+            "department_name": department["department_name"],
+            "monthly_total": float(department["monthly_total"]),
+            "quarterly_total": float(department["quarterly_total"]),
+            "annual_total": float(department["annual_total"]),
+            "total_bonus": float(
+                department["monthly_total"] + department["quarterly_total"] + department["annual_total"]
+            ),
+            "employee_count": len(department["employees"]),
+        }
+        for department in departments.values()
+    ]
+
+
+def dashboard(analytics: KPIAnalytics) -> Dict[str, Any]:
+    facts = analytics.facts
+
+    status_stats = {
+        'DRAFT': sum(fact.draft for fact in facts),
+        'UNDER_REVIEW': sum(fact.under_review for fact in facts),
+        'APPROVED': sum(fact.approved for fact in facts),
+        'REJECTED': sum(fact.rejected for fact in facts)
+    }
+
+    # Динамика КПИ по месяцам: только записи с КПИ%
+    months: Dict[int, List[KPIFact]] = {}
+    for fact in facts:
+        if fact.kpi_values:
+            months.setdefault(fact.month, []).append(fact)
+    trends_data = [
+        {
+            'month': month,
+            'month_name': MONTH_NAMES[month - 1],
+            'avg_kpi': float(_avg(sum(f.kpi_sum for f in months[month]), sum(f.kpi_values for f in months[month])) or 0),
+            'employee_count': len({f.employee_id for f in months[month]}),
+            'total_bonus': float(sum(f.kpi_bonus for f in months[month]))
+        }
+        for month in sorted(months)
+    ]
+
+    # Топ-10 сотрудников по среднему КПИ% (утверждённые KPI)
+    employees: Dict[int, Dict[str, Any]] = {}
+    for fact in facts:
+        if not fact.approved_kpi_values:
+            continue
+        employee = employees.setdefault(fact.employee_id, {
+            'employee_id': fact.employee_id,
+            'employee_name': fact.employee_name,
+            'kpi_sum': Decimal(0),
+            'kpi_count': 0,
+            'total_bonus': Decimal(0)
+        })
+        employee['kpi_sum'] += fact.approved_kpi_sum
+        employee['kpi_count'] += fact.approved_kpi_values
+        employee['total_bonus'] += fact.approved_bonus
+    top_employees = sorted(
+        employees.values(), key=lambda employee: employee['kpi_sum'] / employee['kpi_count'], reverse=True
+    )[:10]
+
+    kpi_sum = sum(fact.kpi_sum for fact in facts)
+    kpi_values = sum(fact.kpi_values for fact in facts)
+    return {
+        'overview': {
+            'total_kpis': sum(fact.kpi_count for fact in facts),
+            'avg_kpi_percentage': round(float(_avg(kpi_sum, kpi_values) or 0), 2),
+            'total_bonuses': round(float(sum(fact.total_bonus for fact in facts)), 2),
+            'unique_employees': len({fact.employee_id for fact in facts}),
+            'total_goals': analytics.total_goals,
+            'active_goals': analytics.active_goals
+        },
+        'status_distribution': status_stats,
+        'monthly_trends': trends_data,
+        'top_employees': [
+            {
+                'employee_id': employee['employee_id'],
+                'employee_name': employee['employee_name'],
+                'avg_kpi': float(employee['kpi_sum'] / employee['kpi_count']),
+                'kpi_count': employee['kpi_count'],
+                'total_bonus': float(employee['total_bonus'])
+            }
+            for employee in top_employees
+        ],
+        'filters': {
+            'year': analytics.year,
+            'department_id': analytics.department_id
+        }
+    }
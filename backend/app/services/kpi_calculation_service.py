@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_
 
 from app.db.models import EmployeeKPI, EmployeeKPIGoal, KPIGoalStatusEnum
+from app.services.kpi_analytics import invalidate_kpi_analytics_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -83,6 +84,7 @@ class KPICalculationService:
             if auto_save:
                 employee_kpi.kpi_percentage = None
                 self.db.commit()
+                invalidate_kpi_analytics_cache()
 
             return {
                 "employee_kpi_id": employee_kpi_id,
@@ -144,6 +146,7 @@ class KPICalculationService:
         if auto_save:
             employee_kpi.kpi_percentage = kpi_percentage
             self.db.commit()
+            invalidate_kpi_analytics_cache()
             self.db.refresh(employee_kpi)
             logger.info(
                 f"KPI% для EmployeeKPI#{employee_kpi_id} рассчитан: "
@@ -0,0 +1,108 @@
+"""
+Bulk assignment of KPI goals to employees
+
+assign_goals() is shared by the bulk-assign and template-apply endpoints and
+runs in a fixed number of statements regardless of employees x goals:
+
+1. one query over employees x goals LEFT JOIN employee_kpi_goals of the period:
+   pairs without a match (the anti-join) are to be created, matched pairs are
+   reported as skipped duplicates
+2. one multi-row INSERT ... RETURNING per GOAL_ASSIGN_CHUNK_SIZE new pairs
+
+The session is not committed: the caller commits (or rolls back).
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, insert, select
+from sqlalchemy.orm import Session
+
+from app.db.models import EmployeeKPIGoal, Employee, KPIGoal
+
+GOAL_ASSIGN_CHUNK_SIZE = 1000
+
+
+@dataclass
+class GoalAssignment:
+    """One goal with the values to assign"""
+    goal_id: int
+    weight: Optional[Decimal] = None
+    target_value: Optional[Decimal] = None
+
+
+@dataclass
+class GoalAssignmentResult:
+    created: Dict[Tuple[int, int], int] = field(default_factory=dict)  # (employee_id, goal_id) -> new id
+    skipped: Dict[Tuple[int, int], int] = field(default_factory=dict)  # (employee_id, goal_id) -> existing id
+
+
+def assign_goals(
+    db: Session,
+    employee_kpis: Dict[int, Optional[int]],
+    goals: Sequence[GoalAssignment],
+    year: int,
+    month: Optional[int],
+    values: Optional[Dict[str, Any]] = None,
+) -> GoalAssignmentResult:
+    """
+    Create EmployeeKPIGoal for every (employee, goal) pair not yet assigned for the period
+
+    Args:
+        db: Database session (not committed here)
+        employee_kpis: employee_id -> EmployeeKPI id to link the goals to (or None)
+        goals: Goals with weight / target value
+        year, month: Assignment period
+        values: Extra column values for every created row (notes, actual_value, ...)
+
+    Returns:
+        GoalAssignmentResult with created and skipped (already assigned) pairs
+    """
+    result = GoalAssignmentResult()
+    if not employee_kpis or not goals:
+        return result
+
+    goal_values = {goal.goal_id: goal for goal in goals}
+    rows = db.execute(
+        select(Employee.id, KPIGoal.id, EmployeeKPIGoal.id)
+        .select_from(Employee)
+        .join(KPIGoal, KPIGoal.id.in_(list(goal_values)))
+        .outerjoin(EmployeeKPIGoal, and_(
+            EmployeeKPIGoal.employee_id == Employee.id,
+            EmployeeKPIGoal.goal_id == KPIGoal.id,
+            EmployeeKPIGoal.year == year,
+            EmployeeKPIGoal.month == month
+        ))
+        .where(Employee.id.in_(list(employee_kpis)))
+        .order_by(Employee.id, KPIGoal.id, EmployeeKPIGoal.id)
+    ).all()
+
+    new_pairs: List[Tuple[int, int]] = []
+    for employee_id, goal_id, existing_id in rows:
+        pair = (employee_id, goal_id)
+        if existing_id is not None:
+            result.skipped.setdefault(pair, existing_id)
+        elif pair not in result.skipped:
+            new_pairs.append(pair)
+
+    for start in range(0, len(new_pairs), GOAL_ASSIGN_CHUNK_SIZE):
+        chunk = new_pairs[start:start + GOAL_ASSIGN_CHUNK_SIZE]
+        ids = db.execute(
+            insert(EmployeeKPIGoal).returning(EmployeeKPIGoal.id, sort_by_parameter_order=True),
+            [
+                {
+                    "employee_id": employee_id,
+                    "goal_id": goal_id,
+                    "employee_kpi_id": employee_kpis[employee_id],
+                    "year": year,
+                    "month": month,
+                    "weight": goal_values[goal_id].weight,
+                    "target_value": goal_values[goal_id].target_value,
+                    **(values or {}),
+                }
+                for employee_id, goal_id in chunk
+            ]
+        ).scalars().all()
+        result.created.update(zip(chunk, ids))
+
+    return result
@@ -1,29 +1,242 @@
 """
 Payroll-KPI Synchronization Service
-Синхронизация PayrollActual ← EmployeeKPI для автоматического создания записей факта зарплаты
+Синхронизация PayrollActual / PayrollPlan ← EmployeeKPI для автоматического создания записей зарплаты
+
+Синхронизация выполняется пакетно: EmployeeKPI, Employee и строки зарплаты за период
+читаются одним запросом (JOIN), суммы считаются в памяти, затем новые записи
+вставляются одним multi-row INSERT, а существующие обновляются одним
+UPDATE ... FROM (VALUES ...) (на PostgreSQL; на других СУБД — executemany по id).
 """
-from decimal import Decimal
-from typing import Optional, Dict, Any, List
-from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional, Dict, Any, List, Sequence, Tuple, Type
+from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, column, insert, select, update, values, Integer, Numeric
 
 from app.db.models import EmployeeKPI, PayrollActual, PayrollPlan, Employee
+from app.services.payroll_tax_breakdown import refresh_payroll_taxes
+from app.services.salary_distribution import invalidate_salary_distribution_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
+INCOME_TAX_RATE = Decimal('0.13')
+SYNC_WRITE_CHUNK_SIZE = 1000
+
+_CENT = Decimal('0.01')
+
+
+def _money(value: Decimal) -> Decimal:
+    return value.quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+def _chunks(rows: Sequence[Any], size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
 
 class PayrollKPISyncService:
     """
-    Сервис для синхронизации PayrollActual с EmployeeKPI.
+    Сервис для синхронизации PayrollActual и PayrollPlan с EmployeeKPI.
 
-    Создаёт или обновляет записи PayrollActual на основе рассчитанных бонусов из EmployeeKPI.
+    Создаёт или обновляет записи зарплаты на основе рассчитанных бонусов из EmployeeKPI.
     """
 
     def __init__(self, db: Session):
         self.db = db
 
+    # ==================== Batch load / write ====================
+
+    def _load_rows(self, payroll_model: Type, filters: List[Any]) -> List[Any]:
+        """
+        Один запрос: EmployeeKPI + Employee + существующая строка зарплаты за тот же период.
+
+        Если строк зарплаты несколько, используется запись с меньшим id (как .first() раньше).
+        """
+        rows = self.db.execute(
+            select(
+                EmployeeKPI.id.label("employee_kpi_id"),
+                EmployeeKPI.employee_id,
+                EmployeeKPI.department_id,
+                EmployeeKPI.year,
+                EmployeeKPI.month,
+                EmployeeKPI.monthly_bonus_calculated,
+                EmployeeKPI.quarterly_bonus_calculated,
+                EmployeeKPI.annual_bonus_calculated,
+                Employee.id.label("found_employee_id"),
+                Employee.full_name.label("employee_name"),
+                Employee.base_salary.label("employee_base_salary"),
+                payroll_model.id.label("payroll_id"),
+            )
+            .outerjoin(Employee, Employee.id == EmployeeKPI.employee_id)
+            .outerjoin(payroll_model, and_(
+                payroll_model.employee_id == EmployeeKPI.employee_id,
+                payroll_model.year == EmployeeKPI.year,
+                payroll_model.month == EmployeeKPI.month,
+                payroll_model.department_id == EmployeeKPI.department_id
+            ))
+            .where(*filters)
+            .order_by(EmployeeKPI.id, payroll_model.id)
+        ).all()
+
+        unique: Dict[int, Any] = {}
+        for row in rows:
+            unique.setdefault(row.employee_kpi_id, row)
+        return list(unique.values())
+
+    @staticmethod
+    def _period_filters(department_id: int, year: int, month: Optional[int]) -> List[Any]:
+        filters = [EmployeeKPI.department_id == department_id, EmployeeKPI.year == year]
+        if month:
+            filters.append(EmployeeKPI.month == month)
+        return filters
+
+    @staticmethod
+    def _bonuses(row: Any) -> Tuple[Decimal, Decimal, Decimal]:
+        return (
+            row.monthly_bonus_calculated or Decimal(0),
+            row.quarterly_bonus_calculated or Decimal(0),
+            row.annual_bonus_calculated or Decimal(0),
+        )
+
+    def _actual_values(self, row: Any, base_salary: Optional[Decimal]) -> Dict[str, Decimal]:
+        if base_salary is None:
+            base_salary = row.employee_base_salary or Decimal(0)
+        monthly_bonus, quarterly_bonus, annual_bonus = self._bonuses(row)
+        total_paid = base_salary + monthly_bonus + quarterly_bonus + annual_bonus
+        return {
+            "base_salary_paid": base_salary,
+            "monthly_bonus_paid": monthly_bonus,
+            "quarterly_bonus_paid": quarterly_bonus,
+            "annual_bonus_paid": annual_bonus,
+            "total_paid": total_paid,
+            # Расчёт НДФЛ (13%)
+            "income_tax_amount": _money(total_paid * INCOME_TAX_RATE),
+        }
+
+    def _plan_values(self, row: Any) -> Dict[str, Decimal]:
+        monthly_bonus, quarterly_bonus, annual_bonus = self._bonuses(row)
+        base_salary = row.employee_base_salary or Decimal(0)
+        return {
+            "monthly_bonus": monthly_bonus,
+            "quarterly_bonus": quarterly_bonus,
+            "annual_bonus": annual_bonus,
+            "total_planned": base_salary + monthly_bonus + quarterly_bonus + annual_bonus,
+        }
+
+    def _bulk_update(self, payroll_model: Type, updates: List[Dict[str, Any]]) -> None:
+        """Обновить существующие строки зарплаты по id: UPDATE ... FROM (VALUES ...)"""
+        if not updates:
+            return
+        fields = [name for name in updates[0] if name != "id"]
+        now = datetime.utcnow()
+
+        if self.db.get_bind().dialect.name != "postgresql":
+            # Нет UPDATE ... FROM (VALUES) с именованными колонками: executemany по первичному ключу
+            self.db.execute(
+                update(payroll_model).execution_options(synchronize_session=False),
+                [{**row, "updated_at": now} for row in updates]
+            )
+            return
+
+        for chunk in _chunks(updates, SYNC_WRITE_CHUNK_SIZE):
+            payroll_values = values(
+                column("id", Integer),
+                *[column(name, Numeric(15, 2)) for name in fields],
+                name="payroll_values"
+            ).data([(row["id"], *[row[name] for name in fields]) for row in chunk])
+            self.db.execute(
+                update(payroll_model)
+                .where(payroll_model.id == payroll_values.c.id)
+                .values({**{name: payroll_values.c[name] for name in fields}, "updated_at": now})
+                .execution_options(synchronize_session=False)
+            )
+
+    def _bulk_insert(self, payroll_model: Type, inserts: List[Dict[str, Any]]) -> List[int]:
+        if not inserts:
+            return []
+        return list(self.db.execute(
+            insert(payroll_model).returning(payroll_model.id, sort_by_parameter_order=True),
+            inserts
+        ).scalars())
+
+    # ==================== PayrollActual ====================
+
+    def _sync_actual(
+        self,
+        filters: List[Any],
+        base_salary: Optional[Decimal] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Пакетная синхронизация EmployeeKPI → PayrollActual (без commit); возвращает (results, errors)"""
+        rows = self._load_rows(PayrollActual, filters)
+        now = datetime.utcnow()
+
+        results: List[Dict[str, Any]] = []
+        errors: List[Dict[str, Any]] = []
+        inserts: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        for row in rows:
+            if row.found_employee_id is None:
+                errors.append(self._error(row, f"Сотрудник с ID {row.employee_id} не найден"))
+                continue
+
+            amounts = self._actual_values(row, base_salary)
+            if row.payroll_id is not None:
+                updates.append({"id": row.payroll_id, **amounts})
+            else:
+                inserts.append({
+                    "year": row.year,
+                    "month": row.month,
+                    "employee_id": row.employee_id,
+                    "department_id": row.department_id,
+                    **amounts,
+                    "other_payments_paid": Decimal(0),
+                    "income_tax_rate": INCOME_TAX_RATE,
+                    "social_tax_amount": Decimal(0),
+                    "notes": f"Синхронизировано из EmployeeKPI#{row.employee_kpi_id}",
+                    "created_at": now,
+                    "updated_at": now,
+                })
+            results.append({
+                "action": "updated" if row.payroll_id is not None else "created",
+                "payroll_actual_id": row.payroll_id,
+                "employee_kpi_id": row.employee_kpi_id,
+                "employee_id": row.employee_id,
+                "year": row.year,
+                "month": row.month,
+                **{name: float(value) for name, value in amounts.items()},
+                "net_amount": float(amounts["total_paid"] - amounts["income_tax_amount"]),
+            })
+
+        self._bulk_update(PayrollActual, updates)
+        new_ids = iter(self._bulk_insert(PayrollActual, inserts))
+        for result in results:
+            if result["payroll_actual_id"] is None:
+                result["payroll_actual_id"] = next(new_ids)
+
+        logger.info(
+            f"PayrollActual синхронизирован: {len(inserts)} создано, {len(updates)} обновлено, "
+            f"{len(errors)} ошибок"
+        )
+        refresh_payroll_taxes(self.db, [(result["employee_id"], result["year"]) for result in results])
+        return results, errors
+
+    @staticmethod
+    def _error(row: Any, message: str) -> Dict[str, Any]:
+        return {
+            "employee_kpi_id": row.employee_kpi_id,
+            "employee_id": row.employee_id,
+            "period": f"{row.year}-{row.month:02d}",
+            "error": message
+        }
+
+    def _single_row_or_raise(self, employee_kpi_id: int, results: List[Dict[str, Any]], errors: List[Dict[str, Any]]):
+        if errors:
+            raise ValueError(errors[0]["error"])
+        if not results:
+            raise ValueError(f"EmployeeKPI с ID {employee_kpi_id} не найден")
+        return results[0]
+
     def sync_employee_kpi_to_payroll(
         self,
         employee_kpi_id: int,
@@ -39,105 +252,10 @@ class PayrollKPISyncService:
         Returns:
             Dict с результатами синхронизации
         """
-        # Получаем запись EmployeeKPI
-        employee_kpi = self.db.query(EmployeeKPI).filter(
-            EmployeeKPI.id == employee_kpi_id
-        ).first()
-
-        if not employee_kpi:
-            raise ValueError(f"EmployeeKPI с ID {employee_kpi_id} не найден")
-
-        # Получаем сотрудника
-        employee = self.db.query(Employee).filter(
-            Employee.id == employee_kpi.employee_id
-        ).first()
-
-        if not employee:
-            raise ValueError(f"Сотрудник с ID {employee_kpi.employee_id} не найден")
-
-        # Определяем базовый оклад
-        if base_salary is None:
-            base_salary = employee.base_salary or Decimal(0)
-
-        # Проверяем существование записи PayrollActual
-        payroll_actual = self.db.query(PayrollActual).filter(
-            and_(
-                PayrollActual.employee_id == employee_kpi.employee_id,
-                PayrollActual.year == employee_kpi.year,
-                PayrollActual.month == employee_kpi.month,
-                PayrollActual.department_id == employee_kpi.department_id
-            )
-        ).first()
-
-        # Подготавливаем данные
-        monthly_bonus = employee_kpi.monthly_bonus_calculated or Decimal(0)
-        quarterly_bonus = employee_kpi.quarterly_bonus_calculated or Decimal(0)
-        annual_bonus = employee_kpi.annual_bonus_calculated or Decimal(0)
-
-        total_paid = base_salary + monthly_bonus + quarterly_bonus + annual_bonus
-
-        # Расчёт НДФЛ (13%)
-        income_tax_rate = Decimal('0.13')
-        income_tax_amount = total_paid * income_tax_rate
-
-        if payroll_actual:
-            # Обновляем существующую запись
-            payroll_actual.base_salary_paid = base_salary
-            payroll_actual.monthly_bonus_paid = monthly_bonus
-            payroll_actual.quarterly_bonus_paid = quarterly_bonus
-            payroll_actual.annual_bonus_paid = annual_bonus
-            payroll_actual.total_paid = total_paid
-            payroll_actual.income_tax_amount = income_tax_amount
-
-            action = "updated"
-            logger.info(
-                f"PayrollActual обновлён для сотрудника#{employee_kpi.employee_id} "
-                f"за {employee_kpi.year}-{employee_kpi.month:02d}"
-            )
-        else:
-            # Создаём новую запись
-            payroll_actual = PayrollActual(
-                year=employee_kpi.year,
-                month=employee_kpi.month,
-                employee_id=employee_kpi.employee_id,
-                department_id=employee_kpi.department_id,
-                base_salary_paid=base_salary,
-                monthly_bonus_paid=monthly_bonus,
-                quarterly_bonus_paid=quarterly_bonus,
-                annual_bonus_paid=annual_bonus,
-                other_payments_paid=Decimal(0),
-                total_paid=total_paid,
-                income_tax_rate=income_tax_rate,
-                income_tax_amount=income_tax_amount,
-                social_tax_amount=Decimal(0),
-                notes=f"Синхронизировано из EmployeeKPI#{employee_kpi_id}"
-            )
-            self.db.add(payroll_actual)
-
-            action = "created"
-            logger.info(
-                f"PayrollActual создан для сотрудника#{employee_kpi.employee_id} "
-                f"за {employee_kpi.year}-{employee_kpi.month:02d}"
-            )
-
+        results, errors = self._sync_actual([EmployeeKPI.id == employee_kpi_id], base_salary)
+        result = self._single_row_or_raise(employee_kpi_id, results, errors)
         self.db.commit()
-        self.db.refresh(payroll_actual)
-
-        return {
-            "action": action,
-            "payroll_actual_id": payroll_actual.id,
-            "employee_kpi_id": employee_kpi_id,
-            "employee_id": employee_kpi.employee_id,
-            "year": employee_kpi.year,
-            "month": employee_kpi.month,
-            "base_salary_paid": float(base_salary),
-            "monthly_bonus_paid": float(monthly_bonus),
-            "quarterly_bonus_paid": float(quarterly_bonus),
-            "annual_bonus_paid": float(annual_bonus),
-            "total_paid": float(total_paid),
-            "income_tax_amount": float(income_tax_amount),
-            "net_amount": float(total_paid - income_tax_amount)
-        }
+        return result
 
     def sync_department_kpi_to_payroll(
         self,
@@ -146,7 +264,7 @@ class PayrollKPISyncService:
         month: Optional[int] = None
     ) -> Dict[str, Any]:
         """
-        Массовая синхронизация всех EmployeeKPI отдела с PayrollActual.
+        Массовая синхронизация всех EmployeeKPI отдела с PayrollActual (одна транзакция).
 
         Args:
             department_id: ID отдела
@@ -156,43 +274,37 @@ class PayrollKPISyncService:
         Returns:
             Dict со статистикой синхронизации
         """
-        query = self.db.query(EmployeeKPI).filter(
-            EmployeeKPI.department_id == department_id,
-            EmployeeKPI.year == year
-        )
+        results, errors = self._sync_actual(self._period_filters(department_id, year, month))
+        self.db.commit()
 
-        if month:
-            query = query.filter(EmployeeKPI.month == month)
-
-        employee_kpis = query.all()
-
-        success_count = 0
-        error_count = 0
-        errors = []
-
-        for emp_kpi in employee_kpis:
-            try:
-                self.sync_employee_kpi_to_payroll(emp_kpi.id)
-                success_count += 1
-            except Exception as e:
-                error_count += 1
-                errors.append({
-                    "employee_kpi_id": emp_kpi.id,
-                    "employee_id": emp_kpi.employee_id,
-                    "period": f"{emp_kpi.year}-{emp_kpi.month:02d}",
-                    "error": str(e)
-                })
-                logger.error(
-                    f"Ошибка при синхронизации EmployeeKPI#{emp_kpi.id}: {e}"
-                )
+        for error in errors:
+            logger.error(f"Ошибка при синхронизации EmployeeKPI#{error['employee_kpi_id']}: {error['error']}")
 
         return {
-            "total": len(employee_kpis),
-            "success": success_count,
-            "errors": error_count,
+            "total": len(results) + len(errors),
+            "success": len(results),
+            "created": sum(1 for result in results if result["action"] == "created"),
+            "updated": sum(1 for result in results if result["action"] == "updated"),
+            "errors": len(errors),
             "error_details": errors
         }
 
+    def _preview(self, row: Any, base_salary: Optional[Decimal]) -> Dict[str, Any]:
+        amounts = self._actual_values(row, base_salary)
+        return {
+            "will_create": row.payroll_id is None,
+            "existing_payroll_actual_id": row.payroll_id,
+            "employee_kpi_id": row.employee_kpi_id,
+            "employee_id": row.employee_id,
+            "employee_name": row.employee_name,
+            "year": row.year,
+            "month": row.month,
+            "preview": {
+                **{name: float(value) for name, value in amounts.items()},
+                "net_amount": float(amounts["total_paid"] - amounts["income_tax_amount"])
+            }
+        }
+
     def get_sync_preview(
         self,
         employee_kpi_id: int,
@@ -203,58 +315,96 @@ class PayrollKPISyncService:
 
         Показывает, какие данные будут синхронизированы.
         """
-        employee_kpi = self.db.query(EmployeeKPI).filter(
-            EmployeeKPI.id == employee_kpi_id
-        ).first()
-
-        if not employee_kpi:
+        rows = self._load_rows(PayrollActual, [EmployeeKPI.id == employee_kpi_id])
+        if not rows:
             raise ValueError(f"EmployeeKPI с ID {employee_kpi_id} не найден")
+        if rows[0].found_employee_id is None:
+            raise ValueError(f"Сотрудник с ID {rows[0].employee_id} не найден")
+        return self._preview(rows[0], base_salary)
 
-        employee = self.db.query(Employee).filter(
-            Employee.id == employee_kpi.employee_id
-        ).first()
-
-        if not employee:
-            raise ValueError(f"Сотрудник с ID {employee_kpi.employee_id} не найден")
-
-        if base_salary is None:
-            base_salary = employee.base_salary or Decimal(0)
-
-        monthly_bonus = employee_kpi.monthly_bonus_calculated or Decimal(0)
-        quarterly_bonus = employee_kpi.quarterly_bonus_calculated or Decimal(0)
-        annual_bonus = employee_kpi.annual_bonus_calculated or Decimal(0)
-
-        total_paid = base_salary + monthly_bonus + quarterly_bonus + annual_bonus
-        income_tax_amount = total_paid * Decimal('0.13')
-
-        # Проверяем существование записи
-        existing = self.db.query(PayrollActual).filter(
-            and_(
-                PayrollActual.employee_id == employee_kpi.employee_id,
-                PayrollActual.year == employee_kpi.year,
-                PayrollActual.month == employee_kpi.month,
-                PayrollActual.department_id == employee_kpi.department_id
-            )
-        ).first()
-
+    def get_department_sync_preview(
+        self,
+        department_id: int,
+        year: int,
+        month: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Пакетный предпросмотр синхронизации отдела за период (тот же JOIN, без записи в БД).
+        """
+        rows = self._load_rows(PayrollActual, self._period_filters(department_id, year, month))
+        items = [self._preview(row, None) for row in rows if row.found_employee_id is not None]
+        errors = [
+            self._error(row, f"Сотрудник с ID {row.employee_id} не найден")
+            for row in rows if row.found_employee_id is None
+        ]
         return {
-            "will_create": existing is None,
-            "existing_payroll_actual_id": existing.id if existing else None,
-            "employee_id": employee_kpi.employee_id,
-            "employee_name": employee.full_name,
-            "year": employee_kpi.year,
-            "month": employee_kpi.month,
-            "preview": {
-                "base_salary_paid": float(base_salary),
-                "monthly_bonus_paid": float(monthly_bonus),
-                "quarterly_bonus_paid": float(quarterly_bonus),
-                "annual_bonus_paid": float(annual_bonus),
-                "total_paid": float(total_paid),
-                "income_tax_amount": float(income_tax_amount),
-                "net_amount": float(total_paid - income_tax_amount)
-            }
+            "total": len(rows),
+            "will_create": sum(1 for item in items if item["will_create"]),
+            "will_update": sum(1 for item in items if not item["will_create"]),
+            "total_paid": round(sum(item["preview"]["total_paid"] for item in items), 2),
+            "items": items,
+            "errors": len(errors),
+            "error_details": errors
         }
 
+    # ==================== PayrollPlan ====================
+
+    def _sync_plan(self, filters: List[Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Пакетная синхронизация бонусов EmployeeKPI → PayrollPlan (без commit); возвращает (results, errors)"""
+        rows = self._load_rows(PayrollPlan, filters)
+        now = datetime.utcnow()
+
+        results: List[Dict[str, Any]] = []
+        errors: List[Dict[str, Any]] = []
+        inserts: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        for row in rows:
+            if row.found_employee_id is None:
+                errors.append(self._error(row, f"Сотрудник с ID {row.employee_id} не найден"))
+                continue
+
+            amounts = self._plan_values(row)
+            base_salary = row.employee_base_salary or Decimal(0)
+            if row.payroll_id is not None:
+                updates.append({"id": row.payroll_id, **amounts})
+            else:
+                inserts.append({
+                    "year": row.year,
+                    "month": row.month,
+                    "employee_id": row.employee_id,
+                    "department_id": row.department_id,
+                    "base_salary": base_salary,
+                    **amounts,
+                    "other_payments": Decimal(0),
+                    "notes": f"Синхронизировано из EmployeeKPI#{row.employee_kpi_id} (APPROVED)",
+                    "created_at": now,
+                    "updated_at": now,
+                })
+            results.append({
+                "action": "updated" if row.payroll_id is not None else "created",
+                "payroll_plan_id": row.payroll_id,
+                "employee_kpi_id": row.employee_kpi_id,
+                "employee_id": row.employee_id,
+                "employee_name": row.employee_name,
+                "year": row.year,
+                "month": row.month,
+                "base_salary": float(base_salary),
+                **{name: float(value) for name, value in amounts.items()},
+            })
+
+        self._bulk_update(PayrollPlan, updates)
+        new_ids = iter(self._bulk_insert(PayrollPlan, inserts))
+        for result in results:
+            if result["payroll_plan_id"] is None:
+                result["payroll_plan_id"] = next(new_ids)
+
+        logger.info(
+            f"PayrollPlan синхронизирован: {len(inserts)} создано, {len(updates)} обновлено, "
+            f"{len(errors)} ошибок"
+        )
+        refresh_payroll_taxes(self.db, [(result["employee_id"], result["year"]) for result in results])
+        return results, errors
+
     def sync_employee_kpi_to_payroll_plan(
         self,
         employee_kpi_id: int
@@ -271,89 +421,30 @@ class PayrollKPISyncService:
         Returns:
             Dict с результатами синхронизации
         """
-        # Получаем запись EmployeeKPI
-        employee_kpi = self.db.query(EmployeeKPI).filter(
-            EmployeeKPI.id == employee_kpi_id
-        ).first()
-
-        if not employee_kpi:
-            raise ValueError(f"EmployeeKPI с ID {employee_kpi_id} не найден")
-
-        # Получаем сотрудника для базового оклада
-        employee = self.db.query(Employee).filter(
-            Employee.id == employee_kpi.employee_id
-        ).first()
-
-        if not employee:
-            raise ValueError(f"Сотрудник с ID {employee_kpi.employee_id} не найден")
-
-        # Ищем существующую запись PayrollPlan
-        payroll_plan = self.db.query(PayrollPlan).filter(
-            and_(
-                PayrollPlan.employee_id == employee_kpi.employee_id,
-                PayrollPlan.year == employee_kpi.year,
-                PayrollPlan.month == employee_kpi.month,
-                PayrollPlan.department_id == employee_kpi.department_id
-            )
-        ).first()
-
-        # Подготавливаем данные бонусов
-        monthly_bonus = employee_kpi.monthly_bonus_calculated or Decimal(0)
-        quarterly_bonus = employee_kpi.quarterly_bonus_calculated or Decimal(0)
-        annual_bonus = employee_kpi.annual_bonus_calculated or Decimal(0)
-
-        base_salary = employee.base_salary or Decimal(0)
-        total_planned = base_salary + monthly_bonus + quarterly_bonus + annual_bonus
-
-        if payroll_plan:
-            # Обновляем существующую запись
-            payroll_plan.monthly_bonus = monthly_bonus
-            payroll_plan.quarterly_bonus = quarterly_bonus
-            payroll_plan.annual_bonus = annual_bonus
-            payroll_plan.total_planned = total_planned
-
-            action = "updated"
-            logger.info(
-                f"PayrollPlan обновлён для сотрудника#{employee_kpi.employee_id} "
-                f"за {employee_kpi.year}-{employee_kpi.month:02d}"
-            )
-        else:
-            # Создаём новую запись
-            payroll_plan = PayrollPlan(
-                year=employee_kpi.year,
-                month=employee_kpi.month,
-                employee_id=employee_kpi.employee_id,
-                department_id=employee_kpi.department_id,
-                base_salary=base_salary,
-                monthly_bonus=monthly_bonus,
-                quarterly_bonus=quarterly_bonus,
-                annual_bonus=annual_bonus,
-                other_payments=Decimal(0),
-                total_planned=total_planned,
-                notes=f"Синхронизировано из EmployeeKPI#{employee_kpi_id} (APPROVED)"
-            )
-            self.db.add(payroll_plan)
-
-            action = "created"
-            logger.info(
-                f"PayrollPlan создан для сотрудника#{employee_kpi.employee_id} "
-                f"за {employee_kpi.year}-{employee_kpi.month:02d}"
-            )
+        results, errors = self._sync_plan([EmployeeKPI.id == employee_kpi_id])
+        result = self._single_row_or_raise(employee_kpi_id, results, errors)
+        self.db.commit()
+        invalidate_salary_distribution_cache()
+        return result
 
+    def sync_department_kpi_to_payroll_plan(
+        self,
+        department_id: int,
+        year: int,
+        month: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Массовая синхронизация бонусов EmployeeKPI отдела в PayrollPlan (одна транзакция).
+        """
+        results, errors = self._sync_plan(self._period_filters(department_id, year, month))
         self.db.commit()
-        self.db.refresh(payroll_plan)
+        invalidate_salary_distribution_cache()
 
         return {
-            "action": action,
-            "payroll_plan_id": payroll_plan.id,
-            "employee_kpi_id": employee_kpi_id,
-            "employee_id": employee_kpi.employee_id,
-            "employee_name": employee.full_name,
-            "year": employee_kpi.year,
-            "month": employee_kpi.month,
-            "base_salary": float(base_salary),
-            "monthly_bonus": float(monthly_bonus),
-            "quarterly_bonus": float(quarterly_bonus),
-            "annual_bonus": float(annual_bonus),
-            "total_planned": float(total_planned)
+            "total": len(results) + len(errors),
+            "success": len(results),
+            "created": sum(1 for result in results if result["action"] == "created"),
+            "updated": sum(1 for result in results if result["action"] == "updated"),
+            "errors": len(errors),
+            "error_details": errors
         }
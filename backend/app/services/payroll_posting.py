@@ -0,0 +1,137 @@
+"""
+Batched lookups and writes for month-end payroll posting
+
+The payroll expense generation and payment registration endpoints preload
+everything they need per period with one query per table (dicts keyed by
+employee_id / department_id) and write the new rows with chunked multi-row
+INSERTs, so a posting for all departments costs a handful of statements
+instead of several queries per employee.
+"""
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.db.models import EmployeeKPI, Expense, Organization, PayrollActual
+
+PAYROLL_WRITE_CHUNK_SIZE = 1000
+
+PaymentKey = Tuple[int, int, int, Optional[date]]  # (employee_id, year, month, payment_date)
+
+
+def _chunks(rows: Sequence[Any], size: int) -> Iterable[Sequence[Any]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def kpis_by_employee(db: Session, employee_ids: Iterable[int], year: int, month: int) -> Dict[int, EmployeeKPI]:
+    """EmployeeKPI of the period keyed by employee_id (the first record if there are several)"""
+    employee_ids = list(set(employee_ids))
+    if not employee_ids:
+        return {}
+    kpis: Dict[int, EmployeeKPI] = {}
+    for kpi in db.execute(
+        select(EmployeeKPI)
+        .where(
+            EmployeeKPI.employee_id.in_(employee_ids),
+            EmployeeKPI.year == year,
+            EmployeeKPI.month == month
+        )
+        .order_by(EmployeeKPI.id)
+    ).scalars():
+        kpis.setdefault(kpi.employee_id, kpi)
+    return kpis
+
+
+def registered_payments(db: Session, keys: Iterable[PaymentKey]) -> Set[PaymentKey]:
+    """Subset of (employee_id, year, month, payment_date) that already have a PayrollActual"""
+    keys = list(set(keys))
+    found: Set[PaymentKey] = set()
+    dated = [key for key in keys if key[3] is not None]
+    undated = [key[:3] for key in keys if key[3] is None]
+
+    for chunk in _chunks(dated, PAYROLL_WRITE_CHUNK_SIZE):
+        found.update(db.execute(
+            select(PayrollActual.employee_id, PayrollActual.year, PayrollActual.month, PayrollActual.payment_date)
+            .where(tuple_(
+                PayrollActual.employee_id, PayrollActual.year, PayrollActual.month, PayrollActual.payment_date
+            ).in_(list(chunk)))
+        ).tuples())
+    for chunk in _chunks(undated, PAYROLL_WRITE_CHUNK_SIZE):
+        found.update(
+            (*row, None) for row in db.execute(
+                select(PayrollActual.employee_id, PayrollActual.year, PayrollActual.month)
+                .where(
+                    tuple_(PayrollActual.employee_id, PayrollActual.year, PayrollActual.month).in_(list(chunk)),
+                    PayrollActual.payment_date.is_(None)
+                )
+            ).tuples()
+        )
+    return found
+
+
+def expense_comments_by_department(
+    db: Session,
+    category_id: int,
+    year: int,
+    month: int,
+    department_id: Optional[int] = None
+) -> Dict[int, List[str]]:
+    """Lower-cased comments of the period's expenses of a category, keyed by department_id"""
+    period_start = datetime(year, month, 1)
+    period_end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    query = select(Expense.department_id, Expense.comment).where(
+        Expense.category_id == category_id,
+        Expense.request_date >= period_start,
+        Expense.request_date < period_end,
+        Expense.comment.isnot(None)
+    )
+    if department_id:
+        query = query.where(Expense.department_id == department_id)
+
+    comments: Dict[int, List[str]] = {}
+    for expense_department_id, comment in db.execute(query):
+        comments.setdefault(expense_department_id, []).append(comment.lower())
+    return comments
+
+
+def organizations_by_department(db: Session, department_ids: Iterable[int]) -> Dict[int, int]:
+    """
+    Organization for generated expenses keyed by department_id
+
+    The department's own active organization (lowest id), otherwise the first
+    active organization (same fallback as the FTP expense import). Departments
+    are missing from the result when there is no active organization at all.
+    """
+    department_ids = set(department_ids)
+    if not department_ids:
+        return {}
+    own: Dict[int, int] = {}
+    for organization_department_id, organization_id in db.execute(
+        select(Organization.department_id, Organization.id)
+        .where(Organization.department_id.in_(department_ids), Organization.is_active == True)
+        .order_by(Organization.id)
+    ):
+        own.setdefault(organization_department_id, organization_id)
+    if len(own) == len(department_ids):
+        return own
+
+    fallback = db.execute(
+        select(Organization.id).where(Organization.is_active == True).order_by(Organization.id).limit(1)
+    ).scalar()
+    if fallback is None:
+        return own
+    return {department_id: own.get(department_id, fallback) for department_id in department_ids}
+
+
+def payroll_expense_number(year: int, month: int, employee_id: int) -> str:
+    """Number of a generated payroll expense (unique per employee and period)"""
+    return f"ЗП-{year}{month:02d}-{employee_id}"
+
+
+def insert_rows(db: Session, model: Any, rows: List[Dict[str, Any]]) -> int:
+    """Multi-row INSERT of rows (same keys in every row), chunked"""
+    for chunk in _chunks(rows, PAYROLL_WRITE_CHUNK_SIZE):
+        db.execute(insert(model).values(list(chunk)))
+    return len(rows)
@@ -9,7 +9,7 @@ from datetime import datetime
 from decimal import Decimal
 from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, or_
 
 from app.db.models import (
     InsuranceRate,
@@ -22,12 +22,48 @@ from app.db.models import (
     TaxTypeEnum,
     PayrollScenarioTypeEnum,
     PayrollDataSourceEnum,
-    TaxRate,
 )
-from app.services.tax_rate_utils import merge_tax_rates_with_defaults
+from app.services.payroll_year_comparison import (
+    INSURANCE_COLUMNS,
+    contributions,
+    load_year_payroll,
+    rate_percents,
+)
+from app.services.tax_rate_resolver import get_tax_rate_resolver
 
 logger = logging.getLogger(__name__)
 
+_CENT = Decimal('0.01')
+
+# Поля детали, которые строятся из источника данных и параметров сценария
+DETAIL_INPUT_FIELDS = (
+    'employee_name', 'position', 'base_salary', 'monthly_bonus', 'quarterly_bonus', 'annual_bonus',
+    'base_year_salary', 'base_year_insurance', 'is_new_hire', 'is_terminated', 'termination_month',
+)
+
+
+def _money(value) -> Decimal:
+    return Decimal(str(value or 0)).quantize(_CENT)
+
+
+def _detail_key(detail: PayrollScenarioDetail) -> Tuple:
+    """Сотрудник базового года или новая позиция ("Новый сотрудник N")"""
+    if detail.employee_id is not None:
+        return ('employee', detail.employee_id)
+    return ('new', detail.employee_name)
+
+
+def _assign_changed(detail: PayrollScenarioDetail, values: Dict) -> bool:
+    """Записать в деталь только отличающиеся значения (суммы - с точностью до копейки)"""
+    changed = False
+    for field, value in values.items():
+        if isinstance(value, Decimal):
+            value = _money(value)
+        if getattr(detail, field) != value:
+            setattr(detail, field, value)
+            changed = True
+    return changed
+
 
 class PayrollScenarioCalculator:
     """
@@ -38,138 +74,270 @@ class PayrollScenarioCalculator:
         self.db = db
         self.department_id = department_id
 
-    def calculate_scenario(self, scenario_id: int) -> Dict:
+    def calculate_scenario(self, scenario_id: int, full_rebuild: bool = False) -> Dict:
         """
         Рассчитать сценарий ФОТ
 
+        Пересчет инкрементальный:
+        - параметры, от которых строятся детали (источник данных, базовый год,
+          % изменения зарплат и штата, отпечаток данных базового года), не
+          менялись с прошлого расчета - пересчитываются только взносы/НДФЛ
+          деталей (ставки могли измениться) и итоги сценария;
+        - параметры или данные базового года изменились - детали строятся заново в памяти и
+          сопоставляются с сохраненными (по сотруднику / новой позиции),
+          записываются только изменившиеся, новые и удаленные строки;
+        - full_rebuild=True - все детали удаляются и создаются заново.
+
         Args:
             scenario_id: ID сценария
+            full_rebuild: Полностью пересоздать детали
 
         Returns:
             Dict с результатами расчета
         """
-        scenario = self.db.query(PayrollScenario).filter(
-            PayrollScenario.id == scenario_id,
-            PayrollScenario.department_id == self.department_id
-        ).first()
-
-        if not scenario:
-            raise ValueError(f"Scenario {scenario_id} not found")
+        scenario = self._get_scenario(scenario_id)
 
         # Получить ставки страховых взносов для целевого года
         insurance_rates = self._get_insurance_rates(scenario.target_year)
 
-        # Получить детали сценария
         scenario_details = self.db.query(PayrollScenarioDetail).filter(
             PayrollScenarioDetail.scenario_id == scenario_id
         ).all()
 
-        # ВСЕГДА пересоздаем детали при расчете от БАЗОВОГО ГОДА,
-        # чтобы правильно применить новые проценты изменения
-        # Удаляем старые детали
-        logger.info(f"Recreating scenario details from BASE YEAR for scenario {scenario_id}")
-        self.db.query(PayrollScenarioDetail).filter(
+        inputs = self._calculation_inputs(scenario)
+        changes = {'created': 0, 'updated': set(), 'deleted': 0}
+
+        if full_rebuild:
+            logger.info(f"Rebuilding scenario details for scenario {scenario_id}")
+            self.db.query(PayrollScenarioDetail).filter(
+                PayrollScenarioDetail.scenario_id == scenario_id
+            ).delete(synchronize_session=False)
+            changes['deleted'] = len(scenario_details)
+            scenario_details = self._build_scenario_details(scenario)
+            self.db.add_all(scenario_details)
+            changes['created'] = len(scenario_details)
+            mode = 'rebuild'
+        elif not scenario_details or scenario.calculation_inputs != inputs:
+            scenario_details = self._sync_scenario_details(scenario, scenario_details, changes)
+            mode = 'sync'
+        else:
+            mode = 'recalculate'
+
+        for detail in scenario_details:
+            if self._apply_detail_costs(detail, scenario.data_source, insurance_rates) and detail.id is not None:
+                changes['updated'].add(detail.id)
+
+        scenario.calculation_inputs = inputs
+        self._update_totals(scenario, scenario_details)
+
+        self.db.commit()
+        self.db.refresh(scenario)
+
+        logger.info(
+            f"Scenario {scenario_id} calculated ({mode}): {changes['created']} created, "
+            f"{len(changes['updated'])} updated, {changes['deleted']} deleted"
+        )
+        return {
+            **self._result(scenario),
+            'mode': mode,
+            'details_created': changes['created'],
+            'details_updated': len(changes['updated']),
+            'details_deleted': changes['deleted'],
+        }
+
+    def update_scenario_detail(self, scenario_id: int, detail_id: int, values: Dict) -> Dict:
+        """
+        Изменить одну деталь сценария и пересчитать только ее и итоги сценария
+
+        Args:
+            scenario_id: ID сценария
+            detail_id: ID детали
+            values: Новые значения полей детали (оклад, премии, увольнение, ...)
+
+        Returns:
+            Dict с итогами сценария
+        """
+        scenario = self._get_scenario(scenario_id)
+        scenario_details = self.db.query(PayrollScenarioDetail).filter(
             PayrollScenarioDetail.scenario_id == scenario_id
-        ).delete()
+        ).all()
+
+        detail = next((item for item in scenario_details if item.id == detail_id), None)
+        if detail is None:
+            raise ValueError(f"Scenario detail {detail_id} not found")
+
+        for field, value in values.items():
+            setattr(detail, field, value)
+
+        self._apply_detail_costs(detail, scenario.data_source, self._get_insurance_rates(scenario.target_year))
+        self._update_totals(scenario, scenario_details)
+
         self.db.commit()
+        self.db.refresh(scenario)
+
+        return self._result(scenario)
+
+    def _get_scenario(self, scenario_id: int) -> PayrollScenario:
+        scenario = self.db.query(PayrollScenario).filter(
+            PayrollScenario.id == scenario_id,
+            PayrollScenario.department_id == self.department_id
+        ).first()
+
+        if not scenario:
+            raise ValueError(f"Scenario {scenario_id} not found")
 
-        # Создаем новые детали в зависимости от источника данных
+        return scenario
+
+    def _calculation_inputs(self, scenario: PayrollScenario) -> Dict:
+        """Параметры сценария, от которых строятся детали (см. PayrollScenario.calculation_inputs)"""
+        return {
+            'data_source': PayrollDataSourceEnum(scenario.data_source).value,
+            'base_year': scenario.base_year,
+            'salary_change_percent': str(_money(scenario.salary_change_percent)),
+            'headcount_change_percent': str(_money(scenario.headcount_change_percent)),
+            'source': self._source_fingerprint(scenario),
+        }
+
+    def _source_fingerprint(self, scenario: PayrollScenario) -> Dict:
+        """
+        Отпечаток данных базового года (число строк, сумма, последнее изменение)
+
+        Новые, измененные или удаленные строки PayrollPlan/PayrollActual меняют
+        отпечаток, и детали синхронизируются с источником. Детали берут из
+        Employee ФИО, должность и базы премий, поэтому в отпечаток входят и
+        сотрудники отдела и базового года (число и последнее изменение).
+        """
         if scenario.data_source == PayrollDataSourceEnum.PLAN:
-            # Если источник данных - план, используем данные из PayrollPlan
-            scenario_details = self._create_scenario_details_from_plan(
-                scenario, insurance_rates
-            )
+            model, amount = PayrollPlan, PayrollPlan.total_planned
         else:
-            # Для EMPLOYEES и ACTUAL используем данные из PayrollActual
-            scenario_details = self._create_scenario_details_from_base_year(
-                scenario, insurance_rates
+            model, amount = PayrollActual, PayrollActual.total_paid
+
+        source_filter = (
+            model.department_id == self.department_id,
+            model.year == scenario.base_year,
+        )
+        count, total, last_updated = self.db.query(
+            func.count(model.id),
+            func.sum(amount),
+            func.max(model.updated_at),
+        ).filter(*source_filter).one()
+
+        base_year_employee_ids = self.db.query(model.employee_id).filter(*source_filter)
+        employees, employees_updated = self.db.query(
+            func.count(Employee.id),
+            func.max(Employee.updated_at),
+        ).filter(
+            or_(
+                Employee.department_id == self.department_id,
+                Employee.id.in_(base_year_employee_ids),
             )
+        ).one()
 
-        # Рассчитать каждого сотрудника
-        total_headcount = 0
-        total_base_salary = Decimal('0.00')
-        total_insurance = Decimal('0.00')
-        total_income_tax = Decimal('0.00')
-        total_payroll_cost = Decimal('0.00')
+        return {
+            'rows': count,
+            'total': str(_money(total)),
+            'updated_at': last_updated.isoformat() if last_updated else None,
+            'employees': employees,
+            'employees_updated_at': employees_updated.isoformat() if employees_updated else None,
+        }
 
-        for detail in scenario_details:
-            # Если источник данных - план, детали уже рассчитаны с суммами из плана
-            # Просто суммируем уже рассчитанные значения
-            if scenario.data_source == PayrollDataSourceEnum.PLAN:
-                # Для планов все уже рассчитано в _create_scenario_details_from_plan
-                if not detail.is_terminated:
-                    total_headcount += 1
-                
-                # Аккумулировать итоги из уже рассчитанных значений
-                # Для планов годовая зарплата = total_employee_cost - total_insurance
-                # (это уже рассчитано в _create_scenario_details_from_plan)
-                if detail.total_employee_cost and detail.total_insurance:
-                    # Годовая зарплата из плана с учетом процента изменения
-                    annual_salary = detail.total_employee_cost - detail.total_insurance
-                else:
-                    # Fallback: используем месячный оклад * 12
-                    annual_salary = detail.base_salary * 12
-                
-                total_base_salary += annual_salary
-                total_insurance += detail.total_insurance or Decimal('0.00')
-                total_income_tax += detail.income_tax or Decimal('0.00')
-                total_payroll_cost += detail.total_employee_cost or Decimal('0.00')
-            else:
-                # Для EMPLOYEES и ACTUAL пересчитываем как раньше
-                # Учитываем уволенных сотрудников - они не считаются в численности
-                # но их зарплата может считаться частично (если указан termination_month)
-                if detail.is_terminated:
-                    # Если указан месяц увольнения, считаем зарплату только до этого месяца
-                    if detail.termination_month:
-                        months_worked = detail.termination_month
-                    else:
-                        months_worked = 0  # Уволен сразу, не считаем
-                else:
-                    total_headcount += 1
-                    months_worked = 12
-
-                # ВАЖНО: detail.base_salary хранит МЕСЯЧНЫЙ оклад
-                # Для годового расчета умножаем на количество отработанных месяцев
-                annual_salary = (detail.base_salary + detail.monthly_bonus) * months_worked
-
-                # Рассчитать страховые взносы на ГОДОВУЮ зарплату (пропорционально месяцам)
-                insurance_calc = self._calculate_insurance_for_employee(
-                    annual_salary,
-                    insurance_rates
-                )
+    def _build_scenario_details(self, scenario: PayrollScenario) -> List[PayrollScenarioDetail]:
+        """Детали сценария из источника данных (не сохранены в сессии)"""
+        if scenario.data_source == PayrollDataSourceEnum.PLAN:
+            # Если источник данных - план, используем данные из PayrollPlan
+            return self._create_scenario_details_from_plan(scenario)
+        # Для EMPLOYEES и ACTUAL используем данные из PayrollActual
+        return self._create_scenario_details_from_base_year(scenario)
+
+    def _sync_scenario_details(
+        self,
+        scenario: PayrollScenario,
+        scenario_details: List[PayrollScenarioDetail],
+        changes: Dict
+    ) -> List[PayrollScenarioDetail]:
+        """Сопоставить построенные детали с сохраненными и записать только отличия"""
+        existing = {_detail_key(detail): detail for detail in scenario_details}
+        details = []
+        for built in self._build_scenario_details(scenario):
+            detail = existing.pop(_detail_key(built), None)
+            if detail is None:
+                self.db.add(built)
+                changes['created'] += 1
+                details.append(built)
+                continue
+            if _assign_changed(detail, {field: getattr(built, field) for field in DETAIL_INPUT_FIELDS}):
+                changes['updated'].add(detail.id)
+            details.append(detail)
 
-                # Рассчитать НДФЛ на ГОДОВУЮ зарплату (13% дефолт или ставка из справочника)
-                income_tax_rate = insurance_rates.get('INCOME_TAX', Decimal('0.13'))
-                income_tax = annual_salary * income_tax_rate
-
-                # Обновить детали (сохраняем годовые значения)
-                detail.pension_contribution = insurance_calc['pension']
-                detail.medical_contribution = insurance_calc['medical']
-                detail.social_contribution = insurance_calc['social']
-                detail.injury_contribution = insurance_calc['injury']
-                detail.total_insurance = insurance_calc['total']
-                detail.income_tax = income_tax
-                detail.total_employee_cost = (
-                    annual_salary +
-                    insurance_calc['total']
-                )
+        for stale in existing.values():
+            self.db.delete(stale)
+            changes['deleted'] += 1
 
-                # Аккумулировать итоги (годовые суммы)
-                total_base_salary += annual_salary
-                total_insurance += insurance_calc['total']
-                total_income_tax += income_tax
-                total_payroll_cost += detail.total_employee_cost
+        return details
+
+    def _detail_annual_salary(self, detail: PayrollScenarioDetail, data_source: PayrollDataSourceEnum) -> Decimal:
+        """Годовая зарплата детали (base_salary / monthly_bonus хранят МЕСЯЧНЫЕ суммы)"""
+        base_salary = detail.base_salary or Decimal('0.00')
+        monthly_bonus = detail.monthly_bonus or Decimal('0.00')
+        quarterly_bonus = detail.quarterly_bonus or Decimal('0.00')
+        annual_bonus = detail.annual_bonus or Decimal('0.00')
+
+        if data_source == PayrollDataSourceEnum.PLAN:
+            # Годовая сумма плана: (оклад + месячная премия) * 12 + квартальная * 4 + годовая
+            return (base_salary + monthly_bonus) * 12 + quarterly_bonus * 4 + annual_bonus
+
+        # Для EMPLOYEES и ACTUAL уволенные получают зарплату до месяца увольнения
+        # (уволен без месяца - не считаем); они не считаются в численности
+        if detail.is_terminated:
+            months_worked = detail.termination_month or 0
+        else:
+            months_worked = 12
+        return (
+            (base_salary + monthly_bonus) * months_worked
+            + quarterly_bonus * (months_worked // 3)
+            + (annual_bonus if months_worked == 12 else Decimal('0.00'))
+        )
+
+    def _apply_detail_costs(
+        self,
+        detail: PayrollScenarioDetail,
+        data_source: PayrollDataSourceEnum,
+        insurance_rates: Dict[str, Decimal]
+    ) -> bool:
+        """Пересчитать взносы, НДФЛ и стоимость детали (годовые суммы); True, если что-то изменилось"""
+        annual_salary = self._detail_annual_salary(detail, data_source)
+        insurance_calc = self._calculate_insurance_for_employee(annual_salary, insurance_rates)
+
+        # НДФЛ на ГОДОВУЮ зарплату (13% дефолт или ставка из справочника)
+        income_tax = annual_salary * insurance_rates.get('INCOME_TAX', Decimal('0.13'))
+
+        return _assign_changed(detail, {
+            'pension_contribution': insurance_calc['pension'],
+            'medical_contribution': insurance_calc['medical'],
+            'social_contribution': insurance_calc['social'],
+            'injury_contribution': insurance_calc['injury'],
+            'total_insurance': insurance_calc['total'],
+            'income_tax': income_tax,
+            'total_employee_cost': annual_salary + insurance_calc['total'],
+        })
+
+    def _update_totals(self, scenario: PayrollScenario, scenario_details: List[PayrollScenarioDetail]) -> None:
+        """Итоги сценария и сравнение с базовым годом по рассчитанным деталям"""
+        total_insurance = sum((detail.total_insurance or Decimal('0.00') for detail in scenario_details), Decimal('0.00'))
+        total_payroll_cost = sum(
+            (detail.total_employee_cost or Decimal('0.00') for detail in scenario_details), Decimal('0.00')
+        )
 
-        # Обновить сценарий
-        scenario.total_headcount = total_headcount
-        scenario.total_base_salary = total_base_salary
+        scenario.total_headcount = sum(1 for detail in scenario_details if not detail.is_terminated)
+        # Годовая зарплата = стоимость - взносы
+        scenario.total_base_salary = total_payroll_cost - total_insurance
         scenario.total_insurance_cost = total_insurance
         scenario.total_payroll_cost = total_payroll_cost
 
         # Рассчитать сравнение с базовым годом (используем тех же сотрудников)
         # Если источник данных - план, используем планы для базового года
         base_year_cost = self._get_base_year_cost_for_employees(
-            scenario.base_year, 
+            scenario.base_year,
             scenario_details,
             data_source=scenario.data_source
         )
@@ -180,9 +348,8 @@ class PayrollScenarioCalculator:
             if base_year_cost > 0 else Decimal('0.00')
         )
 
-        self.db.commit()
-        self.db.refresh(scenario)
-
+    @staticmethod
+    def _result(scenario: PayrollScenario) -> Dict:
         return {
             'scenario_id': scenario.id,
             'total_headcount': scenario.total_headcount,
@@ -196,127 +363,15 @@ class PayrollScenarioCalculator:
     def _get_insurance_rates(self, year: int) -> Dict[str, Decimal]:
         """Получить ставки страховых взносов/НДФЛ для года из справочника TaxRate
 
-        Использует TaxRate (справочник налоговых ставок) вместо InsuranceRate.
-        Логика поиска:
-        1. Конвертируем год в дату (1 января указанного года)
-        2. Ищем активные ставки для этой даты (effective_from <= calc_date и effective_to >= calc_date или NULL)
-        3. Если есть ставки с effective_from в будущем (но <= конца года), учитываем их как будущие изменения
-        4. Сначала ищем ставки для конкретного отдела, затем глобальные
-        5. Если не найдены, используем дефолтные значения
+        Ставки берутся из TaxRateResolver (без запросов к БД): ставка, вступающая
+        в силу в течение года, приоритетнее действующей на 1 января; ставка
+        отдела > глобальная ставка > дефолтное значение.
         """
-        from datetime import date
-        from sqlalchemy import or_, and_
-        
-        # Конвертируем год в дату (1 января указанного года и 31 декабря для поиска будущих ставок)
-        calc_date = date(year, 1, 1)
-        year_end_date = date(year, 12, 31)
-        
-        rates = {}
-        
-        # Получаем ставки для указанной даты
-        # Сначала ищем для конкретного департамента
-        tax_rates_query_dept = self.db.query(TaxRate).filter(
-            TaxRate.is_active == True,
-            TaxRate.department_id == self.department_id,
-            # Ставка должна быть актуальна на calc_date или начаться в течение года
-            or_(
-                # Актуальная ставка на calc_date
-                and_(
-                    TaxRate.effective_from <= calc_date,
-                    or_(
-                        TaxRate.effective_to.is_(None),
-                        TaxRate.effective_to >= calc_date
-                    )
-                ),
-                # Будущая ставка, которая начнет действовать в этом году
-                and_(
-                    TaxRate.effective_from > calc_date,
-                    TaxRate.effective_from <= year_end_date
-                )
-            )
-        ).order_by(TaxRate.effective_from.desc())
-        
-        tax_rates = tax_rates_query_dept.all()
-        
-        # Если не найдены ставки для департамента, ищем глобальные ставки (department_id IS NULL)
-        if not tax_rates:
-            tax_rates_query_global = self.db.query(TaxRate).filter(
-                TaxRate.is_active == True,
-                TaxRate.department_id.is_(None),  # Только глобальные ставки
-                # Ставка должна быть актуальна на calc_date или начаться в течение года
-                or_(
-                    # Актуальная ставка на calc_date
-                    and_(
-                        TaxRate.effective_from <= calc_date,
-                        or_(
-                            TaxRate.effective_to.is_(None),
-                            TaxRate.effective_to >= calc_date
-                        )
-                    ),
-                    # Будущая ставка, которая начнет действовать в этом году
-                    and_(
-                        TaxRate.effective_from > calc_date,
-                        TaxRate.effective_from <= year_end_date
-                    )
-                )
-            ).order_by(TaxRate.effective_from.desc())
-            tax_rates = tax_rates_query_global.all()
-            logger.info(f"Found {len(tax_rates)} global tax rates for year {year}")
-        
-        # Объединяем с дефолтами
-        selected_rates = merge_tax_rates_with_defaults(tax_rates)
-        
-        # Извлекаем нужные ставки страховых взносов + НДФЛ (если есть)
-        # Приоритет: ставка актуальная на calc_date, если есть будущая - берем её
-        for rate_type in [
-            TaxTypeEnum.PENSION_FUND,
-            TaxTypeEnum.MEDICAL_INSURANCE,
-            TaxTypeEnum.SOCIAL_INSURANCE,
-            TaxTypeEnum.INJURY_INSURANCE,
-            TaxTypeEnum.INCOME_TAX,
-        ]:
-            # Ищем ставку для этого типа
-            rate_obj = selected_rates.get(rate_type)
-            
-            # Если есть несколько ставок, ПРИОРИТЕТ будущим ставкам, которые начнут действовать в целевом году
-            matching_rates = [r for r in tax_rates if r.tax_type == rate_type]
-            if matching_rates:
-                # Разделяем на актуальные и будущие
-                current_rates = [r for r in matching_rates if r.effective_from <= calc_date]
-                future_rates = [r for r in matching_rates if r.effective_from > calc_date and r.effective_from <= year_end_date]
-                
-                # ВАЖНО: Будущие ставки имеют приоритет над текущими
-                # Если есть ставка, которая начнет действовать в целевом году, используем её
-                if future_rates:
-                    # Берем самую раннюю будущую ставку (которая начнет действовать первой в целевом году)
-                    rate_obj = min(future_rates, key=lambda r: r.effective_from)
-                    logger.info(f"Using future rate for {rate_type.value} in {year}: {rate_obj.rate * 100}% (effective_from: {rate_obj.effective_from})")
-                elif current_rates:
-                    # Если нет будущих, берем самую позднюю актуальную ставку
-                    rate_obj = max(current_rates, key=lambda r: r.effective_from)
-                else:
-                    rate_obj = None
-            
-            if rate_obj and hasattr(rate_obj, 'rate'):
-                rates[rate_type.value] = Decimal(str(rate_obj.rate))
-                # Check if rate_obj has effective_from (TaxRate) or not (TaxRateDefault)
-                if hasattr(rate_obj, 'effective_from'):
-                    logger.info(f"Found tax rate for {rate_type.value} in {year}: {rates[rate_type.value] * 100}% (effective_from: {rate_obj.effective_from})")
-                else:
-                    logger.info(f"Using default tax rate for {rate_type.value} in {year}: {rates[rate_type.value] * 100}%")
-            else:
-                # Дефолтные ставки на случай отсутствия данных
-                defaults = {
-                    TaxTypeEnum.PENSION_FUND.value: Decimal('0.22'),
-                    TaxTypeEnum.MEDICAL_INSURANCE.value: Decimal('0.051'),
-                    TaxTypeEnum.SOCIAL_INSURANCE.value: Decimal('0.029'),
-                    TaxTypeEnum.INJURY_INSURANCE.value: Decimal('0.002'),
-                    TaxTypeEnum.INCOME_TAX.value: Decimal('0.13'),
-                }
-                rates[rate_type.value] = defaults.get(rate_type.value, Decimal('0.00'))
-                logger.warning(f"No tax rate found for {rate_type.value} in {year}, using default: {rates[rate_type.value]}")
-
-        return rates
+        resolver = get_tax_rate_resolver(self.db)
+        return {
+            rate_type.value: resolver.rate_for_year(rate_type, year, self.department_id).rate
+            for rate_type in (*INSURANCE_COLUMNS, TaxTypeEnum.INCOME_TAX)
+        }
 
     def _calculate_insurance_for_employee(
         self, gross_salary: Decimal, insurance_rates: Dict[str, Decimal]
@@ -401,9 +456,7 @@ class PayrollScenarioCalculator:
         self.db.commit()
         return details
 
-    def _create_scenario_details_from_base_year(
-        self, scenario: PayrollScenario, insurance_rates: Dict[str, Decimal]
-    ) -> List[PayrollScenarioDetail]:
+    def _create_scenario_details_from_base_year(self, scenario: PayrollScenario) -> List[PayrollScenarioDetail]:
         """
         Создать детали сценария от БАЗОВОГО ГОДА с применением процентов изменения
 
@@ -413,10 +466,10 @@ class PayrollScenarioCalculator:
 
         Args:
             scenario: Сценарий с параметрами (headcount_change_percent, salary_change_percent)
-            insurance_rates: Ставки страховых взносов для целевого года
 
         Returns:
-            List[PayrollScenarioDetail]: Детали сценария
+            List[PayrollScenarioDetail]: Детали сценария (не добавлены в сессию, суммы
+            взносов считает _apply_detail_costs)
         """
         logger.info(f"Creating scenario details from BASE YEAR {scenario.base_year}")
 
@@ -469,14 +522,16 @@ class PayrollScenarioCalculator:
                 position=emp.position,
                 base_salary=monthly_base_salary,  # Месячный оклад
                 monthly_bonus=Decimal('0.00'),  # Бонусы пока не учитываем
+                quarterly_bonus=Decimal('0.00'),
+                annual_bonus=Decimal('0.00'),
                 base_year_salary=annual_base_salary,  # Годовая зарплата базового года
                 base_year_insurance=emp.annual_insurance or Decimal('0.00'),
                 department_id=self.department_id,
                 is_new_hire=False,
                 is_terminated=False,
+                termination_month=None,
             )
 
-            self.db.add(detail)
             details.append(detail)
 
         # 4. Применить изменение headcount
@@ -498,13 +553,15 @@ class PayrollScenarioCalculator:
                         position="Планируемая позиция",
                         base_salary=avg_monthly_salary,
                         monthly_bonus=Decimal('0.00'),
+                        quarterly_bonus=Decimal('0.00'),
+                        annual_bonus=Decimal('0.00'),
                         base_year_salary=Decimal('0.00'),  # Не было в базовом году
                         base_year_insurance=Decimal('0.00'),
                         department_id=self.department_id,
                         is_new_hire=True,
                         is_terminated=False,
+                        termination_month=None,
                     )
-                    self.db.add(detail)
                     details.append(detail)
 
             elif headcount_change < 0:
@@ -517,8 +574,7 @@ class PayrollScenarioCalculator:
                     # Устанавливаем месяц увольнения (например, середина года)
                     details[i].termination_month = 6
 
-        self.db.commit()
-        logger.info(f"Created {len(details)} scenario details from base year")
+        logger.info(f"Built {len(details)} scenario details from base year")
 
         return details
 
@@ -590,79 +646,76 @@ class PayrollScenarioCalculator:
         Returns:
             Decimal: Общий ФОТ за базовый год для указанных сотрудников
         """
-        total_base_year_cost = Decimal('0.00')
         base_insurance_rates = self._get_insurance_rates(base_year)
 
-        for detail in scenario_details:
-            # Пропускаем новых сотрудников (их не было в базовом году)
-            if detail.is_new_hire or not detail.employee_id:
-                continue
+        # Новых сотрудников (их не было в базовом году) и уволенных не учитываем
+        compared = [
+            detail for detail in scenario_details
+            if detail.employee_id and not detail.is_new_hire and not detail.is_terminated
+        ]
+        employee_ids = {detail.employee_id for detail in compared}
+        if not employee_ids:
+            return Decimal('0.00')
+
+        # Данные сотрудников за базовый год одним запросом
+        if data_source == PayrollDataSourceEnum.PLAN:
+            # Если источник данных - план, используем планы (total_planned),
+            # страховые взносы рассчитываем от годовой суммы из плана
+            rows = self.db.query(
+                PayrollPlan.employee_id,
+                func.sum(PayrollPlan.total_planned),
+            ).filter(
+                PayrollPlan.employee_id.in_(employee_ids),
+                PayrollPlan.year == base_year,
+                PayrollPlan.department_id == self.department_id
+            ).group_by(PayrollPlan.employee_id).all()
+            employee_costs = {
+                employee_id: (year_salary or Decimal('0.00')) + self._calculate_insurance_for_employee(
+                    year_salary or Decimal('0.00'), base_insurance_rates
+                )['total']
+                for employee_id, year_salary in rows
+            }
+        else:
+            # Для ACTUAL и EMPLOYEES используем фактические выплаты
+            rows = self.db.query(
+                PayrollActual.employee_id,
+                func.sum(PayrollActual.total_paid),
+                func.sum(PayrollActual.social_tax_amount),
+            ).filter(
+                PayrollActual.employee_id.in_(employee_ids),
+                PayrollActual.year == base_year,
+                PayrollActual.department_id == self.department_id
+            ).group_by(PayrollActual.employee_id).all()
+            employee_costs = {
+                employee_id: (year_salary or Decimal('0.00')) + (year_insurance or Decimal('0.00'))
+                for employee_id, year_salary, year_insurance in rows
+            }
 
-            # Пропускаем уволенных (не учитываем их в базовом году для сравнения)
-            if detail.is_terminated:
-                continue
+        # Если нет данных за базовый год - fallback на текущий оклад (или оклад из сценария)
+        missing = {employee_id for employee_id in employee_ids if not employee_costs.get(employee_id)}
+        current_salaries = dict(
+            self.db.query(Employee.id, Employee.base_salary).filter(Employee.id.in_(missing)).all()
+        ) if missing else {}
 
-            # Получить данные сотрудника за базовый год
-            if data_source == PayrollDataSourceEnum.PLAN:
-                # Если источник данных - план, используем планы
-                payroll_plans = self.db.query(PayrollPlan).filter(
-                    PayrollPlan.employee_id == detail.employee_id,
-                    PayrollPlan.year == base_year,
-                    PayrollPlan.department_id == self.department_id
-                ).all()
-                
-                if payroll_plans:
-                    # Суммируем все плановые суммы за год (total_planned)
-                    year_salary = sum(p.total_planned for p in payroll_plans)
-                    # Рассчитать страховые взносы от годовой суммы из плана
-                    insurance_calc = self._calculate_insurance_for_employee(
-                        year_salary, base_insurance_rates
-                    )
-                    year_insurance = insurance_calc['total']
-                    employee_total_cost = year_salary + year_insurance
-                else:
-                    employee_total_cost = Decimal('0.00')
-            else:
-                # Для ACTUAL и EMPLOYEES используем фактические выплаты
-                payroll_actuals = self.db.query(PayrollActual).filter(
-                    PayrollActual.employee_id == detail.employee_id,
-                    PayrollActual.year == base_year,
-                    PayrollActual.department_id == self.department_id
-                ).all()
-
-                if payroll_actuals:
-                    # Суммируем все выплаты за год (12 месяцев)
-                    year_salary = sum(p.total_paid for p in payroll_actuals)
-                    year_insurance = sum(p.social_tax_amount for p in payroll_actuals)
-                    employee_total_cost = year_salary + year_insurance
-                else:
-                    employee_total_cost = Decimal('0.00')
-            
-            # Если нет данных за базовый год, используем fallback
+        total_base_year_cost = Decimal('0.00')
+        for detail in compared:
+            employee_total_cost = employee_costs.get(detail.employee_id) or Decimal('0.00')
             if employee_total_cost == 0:
-                employee = self.db.query(Employee).get(detail.employee_id)
-                if employee:
-                    annual_salary = employee.base_salary * 12
-                    # Рассчитываем страховые взносы по ставкам базового года
-                    insurance_calc = self._calculate_insurance_for_employee(
-                        annual_salary, base_insurance_rates
-                    )
-                    employee_total_cost = annual_salary + insurance_calc['total']
-                else:
-                    # Последний fallback - используем плановый оклад из сценария
-                    annual_salary = detail.base_salary * 12
-                    insurance_calc = self._calculate_insurance_for_employee(
-                        annual_salary, base_insurance_rates
-                    )
-                    employee_total_cost = annual_salary + insurance_calc['total']
+                monthly_salary = current_salaries.get(detail.employee_id)
+                if monthly_salary is None:
+                    monthly_salary = detail.base_salary
+                annual_salary = monthly_salary * 12
+                # Рассчитываем страховые взносы по ставкам базового года
+                insurance_calc = self._calculate_insurance_for_employee(
+                    annual_salary, base_insurance_rates
+                )
+                employee_total_cost = annual_salary + insurance_calc['total']
 
             total_base_year_cost += employee_total_cost
 
         return total_base_year_cost
 
-    def _create_scenario_details_from_plan(
-        self, scenario: PayrollScenario, insurance_rates: Dict[str, Decimal]
-    ) -> List[PayrollScenarioDetail]:
+    def _create_scenario_details_from_plan(self, scenario: PayrollScenario) -> List[PayrollScenarioDetail]:
         """
         Создать детали сценария из ПЛАНА (PayrollPlan) для базового года
         
@@ -671,10 +724,10 @@ class PayrollScenarioCalculator:
         
         Args:
             scenario: Сценарий с параметрами
-            insurance_rates: Ставки страховых взносов для целевого года
-            
+
         Returns:
-            List[PayrollScenarioDetail]: Детали сценария из планов
+            List[PayrollScenarioDetail]: Детали сценария из планов (не добавлены в сессию,
+            суммы взносов считает _apply_detail_costs)
         """
         logger.info(f"Creating scenario details from PLAN for base year {scenario.base_year}")
         
@@ -731,9 +784,12 @@ class PayrollScenarioCalculator:
         salary_multiplier = Decimal('1.00') + (scenario.salary_change_percent / 100)
         logger.info(f"Salary multiplier: {salary_multiplier} ({scenario.salary_change_percent}%)")
         
+        # Ставки базового года (для взносов базового года)
+        base_insurance_rates = self._get_insurance_rates(scenario.base_year)
+
         # Создать детали для сотрудников из плана
         details = []
-        
+
         for plan in plan_data:
             # ИСПРАВЛЕНО: Используем данные из ПОСЛЕДНЕГО месяца плана
             base_salary = plan.last_month_base_salary or Decimal('0.00')
@@ -747,23 +803,6 @@ class PayrollScenarioCalculator:
             adjusted_quarterly_bonus = quarterly_bonus * salary_multiplier
             adjusted_annual_bonus = annual_bonus * salary_multiplier
 
-            # Рассчитать годовую сумму: (оклад + месячная премия) * 12 + квартальная * 4 + годовая
-            adjusted_annual = (
-                (adjusted_base_salary + adjusted_monthly_bonus) * 12 +
-                adjusted_quarterly_bonus * 4 +
-                adjusted_annual_bonus
-            )
-            
-            # Рассчитать страховые взносы от скорректированной годовой суммы
-            insurance_calc = self._calculate_insurance_for_employee(
-                adjusted_annual,
-                insurance_rates
-            )
-            
-            # Рассчитать НДФЛ от годовой суммы из плана
-            income_tax_rate = insurance_rates.get('INCOME_TAX', Decimal('0.13'))
-            income_tax = adjusted_annual * income_tax_rate
-            
             # Получить базовый год для сравнения: тоже используем полную годовую сумму
             base_year_annual = (
                 (base_salary + monthly_bonus) * 12 +
@@ -771,7 +810,6 @@ class PayrollScenarioCalculator:
                 annual_bonus
             )
             # Рассчитать страховые взносы базового года (для сравнения)
-            base_insurance_rates = self._get_insurance_rates(scenario.base_year)
             base_insurance_calc = self._calculate_insurance_for_employee(
                 base_year_annual,
                 base_insurance_rates
@@ -787,22 +825,14 @@ class PayrollScenarioCalculator:
                 monthly_bonus=adjusted_monthly_bonus,  # месячная премия
                 quarterly_bonus=adjusted_quarterly_bonus,  # квартальная премия
                 annual_bonus=adjusted_annual_bonus,  # годовая премия
-                # Сохраняем годовые суммы для расчета
-                pension_contribution=insurance_calc['pension'],
-                medical_contribution=insurance_calc['medical'],
-                social_contribution=insurance_calc['social'],
-                injury_contribution=insurance_calc['injury'],
-                total_insurance=insurance_calc['total'],
-                income_tax=income_tax,
-                total_employee_cost=adjusted_annual + insurance_calc['total'],
                 base_year_salary=base_year_annual,  # ИСПРАВЛЕНО: полная годовая сумма базового года
                 base_year_insurance=base_year_insurance,
                 department_id=self.department_id,
                 is_new_hire=False,
                 is_terminated=False,
+                termination_month=None,
             )
-            
-            self.db.add(detail)
+
             details.append(detail)
         
         # Применить изменение headcount
@@ -817,13 +847,7 @@ class PayrollScenarioCalculator:
                 
                 for i in range(headcount_change):
                     adjusted_avg = avg_monthly * salary_multiplier
-                    adjusted_annual = avg_annual * salary_multiplier
-                    
-                    insurance_calc = self._calculate_insurance_for_employee(
-                        adjusted_annual,
-                        insurance_rates
-                    )
-                    
+
                     detail = PayrollScenarioDetail(
                         scenario_id=scenario.id,
                         employee_id=None,
@@ -831,17 +855,15 @@ class PayrollScenarioCalculator:
                         position="Планируемая позиция",
                         base_salary=adjusted_avg,
                         monthly_bonus=Decimal('0.00'),
-                        pension_contribution=insurance_calc['pension'],
-                        medical_contribution=insurance_calc['medical'],
-                        social_contribution=insurance_calc['social'],
-                        injury_contribution=insurance_calc['injury'],
-                        total_insurance=insurance_calc['total'],
-                        income_tax=adjusted_annual * insurance_rates.get('INCOME_TAX', Decimal('0.13')),
-                        total_employee_cost=adjusted_annual + insurance_calc['total'],
+                        quarterly_bonus=Decimal('0.00'),
+                        annual_bonus=Decimal('0.00'),
+                        base_year_salary=None,
+                        base_year_insurance=None,
                         is_new_hire=True,
+                        is_terminated=False,
+                        termination_month=None,
                         department_id=self.department_id,
                     )
-                    self.db.add(detail)
                     details.append(detail)
             
             elif headcount_change < 0:
@@ -850,9 +872,8 @@ class PayrollScenarioCalculator:
                     if i < len(details):
                         details[i].is_terminated = True
         
-        self.db.commit()
-        logger.info(f"Created {len(details)} scenario details from PLAN")
-        
+        logger.info(f"Built {len(details)} scenario details from PLAN")
+
         return details
 
 
@@ -869,6 +890,10 @@ class InsuranceImpactAnalyzer:
         """
         Проанализировать влияние изменений ставок между годами
 
+        ФОТ базового года (по сотрудникам, с годовыми порогами взносов)
+        пересчитывается по ставкам базового и целевого года; разница -
+        влияние изменения ставок при неизменном штате.
+
         Args:
             base_year: Базовый год
             target_year: Целевой год
@@ -876,12 +901,10 @@ class InsuranceImpactAnalyzer:
         Returns:
             Dict с анализом
         """
-        # Получить ставки для обоих годов
-        base_rates = self._get_all_rates(base_year)
-        target_rates = self._get_all_rates(target_year)
-        
-        logger.info(f"Base year {base_year} rates: {base_rates}")
-        logger.info(f"Target year {target_year} rates: {target_rates}")
+        payroll = load_year_payroll(self.db, self.department_id, [base_year, target_year])
+        resolver = get_tax_rate_resolver(self.db)
+        base_rates = resolver.rates_for_year(base_year, self.department_id)
+        target_rates = resolver.rates_for_year(target_year, self.department_id)
 
         # Маппинг английских названий на русские
         rate_type_labels = {
@@ -890,224 +913,58 @@ class InsuranceImpactAnalyzer:
             'SOCIAL_INSURANCE': 'ФСС',
             'INJURY_INSURANCE': 'Травматизм',
         }
-        
-        # Рассчитать изменения
-        rate_changes = {}
-        for rate_type in base_rates:
-            base_rate = base_rates[rate_type]
-            target_rate = target_rates.get(rate_type, base_rate)
-            
-            # Используем русское название как ключ
-            russian_name = rate_type_labels.get(rate_type, rate_type)
 
-            rate_changes[russian_name] = {
-                'from': float(base_rate * 100),
-                'to': float(target_rate * 100),
-                'change': float((target_rate - base_rate) * 100),
+        # Рассчитать изменения (в процентах)
+        base_percents = rate_percents(base_rates)
+        target_percents = rate_percents(target_rates)
+        rate_changes = {
+            rate_type_labels[rate_type]: {
+                'from': base_percents[rate_type],
+                'to': target_percents[rate_type],
+                'change': round(target_percents[rate_type] - base_percents[rate_type], 4),
             }
-            logger.info(f"Rate change for {russian_name} ({rate_type}): {base_rate * 100}% -> {target_rate * 100}% (change: {(target_rate - base_rate) * 100}%)")
-
-        # Получить данные ФОТ за базовый год
-        base_year_payroll = self._get_year_payroll_data(base_year)
-
-        # Рассчитать влияние на каждый тип взносов
-        total_impact = Decimal('0.00')
-        pension_impact = Decimal('0.00')
-        medical_impact = Decimal('0.00')
-        social_impact = Decimal('0.00')
-
-        if base_year_payroll['total_salary'] > 0:
-            pension_change = (
-                target_rates.get('PENSION_FUND', Decimal('0.22')) -
-                base_rates.get('PENSION_FUND', Decimal('0.22'))
-            )
-            pension_impact = base_year_payroll['total_salary'] * pension_change * 12
-
-            medical_change = (
-                target_rates.get('MEDICAL_INSURANCE', Decimal('0.051')) -
-                base_rates.get('MEDICAL_INSURANCE', Decimal('0.051'))
-            )
-            medical_impact = base_year_payroll['total_salary'] * medical_change * 12
+            for rate_type in base_percents
+        }
 
-            social_change = (
-                target_rates.get('SOCIAL_INSURANCE', Decimal('0.029')) -
-                base_rates.get('SOCIAL_INSURANCE', Decimal('0.029'))
-            )
-            social_impact = base_year_payroll['total_salary'] * social_change * 12
+        # ФОТ базового года по ставкам обоих годов
+        base_payroll = payroll[base_year]
+        base_insurance = contributions(base_payroll.gross, base_rates)
+        target_insurance = contributions(base_payroll.gross, target_rates)
+        impact = {
+            column: target_insurance[column] - base_insurance[column]
+            for column in list(INSURANCE_COLUMNS.values()) + ['total_insurance']
+        }
 
-            total_impact = pension_impact + medical_impact + social_impact
+        total_salary = float(base_payroll.gross.sum())
+        base_cost = total_salary + base_insurance['total_insurance']
+        total_impact = impact['total_insurance']
 
         # Генерировать рекомендации
         recommendations = self._generate_recommendations(
-            total_impact,
-            base_year_payroll['total_cost'],
-            base_year_payroll['headcount']
+            Decimal(str(total_impact)),
+            Decimal(str(base_cost)),
+            base_payroll.headcount
         )
 
         return {
             'base_year': base_year,
             'target_year': target_year,
             'rate_changes': rate_changes,
-            'total_impact': float(total_impact),
-            'impact_percent': float(
-                (total_impact / base_year_payroll['total_cost'] * 100)
-                if base_year_payroll['total_cost'] > 0 else 0
-            ),
-            'pension_impact': float(pension_impact),
-            'medical_impact': float(medical_impact),
-            'social_impact': float(social_impact),
+            'total_impact': total_impact,
+            'impact_percent': total_impact / base_cost * 100 if base_cost > 0 else 0,
+            'pension_impact': impact['pension'],
+            'medical_impact': impact['medical'],
+            'social_impact': impact['social'],
+            'injury_impact': impact['injury'],
             'recommendations': recommendations,
-        }
-
-    def _get_all_rates(self, year: int) -> Dict[str, Decimal]:
-        """Получить все ставки для года из справочника TaxRate
-        
-        Использует TaxRate (справочник налоговых ставок) вместо InsuranceRate.
-        Учитывает будущие ставки, которые начнут действовать в целевом году.
-        """
-        from datetime import date
-        from sqlalchemy import or_, and_
-        
-        # Конвертируем год в дату (1 января указанного года и 31 декабря для поиска будущих ставок)
-        calc_date = date(year, 1, 1)
-        year_end_date = date(year, 12, 31)
-        
-        # Получаем ставки для указанной даты
-        # Сначала ищем для конкретного департамента
-        tax_rates_query_dept = self.db.query(TaxRate).filter(
-            TaxRate.is_active == True,
-            TaxRate.department_id == self.department_id,
-            # Ставка должна быть актуальна на calc_date или начаться в течение года
-            or_(
-                # Актуальная ставка на calc_date
-                and_(
-                    TaxRate.effective_from <= calc_date,
-                    or_(
-                        TaxRate.effective_to.is_(None),
-                        TaxRate.effective_to >= calc_date
-                    )
-                ),
-                # Будущая ставка, которая начнет действовать в этом году
-                and_(
-                    TaxRate.effective_from > calc_date,
-                    TaxRate.effective_from <= year_end_date
-                )
-            )
-        ).order_by(TaxRate.effective_from.desc())
-        
-        tax_rates = tax_rates_query_dept.all()
-        
-        # Если не найдены ставки для департамента, ищем глобальные ставки (department_id IS NULL)
-        if not tax_rates:
-            tax_rates_query_global = self.db.query(TaxRate).filter(
-                TaxRate.is_active == True,
-                TaxRate.department_id.is_(None),  # Глобальные ставки имеют department_id = NULL
-                # Ставка должна быть актуальна на calc_date или начаться в течение года
-                or_(
-                    # Актуальная ставка на calc_date
-                    and_(
-                        TaxRate.effective_from <= calc_date,
-                        or_(
-                            TaxRate.effective_to.is_(None),
-                            TaxRate.effective_to >= calc_date
-                        )
-                    ),
-                    # Будущая ставка, которая начнет действовать в этом году
-                    and_(
-                        TaxRate.effective_from > calc_date,
-                        TaxRate.effective_from <= year_end_date
-                    )
-                )
-            ).order_by(TaxRate.effective_from.desc())
-            tax_rates = tax_rates_query_global.all()
-            logger.info(f"Found {len(tax_rates)} global tax rates (department_id IS NULL) for year {year} in _get_all_rates")
-        
-        # Объединяем с дефолтами
-        selected_rates = merge_tax_rates_with_defaults(tax_rates)
-        
-        # Извлекаем нужные ставки страховых взносов
-        # ПРИОРИТЕТ: будущие ставки > текущие ставки
-        rates = {}
-        logger.info(f"Total tax_rates found: {len(tax_rates)}")
-        logger.info(f"Selected rates from merge: {list(selected_rates.keys())}")
-        
-        for rate_type in [TaxTypeEnum.PENSION_FUND, TaxTypeEnum.MEDICAL_INSURANCE,
-                          TaxTypeEnum.SOCIAL_INSURANCE, TaxTypeEnum.INJURY_INSURANCE]:
-            # Ищем ставку для этого типа
-            rate_obj = None
-            
-            # Если есть несколько ставок, берем будущую, если она есть, иначе текущую
-            matching_rates = [r for r in tax_rates if r.tax_type == rate_type]
-            logger.info(f"Found {len(matching_rates)} matching rates for {rate_type.value} in year {year}")
-            
-            if matching_rates:
-                # Разделяем на актуальные и будущие
-                current_rates = [r for r in matching_rates if r.effective_from <= calc_date]
-                future_rates = [r for r in matching_rates if r.effective_from > calc_date and r.effective_from <= year_end_date]
-                
-                logger.info(f"Current rates: {len(current_rates)}, Future rates: {len(future_rates)}")
-                
-                # ВАЖНО: Будущие ставки имеют приоритет
-                if future_rates:
-                    # Берем самую раннюю будущую ставку (которая начнет действовать первой в целевом году)
-                    rate_obj = min(future_rates, key=lambda r: r.effective_from)
-                    logger.info(f"Using future rate for {rate_type.value} in {year}: {rate_obj.rate * 100}% (effective_from: {rate_obj.effective_from})")
-                elif current_rates:
-                    # Если нет будущих, берем самую позднюю актуальную ставку
-                    rate_obj = max(current_rates, key=lambda r: r.effective_from)
-                    logger.info(f"Using current rate for {rate_type.value} in {year}: {rate_obj.rate * 100}% (effective_from: {rate_obj.effective_from})")
-            
-            # Если не нашли в tax_rates, используем selected_rates (может быть TaxRateDefault)
-            if not rate_obj:
-                rate_obj = selected_rates.get(rate_type)
-                if rate_obj:
-                    logger.info(f"Using rate from selected_rates for {rate_type.value}: {rate_obj.rate * 100}%")
-            
-            if rate_obj:
-                # Может быть TaxRate или TaxRateDefault - оба имеют rate
-                if hasattr(rate_obj, 'rate'):
-                    rates[rate_type.value] = Decimal(str(rate_obj.rate))
-                    logger.info(f"Final rate for {rate_type.value} in {year}: {rates[rate_type.value] * 100}%")
-                else:
-                    logger.warning(f"Rate object for {rate_type.value} has no 'rate' attribute")
-            else:
-                # Дефолтные ставки (если ничего не найдено)
-                defaults = {
-                    'PENSION_FUND': Decimal('0.22'),
-                    'MEDICAL_INSURANCE': Decimal('0.051'),
-                    'SOCIAL_INSURANCE': Decimal('0.029'),
-                    'INJURY_INSURANCE': Decimal('0.002'),
-                }
-                rates[rate_type.value] = defaults.get(rate_type.value, Decimal('0.00'))
-                logger.warning(f"No tax rate found for {rate_type.value} in {year}, using hardcoded default: {rates[rate_type.value] * 100}%")
-
-        return rates
-
-    def _get_year_payroll_data(self, year: int) -> Dict:
-        """Получить данные ФОТ за год"""
-        result = self.db.query(
-            func.count(func.distinct(PayrollActual.employee_id)).label('headcount'),
-            func.sum(PayrollActual.total_paid).label('total_salary'),
-            func.sum(PayrollActual.social_tax_amount).label('total_insurance'),
-            func.sum(PayrollActual.total_paid + PayrollActual.social_tax_amount).label('total_cost')
-        ).filter(
-            PayrollActual.department_id == self.department_id,
-            PayrollActual.year == year
-        ).first()
-
-        if result:
-            return {
-                'headcount': result.headcount or 0,
-                'total_salary': result.total_salary or Decimal('0.00'),
-                'total_insurance': result.total_insurance or Decimal('0.00'),
-                'total_cost': result.total_cost or Decimal('0.00'),
-            }
-
-        return {
-            'headcount': 0,
-            'total_salary': Decimal('0.00'),
-            'total_insurance': Decimal('0.00'),
-            'total_cost': Decimal('0.00'),
+            'base_year_payroll': {
+                'source': base_payroll.source,
+                'headcount': base_payroll.headcount,
+                'total_salary': total_salary,
+                'total_insurance': base_insurance['total_insurance'],
+                'total_cost': base_cost,
+            },
+            'target_year_headcount': payroll[target_year].headcount,
         }
 
     def _generate_recommendations(
@@ -1191,13 +1048,10 @@ class PayrollComparisonGenerator:
         Returns:
             PayrollYearlyComparison record
         """
-        # Использовать анализатор для расчетов
+        # Использовать анализатор для расчетов (ФОТ обоих лет одним запросом)
         analyzer = InsuranceImpactAnalyzer(self.db, self.department_id)
         impact_analysis = analyzer.analyze_impact(base_year, target_year)
-
-        # Получить данные по годам
-        base_data = analyzer._get_year_payroll_data(base_year)
-        target_data = analyzer._get_year_payroll_data(target_year)
+        base_data = impact_analysis['base_year_payroll']
 
         # Создать или обновить запись
         comparison = self.db.query(PayrollYearlyComparison).filter(
@@ -1216,14 +1070,14 @@ class PayrollComparisonGenerator:
 
         # Обновить данные
         comparison.base_year_headcount = base_data['headcount']
-        comparison.base_year_total_salary = base_data['total_salary']
-        comparison.base_year_total_insurance = base_data['total_insurance']
-        comparison.base_year_total_cost = base_data['total_cost']
+        comparison.base_year_total_salary = Decimal(str(base_data['total_salary']))
+        comparison.base_year_total_insurance = Decimal(str(base_data['total_insurance']))
+        comparison.base_year_total_cost = Decimal(str(base_data['total_cost']))
 
-        comparison.target_year_headcount = target_data['headcount']
-        comparison.target_year_total_salary = base_data['total_salary']  # Без изменений в штате
+        comparison.target_year_headcount = impact_analysis['target_year_headcount']
+        comparison.target_year_total_salary = comparison.base_year_total_salary  # Без изменений в штате
         comparison.target_year_total_insurance = (
-            base_data['total_insurance'] + Decimal(str(impact_analysis['total_impact']))
+            comparison.base_year_total_insurance + Decimal(str(impact_analysis['total_impact']))
         )
         comparison.target_year_total_cost = (
             comparison.target_year_total_salary + comparison.target_year_total_insurance
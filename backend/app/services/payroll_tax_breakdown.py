@@ -0,0 +1,239 @@
+"""
+Derived payroll tax breakdown (PayrollTaxBreakdown) per employee-month
+
+For every (employee, year) with payroll actuals / plans the months are
+computed in order on the year-to-date gross:
+
+- НДФЛ: progressive scale (calculate_progressive_ndfl) on the YTD gross,
+  the month gets the increment over the previous month
+- contributions (ПФР, ФОМС, ФСС, НС и ПЗ): TaxRate effective on the 1st of the
+  month from the tax rate resolver (department rate > global rate > default),
+  threshold applied to the YTD gross, the month again gets the increment
+
+Because every row is an increment, tax analytics are plain SUMs over the
+table. Writers of PayrollActual / PayrollPlan call refresh_payroll_taxes()
+before their commit, tax rate writes call refresh_payroll_taxes_for_rates();
+scripts/backfill_payroll_tax_breakdown.py fills the table for existing data.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.db.models import (
+    PayrollActual,
+    PayrollPlan,
+    PayrollTaxBreakdown,
+    PayrollTaxSourceEnum,
+    TaxRate,
+    TaxTypeEnum,
+)
+from app.services.payroll_posting import insert_rows
+from app.services.tax_rate_resolver import ResolvedRate, TaxRateResolver, get_tax_rate_resolver
+from app.utils.ndfl_calculator import calculate_progressive_ndfl
+
+TAX_REFRESH_CHUNK_SIZE = 500  # (employee, year) pairs per load / delete / insert round
+
+EmployeeYear = Tuple[int, int]
+
+CONTRIBUTION_COLUMNS = {
+    TaxTypeEnum.PENSION_FUND: "pension_contribution",
+    TaxTypeEnum.MEDICAL_INSURANCE: "medical_contribution",
+    TaxTypeEnum.SOCIAL_INSURANCE: "social_contribution",
+    TaxTypeEnum.INJURY_INSURANCE: "injury_contribution",
+}
+
+_CENT = Decimal("0.01")
+
+# Gross component columns of the breakdown and their source columns
+_SOURCES = {
+    PayrollTaxSourceEnum.ACTUAL: (PayrollActual, {
+        "base_salary": PayrollActual.base_salary_paid,
+        "monthly_bonus": PayrollActual.monthly_bonus_paid,
+        "quarterly_bonus": PayrollActual.quarterly_bonus_paid,
+        "annual_bonus": PayrollActual.annual_bonus_paid,
+        "other_payments": PayrollActual.other_payments_paid,
+        "gross": PayrollActual.total_paid,
+    }),
+    PayrollTaxSourceEnum.PLAN: (PayrollPlan, {
+        "base_salary": PayrollPlan.base_salary,
+        "monthly_bonus": PayrollPlan.monthly_bonus,
+        "quarterly_bonus": PayrollPlan.quarterly_bonus,
+        "annual_bonus": PayrollPlan.annual_bonus,
+        "other_payments": PayrollPlan.other_payments,
+        "gross": PayrollPlan.total_planned,
+    }),
+}
+
+
+def _money(value: Any) -> Decimal:
+    return Decimal(str(value or 0)).quantize(_CENT)
+
+
+def _chunks(items: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def ytd_ndfl(income: Decimal, year: int) -> Decimal:
+    """НДФЛ accrued on a year-to-date income"""
+    return _money(calculate_progressive_ndfl(income, year)["total_tax"])
+
+
+def ytd_contribution(rate: ResolvedRate, income: Decimal) -> Decimal:
+    """Contribution accrued on a year-to-date income: rate up to threshold_amount, rate_above_threshold above"""
+    threshold = rate.threshold_amount
+    if threshold and income > threshold:
+        return _money(threshold * rate.rate + (income - threshold) * (rate.rate_above_threshold or Decimal(0)))
+    return _money(income * rate.rate)
+
+
+def _load_months(db: Session, source: PayrollTaxSourceEnum, keys: Sequence[EmployeeYear]) -> List[Dict[str, Any]]:
+    """Source rows summed per employee-month (several payments per month are one month)"""
+    model, columns = _SOURCES[source]
+    query = (
+        select(
+            model.employee_id, model.year, model.month,
+            func.max(model.department_id).label("department_id"),
+            *[func.sum(column).label(name) for name, column in columns.items()]
+        )
+        .where(tuple_(model.employee_id, model.year).in_(keys))
+        .group_by(model.employee_id, model.year, model.month)
+        .order_by(model.employee_id, model.year, model.month)
+    )
+    return [dict(row._mapping) for row in db.execute(query)]
+
+
+def calculate_breakdown(
+    months: List[Dict[str, Any]],
+    rates: TaxRateResolver,
+    source: PayrollTaxSourceEnum
+) -> List[Dict[str, Any]]:
+    """Breakdown rows of employee-months ordered by (employee_id, year, month)"""
+    rows = []
+    calculated_at = datetime.utcnow()
+    current: Optional[EmployeeYear] = None
+    ytd_gross = Decimal(0)
+    for month in months:
+        if (month["employee_id"], month["year"]) != current:
+            current = (month["employee_id"], month["year"])
+            ytd_gross = Decimal(0)
+
+        gross = _money(month["gross"])
+        before, ytd_gross = ytd_gross, ytd_gross + gross
+        year = month["year"]
+        row = {
+            "source": source,
+            "employee_id": month["employee_id"],
+            "department_id": month["department_id"],
+            "year": year,
+            "month": month["month"],
+            "base_salary": _money(month["base_salary"]),
+            "monthly_bonus": _money(month["monthly_bonus"]),
+            "quarterly_bonus": _money(month["quarterly_bonus"]),
+            "annual_bonus": _money(month["annual_bonus"]),
+            "other_payments": _money(month["other_payments"]),
+            "gross": gross,
+            "ndfl": ytd_ndfl(ytd_gross, year) - ytd_ndfl(before, year),
+            "calculated_at": calculated_at,
+        }
+        first_day = date(year, month["month"], 1)
+        for tax_type, column in CONTRIBUTION_COLUMNS.items():
+            rate = rates.rate_on(tax_type, first_day, month["department_id"])
+            row[column] = ytd_contribution(rate, ytd_gross) - ytd_contribution(rate, before)
+        row["total_contributions"] = sum(row[column] for column in CONTRIBUTION_COLUMNS.values())
+        row["net"] = gross - row["ndfl"]
+        row["employer_cost"] = gross + row["total_contributions"]
+        rows.append(row)
+    return rows
+
+
+def refresh_payroll_taxes(
+    db: Session,
+    employee_years: Iterable[EmployeeYear],
+    rates: Optional[TaxRateResolver] = None
+) -> int:
+    """
+    Recompute the breakdown (actual and plan) of the given (employee_id, year) pairs
+
+    Whole years are recomputed since a month changes the YTD base of the
+    following months. Does not commit. Rates come from the shared resolver
+    unless given (tax rate writes pass one loaded from their own session).
+
+    Returns:
+        Number of breakdown rows written
+    """
+    db.flush()
+    keys = sorted({(employee_id, year) for employee_id, year in employee_years if employee_id and year})
+    if rates is None:
+        rates = get_tax_rate_resolver(db)
+    written = 0
+    for chunk in _chunks(keys, TAX_REFRESH_CHUNK_SIZE):
+        db.execute(
+            delete(PayrollTaxBreakdown)
+            .where(tuple_(PayrollTaxBreakdown.employee_id, PayrollTaxBreakdown.year).in_(chunk))
+            .execution_options(synchronize_session=False)
+        )
+        for source in PayrollTaxSourceEnum:
+            written += insert_rows(
+                db, PayrollTaxBreakdown, calculate_breakdown(_load_months(db, source, chunk), rates, source)
+            )
+    return written
+
+
+def payroll_employee_years(
+    db: Session,
+    years: Optional[Iterable[int]] = None,
+    department_id: Optional[int] = None
+) -> List[EmployeeYear]:
+    """(employee_id, year) pairs with payroll actuals or plans"""
+    years = sorted(set(years)) if years is not None else None
+    pairs: Set[EmployeeYear] = set()
+    for model in (PayrollActual, PayrollPlan):
+        query = select(model.employee_id, model.year).distinct()
+        if years is not None:
+            query = query.where(model.year.in_(years))
+        if department_id:
+            query = query.where(model.department_id == department_id)
+        pairs.update(tuple(row) for row in db.execute(query))
+    return sorted(pairs)
+
+
+def refresh_department_payroll_taxes(
+    db: Session,
+    years: Optional[Iterable[int]] = None,
+    department_id: Optional[int] = None
+) -> int:
+    """Recompute the breakdown of all employees with payroll in the years (all years / departments if None)"""
+    return refresh_payroll_taxes(db, payroll_employee_years(db, years, department_id))
+
+
+def tax_rate_period(rate: Union[TaxRate, Dict[str, Any]]) -> Dict[str, Any]:
+    """Period and department of a tax rate, e.g. to keep the state before an update / delete"""
+    if isinstance(rate, dict):
+        return rate
+    return {
+        "effective_from": rate.effective_from,
+        "effective_to": rate.effective_to,
+        "department_id": rate.department_id,
+    }
+
+
+def refresh_payroll_taxes_for_rates(db: Session, rates: Iterable[Union[TaxRate, Dict[str, Any]]]) -> int:
+    """Recompute the breakdown of payroll the tax rates (their periods before and after a change) apply to"""
+    db.flush()
+    keys: Set[EmployeeYear] = set()
+    for rate in rates:
+        period = tax_rate_period(rate)
+        first_year = period["effective_from"].year
+        years = None
+        if period.get("effective_to") is not None:
+            years = range(first_year, period["effective_to"].year + 1)
+        keys.update(
+            (employee_id, year)
+            for employee_id, year in payroll_employee_years(db, years, period.get("department_id"))
+            if year >= first_year
+        )
+    return refresh_payroll_taxes(db, keys, TaxRateResolver.load(db))
@@ -0,0 +1,158 @@
+"""
+Multi-year payroll comparison (cost, insurance, НДФЛ, headcount per year)
+
+load_year_payroll() reads the annual gross of every employee of a department
+for a span of years with one grouped query over payroll actuals and plans
+(UNION ALL). For every year the actuals are used when present, otherwise
+the plan; years of the span after the last year with data are projected
+with the payroll of that year.
+
+The per-employee gross of a year is a NumPy vector, contributions (annual
+thresholds per employee) and progressive НДФЛ are computed on the whole
+vector with the year's rates from the tax rate resolver, so an N-year matrix
+or a "payroll of year A at the rates of year B" comparison costs one query.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from app.db.models import PayrollActual, PayrollPlan, TaxTypeEnum
+from app.services.tax_rate_resolver import ResolvedRate, get_tax_rate_resolver
+from app.utils.ndfl_calculator import TAX_BRACKETS_2024, TAX_BRACKETS_2025
+
+INSURANCE_COLUMNS = {
+    TaxTypeEnum.PENSION_FUND: "pension",
+    TaxTypeEnum.MEDICAL_INSURANCE: "medical",
+    TaxTypeEnum.SOCIAL_INSURANCE: "social",
+    TaxTypeEnum.INJURY_INSURANCE: "injury",
+}
+
+SOURCE_ACTUAL = "actual"
+SOURCE_PLAN = "plan"
+SOURCE_PROJECTION = "projection"
+
+
+@dataclass
+class YearPayroll:
+    """Annual gross per employee of one year"""
+    year: int
+    source: Optional[str]  # actual / plan / projection, None without data
+    gross: np.ndarray
+
+    @property
+    def headcount(self) -> int:
+        return int(self.gross.size)
+
+
+def load_year_payroll(db: Session, department_id: int, years: Iterable[int]) -> Dict[int, YearPayroll]:
+    """Payroll of the years (actuals > plan > projection of the latest earlier year of the span with data)"""
+    years = sorted(set(years))
+    if not years:
+        return {}
+
+    actual = select(
+        literal(SOURCE_ACTUAL).label("source"), PayrollActual.year, PayrollActual.employee_id,
+        PayrollActual.total_paid.label("gross"),
+    ).where(
+        PayrollActual.department_id == department_id,
+        PayrollActual.year.between(years[0], years[-1]),
+    )
+    plan = select(
+        literal(SOURCE_PLAN).label("source"), PayrollPlan.year, PayrollPlan.employee_id,
+        PayrollPlan.total_planned.label("gross"),
+    ).where(
+        PayrollPlan.department_id == department_id,
+        PayrollPlan.year.between(years[0], years[-1]),
+    )
+    payroll = union_all(actual, plan).subquery()
+    rows = db.execute(
+        select(payroll.c.source, payroll.c.year, func.sum(payroll.c.gross))
+        .group_by(payroll.c.source, payroll.c.year, payroll.c.employee_id)
+    ).all()
+
+    grouped: Dict[Tuple[int, str], List[float]] = {}
+    for source, year, gross in rows:
+        grouped.setdefault((year, source), []).append(float(gross or 0))
+
+    result: Dict[int, YearPayroll] = {}
+    latest: Optional[YearPayroll] = None
+    for year in range(years[0], years[-1] + 1):
+        source = next((source for source in (SOURCE_ACTUAL, SOURCE_PLAN) if (year, source) in grouped), None)
+        if source is not None:
+            latest = current = YearPayroll(year, source, np.array(grouped[(year, source)]))
+        elif latest is not None:
+            current = YearPayroll(year, SOURCE_PROJECTION, latest.gross)
+        else:
+            current = YearPayroll(year, None, np.zeros(0))
+        if year in years:
+            result[year] = current
+    return result
+
+
+def contributions(gross: np.ndarray, rates: Dict[TaxTypeEnum, ResolvedRate]) -> Dict[str, float]:
+    """Employer contributions on annual per-employee gross (threshold per employee)"""
+    result = {}
+    for tax_type, column in INSURANCE_COLUMNS.items():
+        rate = rates[tax_type]
+        if rate.threshold_amount:
+            threshold = float(rate.threshold_amount)
+            amount = (
+                np.minimum(gross, threshold) * float(rate.rate)
+                + np.maximum(gross - threshold, 0) * float(rate.rate_above_threshold or 0)
+            )
+        else:
+            amount = gross * float(rate.rate)
+        result[column] = round(float(amount.sum()), 2)
+    result["total_insurance"] = round(sum(result[column] for column in INSURANCE_COLUMNS.values()), 2)
+    return result
+
+
+def progressive_ndfl(gross: np.ndarray, year: int) -> float:
+    """НДФЛ on annual per-employee gross by the progressive scale of the year"""
+    brackets = TAX_BRACKETS_2025 if year >= 2025 else TAX_BRACKETS_2024
+    tax = np.zeros_like(gross)
+    lower = 0.0
+    for threshold, rate in brackets:
+        upper = float(threshold) if threshold is not None else np.inf
+        tax += (np.clip(gross, lower, upper) - lower) * float(rate)
+        lower = upper
+    return round(float(tax.sum()), 2)
+
+
+def rate_percents(rates: Dict[TaxTypeEnum, ResolvedRate]) -> Dict[str, float]:
+    """Insurance rates in percent keyed by TaxTypeEnum value"""
+    return {tax_type.value: float(Decimal(str(rates[tax_type].rate)) * 100) for tax_type in INSURANCE_COLUMNS}
+
+
+def year_matrix(db: Session, department_id: int, start_year: int, end_year: int) -> List[Dict[str, Any]]:
+    """Cost, insurance, НДФЛ and headcount of every year in [start_year, end_year]"""
+    payroll = load_year_payroll(db, department_id, range(start_year, end_year + 1))
+    resolver = get_tax_rate_resolver(db)
+
+    rows = []
+    previous_cost: Optional[float] = None
+    for year in range(start_year, end_year + 1):
+        year_payroll = payroll[year]
+        rates = resolver.rates_for_year(year, department_id)
+        total_salary = round(float(year_payroll.gross.sum()), 2)
+        row = {
+            "year": year,
+            "source": year_payroll.source,
+            "headcount": year_payroll.headcount,
+            "total_salary": total_salary,
+            **contributions(year_payroll.gross, rates),
+            "ndfl": progressive_ndfl(year_payroll.gross, year),
+            "rates": rate_percents(rates),
+        }
+        row["total_cost"] = round(total_salary + row["total_insurance"], 2)
+        row["cost_change"] = round(row["total_cost"] - previous_cost, 2) if previous_cost is not None else None
+        row["cost_change_percent"] = (
+            round(row["cost_change"] / previous_cost * 100, 2) if previous_cost else None
+        )
+        previous_cost = row["total_cost"]
+        rows.append(row)
+    return rows
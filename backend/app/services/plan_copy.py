@@ -0,0 +1,368 @@
+"""
+Set-based copy engine for revenue plans and budget versions
+
+Plans and versions (a handful of rows per department) are inserted with one
+multi-row INSERT ... RETURNING each; their details (months x streams or
+categories, the bulk of the data) are copied with a single
+INSERT ... SELECT per call. The coefficient and the optional monthly
+seasonality factors are applied in SQL, so nothing is loaded into Python.
+
+Nothing is committed here: callers commit, so a copy for many departments
+is one transaction.
+"""
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+from sqlalchemy import Numeric, and_, case, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from app.db.models import (
+    BudgetPlanDetail,
+    BudgetVersion,
+    BudgetVersionStatusEnum,
+    RevenuePlan,
+    RevenuePlanDetail,
+    RevenuePlanStatusEnum,
+    RevenuePlanVersion,
+    RevenueVersionStatusEnum,
+)
+
+MONTHS = range(1, 13)
+REVENUE_MONTH_COLUMNS = [f"month_{month:02d}" for month in MONTHS]
+
+_FACTOR_TYPE = Numeric(12, 6)
+
+
+@dataclass
+class PlanCopyResult:
+    """Per-department outcome of a copy"""
+    department_id: int
+    created_plans: int = 0
+    created_versions: int = 0
+    created_details: int = 0
+    skipped_plans: int = 0
+    version_ids: List[int] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def month_factors(coefficient: float = 1.0, seasonality: Optional[Sequence[float]] = None) -> List[Decimal]:
+    """
+    Multiplier for each month: coefficient x seasonality[month]
+
+    Raises:
+        ValueError: If seasonality does not have 12 values
+    """
+    if seasonality is not None and len(seasonality) != 12:
+        raise ValueError("Seasonality must contain 12 monthly factors")
+    base = Decimal(str(coefficient))
+    return [
+        base * (Decimal(str(seasonality[month - 1])) if seasonality is not None else 1)
+        for month in MONTHS
+    ]
+
+
+def _scaled(column, factor: Decimal):
+    return func.round(func.coalesce(column, 0) * literal(factor, _FACTOR_TYPE), 2)
+
+
+def _insert_returning_ids(db: Session, model, rows: List[dict]) -> List[int]:
+    if not rows:
+        return []
+    statement = insert(model).returning(model.id, sort_by_parameter_order=True)
+    return list(db.execute(statement, rows).scalars())
+
+
+# ---------------------------------------------------------------------------
+# Budget versions
+# ---------------------------------------------------------------------------
+
+def copy_budget_version_details(
+    db: Session,
+    version_map: Mapping[int, int],
+    factors: Optional[Sequence[Decimal]] = None,
+) -> int:
+    """
+    Copy plan details of source versions into target versions with one INSERT ... SELECT
+
+    Args:
+        version_map: source version id -> target version id
+        factors: Optional 12 monthly multipliers for planned_amount (see month_factors)
+
+    Returns:
+        Number of copied details
+    """
+    if not version_map:
+        return 0
+
+    planned_amount = BudgetPlanDetail.planned_amount
+    if factors is not None:
+        if len(set(factors)) == 1:
+            planned_amount = _scaled(planned_amount, factors[0])
+        else:
+            planned_amount = func.round(planned_amount * case(
+                {month: literal(factor, _FACTOR_TYPE) for month, factor in zip(MONTHS, factors)},
+                value=BudgetPlanDetail.month,
+            ), 2)
+
+    now = datetime.utcnow()
+    copied = {
+        "version_id": case(dict(version_map), value=BudgetPlanDetail.version_id),
+        "month": BudgetPlanDetail.month,
+        "category_id": BudgetPlanDetail.category_id,
+        "subcategory": BudgetPlanDetail.subcategory,
+        "planned_amount": planned_amount,
+        "type": BudgetPlanDetail.type,
+        "calculation_method": BudgetPlanDetail.calculation_method,
+        "calculation_params": BudgetPlanDetail.calculation_params,
+        "business_driver": BudgetPlanDetail.business_driver,
+        "justification": BudgetPlanDetail.justification,
+        "based_on_year": BudgetPlanDetail.based_on_year,
+        "based_on_avg": BudgetPlanDetail.based_on_avg,
+        "based_on_total": BudgetPlanDetail.based_on_total,
+        "growth_rate": BudgetPlanDetail.growth_rate,
+        "created_at": literal(now),
+        "updated_at": literal(now),
+    }
+    source = select(*copied.values()).where(BudgetPlanDetail.version_id.in_(list(version_map)))
+    return db.execute(insert(BudgetPlanDetail).from_select(list(copied), source)).rowcount
+
+
+def copy_budget_year(
+    db: Session,
+    source_year: int,
+    target_year: int,
+    department_ids: Iterable[int],
+    *,
+    created_by: str,
+    coefficient: float = 1.0,
+    seasonality: Optional[Sequence[float]] = None,
+) -> Dict[int, PlanCopyResult]:
+    """
+    Copy the baseline budget version of source_year into a new DRAFT version of target_year
+
+    Departments without a baseline version for source_year are reported as skipped.
+    Version totals are left at 0 for the caller to recalculate.
+
+    Returns:
+        department_id -> PlanCopyResult (with the new version id in version_ids)
+    """
+    factors = month_factors(coefficient, seasonality)
+    department_ids = sorted(set(department_ids))
+    results = {department_id: PlanCopyResult(department_id) for department_id in department_ids}
+
+    baselines = db.execute(
+        select(BudgetVersion.department_id, BudgetVersion.id, BudgetVersion.version_number)
+        .where(
+            BudgetVersion.year == source_year,
+            BudgetVersion.is_baseline == True,
+            BudgetVersion.department_id.in_(department_ids),
+        )
+        .order_by(BudgetVersion.department_id, BudgetVersion.id)
+    ).all()
+    max_numbers = dict(db.execute(
+        select(BudgetVersion.department_id, func.max(BudgetVersion.version_number))
+        .where(BudgetVersion.year == target_year, BudgetVersion.department_id.in_(department_ids))
+        .group_by(BudgetVersion.department_id)
+    ).all())
+
+    sources = {}
+    for department_id, version_id, version_number in baselines:
+        sources.setdefault(department_id, (version_id, version_number))
+    for department_id, result in results.items():
+        if department_id not in sources:
+            result.skipped_plans = 1
+
+    now = datetime.utcnow()
+    copy_note = f"Copied from {source_year} (coefficient: {coefficient})"
+    new_ids = _insert_returning_ids(db, BudgetVersion, [
+        {
+            "year": target_year,
+            "version_number": (max_numbers.get(department_id) or 0) + 1,
+            "version_name": f"Copy of {source_year} v{version_number}",
+            "department_id": department_id,
+            "status": BudgetVersionStatusEnum.DRAFT,
+            "is_baseline": False,
+            "created_by": created_by,
+            "created_at": now,
+            "updated_at": now,
+            "change_log": copy_note,
+            "total_amount": 0,
+            "total_capex": 0,
+            "total_opex": 0,
+        }
+        for department_id, (version_id, version_number) in sources.items()
+    ])
+    version_map = {source[0]: new_id for source, new_id in zip(sources.values(), new_ids)}
+    for department_id, new_id in zip(sources, new_ids):
+        results[department_id].created_versions = 1
+        results[department_id].version_ids.append(new_id)
+
+    copy_budget_version_details(db, version_map, factors)
+    counts = dict(db.execute(
+        select(BudgetVersion.department_id, func.count(BudgetPlanDetail.id))
+        .join(BudgetPlanDetail, BudgetPlanDetail.version_id == BudgetVersion.id)
+        .where(BudgetVersion.id.in_(new_ids))
+        .group_by(BudgetVersion.department_id)
+    ).all()) if new_ids else {}
+    for department_id, count in counts.items():
+        results[department_id].created_details = count
+
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Revenue plans
+# ---------------------------------------------------------------------------
+
+def copy_revenue_plan_details(
+    db: Session,
+    version_map: Mapping[int, int],
+    factors: Sequence[Decimal],
+) -> int:
+    """
+    Copy revenue plan details of source versions into target versions with one INSERT ... SELECT
+
+    Monthly values are multiplied by their factor and rounded to kopecks;
+    `total` is the sum of the rounded months.
+
+    Returns:
+        Number of copied details
+    """
+    if not version_map:
+        return 0
+
+    months = {
+        name: _scaled(getattr(RevenuePlanDetail, name), factor)
+        for name, factor in zip(REVENUE_MONTH_COLUMNS, factors)
+    }
+    total = months[REVENUE_MONTH_COLUMNS[0]]
+    for name in REVENUE_MONTH_COLUMNS[1:]:
+        total = total + months[name]
+
+    now = datetime.utcnow()
+    copied = {
+        "version_id": case(dict(version_map), value=RevenuePlanDetail.version_id),
+        "revenue_stream_id": RevenuePlanDetail.revenue_stream_id,
+        "revenue_category_id": RevenuePlanDetail.revenue_category_id,
+        "department_id": RevenuePlanDetail.department_id,
+        **months,
+        "total": total,
+        "created_at": literal(now),
+        "updated_at": literal(now),
+    }
+    source = select(*copied.values()).where(RevenuePlanDetail.version_id.in_(list(version_map)))
+    return db.execute(insert(RevenuePlanDetail).from_select(list(copied), source)).rowcount
+
+
+def copy_revenue_plans(
+    db: Session,
+    source_year: int,
+    target_year: int,
+    department_ids: Iterable[int],
+    *,
+    created_by: int,
+    coefficient: float = 1.0,
+    seasonality: Optional[Sequence[float]] = None,
+) -> Dict[int, PlanCopyResult]:
+    """
+    Copy the approved version of every source_year revenue plan into a new DRAFT plan of target_year
+
+    The new plan name has source_year replaced by target_year. Plans without an
+    approved version, and plans whose target name already exists in the
+    department for target_year, are skipped.
+
+    Returns:
+        department_id -> PlanCopyResult (departments without source plans are absent)
+    """
+    factors = month_factors(coefficient, seasonality)
+    department_ids = sorted(set(department_ids))
+
+    source_rows = db.execute(
+        select(
+            RevenuePlan.id,
+            RevenuePlan.department_id,
+            RevenuePlan.name,
+            RevenuePlan.revenue_stream_id,
+            RevenuePlan.revenue_category_id,
+            RevenuePlanVersion.id,
+            RevenuePlanVersion.version_number,
+        )
+        .outerjoin(RevenuePlanVersion, and_(
+            RevenuePlanVersion.plan_id == RevenuePlan.id,
+            RevenuePlanVersion.status == RevenueVersionStatusEnum.APPROVED,
+        ))
+        .where(RevenuePlan.year == source_year, RevenuePlan.department_id.in_(department_ids))
+        .order_by(RevenuePlan.id, RevenuePlanVersion.id)
+    ).all()
+    taken_names = set(db.execute(
+        select(RevenuePlan.department_id, RevenuePlan.name)
+        .where(RevenuePlan.year == target_year, RevenuePlan.department_id.in_(department_ids))
+    ).all())
+
+    results: Dict[int, PlanCopyResult] = {}
+    seen_plans = set()
+    to_copy = []
+    for plan_id, department_id, name, stream_id, category_id, version_id, version_number in source_rows:
+        if plan_id in seen_plans:
+            continue  # several approved versions: the first one is copied
+        seen_plans.add(plan_id)
+        result = results.setdefault(department_id, PlanCopyResult(department_id))
+
+        target_name = name.replace(str(source_year), str(target_year))
+        if version_id is None or (department_id, target_name) in taken_names:
+            result.skipped_plans += 1
+            continue
+        taken_names.add((department_id, target_name))
+        to_copy.append((department_id, name, target_name, stream_id, category_id, version_id, version_number))
+
+    now = datetime.utcnow()
+    plan_ids = _insert_returning_ids(db, RevenuePlan, [
+        {
+            "name": target_name,
+            "year": target_year,
+            "department_id": department_id,
+            "revenue_stream_id": stream_id,
+            "revenue_category_id": category_id,
+            "description": f"Copied from {source_year} (coefficient: {coefficient})",
+            "status": RevenuePlanStatusEnum.DRAFT,
+            "total_planned_revenue": Decimal("0"),
+            "created_by": created_by,
+            "created_at": now,
+        }
+        for department_id, name, target_name, stream_id, category_id, _, _ in to_copy
+    ])
+    version_ids = _insert_returning_ids(db, RevenuePlanVersion, [
+        {
+            "plan_id": plan_id,
+            "version_number": 1,
+            "version_name": "Version 1 (Copied)",
+            "description": f"Copied from plan '{name}' (year {source_year}, version {version_number})",
+            "status": RevenueVersionStatusEnum.DRAFT,
+            "created_by": created_by,
+            "created_at": now,
+        }
+        for plan_id, (_, name, _, _, _, _, version_number) in zip(plan_ids, to_copy)
+    ])
+
+    version_map = {}
+    for new_version_id, (department_id, *_, source_version_id, _) in zip(version_ids, to_copy):
+        version_map[source_version_id] = new_version_id
+        results[department_id].created_plans += 1
+        results[department_id].created_versions += 1
+        results[department_id].version_ids.append(new_version_id)
+
+    copy_revenue_plan_details(db, version_map, factors)
+    if version_ids:
+        counts = db.execute(
+            select(RevenuePlanDetail.department_id, func.count())
+            .where(RevenuePlanDetail.version_id.in_(version_ids))
+            .group_by(RevenuePlanDetail.department_id)
+        ).all()
+        for department_id, count in counts:
+            results[department_id].created_details = count
+
+    return results
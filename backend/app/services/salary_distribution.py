@@ -0,0 +1,284 @@
+"""
+Salary distribution and percentile statistics computed in the database
+
+Compensation values come from a sub-select with the columns
+(department_id, year, month, value); each distinct (department_id, year,
+month) is one group, so many departments / months are computed in one call:
+
+- PostgreSQL: one aggregate query with percentile_cont(...) WITHIN GROUP and
+  stddev_samp per group, one GROUP BY floor(value / bucket_size) query for
+  the histogram buckets
+- other dialects (SQLite): the values are fetched once and aggregated with NumPy
+  (np.percentile uses the same linear interpolation as percentile_cont)
+
+Results are cached per group and bucket size in the shared cache; payroll and
+employee writes call invalidate_salary_distribution_cache().
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, literal, null, select, Integer
+from sqlalchemy.orm import Session
+
+from app.db.models import Employee, EmployeeStatusEnum, PayrollPlan
+from app.services.cache import cache_service
+
+SALARY_DISTRIBUTION_CACHE_NAMESPACE = "salary_distribution"
+
+PERCENTILES = (25, 50, 75, 90)
+
+GroupKey = Tuple[Optional[int], Optional[int], Optional[int]]  # (department_id, year, month)
+
+
+def invalidate_salary_distribution_cache() -> None:
+    """Drop cached distributions after payroll / salary data changes"""
+    cache_service.invalidate_namespace(SALARY_DISTRIBUTION_CACHE_NAMESPACE)
+
+
+# ==================== Value sources ====================
+
+def _department_column(by_department: bool, column):
+    return column if by_department else literal(None).label("department_id")
+
+
+def current_compensation_values(
+    department_ids: Optional[List[int]] = None,
+    by_department: bool = False,
+    base_salary_only: bool = False
+):
+    """
+    Current monthly compensation of active employees
+
+    Total compensation = base_salary + monthly_bonus_base + quarterly_bonus_base/4 + annual_bonus_base/12
+    (amortizing quarterly and annual bonuses to monthly equivalent)
+    """
+    value = Employee.base_salary
+    if not base_salary_only:
+        value = (
+            Employee.base_salary +
+            func.coalesce(Employee.monthly_bonus_base, 0) +
+            func.coalesce(Employee.quarterly_bonus_base, 0) / 4 +
+            func.coalesce(Employee.annual_bonus_base, 0) / 12
+        )
+    query = select(
+        _department_column(by_department, Employee.department_id.label("department_id")),
+        null().label("year"),
+        null().label("month"),
+        value.label("value")
+    ).where(Employee.status == EmployeeStatusEnum.ACTIVE)
+    if department_ids:
+        query = query.where(Employee.department_id.in_(department_ids))
+    return query.subquery("compensation")
+
+
+def planned_compensation_values(
+    year: int,
+    months: Optional[List[int]] = None,
+    department_ids: Optional[List[int]] = None,
+    by_department: bool = False
+):
+    """
+    Planned monthly compensation (PayrollPlan.total_planned) per employee
+
+    With months: one group per month. Without: one group for the year with
+    the employee's average monthly plan.
+    """
+    department = _department_column(by_department, PayrollPlan.department_id.label("department_id"))
+    month = PayrollPlan.month if months else null()
+    per_month = func.sum(PayrollPlan.total_planned)
+    value = per_month if months else per_month / func.count(func.distinct(PayrollPlan.month))
+
+    query = select(
+        department,
+        literal(year, Integer).label("year"),
+        month.label("month"),
+        value.label("value")
+    ).where(PayrollPlan.year == year)
+    if months:
+        query = query.where(PayrollPlan.month.in_(months))
+    if department_ids:
+        query = query.where(PayrollPlan.department_id.in_(department_ids))
+
+    group_by = [PayrollPlan.employee_id]
+    if by_department:
+        group_by.append(PayrollPlan.department_id)
+    if months:
+        group_by.append(PayrollPlan.month)
+    return query.group_by(*group_by).subquery("compensation")
+
+
+# ==================== Aggregation ====================
+
+def empty_distribution() -> Dict[str, Any]:
+    return {
+        "total_employees": 0,
+        "buckets": [],
+        "statistics": {
+            "total_employees": 0,
+            "avg_salary": 0,
+            "median_salary": 0,
+            "min_salary": 0,
+            "max_salary": 0,
+            "percentile_25": 0,
+            "percentile_75": 0,
+            "percentile_90": 0,
+            "std_deviation": 0,
+            "total_payroll": 0
+        }
+    }
+
+
+def _bucket(bucket_index: int, bucket_size: int, count: int, total: int, avg_in_range: float) -> Dict[str, Any]:
+    current_min = bucket_index * bucket_size
+    current_max = current_min + bucket_size
+    # Format range label
+    if current_min >= 1000000:
+        label = f"{current_min // 1000}k-{current_max // 1000}k"
+    else:
+        label = f"{int(current_min):,}-{int(current_max):,}"
+    return {
+        "range_min": float(current_min),
+        "range_max": float(current_max),
+        "range_label": label,
+        "employee_count": count,
+        "percentage": round(count / total * 100, 2),
+        "avg_salary": round(avg_in_range, 2)
+    }
+
+
+def _distribution(
+    count: int,
+    total: float,
+    minimum: float,
+    maximum: float,
+    std_deviation: Optional[float],
+    percentiles: List[float],
+    buckets: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    p25, p50, p75, p90 = percentiles
+    return {
+        "total_employees": count,
+        "buckets": buckets,
+        "statistics": {
+            "total_employees": count,
+            "avg_salary": round(total / count, 2),
+            "median_salary": round(p50, 2),
+            "min_salary": round(minimum, 2),
+            "max_salary": round(maximum, 2),
+            "percentile_25": round(p25, 2),
+            "percentile_75": round(p75, 2),
+            "percentile_90": round(p90, 2),
+            "std_deviation": round(std_deviation or 0, 2),
+            "total_payroll": round(total, 2)
+        }
+    }
+
+
+def _sql_distributions(db: Session, values, bucket_size: Optional[int]) -> Dict[GroupKey, Dict[str, Any]]:
+    keys = (values.c.department_id, values.c.year, values.c.month)
+    stats = db.execute(
+        select(
+            *keys,
+            func.count(),
+            func.sum(values.c.value),
+            func.min(values.c.value),
+            func.max(values.c.value),
+            func.stddev_samp(values.c.value),
+            *[func.percentile_cont(p / 100).within_group(values.c.value) for p in PERCENTILES]
+        ).group_by(*keys)
+    ).all()
+
+    buckets: Dict[GroupKey, List[Dict[str, Any]]] = {}
+    counts = {tuple(row[:3]): row[3] for row in stats}
+    if bucket_size:
+        bucket_index = func.floor(values.c.value / bucket_size)
+        for *key, index, count, avg_in_range in db.execute(
+            select(*keys, bucket_index, func.count(), func.avg(values.c.value))
+            .group_by(*keys, bucket_index)
+            .order_by(*keys, bucket_index)
+        ):
+            key = tuple(key)
+            buckets.setdefault(key, []).append(
+                _bucket(int(index), bucket_size, count, counts[key], float(avg_in_range))
+            )
+
+    return {
+        tuple(row[:3]): _distribution(
+            row[3], float(row[4]), float(row[5]), float(row[6]),
+            float(row[7]) if row[7] is not None else None,
+            [float(value) for value in row[8:]],
+            buckets.get(tuple(row[:3]), [])
+        )
+        for row in stats
+    }
+
+
+def _numpy_distributions(db: Session, values, bucket_size: Optional[int]) -> Dict[GroupKey, Dict[str, Any]]:
+    grouped: Dict[GroupKey, List[float]] = {}
+    for department_id, year, month, value in db.execute(select(values)):
+        grouped.setdefault((department_id, year, month), []).append(float(value))
+
+    result = {}
+    for key, group in grouped.items():
+        salaries = np.array(group)
+        buckets = []
+        if bucket_size:
+            indexes, counts = np.unique(np.floor(salaries / bucket_size), return_counts=True)
+            for index, count in zip(indexes, counts):
+                in_range = salaries[np.floor(salaries / bucket_size) == index]
+                buckets.append(_bucket(int(index), bucket_size, int(count), len(salaries), float(in_range.mean())))
+        result[key] = _distribution(
+            len(salaries),
+            float(salaries.sum()),
+            float(salaries.min()),
+            float(salaries.max()),
+            float(salaries.std(ddof=1)) if len(salaries) > 1 else None,
+            [float(value) for value in np.percentile(salaries, PERCENTILES)],
+            buckets
+        )
+    return result
+
+
+def compute_distributions(db: Session, values, bucket_size: Optional[int] = None) -> Dict[GroupKey, Dict[str, Any]]:
+    """Statistics (and histogram if bucket_size) of every (department_id, year, month) group of values"""
+    if db.get_bind().dialect.name == "postgresql":
+        return _sql_distributions(db, values, bucket_size)
+    return _numpy_distributions(db, values, bucket_size)
+
+
+def cached_distributions(
+    db: Session,
+    source: str,
+    keys: Iterable[GroupKey],
+    values: Callable[[List[GroupKey]], Any],
+    bucket_size: Optional[int] = None
+) -> Dict[GroupKey, Dict[str, Any]]:
+    """
+    Distributions of the requested groups; only groups missing from the cache are computed
+
+    Args:
+        source: Name of the value source (part of the cache key)
+        keys: Requested (department_id, year, month) groups
+        values: Builds the values sub-select for the missing groups
+        bucket_size: Histogram bucket size (None = statistics only)
+    """
+    keys = list(dict.fromkeys(keys))
+    result: Dict[GroupKey, Dict[str, Any]] = {}
+    missing: List[GroupKey] = []
+    for key in keys:
+        cached = cache_service.get(SALARY_DISTRIBUTION_CACHE_NAMESPACE, cache_service.build_key(source, *key, bucket_size))
+        if cached is None:
+            missing.append(key)
+        else:
+            result[key] = cached
+
+    if missing:
+        computed = compute_distributions(db, values(missing), bucket_size)
+        for key in missing:
+            result[key] = computed.get(key) or empty_distribution()
+            cache_service.set(
+                SALARY_DISTRIBUTION_CACHE_NAMESPACE,
+                cache_service.build_key(source, *key, bucket_size),
+                result[key]
+            )
+    return result
@@ -225,6 +225,53 @@ async def check_expired_modules_task():
         logger.error(f"Error in scheduled expired modules check: {e}", exc_info=True)
 
 
+async def refresh_analytics_snapshots_task():
+    """
+    Scheduled task: Export closed months of fact tables to Parquet snapshots
+
+    Runs daily at configurable time (default: 2:30 AM Moscow time)
+    Only partitions changed since the previous run are rewritten
+    """
+    logger.info("Starting analytics snapshot refresh")
+
+    try:
+        from app.services.analytics_snapshot import refresh_snapshots
+
+        db: Session = SessionLocal()
+
+        try:
+            rewritten = refresh_snapshots(db)
+            logger.info(f"Analytics snapshot refresh completed: rewritten partitions {rewritten}")
+        finally:
+            db.close()
+
+    except Exception as e:
+        logger.error(f"Error in scheduled analytics snapshot refresh: {e}", exc_info=True)
+
+
+async def purge_attachment_blobs_task():
+    """
+    Scheduled task: Remove attachment blobs no attachment references
+
+    Runs hourly; covers blobs released by expense cascades and purges
+    that failed right after a delete
+    """
+    try:
+        from app.services.attachment_storage import purge_unreferenced_blobs
+
+        db: Session = SessionLocal()
+
+        try:
+            removed = purge_unreferenced_blobs(db)
+            if removed:
+                logger.info(f"Attachment blob purge completed: {removed} blobs removed")
+        finally:
+            db.close()
+
+    except Exception as e:
+        logger.error(f"Error in scheduled attachment blob purge: {e}", exc_info=True)
+
+
 def start_scheduler():
     """
     Start background scheduler with all scheduled tasks
@@ -233,6 +280,8 @@ def start_scheduler():
     - Credit Portfolio Import: Configurable schedule (default: Daily at 6:00 AM Moscow time)
     - Employee KPI Auto-Creation: Monthly on 1st day at 00:01 AM Moscow time
     - Expired Modules Check: Daily at configurable time (default: Daily at 1:00 AM Moscow time)
+    - Analytics Snapshot Refresh: Daily at configurable time (default: Daily at 2:30 AM Moscow time)
+    - Attachment Blob Purge: Hourly
 
     Configuration via environment variables:
     - SCHEDULER_ENABLED: Enable/disable scheduler (default: true)
@@ -243,6 +292,10 @@ def start_scheduler():
     - MODULE_EXPIRY_CHECK_ENABLED: Enable module expiry check (default: true)
     - MODULE_EXPIRY_CHECK_HOUR: Hour for module expiry check (0-23, default: 1)
     - MODULE_EXPIRY_CHECK_MINUTE: Minute for module expiry check (0-59, default: 0)
+    - ANALYTICS_SNAPSHOT_ENABLED: Enable analytics snapshot refresh (default: true)
+    - ANALYTICS_SNAPSHOT_HOUR: Hour for snapshot refresh (0-23, default: 2)
+    - ANALYTICS_SNAPSHOT_MINUTE: Minute for snapshot refresh (0-59, default: 30)
+    - ATTACHMENT_BLOB_PURGE_ENABLED: Enable hourly attachment blob purge (default: true)
     """
     # Check if scheduler is enabled
     scheduler_enabled = getattr(settings, 'SCHEDULER_ENABLED', True)
@@ -306,6 +359,41 @@ def start_scheduler():
     else:
         logger.info("Module expiry check is disabled via MODULE_EXPIRY_CHECK_ENABLED setting")
 
+    # Analytics Snapshot Refresh - Daily at configurable time
+    snapshot_enabled = getattr(settings, 'ANALYTICS_SNAPSHOT_ENABLED', True)
+    if snapshot_enabled:
+        snapshot_hour = getattr(settings, 'ANALYTICS_SNAPSHOT_HOUR', 2)
+        snapshot_minute = getattr(settings, 'ANALYTICS_SNAPSHOT_MINUTE', 30)
+
+        scheduler.add_job(
+            refresh_analytics_snapshots_task,
+            CronTrigger(hour=snapshot_hour, minute=snapshot_minute, timezone='Europe/Moscow'),
+            id='analytics_snapshot_refresh',
+            name='Refresh Analytics Parquet Snapshots',
+            replace_existing=True,
+            max_instances=1  # Prevent concurrent runs
+        )
+
+        logger.info(f"Analytics snapshot refresh scheduled: Daily at {snapshot_hour:02d}:{snapshot_minute:02d} Moscow time")
+    else:
+        logger.info("Analytics snapshot refresh is disabled via ANALYTICS_SNAPSHOT_ENABLED setting")
+
+    # Attachment Blob Purge - Hourly
+    blob_purge_enabled = getattr(settings, 'ATTACHMENT_BLOB_PURGE_ENABLED', True)
+    if blob_purge_enabled:
+        scheduler.add_job(
+            purge_attachment_blobs_task,
+            CronTrigger(minute=15, timezone='Europe/Moscow'),
+            id='attachment_blob_purge',
+            name='Purge Unreferenced Attachment Blobs',
+            replace_existing=True,
+            max_instances=1  # Prevent concurrent runs
+        )
+
+        logger.info("Attachment blob purge scheduled: Hourly at :15")
+    else:
+        logger.info("Attachment blob purge is disabled via ATTACHMENT_BLOB_PURGE_ENABLED setting")
+
     logger.info("Scheduled jobs:")
     for job in scheduler.get_jobs():
         try:
@@ -0,0 +1,233 @@
+"""
+In-memory tax rate resolution (TaxRate reference)
+
+The active TaxRate rows are loaded once into an interval index keyed by
+(tax type, department): for every key the overlapping validity periods are
+flattened into a sorted list of breakpoints, each holding the rate in force
+from that day on (latest effective_from wins, like the effective_from DESC
+queries it replaces). A lookup is a bisect over the breakpoints, many dates
+are resolved at once with np.searchsorted.
+
+Resolution order for a department: department rate > global rate
+(department_id IS NULL) > DEFAULT_TAX_RATES.
+
+get_tax_rate_resolver() keeps one index per process. tax_rates writes call
+invalidate_tax_rate_cache() after their commit; the generation stamp kept in
+the shared cache makes the other workers reload as well, TAX_RATE_INDEX_TTL_SECONDS
+bounds staleness when the shared cache is process-local.
+"""
+import heapq
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.db.models import TaxRate, TaxTypeEnum
+from app.services.cache import cache_service
+from app.services.tax_rate_utils import DEFAULT_TAX_RATES, TaxRateDefault
+
+TAX_RATE_CACHE_NAMESPACE = "tax_rates"
+TAX_RATE_INDEX_TTL_SECONDS = 300
+_GENERATION_TTL_SECONDS = 7 * 24 * 3600
+
+
+@dataclass(frozen=True)
+class TaxRateEntry:
+    """Detached copy of an active TaxRate row"""
+
+    id: int
+    tax_type: TaxTypeEnum
+    name: str
+    rate: Decimal
+    threshold_amount: Optional[Decimal]
+    rate_above_threshold: Optional[Decimal]
+    effective_from: date
+    effective_to: Optional[date]
+    department_id: Optional[int]
+
+    @classmethod
+    def from_model(cls, tax_rate: TaxRate) -> "TaxRateEntry":
+        return cls(
+            id=tax_rate.id,
+            tax_type=TaxTypeEnum(tax_rate.tax_type),
+            name=tax_rate.name,
+            rate=Decimal(str(tax_rate.rate)),
+            threshold_amount=Decimal(str(tax_rate.threshold_amount)) if tax_rate.threshold_amount is not None else None,
+            rate_above_threshold=(
+                Decimal(str(tax_rate.rate_above_threshold)) if tax_rate.rate_above_threshold is not None else None
+            ),
+            effective_from=tax_rate.effective_from,
+            effective_to=tax_rate.effective_to,
+            department_id=tax_rate.department_id,
+        )
+
+
+ResolvedRate = Union[TaxRateEntry, TaxRateDefault]
+
+
+class _Timeline:
+    """Rates of one (tax type, department) as disjoint periods"""
+
+    def __init__(self, entries: List[TaxRateEntry]):
+        entries = sorted(entries, key=lambda entry: (entry.effective_from, entry.id))
+        self.starts = [entry.effective_from for entry in entries]
+        self.entries = entries
+
+        ends = {entry.effective_to + timedelta(days=1) for entry in entries if entry.effective_to is not None}
+        points = sorted(set(self.starts) | ends)
+        self.points: List[date] = []
+        self.values: List[Optional[TaxRateEntry]] = []
+        started: List[Tuple[date, int, int]] = []
+        position = 0
+        for point in points:
+            while position < len(entries) and entries[position].effective_from <= point:
+                entry = entries[position]
+                heapq.heappush(started, (_negate(entry.effective_from), -entry.id, position))
+                position += 1
+            # Latest start covering the point; periods ended before it are dropped lazily
+            while started and _ended(entries[started[0][2]], point):
+                heapq.heappop(started)
+            value = entries[started[0][2]] if started else None
+            if not self.values or self.values[-1] is not value:
+                self.points.append(point)
+                self.values.append(value)
+        self.ordinals = np.array([point.toordinal() for point in self.points], dtype=np.int64)
+
+    def at(self, on: date) -> Optional[TaxRateEntry]:
+        index = bisect_right(self.points, on) - 1
+        return self.values[index] if index >= 0 else None
+
+    def at_many(self, ordinals: np.ndarray) -> List[Optional[TaxRateEntry]]:
+        indexes = np.searchsorted(self.ordinals, ordinals, side="right") - 1
+        return [self.values[index] if index >= 0 else None for index in indexes.tolist()]
+
+    def first_start_between(self, after: date, until: date) -> Optional[TaxRateEntry]:
+        index = bisect_right(self.starts, after)
+        if index < len(self.starts) and self.starts[index] <= until:
+            return self.entries[index]
+        return None
+
+
+def _negate(value: date) -> int:
+    return -value.toordinal()
+
+
+def _ended(entry: TaxRateEntry, on: date) -> bool:
+    return entry.effective_to is not None and entry.effective_to < on
+
+
+class TaxRateResolver:
+    """Interval index over active tax rates, no DB access after construction"""
+
+    def __init__(self, entries: Iterable[TaxRateEntry]):
+        grouped: Dict[Tuple[TaxTypeEnum, Optional[int]], List[TaxRateEntry]] = {}
+        for entry in entries:
+            grouped.setdefault((entry.tax_type, entry.department_id), []).append(entry)
+        self._timelines = {key: _Timeline(group) for key, group in grouped.items()}
+
+    @classmethod
+    def load(cls, db: Session) -> "TaxRateResolver":
+        """Build an index from the session (sees its flushed, uncommitted changes)"""
+        return cls(
+            TaxRateEntry.from_model(tax_rate)
+            for tax_rate in db.query(TaxRate).filter(TaxRate.is_active == True).all()
+        )
+
+    def _chain(self, tax_type: TaxTypeEnum, department_id: Optional[int]) -> List[_Timeline]:
+        keys = [(tax_type, department_id), (tax_type, None)] if department_id is not None else [(tax_type, None)]
+        return [self._timelines[key] for key in keys if key in self._timelines]
+
+    def rate_on(
+        self,
+        tax_type: TaxTypeEnum,
+        on: date,
+        department_id: Optional[int] = None
+    ) -> ResolvedRate:
+        """Rate of one type effective on a date"""
+        for timeline in self._chain(tax_type, department_id):
+            entry = timeline.at(on)
+            if entry is not None:
+                return entry
+        return DEFAULT_TAX_RATES[tax_type]
+
+    def rates_on(self, on: date, department_id: Optional[int] = None) -> Dict[TaxTypeEnum, ResolvedRate]:
+        """All rate types effective on a date (same shape as merge_tax_rates_with_defaults)"""
+        return {tax_type: self.rate_on(tax_type, on, department_id) for tax_type in DEFAULT_TAX_RATES}
+
+    def rate_on_dates(
+        self,
+        tax_type: TaxTypeEnum,
+        dates: Sequence[date],
+        department_id: Optional[int] = None
+    ) -> List[ResolvedRate]:
+        """Rates of one type effective on each of the dates, in input order"""
+        ordinals = np.fromiter((value.toordinal() for value in dates), dtype=np.int64, count=len(dates))
+        resolved: List[Optional[TaxRateEntry]] = [None] * len(dates)
+        for timeline in self._chain(tax_type, department_id):
+            missing = [index for index, entry in enumerate(resolved) if entry is None]
+            if not missing:
+                break
+            for index, entry in zip(missing, timeline.at_many(ordinals[missing])):
+                resolved[index] = entry
+        default = DEFAULT_TAX_RATES[tax_type]
+        return [entry if entry is not None else default for entry in resolved]
+
+    def rate_for_year(
+        self,
+        tax_type: TaxTypeEnum,
+        year: int,
+        department_id: Optional[int] = None
+    ) -> ResolvedRate:
+        """
+        Rate of one type used for yearly planning
+
+        A rate starting during the year (the earliest one) takes precedence over
+        the rate in force on January 1st, so announced changes are planned with.
+        """
+        first_day = date(year, 1, 1)
+        for timeline in self._chain(tax_type, department_id):
+            entry = timeline.first_start_between(first_day, date(year, 12, 31)) or timeline.at(first_day)
+            if entry is not None:
+                return entry
+        return DEFAULT_TAX_RATES[tax_type]
+
+    def rates_for_year(self, year: int, department_id: Optional[int] = None) -> Dict[TaxTypeEnum, ResolvedRate]:
+        return {tax_type: self.rate_for_year(tax_type, year, department_id) for tax_type in DEFAULT_TAX_RATES}
+
+
+_lock = threading.Lock()
+_resolver: Optional[TaxRateResolver] = None
+_loaded_at = 0.0
+_generation: Optional[str] = None
+
+
+def get_tax_rate_resolver(db: Session) -> TaxRateResolver:
+    """Process-wide resolver, (re)loaded from the DB when invalidated or older than the TTL"""
+    global _resolver, _loaded_at, _generation
+    generation = cache_service.get(TAX_RATE_CACHE_NAMESPACE, "generation")
+    with _lock:
+        if (
+            _resolver is not None
+            and generation == _generation
+            and time.monotonic() - _loaded_at < TAX_RATE_INDEX_TTL_SECONDS
+        ):
+            return _resolver
+    resolver = TaxRateResolver.load(db)
+    with _lock:
+        _resolver, _loaded_at, _generation = resolver, time.monotonic(), generation
+    return resolver
+
+
+def invalidate_tax_rate_cache() -> None:
+    """Drop the rate index after TaxRate writes (call after the commit)"""
+    global _resolver
+    with _lock:
+        _resolver = None
+    cache_service.set(TAX_RATE_CACHE_NAMESPACE, "generation", uuid.uuid4().hex, ttl_seconds=_GENERATION_TTL_SECONDS)
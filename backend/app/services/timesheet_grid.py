@@ -0,0 +1,272 @@
+"""
+Bulk save of the timesheet grid (department x month)
+
+save_grid_cells() applies a batch of changed cells in a fixed number of
+statements regardless of the number of cells:
+
+1. optimistic lock: one UPDATE ... WHERE (id, lock_version) IN (...) that
+   bumps lock_version of every touched timesheet; if any timesheet changed
+   since the grid was loaded the whole save is rejected
+2. missing timesheets are created with one multi-row INSERT
+3. cells are diffed against stored records; new and changed records are
+   written with INSERT ... ON CONFLICT (timesheet_id, work_date) DO UPDATE,
+   cleared cells with one DELETE
+4. timesheet totals are recomputed with one aggregate UPDATE
+
+The session is not committed: the caller commits (or rolls back) the save.
+"""
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import and_, delete, func, insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import (
+    DailyWorkRecord,
+    DayTypeEnum,
+    Employee,
+    TimesheetStatusEnum,
+    WorkTimesheet,
+)
+from app.schemas.timesheet import TimesheetGridCell
+
+GRID_WRITE_CHUNK_SIZE = 1000
+
+_DIALECT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+RECORD_VALUE_FIELDS = ("is_working_day", "hours_worked", "day_type", "break_hours", "overtime_hours", "notes")
+
+
+class TimesheetGridError(ValueError):
+    """Grid save request cannot be applied (bad cells, locked timesheets)"""
+
+
+class TimesheetConflictError(Exception):
+    """Timesheets were changed by someone else since the grid was loaded"""
+
+    def __init__(self, employee_ids: Iterable[int]):
+        self.employee_ids = sorted(set(employee_ids))
+        super().__init__(f"Timesheets of employees {self.employee_ids} were modified by another user")
+
+
+@dataclass
+class GridSaveStats:
+    created_timesheets: int = 0
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+
+
+def _chunks(rows: Sequence[Any], size: int) -> Iterable[Sequence[Any]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def timesheet_totals_update(timesheet_ids: Sequence[Any], bump_lock: bool = False):
+    """
+    One UPDATE that recomputes total_days_worked / total_hours_worked from daily records
+
+    A day counts as worked when it is a working WORK day with hours > 0
+    (same rule as the grid view).
+    """
+    paid = and_(
+        DailyWorkRecord.timesheet_id == WorkTimesheet.id,
+        DailyWorkRecord.is_working_day.is_(True),
+        DailyWorkRecord.day_type == DayTypeEnum.WORK,
+        DailyWorkRecord.hours_worked > 0,
+    )
+    values = {
+        "total_days_worked": select(func.count(DailyWorkRecord.id)).where(paid).scalar_subquery(),
+        "total_hours_worked": select(func.coalesce(func.sum(DailyWorkRecord.hours_worked), 0)).where(paid).scalar_subquery(),
+        "updated_at": datetime.utcnow(),
+    }
+    if bump_lock:
+        values["lock_version"] = WorkTimesheet.lock_version + 1
+    return (
+        update(WorkTimesheet)
+        .where(WorkTimesheet.id.in_(list(timesheet_ids)))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _normalize_cells(cells: Sequence[TimesheetGridCell], year: int, month: int) -> Dict[Tuple[int, date], TimesheetGridCell]:
+    """Validate cell dates; the last cell wins for a repeated (employee, day)"""
+    by_key: Dict[Tuple[int, date], TimesheetGridCell] = {}
+    for cell in cells:
+        if cell.work_date.year != year or cell.work_date.month != month:
+            raise TimesheetGridError(f"Date {cell.work_date} is outside of {month:02d}.{year}")
+        by_key[(cell.employee_id, cell.work_date)] = cell
+    return by_key
+
+
+def _cell_values(cell: TimesheetGridCell) -> Dict[str, Any]:
+    return {name: getattr(cell, name) for name in RECORD_VALUE_FIELDS}
+
+
+async def save_grid_cells(
+    db: AsyncSession,
+    department_id: int,
+    year: int,
+    month: int,
+    cells: Sequence[TimesheetGridCell],
+    lock_versions: Dict[int, int],
+) -> GridSaveStats:
+    """
+    Apply changed grid cells of one department-month
+
+    Args:
+        db: Async database session (not committed here)
+        department_id: Department of the grid
+        year, month: Grid period
+        cells: Changed cells (full state of each employee-day)
+        lock_versions: employee_id -> lock_version seen by the client
+
+    Raises:
+        TimesheetGridError: cells outside the period, unknown employees,
+            non-DRAFT timesheets
+        TimesheetConflictError: optimistic lock failed
+    """
+    stats = GridSaveStats()
+    by_key = _normalize_cells(cells, year, month)
+    employee_ids = sorted({employee_id for employee_id, _ in by_key})
+
+    known_employees = set((await db.execute(
+        select(Employee.id).where(Employee.id.in_(employee_ids), Employee.department_id == department_id)
+    )).scalars())
+    unknown = [employee_id for employee_id in employee_ids if employee_id not in known_employees]
+    if unknown:
+        raise TimesheetGridError(f"Employees {unknown} do not belong to department {department_id}")
+
+    timesheets = (await db.execute(
+        select(WorkTimesheet.id, WorkTimesheet.employee_id, WorkTimesheet.status, WorkTimesheet.lock_version).where(
+            WorkTimesheet.department_id == department_id,
+            WorkTimesheet.year == year,
+            WorkTimesheet.month == month,
+            WorkTimesheet.employee_id.in_(employee_ids),
+        )
+    )).all()
+
+    locked = [row.employee_id for row in timesheets if row.status != TimesheetStatusEnum.DRAFT]
+    if locked:
+        raise TimesheetGridError(f"Timesheets of employees {sorted(locked)} are not in DRAFT status")
+
+    stale = [row.employee_id for row in timesheets if lock_versions.get(row.employee_id) != row.lock_version]
+    if stale:
+        raise TimesheetConflictError(stale)
+
+    # 1. Optimistic lock: bump versions only if nobody else did in between
+    timesheet_by_employee: Dict[int, Any] = {row.employee_id: row.id for row in timesheets}
+    if timesheets:
+        bumped = (await db.execute(
+            update(WorkTimesheet)
+            .where(tuple_(WorkTimesheet.id, WorkTimesheet.lock_version).in_(
+                [(row.id, row.lock_version) for row in timesheets]
+            ))
+            .values(lock_version=WorkTimesheet.lock_version + 1)
+            .returning(WorkTimesheet.id)
+            .execution_options(synchronize_session=False)
+        )).scalars().all()
+        if len(bumped) != len(timesheets):
+            bumped = set(bumped)
+            raise TimesheetConflictError(row.employee_id for row in timesheets if row.id not in bumped)
+
+    # 2. Create timesheets for employees that have none yet (only if they get records)
+    new_timesheets = [
+        {
+            "id": uuid.uuid4(),
+            "employee_id": employee_id,
+            "department_id": department_id,
+            "year": year,
+            "month": month,
+            "status": TimesheetStatusEnum.DRAFT,
+            "total_days_worked": 0,
+            "total_hours_worked": 0,
+            "lock_version": 1,
+        }
+        for employee_id in employee_ids
+        if employee_id not in timesheet_by_employee
+        and any(not cell.delete for (cell_employee, _), cell in by_key.items() if cell_employee == employee_id)
+    ]
+    if new_timesheets:
+        try:
+            await db.execute(insert(WorkTimesheet), new_timesheets)
+        except IntegrityError:
+            # Created concurrently by another save (uq_timesheet_employee_period)
+            raise TimesheetConflictError(row["employee_id"] for row in new_timesheets)
+        timesheet_by_employee.update({row["employee_id"]: row["id"] for row in new_timesheets})
+        stats.created_timesheets = len(new_timesheets)
+
+    # 3. Diff cells against stored records
+    existing: Dict[Tuple[Any, date], Any] = {}
+    if timesheets:
+        records = (await db.execute(
+            select(DailyWorkRecord.id, DailyWorkRecord.timesheet_id, DailyWorkRecord.work_date,
+                   *[getattr(DailyWorkRecord, name) for name in RECORD_VALUE_FIELDS]).where(
+                DailyWorkRecord.timesheet_id.in_([row.id for row in timesheets]),
+                DailyWorkRecord.work_date.in_(sorted({work_date for _, work_date in by_key})),
+            )
+        )).all()
+        existing = {(record.timesheet_id, record.work_date): record for record in records}
+
+    now = datetime.utcnow()
+    upserts: List[Dict[str, Any]] = []
+    delete_ids: List[Any] = []
+    for (employee_id, work_date), cell in by_key.items():
+        timesheet_id = timesheet_by_employee.get(employee_id)
+        record = existing.get((timesheet_id, work_date)) if timesheet_id else None
+        if cell.delete:
+            if record is not None:
+                delete_ids.append(record.id)
+            else:
+                stats.unchanged += 1
+            continue
+        values = _cell_values(cell)
+        if record is not None and all(getattr(record, name) == value for name, value in values.items()):
+            stats.unchanged += 1
+            continue
+        if record is None:
+            stats.inserted += 1
+        else:
+            stats.updated += 1
+        upserts.append({
+            "id": record.id if record is not None else uuid.uuid4(),
+            "timesheet_id": timesheet_id,
+            "work_date": work_date,
+            "department_id": department_id,
+            "updated_at": now,
+            **values,
+        })
+
+    if upserts:
+        dialect_insert = _DIALECT_INSERTS[db.get_bind().dialect.name]
+        table = DailyWorkRecord.__table__
+        for chunk in _chunks(upserts, GRID_WRITE_CHUNK_SIZE):
+            statement = dialect_insert(table).values(list(chunk))
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.timesheet_id, table.c.work_date],
+                set_={name: statement.excluded[name] for name in (*RECORD_VALUE_FIELDS, "updated_at")},
+            )
+            await db.execute(statement)
+
+    for chunk in _chunks(delete_ids, GRID_WRITE_CHUNK_SIZE):
+        await db.execute(
+            delete(DailyWorkRecord)
+            .where(DailyWorkRecord.id.in_(list(chunk)))
+            .execution_options(synchronize_session=False)
+        )
+    stats.deleted = len(delete_ids)
+
+    # 4. Totals of every touched timesheet in one statement
+    if timesheet_by_employee:
+        await db.execute(timesheet_totals_update(list(timesheet_by_employee.values())))
+
+    return stats
@@ -19,6 +19,8 @@ from app.services.import_config_manager import (
     ImportConfig,
     get_import_config_manager
 )
+from app.services.payroll_tax_breakdown import refresh_department_payroll_taxes
+from app.services.salary_distribution import invalidate_salary_distribution_cache
 from app.db.models import (
     BudgetCategory,
     BudgetPlan,
@@ -300,7 +302,15 @@ class UnifiedImportService:
             result = self._import_entities(entity_type, config, mapped_data, department_id)
 
             if result["success"]:
+                if entity_type == "payroll_plans":
+                    refresh_department_payroll_taxes(
+                        self.db,
+                        {int(row["year"]) for row in mapped_data if row.get("year")},
+                        department_id if department_id is not None else self.current_user.department_id
+                    )
                 self.db.commit()
+                if entity_type in ("employees", "payroll_plans"):
+                    invalidate_salary_distribution_cache()
             else:
                 self.db.rollback()
 
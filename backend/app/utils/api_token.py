@@ -1,11 +1,15 @@
 """
 Utilities for API Token management and authentication
 """
+import hashlib
 import secrets
+import time
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 from fastapi import HTTPException, Security, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.db.models import APIToken, APITokenStatusEnum, APITokenScopeEnum
@@ -14,6 +18,12 @@ from app.utils.logger import log_info, log_warning
 
 security = HTTPBearer()
 
+# Fingerprints of tokens that passed verification recently (process-local).
+# The rate limiter keys Bearer itb_... traffic by token only for these, so
+# made-up tokens cannot get a fresh bucket each and stay on the per-IP limit.
+VERIFIED_TOKEN_TTL_SECONDS = 300
+_verified_tokens: Dict[str, float] = {}
+
 
 def generate_token_key() -> str:
     """
@@ -40,6 +50,89 @@ async def verify_api_token(
 
     Updates last_used_at and request_count on successful verification
     """
+    token_key = _get_token_key(credentials)
+
+    # Query token from database
+    token = db.query(APIToken).filter(APIToken.token_key == token_key).first()
+
+    token = _require_active_token(token, token_key)
+    if _token_has_expired(token):
+        # Auto-update status to EXPIRED
+        token.status = APITokenStatusEnum.EXPIRED
+        db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="API token has expired"
+        )
+
+    # Update usage tracking
+    token.last_used_at = datetime.now()
+    token.request_count += 1
+    db.commit()
+    remember_verified_token(token_key)
+
+    log_info(f"API token verified: {token.name} (ID: {token.id})")
+
+    return token
+
+
+async def verify_api_token_async(
+    credentials: HTTPAuthorizationCredentials,
+    db: AsyncSession
+) -> APIToken:
+    """
+    Same checks as verify_api_token, using AsyncSession
+
+    Used by async routes so token lookup and usage tracking do not block the event loop.
+    """
+    token_key = _get_token_key(credentials)
+
+    result = await db.execute(select(APIToken).where(APIToken.token_key == token_key))
+    token = result.scalar_one_or_none()
+
+    token = _require_active_token(token, token_key)
+    if _token_has_expired(token):
+        # Auto-update status to EXPIRED
+        token.status = APITokenStatusEnum.EXPIRED
+        await db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="API token has expired"
+        )
+
+    # Update usage tracking
+    token.last_used_at = datetime.now()
+    token.request_count += 1
+    await db.commit()
+    remember_verified_token(token_key)
+
+    log_info(f"API token verified: {token.name} (ID: {token.id})")
+
+    return token
+
+
+def token_fingerprint(token_key: str) -> str:
+    """Hash of a token key, so raw tokens never reach Redis or logs"""
+    return hashlib.sha256(token_key.encode()).hexdigest()[:32]
+
+
+def remember_verified_token(token_key: str) -> None:
+    """Mark a token as verified for VERIFIED_TOKEN_TTL_SECONDS"""
+    now = time.monotonic()
+    if len(_verified_tokens) > 10000:
+        for fingerprint in [key for key, expires_at in _verified_tokens.items() if expires_at <= now]:
+            _verified_tokens.pop(fingerprint, None)
+    _verified_tokens[token_fingerprint(token_key)] = now + VERIFIED_TOKEN_TTL_SECONDS
+
+
+def is_verified_token(token_key: str) -> bool:
+    """True if the token passed verification within VERIFIED_TOKEN_TTL_SECONDS"""
+    expires_at = _verified_tokens.get(token_fingerprint(token_key))
+    return expires_at is not None and expires_at > time.monotonic()
+
+
+def _get_token_key(credentials: Optional[HTTPAuthorizationCredentials]) -> str:
+    """Extract token key from Authorization header and validate its format"""
     if not credentials:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -54,9 +147,11 @@ async def verify_api_token(
             detail="Invalid token format"
         )
 
-    # Query token from database
-    token = db.query(APIToken).filter(APIToken.token_key == token_key).first()
+    return token_key
 
+
+def _require_active_token(token: Optional[APIToken], token_key: str) -> APIToken:
+    """Return the token if it exists and is ACTIVE, raise 401 otherwise"""
     if not token:
         log_warning(f"API token not found: {token_key[:20]}...")
         raise HTTPException(
@@ -72,25 +167,16 @@ async def verify_api_token(
             detail=f"API token is {token.status.lower()}"
         )
 
-    # Check if token is expired
-    if token.expires_at and token.expires_at < datetime.now():
-        log_warning(f"API token expired: {token.name}")
-        # Auto-update status to EXPIRED
-        token.status = APITokenStatusEnum.EXPIRED
-        db.commit()
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="API token has expired"
-        )
+    return token
 
-    # Update usage tracking
-    token.last_used_at = datetime.now()
-    token.request_count += 1
-    db.commit()
 
-    log_info(f"API token verified: {token.name} (ID: {token.id})")
+def _token_has_expired(token: APIToken) -> bool:
+    """True if expires_at has passed (the caller persists the EXPIRED status)"""
+    if token.expires_at and token.expires_at < datetime.now():
+        log_warning(f"API token expired: {token.name}")
+        return True
 
-    return token
+    return False
 
 
 def check_token_scope(token: APIToken, required_scope: APITokenScopeEnum) -> bool:
@@ -7,6 +7,7 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
@@ -127,7 +128,8 @@ async def get_current_user(
     except (ValueError, TypeError):
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == user_id).first()
+    # Sync session: run the lookup in the threadpool so the event loop stays free
+    user = await run_in_threadpool(lambda: db.query(User).filter(User.id == user_id).first())
     if user is None:
         raise credentials_exception
 
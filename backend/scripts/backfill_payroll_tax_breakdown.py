@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Заполнение payroll_tax_breakdowns (НДФЛ и страховые взносы по сотруднику и месяцу)
+для уже существующих PayrollActual / PayrollPlan.
+
+Запуск после миграции b7c9d1e3f5a8 (и при необходимости полного пересчета):
+    python scripts/backfill_payroll_tax_breakdown.py
+    python scripts/backfill_payroll_tax_breakdown.py --year 2025 --department-id 3
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Добавляем родительскую директорию в путь
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db.session import SessionLocal
+from app.services.payroll_tax_breakdown import (
+    TAX_REFRESH_CHUNK_SIZE,
+    payroll_employee_years,
+    refresh_payroll_taxes,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill payroll tax breakdown")
+    parser.add_argument("--year", type=int, action="append", help="Год (можно указать несколько раз)")
+    parser.add_argument("--department-id", type=int, help="Только один отдел")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        keys = payroll_employee_years(db, args.year, args.department_id)
+        print(f"Сотрудник-лет для пересчета: {len(keys)}")
+
+        written = 0
+        for start in range(0, len(keys), TAX_REFRESH_CHUNK_SIZE):
+            written += refresh_payroll_taxes(db, keys[start:start + TAX_REFRESH_CHUNK_SIZE])
+            db.commit()
+            print(f"  {min(start + TAX_REFRESH_CHUNK_SIZE, len(keys))}/{len(keys)}: {written} строк")
+
+        print(f"✓ Готово: {written} строк payroll_tax_breakdowns")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
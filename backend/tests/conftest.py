@@ -134,6 +134,81 @@ def db_session(db_engine) -> Generator[Session, None, None]:
         session.close()
 
 
+def create_tables(connection, models) -> None:
+    """
+    Create only the tables of the given models
+
+    Base.metadata.create_all() does not work on SQLite (PostgreSQL UUID
+    columns), so the tables are copied to a separate MetaData with UUID
+    columns turned into the generic Uuid (CHAR(32) on SQLite).
+    """
+    from sqlalchemy import MetaData, Uuid
+    from sqlalchemy.dialects.postgresql import UUID
+
+    metadata = MetaData()
+    for table in Base.metadata.tables.values():
+        table.to_metadata(metadata)
+    tables = [metadata.tables[model.__tablename__] for model in models]
+    for table in tables:
+        for column in table.columns:
+            if isinstance(column.type, UUID):
+                column.type = Uuid()
+    metadata.create_all(connection, tables=tables)
+
+
+@pytest.fixture(scope="function")
+def make_db_session():
+    """
+    Factory of sessions on an in-memory SQLite database with only the given tables
+
+    Usage: db = make_db_session(Employee, PayrollPlan)
+    Engines and sessions are disposed after the test.
+    """
+    created = []
+
+    def factory(*models) -> Session:
+        engine = create_engine(
+            "sqlite://",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        with engine.begin() as connection:
+            create_tables(connection, models)
+        session = sessionmaker(bind=engine, autoflush=False)()
+        created.append((engine, session))
+        return session
+
+    yield factory
+
+    for engine, session in created:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture(scope="function")
+async def make_async_session_factory():
+    """
+    Async variant of make_db_session (aiosqlite): returns an async_sessionmaker
+
+    Usage: factory = await make_async_session_factory(Employee, WorkTimesheet)
+    """
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    engines = []
+
+    async def factory(*models):
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with engine.begin() as connection:
+            await connection.run_sync(create_tables, models)
+        engines.append(engine)
+        return async_sessionmaker(engine, expire_on_commit=False)
+
+    yield factory
+
+    for engine in engines:
+        await engine.dispose()
+
+
 @pytest.fixture(scope="function")
 def client(db_session: Session) -> Generator[TestClient, None, None]:
     """
@@ -156,6 +231,26 @@ def client(db_session: Session) -> Generator[TestClient, None, None]:
     app.dependency_overrides.clear()
 
 
+@pytest.fixture(scope="function")
+def make_api_client():
+    """
+    Factory of test clients bound to a session and an authenticated user
+
+    Usage: client = make_api_client(db, User(id=1, role=UserRoleEnum.ADMIN, department_id=1))
+    get_db and get_current_active_user are overridden, no login round-trip.
+    """
+    from app.utils.auth import get_current_active_user
+
+    def factory(session: Session, user) -> TestClient:
+        app.dependency_overrides[get_db] = lambda: session
+        app.dependency_overrides[get_current_active_user] = lambda: user
+        return TestClient(app)
+
+    yield factory
+
+    app.dependency_overrides.clear()
+
+
 # ================================================================
 # Test Data Fixtures
 # ================================================================
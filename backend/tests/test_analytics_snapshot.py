@@ -0,0 +1,77 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from app.core.config import settings
+from app.db.models import (
+    BankTransaction,
+    BudgetCategory,
+    Expense,
+    ExpenseTypeEnum,
+    FinExpense,
+    FinExpenseDetail,
+    FinReceipt,
+)
+from app.services.analytics_snapshot import load_manifest, query_facts, refresh_snapshots
+
+TODAY = date(2025, 3, 15)
+YEARLY_TOTALS = "SELECT year(request_date) AS year, sum(amount) FROM facts GROUP BY ALL ORDER BY year"
+
+
+@pytest.fixture
+def session(make_db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ANALYTICS_SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "ANALYTICS_SNAPSHOT_ENABLED", True)
+    db = make_db_session(BudgetCategory, Expense, BankTransaction, FinReceipt, FinExpense, FinExpenseDetail)
+    db.add(BudgetCategory(id=1, name="Servers", type=ExpenseTypeEnum.CAPEX, department_id=1))
+    for number, (department_id, day, amount) in enumerate([
+        (1, datetime(2024, 6, 1), "100.00"),
+        (1, datetime(2025, 2, 10), "50.50"),
+        (2, datetime(2024, 7, 1), "7.00"),
+        (1, datetime(2025, 3, 5), "1.25"),  # open month: always read live
+    ]):
+        db.add(Expense(
+            number=str(number), department_id=department_id, category_id=1, organization_id=1,
+            amount=Decimal(amount), request_date=day,
+        ))
+    db.commit()
+    return db
+
+
+def test_closed_months_come_from_snapshot_and_open_month_live(session):
+    refresh_snapshots(session, today=TODAY)
+    # Rows added to a closed month after the refresh are not visible until the next one
+    session.add(Expense(
+        number="late", department_id=1, category_id=1, organization_id=1,
+        amount=Decimal("1000.00"), request_date=datetime(2024, 6, 2),
+    ))
+    session.commit()
+
+    assert load_manifest()["closed_before"] == "2025-03-01"
+    assert query_facts(session, "expenses", YEARLY_TOTALS, department_id=1) == [
+        (2024, Decimal("100.00")),
+        (2025, Decimal("51.75")),
+    ]
+    assert query_facts(
+        session, "expenses", "SELECT sum(amount) FROM facts WHERE category_type = ?", ["CAPEX"],
+        date_from=date(2024, 7, 1), date_before=date(2025, 3, 1),
+    ) == [(Decimal("57.50"),)]
+
+
+def test_refresh_rewrites_only_changed_partitions(session):
+    assert refresh_snapshots(session, today=TODAY)["expenses"] == 3
+
+    expense = session.query(Expense).filter(Expense.number == "0").one()
+    expense.amount = Decimal("200.00")
+    session.commit()
+
+    assert refresh_snapshots(session, today=TODAY)["expenses"] == 1
+    assert query_facts(session, "expenses", YEARLY_TOTALS, department_id=1)[0] == (2024, Decimal("200.00"))
+
+
+def test_without_snapshot_everything_is_read_live(session):
+    assert query_facts(session, "expenses", YEARLY_TOTALS) == [
+        (2024, Decimal("107.00")),
+        (2025, Decimal("51.75")),
+    ]
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db import session as db_session_module
+from app.db.models import APIToken, APITokenStatusEnum
+from app.db.session import dispose_async_engine, get_async_database_url, get_async_db
+from app.utils.api_token import is_verified_token, verify_api_token_async
+
+
+@pytest.fixture
+async def async_engine_on_sqlite(monkeypatch):
+    monkeypatch.setattr(settings, "ASYNC_DATABASE_URL", "sqlite+aiosqlite://")
+    monkeypatch.setattr(db_session_module, "_async_engine", None)
+    monkeypatch.setattr(db_session_module, "_async_session_factory", None)
+    yield
+    await dispose_async_engine()
+
+
+@pytest.mark.parametrize("url,expected", [
+    ("postgresql://user:secret@db:5432/budget", "postgresql+asyncpg://user:secret@db:5432/budget"),
+    ("sqlite:///./test.db", "sqlite+aiosqlite:///./test.db"),
+])
+def test_async_database_url(url, expected):
+    assert get_async_database_url(url) == expected
+
+
+def test_async_database_url_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        get_async_database_url("mysql://user@db/budget")
+
+
+async def test_get_async_db_yields_a_session_and_rolls_back_on_error(async_engine_on_sqlite):
+    dependency = get_async_db()
+    db = await dependency.__anext__()
+    assert isinstance(db, AsyncSession)
+    assert (await db.execute(text("SELECT 1"))).scalar_one() == 1
+    await dependency.aclose()
+
+    dependency = get_async_db()
+    db = await dependency.__anext__()
+    await db.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY)"))
+    await db.commit()
+    await db.execute(text("INSERT INTO items (id) VALUES (1)"))
+    with pytest.raises(RuntimeError):
+        await dependency.athrow(RuntimeError("route failed"))
+
+    dependency = get_async_db()
+    db = await dependency.__anext__()
+    assert (await db.execute(text("SELECT count(*) FROM items"))).scalar_one() == 0
+    await dependency.aclose()
+
+
+@pytest.fixture
+async def token_session(make_async_session_factory):
+    session_factory = await make_async_session_factory(APIToken)
+    async with session_factory() as db:
+        db.add_all([
+            APIToken(id=1, name="active", token_key="itb_active", scopes=["READ"], created_by=1),
+            APIToken(
+                id=2, name="revoked", token_key="itb_revoked", scopes=["READ"], created_by=1,
+                status=APITokenStatusEnum.REVOKED,
+            ),
+            APIToken(
+                id=3, name="old", token_key="itb_old", scopes=["READ"], created_by=1,
+                expires_at=datetime.now() - timedelta(days=1),
+            ),
+        ])
+        await db.commit()
+        yield db
+
+
+def _credentials(token_key):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token_key)
+
+
+async def test_verify_api_token_async_tracks_usage(token_session):
+    token = await verify_api_token_async(_credentials("itb_active"), token_session)
+    await verify_api_token_async(_credentials("itb_active"), token_session)
+
+    assert token.id == 1
+    assert token.request_count == 2
+    assert token.last_used_at is not None
+    assert is_verified_token("itb_active")
+
+
+@pytest.mark.parametrize("token_key,detail", [
+    ("itb_unknown", "Invalid API token"),
+    ("itb_revoked", "API token is revoked"),
+    ("not_a_token", "Invalid token format"),
+])
+async def test_verify_api_token_async_rejects(token_session, token_key, detail):
+    with pytest.raises(HTTPException) as error:
+        await verify_api_token_async(_credentials(token_key), token_session)
+
+    assert (error.value.status_code, error.value.detail) == (401, detail)
+    assert not is_verified_token(token_key)
+
+
+async def test_verify_api_token_async_marks_expired_tokens(token_session):
+    with pytest.raises(HTTPException) as error:
+        await verify_api_token_async(_credentials("itb_old"), token_session)
+
+    assert error.value.detail == "API token has expired"
+    status = (await token_session.execute(select(APIToken.status).where(APIToken.id == 3))).scalar_one()
+    assert status == APITokenStatusEnum.EXPIRED
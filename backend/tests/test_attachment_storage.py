@@ -0,0 +1,95 @@
+import hashlib
+import io
+
+import pytest
+from sqlalchemy import select
+
+from app.db.models import AttachmentBlob
+from app.services import attachment_storage
+from app.services.attachment_storage import (
+    FileTooLargeError,
+    _parse_range,
+    blob_path,
+    publish_blob,
+    purge_unreferenced_blobs,
+    release_unpublished_blob,
+    spool_upload,
+)
+
+
+@pytest.fixture(autouse=True)
+def blob_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(attachment_storage, "BLOB_DIR", tmp_path / "blobs")
+    return tmp_path / "blobs"
+
+
+def test_spool_and_publish_is_content_addressed(blob_dir):
+    content = b"%PDF-1.4 " + b"x" * (3 * attachment_storage.CHUNK_SIZE + 17)
+
+    first = spool_upload(io.BytesIO(content), max_size=len(content))
+    second = spool_upload(io.BytesIO(content), max_size=len(content))
+    path = publish_blob(first)
+    assert publish_blob(second) == path
+
+    assert first.sha256 == hashlib.sha256(content).hexdigest()
+    assert first.size == len(content)
+    assert path == blob_path(first.sha256)
+    assert path.read_bytes() == content
+    assert [p for p in blob_dir.rglob("*") if p.is_file()] == [path]
+
+
+def test_spool_rejects_oversized_upload_and_cleans_up(blob_dir):
+    with pytest.raises(FileTooLargeError):
+        spool_upload(io.BytesIO(b"x" * 101), max_size=100)
+
+    assert not [p for p in blob_dir.rglob("*") if p.is_file()]
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=900-", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=950-5000", (950, 999)),
+    ("bytes=1000-", ()),
+    ("bytes=0-9,20-29", None),
+    ("items=0-9", None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+
+def test_purge_removes_only_unreferenced_blobs(blob_dir, make_db_session):
+    db = make_db_session(AttachmentBlob)
+    paths = {}
+    for name, refs in (("a", 0), ("b", 1), ("c", 0)):
+        sha256 = hashlib.sha256(name.encode()).hexdigest()
+        paths[name] = publish_blob(spool_upload(io.BytesIO(name.encode()), max_size=10))
+        db.add(AttachmentBlob(sha256=sha256, file_size=1, ref_count=refs))
+    db.commit()
+
+    # Right after a delete only the released blob is purged
+    assert purge_unreferenced_blobs(db, [hashlib.sha256(b"a").hexdigest()]) == 1
+    assert not paths["a"].exists() and paths["c"].exists()
+
+    # The sweep takes every unreferenced blob, referenced ones stay
+    assert purge_unreferenced_blobs(db) == 1
+    assert [blob.sha256 for blob in db.query(AttachmentBlob).all()] == [hashlib.sha256(b"b").hexdigest()]
+    assert [p for p in blob_dir.rglob("*") if p.is_file()] == [paths["b"]]
+
+
+async def test_rolled_back_upload_releases_its_blob(blob_dir, make_async_session_factory):
+    factory = await make_async_session_factory(AttachmentBlob)
+    orphan = publish_blob(spool_upload(io.BytesIO(b"orphan"), max_size=10))
+    shared = publish_blob(spool_upload(io.BytesIO(b"shared"), max_size=10))
+    async with factory() as db:
+        db.add(AttachmentBlob(sha256=hashlib.sha256(b"shared").hexdigest(), file_size=6, ref_count=1))
+        await db.commit()
+
+        await release_unpublished_blob(db, hashlib.sha256(b"orphan").hexdigest(), 6)
+        await release_unpublished_blob(db, hashlib.sha256(b"shared").hexdigest(), 6)
+
+        blobs = (await db.execute(select(AttachmentBlob.sha256, AttachmentBlob.ref_count))).all()
+
+    # Another attachment still uses the shared blob
+    assert [tuple(blob) for blob in blobs] == [(hashlib.sha256(b"shared").hexdigest(), 1)]
+    assert not orphan.exists() and shared.exists()
@@ -0,0 +1,117 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+from sqlalchemy import select
+
+from app.api.v1.external_api import ORGANIZATION_IMPORT
+from app.db.models import Contractor, Organization
+from app.services.bulk_upsert import (
+    BulkImportSpec,
+    ImportPayloadError,
+    bulk_upsert,
+    decode_import_body,
+    to_str,
+)
+
+CONTRACTORS = BulkImportSpec(
+    model=Contractor,
+    fields={"name": to_str, "inn": to_str, "kpp": to_str},
+    required=("name",),
+    match_on=(("inn",),),
+)
+
+
+@pytest.fixture
+def session(make_db_session):
+    return make_db_session(Contractor)
+
+
+def _decode(body: bytes, content_type: str, content_encoding: str = None):
+    async def chunks():
+        for start in range(0, len(body), 7):
+            yield body[start:start + 7]
+
+    return asyncio.run(decode_import_body(chunks(), content_type, content_encoding))
+
+
+def test_upsert_by_natural_key_with_per_row_errors(session):
+    session.add(Contractor(name="Old", inn="111", department_id=1))
+    session.commit()
+
+    result = bulk_upsert(
+        session,
+        CONTRACTORS,
+        [
+            {"name": "Renamed", "inn": "111"},
+            {"name": "New", "inn": "222"},
+            {"inn": "333"},
+            {"name": "X", "unknown": 1},
+        ],
+        department_id=1,
+        insert_values={"department_id": 1},
+    )
+    session.commit()
+
+    assert (result.created_count, result.updated_count) == (1, 1)
+    assert [error["index"] for error in result.errors] == [2, 3]
+    rows = session.execute(select(Contractor.name, Contractor.inn).order_by(Contractor.inn)).all()
+    assert [tuple(row) for row in rows] == [("Renamed", "111"), ("New", "222")]
+
+
+def test_natural_key_lookup_is_scoped_to_department(session):
+    session.add(Contractor(name="Other dept", inn="111", department_id=2))
+    session.commit()
+
+    result = bulk_upsert(
+        session, CONTRACTORS, [{"name": "Mine", "inn": "111"}],
+        department_id=1, insert_values={"department_id": 1},
+    )
+
+    assert (result.created_count, result.updated_count) == (1, 0)
+
+
+def test_organization_name_conflicts_are_row_errors(make_db_session):
+    session = make_db_session(Organization)
+    session.add_all([
+        Organization(id=1, name="Alpha", inn="111"),
+        Organization(id=2, name="Beta", inn="222"),
+        Organization(id=3, name="Gamma"),
+    ])
+    session.commit()
+
+    result = bulk_upsert(
+        session,
+        ORGANIZATION_IMPORT,
+        [
+            {"name": "Beta", "inn": "999"},  # new INN, name of another organization
+            {"name": "Beta", "inn": "111"},  # rename onto an existing name
+            {"name": "Gamma", "inn": "333"},  # name match without INN: fills it in
+            {"name": "Delta", "inn": "444"},
+            {"name": "Delta", "inn": "555"},  # two new organizations with one name
+        ],
+        department_id=1,
+    )
+    session.commit()
+
+    assert (result.created_count, result.updated_count) == (1, 1)
+    assert [(error["index"], error["error"]) for error in result.errors] == [
+        (0, "name: belongs to record id=2 with a different inn"),
+        (1, "name: already used by record id=2"),
+        (4, "name: already used by another row of the payload"),
+    ]
+    rows = session.execute(select(Organization.name, Organization.inn).order_by(Organization.id)).all()
+    assert [tuple(row) for row in rows] == [("Alpha", "111"), ("Beta", "222"), ("Gamma", "333"), ("Delta", "444")]
+
+
+def test_decode_gzip_ndjson_body():
+    rows = [{"name": f"C{i}", "inn": str(i)} for i in range(50)]
+    body = gzip.compress("\n".join(json.dumps(row) for row in rows).encode())
+
+    assert _decode(body, "application/x-ndjson", "gzip") == rows
+
+
+def test_decode_rejects_non_array_json():
+    with pytest.raises(ImportPayloadError):
+        _decode(b'{"name": "x"}', "application/json")
@@ -0,0 +1,73 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app.db.models import ChangeLogEntry, Employee
+from app.services.change_feed import (
+    START_CURSOR,
+    InvalidCursorError,
+    _collapse,
+    _load_rows,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor((987654321, 42))
+
+    assert decode_cursor(cursor) == (987654321, 42)
+    assert "=" not in cursor
+
+
+def test_missing_cursor_starts_from_beginning():
+    assert decode_cursor(None) == START_CURSOR
+    assert decode_cursor("") == START_CURSOR
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "!!!", encode_cursor((1, 2))[:-2]])
+def test_invalid_cursor_rejected(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+
+
+def test_collapse_keeps_latest_entry_per_row_in_feed_order():
+    entries = [
+        ChangeLogEntry(id=1, entity="expenses", entity_id=10, operation="upsert"),
+        ChangeLogEntry(id=2, entity="employees", entity_id=10, operation="upsert"),
+        ChangeLogEntry(id=3, entity="expenses", entity_id=10, operation="delete"),
+    ]
+
+    collapsed = _collapse(entries)
+
+    assert [(e.entity, e.entity_id, e.operation) for e in collapsed] == [
+        ("employees", 10, "upsert"),
+        ("expenses", 10, "delete"),
+    ]
+
+
+async def test_rows_of_another_department_are_not_loaded(make_async_session_factory):
+    session_factory = await make_async_session_factory(Employee)
+    async with session_factory() as db:
+        for employee_id, department_id in ((1, 1), (2, 2)):
+            db.add(Employee(
+                id=employee_id, full_name=f"Сотрудник {employee_id}", position="Инженер",
+                base_salary=Decimal(100000), department_id=department_id,
+            ))
+        await db.commit()
+
+        sources = {
+            "employees": (
+                select(Employee.id, Employee.full_name), Employee.id, Employee.department_id,
+                lambda row: {"id": row.id, "full_name": row.full_name},
+            ),
+        }
+        entries = [
+            ChangeLogEntry(id=1, entity="employees", entity_id=1, operation="upsert"),
+            ChangeLogEntry(id=2, entity="employees", entity_id=2, operation="upsert"),
+        ]
+
+        # Employee 2 was moved to department 2: department 1 sees it as deleted
+        assert set(await _load_rows(db, entries, sources, department_id=1)) == {("employees", 1)}
+        assert set(await _load_rows(db, entries, sources)) == {("employees", 1), ("employees", 2)}
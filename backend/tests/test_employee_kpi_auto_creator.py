@@ -0,0 +1,66 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.db.models import (
+    Employee,
+    EmployeeKPI,
+    EmployeeKPIGoal,
+    EmployeeStatusEnum,
+    KPIGoal,
+    KPIGoalStatusEnum,
+)
+from app.services.employee_kpi_auto_creator import EmployeeKPIAutoCreator
+
+
+@pytest.fixture
+def session(make_db_session):
+    db = make_db_session(Employee, KPIGoal, EmployeeKPI, EmployeeKPIGoal)
+    for employee_id, department_id, status in [
+        (1, 1, EmployeeStatusEnum.ACTIVE),
+        (2, 1, EmployeeStatusEnum.ACTIVE),
+        (3, 1, EmployeeStatusEnum.FIRED),
+        (4, 2, EmployeeStatusEnum.ACTIVE),
+    ]:
+        db.add(Employee(
+            id=employee_id, full_name=f"Employee {employee_id}", position="Dev", hire_date=date(2024, 1, 1),
+            base_salary=Decimal("100000"), department_id=department_id, status=status,
+        ))
+    for goal_id, status in [(1, KPIGoalStatusEnum.ACTIVE), (2, KPIGoalStatusEnum.ACTIVE), (3, KPIGoalStatusEnum.CANCELLED)]:
+        db.add(KPIGoal(id=goal_id, name=f"Goal {goal_id}", year=2025, department_id=1, status=status))
+    db.commit()
+    return db
+
+
+def test_rollover_copies_previous_goals_and_falls_back_to_department_goals(session):
+    previous = EmployeeKPI(employee_id=1, department_id=1, year=2024, month=12)
+    session.add(previous)
+    session.flush()
+    for goal_id in (1, 3):
+        session.add(EmployeeKPIGoal(
+            employee_id=1, goal_id=goal_id, employee_kpi_id=previous.id, year=2024, month=12,
+            target_value=Decimal("50"), weight=Decimal("70"), actual_value=Decimal("45"),
+        ))
+    session.add(EmployeeKPI(employee_id=4, department_id=2, year=2025, month=1))
+    session.commit()
+
+    result = EmployeeKPIAutoCreator(session).create_monthly_kpis(2025, 1)
+
+    assert (result["total_employees"], result["created"], result["skipped"]) == (3, 2, 1)
+    assert (result["goals_copied"], result["goals_default"]) == (1, 2)
+    report = {row["employee_id"]: (row["status"], row["goals"], row["goals_source"]) for row in result["employees"]}
+    assert report == {
+        1: ("created", 1, "previous_month"),
+        2: ("created", 2, "department_defaults"),
+        4: ("skipped", 0, None),
+    }
+
+    copied = session.query(EmployeeKPIGoal).filter(EmployeeKPIGoal.year == 2025, EmployeeKPIGoal.employee_id == 1).one()
+    assert (copied.goal_id, copied.target_value, copied.weight, copied.actual_value) == (1, Decimal("50"), Decimal("70"), 0)
+    defaults = session.query(EmployeeKPIGoal).filter(EmployeeKPIGoal.employee_id == 2).all()
+    assert sorted(goal.goal_id for goal in defaults) == [1, 2]
+    assert {goal.weight for goal in defaults} == {Decimal("50")}
+
+    rerun = EmployeeKPIAutoCreator(session).create_monthly_kpis(2025, 1)
+    assert (rerun["created"], rerun["skipped"]) == (0, 3)
@@ -0,0 +1,88 @@
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import httpx
+import pytest
+
+from app.api.v1.external_api import EXPENSE_EXPORT_FIELDS, verify_api_token_dependency
+from app.db.models import APIToken, Expense, ExpenseStatusEnum
+from app.main import app
+from app.services import export_stream
+from app.services.export_stream import accepts_gzip
+
+
+@pytest.fixture
+async def client(make_async_session_factory, monkeypatch):
+    factory = await make_async_session_factory(Expense)
+    async with factory() as db:
+        # Inserted out of id order; id 4 belongs to another department
+        for expense_id, department_id in ((5, 1), (2, 1), (4, 2), (1, 1), (6, 1), (3, 1)):
+            db.add(Expense(
+                id=expense_id, number=str(expense_id), department_id=department_id, organization_id=1,
+                amount=Decimal(expense_id * 100), request_date=datetime(2025, expense_id, 1),
+                status=ExpenseStatusEnum.PAID, comment=f"Заявка {expense_id}",
+            ))
+        await db.commit()
+
+    monkeypatch.setattr(export_stream, "AsyncSessionLocal", factory)
+    # Small batches so pages and encoder chunks cross batch boundaries
+    monkeypatch.setattr(export_stream, "EXPORT_BATCH_SIZE", 2)
+    token = APIToken(id=1, name="export", department_id=1, scopes=["READ"])
+    app.dependency_overrides[verify_api_token_dependency] = lambda: token
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://test") as http_client:
+            yield http_client
+    finally:
+        app.dependency_overrides.clear()
+
+
+async def test_json_pages_follow_id_order(client):
+    pages = []
+    after_id = None
+    while True:
+        params = {"limit": 2} if after_id is None else {"limit": 2, "after_id": after_id}
+        response = await client.get("/api/v1/external/export/expenses", params=params)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        if not page["count"]:
+            break
+        pages.append([row["id"] for row in page["data"]])
+        after_id = page["next_after_id"]
+
+    assert pages == [[1, 2], [3, 5], [6]]
+    assert page == {"data": [], "count": 0, "next_after_id": None}
+
+
+async def test_csv_and_ndjson_stream_every_row(client):
+    response = await client.get("/api/v1/external/export/expenses", params={"format": "csv", "after_id": 1})
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["id"] for row in rows] == ["2", "3", "5", "6"]
+    assert rows[0]["description"] == "Заявка 2" and rows[0]["status"] == "PAID"
+
+    response = await client.get("/api/v1/external/export/expenses", params={"format": "ndjson", "year": 2025, "month": 3})
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [3]
+
+    # An empty page is a header-only CSV
+    response = await client.get("/api/v1/external/export/expenses", params={"format": "csv", "after_id": 6})
+    assert response.text.splitlines() == [",".join(EXPENSE_EXPORT_FIELDS)]
+
+
+async def test_gzip_is_negotiated(client):
+    plain = await client.get("/api/v1/external/export/expenses", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+
+    compressed = await client.get("/api/v1/external/export/expenses", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.json() == plain.json()
+
+
+def test_accepts_gzip():
+    assert accepts_gzip("gzip, deflate, br")
+    assert accepts_gzip("*")
+    assert not accepts_gzip(None)
+    assert not accepts_gzip("br")
+    assert not accepts_gzip("gzip;q=0, deflate")
@@ -0,0 +1,105 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from app.db.models import (
+    BudgetCategory,
+    Expense,
+    ExpenseStatusEnum,
+    ExpenseTypeEnum,
+    ForecastExpense,
+    Organization,
+    PayrollPlan,
+)
+from app.services.forecast_generator import ForecastGenerator
+
+
+def _expense(number, department_id, category_id, amount, request_date, contractor_id=None, comment=None,
+             status=ExpenseStatusEnum.PAID):
+    return Expense(
+        number=number, department_id=department_id, category_id=category_id, contractor_id=contractor_id,
+        organization_id=1, amount=Decimal(amount), request_date=request_date, status=status, comment=comment,
+    )
+
+
+@pytest.fixture
+def session(make_db_session):
+    db = make_db_session(BudgetCategory, Organization, Expense, ForecastExpense, PayrollPlan)
+    db.add(Organization(id=1, name="ООО Ромашка"))
+    for department_id in (1, 2):
+        db.add(BudgetCategory(
+            id=department_id * 10, name="Хостинг", type=ExpenseTypeEnum.OPEX, department_id=department_id,
+        ))
+        db.add(BudgetCategory(
+            id=department_id * 10 + 1, name="Канцелярия", type=ExpenseTypeEnum.OPEX, department_id=department_id,
+        ))
+    db.add(BudgetCategory(id=12, name="ФОТ", type=ExpenseTypeEnum.OPEX, department_id=1))
+
+    # Department 1: hosting paid on the 5th of every month, the latest comment is blank
+    db.add(_expense("1", 1, 10, 10000, datetime(2024, 10, 5), contractor_id=7, comment="Старый"))
+    db.add(_expense("2", 1, 10, 11000, datetime(2024, 11, 5), contractor_id=7, comment="Хостинг за ноябрь"))
+    db.add(_expense("3", 1, 10, 12000, datetime(2024, 12, 5), contractor_id=7, comment="  "))
+    # Two office supply purchases without a comment: a category average only
+    db.add(_expense("4", 1, 11, 3000, datetime(2024, 8, 20)))
+    db.add(_expense("5", 1, 11, 5000, datetime(2024, 12, 20)))
+    # Drafts and older history are ignored
+    db.add(_expense("6", 1, 11, 99000, datetime(2024, 12, 21), status=ExpenseStatusEnum.DRAFT))
+    db.add(_expense("7", 1, 11, 99000, datetime(2024, 1, 10)))
+    # Department 2: a single expense is not enough for any forecast
+    db.add(_expense("8", 2, 20, 1000, datetime(2024, 12, 1), contractor_id=7))
+
+    db.add(PayrollPlan(
+        employee_id=1, department_id=1, year=2025, month=1, base_salary=Decimal(100000),
+        total_planned=Decimal(100000),
+    ))
+    db.commit()
+    return db
+
+
+def _forecasts(db, department_id):
+    return db.query(ForecastExpense).filter_by(department_id=department_id).order_by(
+        ForecastExpense.forecast_date, ForecastExpense.category_id, ForecastExpense.amount,
+    ).all()
+
+
+def test_generates_regular_average_and_payroll_forecasts(session):
+    created = ForecastGenerator(session).generate([1, 2], [(2025, 1)])
+
+    assert created == {(1, 2025, 1): 5, (2, 2025, 1): 0}
+    rows = [(f.forecast_date, f.category_id, f.amount, f.is_regular, f.comment) for f in _forecasts(session, 1)]
+    assert rows == [
+        # 5 January 2025 is a Sunday: moved to Friday
+        (date(2025, 1, 3), 10, Decimal(11000), True, "Хостинг за ноябрь"),
+        (date(2025, 1, 10), 12, Decimal(40000), True, "Аванс сотрудникам"),
+        (date(2025, 1, 20), 11, Decimal(4000), False, "Канцелярия"),
+        (date(2025, 1, 24), 12, Decimal(13000), True, "НДФЛ с заработной платы"),
+        (date(2025, 1, 24), 12, Decimal(47000), True, "Оклад и премии сотрудникам"),
+    ]
+    assert _forecasts(session, 1)[0].contractor_id == 7
+
+
+def test_regenerating_replaces_only_requested_months(session):
+    generator = ForecastGenerator(session)
+    # Periods out of order and repeated are generated once each
+    generator.generate([1], [(2025, 2), (2025, 1), (2025, 2)])
+    session.commit()
+    february = [f.id for f in _forecasts(session, 1) if f.forecast_date.month == 2]
+
+    created = generator.generate([1], [(2025, 1)], include_payroll=False)
+    session.commit()
+
+    assert created == {(1, 2025, 1): 2}
+    remaining = _forecasts(session, 1)
+    assert [f.id for f in remaining if f.forecast_date.month == 2] == february
+    assert len([f for f in remaining if f.forecast_date.month == 1]) == 2
+
+
+def test_empty_input_writes_nothing(session):
+    generator = ForecastGenerator(session)
+
+    assert generator.generate([], [(2025, 1)]) == {}
+    assert generator.generate([1], []) == {}
+    # Nothing in the lookback window
+    assert generator.generate([1, 2], [(2020, 1)]) == {(1, 2020, 1): 0, (2, 2020, 1): 0}
+    assert session.query(ForecastExpense).count() == 0
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+
+from app.db.models import BudgetCategory, Contractor, Department, Expense, Organization
+from app.services.ftp_import_service import FTPImportService
+
+
+@pytest.fixture
+def session(make_db_session):
+    db = make_db_session(Department, Organization, BudgetCategory, Contractor, Expense)
+    db.add(Department(id=1, name="Общий", code="GEN", is_active=True))
+    db.add(Organization(id=1, name="ООО Ромашка"))
+    db.commit()
+    return db
+
+
+def _row(number, amount):
+    return {
+        "number": number,
+        "amount": amount,
+        "request_date": datetime(2025, 3, 1),
+        "status": "Оплачена",
+        "contractor_name": "Поставщик",
+    }
+
+
+def test_bad_rows_are_skipped_without_rolling_back_the_file(session):
+    service = FTPImportService("localhost", "user", "password")
+    rows = [_row(f"EXP-{i}", 1000 + i) for i in range(7)]
+    rows[2]["amount"] = "not a number"
+    rows[5]["amount"] = "1,5"
+
+    created, updated, skipped = service.import_expenses_bulk(session, rows, chunk_size=3)
+
+    assert (created, updated, skipped) == (5, 0, 2)
+    numbers = sorted(number for (number,) in session.query(Expense.number).all())
+    assert numbers == ["EXP-0", "EXP-1", "EXP-3", "EXP-4", "EXP-6"]
+    assert session.query(Contractor).count() == 1
+
+    # Updates of existing rows are isolated the same way
+    rows = [_row("EXP-0", 5000), _row("EXP-1", "bad"), _row("EXP-7", 7000)]
+    assert service.import_expenses_bulk(session, rows, chunk_size=3) == (1, 1, 1)
+    amounts = dict(session.query(Expense.number, Expense.amount).all())
+    assert (amounts["EXP-0"], amounts["EXP-1"], amounts["EXP-7"]) == (5000, 1001, 7000)
@@ -0,0 +1,122 @@
+import re
+import warnings
+from datetime import datetime
+from decimal import Decimal
+
+import pandas as pd
+
+from app.services.ftp_import_service import FTP_COLUMN_MAPPING, FTP_STATUS_MAPPING, FTPImportService
+
+
+def _row_wise_normalize(df):
+    """The row-by-row normalize_expense_data the column-wise version replaced (reference)"""
+    expenses = []
+    for _, row in df.iterrows():
+        try:
+            expense = {}
+            for excel_col, db_col in FTP_COLUMN_MAPPING.items():
+                if excel_col in row:
+                    value = row[excel_col]
+                    expense[db_col] = None if pd.isna(value) else value
+
+            if expense.get('number'):
+                match = re.search(r'([А-ЯA-Z0-9]{2,4}0В-\d{6})', expense['number'])
+                if not match:
+                    continue
+                expense['number'] = match.group(1)
+            if not expense.get('number'):
+                continue
+
+            if expense.get('status') and expense['status'] in FTP_STATUS_MAPPING:
+                expense['status'] = FTP_STATUS_MAPPING[expense['status']]
+            else:
+                expense['status'] = 'PENDING'
+
+            for column in ('request_date', 'payment_date'):
+                if expense.get(column):
+                    if isinstance(expense[column], str):
+                        expense[column] = pd.to_datetime(expense[column], format='%d.%m.%Y', errors='coerce')
+                        if pd.notna(expense[column]):
+                            dt = expense[column].to_pydatetime()
+                            expense[column] = dt.replace(hour=12, minute=0, second=0, microsecond=0)
+                    elif isinstance(expense[column], pd.Timestamp):
+                        dt = expense[column].to_pydatetime()
+                        expense[column] = dt.replace(hour=12, minute=0, second=0, microsecond=0)
+
+            if expense.get('amount') is not None and expense.get('amount') != '':
+                try:
+                    expense['amount'] = Decimal(str(expense['amount']))
+                    if expense['amount'] <= 0:
+                        continue
+                except (ValueError, TypeError):
+                    continue
+            else:
+                continue
+
+            expenses.append(expense)
+        except Exception:
+            continue
+    return expenses
+
+
+def _typed(expenses):
+    return [{key: (type(value), value) for key, value in expense.items()} for expense in expenses]
+
+
+def _excel_frame():
+    number = "Заявка на расходование ДС {} от 21.07.2025 15:28:39".format
+    return pd.DataFrame({
+        'Заявка на расходование денежных средств': [
+            number("ВГ0В-000001"), number("ВГ0В-000002"), number("ВГ0В-000003"), number("ВГ0В-000004"),
+            "Без номера", None, number("ВГ0В-000007"), number("ВГ0В-000008"), number("ВГ0В-000009"),
+        ],
+        'Желательная дата платежа': [
+            "21.07.2025", None, "01.12.2024", "05.01.2025", "05.01.2025", "05.01.2025", None, "31.12.2025", None,
+        ],
+        'Дата оплаты': pd.to_datetime([
+            "2025-07-22 15:30", None, "2024-12-03 00:00", None, None, None, "2025-02-01 09:00", None, None,
+        ]),
+        'Получатель': ["ООО Поставщик", None, "ИП Иванов", "ООО Поставщик", None, None, "АО Связь", None, None],
+        'Подразделение': ["IT", "IT", None, "Финансы", "IT", "IT", "IT", None, "IT"],
+        'Сумма документа': [1500.5, 200.0, "3000", 0.0, 10.0, 10.0, "abc", -5.0, None],
+        'Статус': ["Оплачена", "К оплате", None, "Черновик", "Оплачена", None, "Неизвестный", "Закрыта", "Оплачено"],
+        'Комментарий': ["Сервер", None, "Лицензии", None, None, None, "Связь", None, None],
+        'Лишняя колонка': range(9),
+    })
+
+
+def test_column_wise_normalization_matches_row_wise_output():
+    service = FTPImportService("localhost", "user", "password")
+    frame = _excel_frame()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", FutureWarning)
+        expenses = service.normalize_expense_data(frame)
+
+    assert _typed(expenses) == _typed(_row_wise_normalize(frame))
+    assert [expense['number'] for expense in expenses] == ["ВГ0В-000001", "ВГ0В-000002", "ВГ0В-000003"]
+    assert expenses[0]['payment_date'] == datetime(2025, 7, 22, 12, 0)
+
+
+def test_empty_and_numberless_frames():
+    service = FTPImportService("localhost", "user", "password")
+
+    assert service.normalize_expense_data(_excel_frame().iloc[0:0]) == []
+    assert service.normalize_expense_data(pd.DataFrame({'Статус': ["Оплачена"]})) == []
+
+
+def test_intended_differences_from_row_wise_output():
+    service = FTPImportService("localhost", "user", "password")
+    frame = pd.DataFrame({
+        'Заявка на расходование денежных средств': ["ДС ВГ0В-000001 от 21.07.2025"],
+        'Желательная дата платежа': ["завтра"],
+        'Подразделение': ["  IT  "],
+        'Сумма документа': [100.0],
+    })
+
+    [expense] = service.normalize_expense_data(frame)
+    [reference] = _row_wise_normalize(frame)
+
+    # Unparseable dates become None (not NaT), subdivision names are stripped
+    assert reference['request_date'] is pd.NaT and expense['request_date'] is None
+    assert (reference['subdivision_name'], expense['subdivision_name']) == ("  IT  ", "IT")
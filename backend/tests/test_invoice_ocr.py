@@ -0,0 +1,82 @@
+import os
+import time
+import types
+
+import pytest
+
+from app.services import invoice_ocr
+from app.services.invoice_ocr import InvoiceOCRService
+
+
+def _render_page(pdf_path, dpi, first_page, last_page):
+    # The first page is the slowest: results must still come back in page order
+    if first_page == 1:
+        time.sleep(0.3)
+    return [f"image-{page}" for page in range(first_page, last_page + 1)]
+
+
+def _recognize(image, config):
+    return f"{image}@{os.getpid()}"
+
+
+@pytest.fixture
+def ocr(monkeypatch):
+    # Worker processes are forked after the patches, so they see them too
+    invoice_ocr.shutdown_ocr_executor()
+    monkeypatch.setattr(invoice_ocr.settings, "OCR_MAX_WORKERS", 2)
+    monkeypatch.setattr(invoice_ocr, "convert_from_path", _render_page)
+    monkeypatch.setattr(invoice_ocr, "pytesseract", types.SimpleNamespace(image_to_string=_recognize))
+    yield InvoiceOCRService()
+    invoice_ocr.shutdown_ocr_executor()
+
+
+def test_pdf_pages_are_recognized_in_worker_processes_in_page_order(ocr, tmp_path):
+    pdf_path = tmp_path / "invoice.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4")
+
+    text, page_timings = ocr._ocr_pdf_pages(pdf_path, page_count=3)
+
+    pages = [line.split("@") for line in text.split("\n\n") if line]
+    assert [image for image, _ in pages] == ["image-1", "image-2", "image-3"]
+    assert str(os.getpid()) not in {pid for _, pid in pages}
+    assert [timing["page"] for timing in page_timings] == [1, 2, 3]
+    assert all("text" not in timing for timing in page_timings)
+
+
+def test_single_and_empty_pdf_stay_in_process(ocr, tmp_path):
+    pdf_path = tmp_path / "invoice.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4")
+
+    assert ocr._ocr_pdf_pages(pdf_path, page_count=0) == ("", [])
+    text, page_timings = ocr._ocr_pdf_pages(pdf_path, page_count=1)
+    assert text == f"image-1@{os.getpid()}\n\n"
+    assert [timing["page"] for timing in page_timings] == [1]
+    assert invoice_ocr._executor is None
+
+
+def test_each_call_returns_its_own_timings_and_hashes_once(ocr, tmp_path, monkeypatch):
+    monkeypatch.setattr(invoice_ocr, "Image", types.SimpleNamespace(open=lambda path: path.name))
+    hashed = []
+    monkeypatch.setattr(invoice_ocr, "compute_file_sha256", lambda path: hashed.append(path) or "computed")
+    first_path = tmp_path / "scan.png"
+    first_path.write_bytes(b"png bytes")
+    second_path = tmp_path / "other.png"
+    second_path.write_bytes(b"other png bytes")
+
+    first = ocr.process_file_with_stats(first_path)
+    second = ocr.process_file_with_stats(second_path, file_sha256="known")
+
+    assert (first.text, first.file_sha256) == (f"scan.png@{os.getpid()}", "computed")
+    assert (second.text, second.file_sha256) == (f"other.png@{os.getpid()}", "known")
+    assert [len(first.page_timings), len(second.page_timings)] == [1, 1]
+    assert first.page_timings is not second.page_timings
+    # The hash passed in by the caller is not computed again
+    assert hashed == [first_path]
+
+
+def test_unsupported_format_is_rejected(ocr, tmp_path):
+    path = tmp_path / "invoice.docx"
+    path.write_bytes(b"doc")
+
+    with pytest.raises(ValueError):
+        ocr.process_file_with_stats(path)
@@ -0,0 +1,145 @@
+import io
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from app.api.v1 import invoice_processing
+from app.core.config import settings
+from app.db.models import InvoiceProcessingStatusEnum, ProcessedInvoice, User, UserRoleEnum
+from app.services.invoice_queue import (
+    claim_invoice,
+    get_batch_department,
+    get_batch_progress,
+    queued_pending_ids,
+    reset_stale_processing,
+)
+
+
+@pytest.fixture
+def session(make_db_session):
+    return make_db_session(ProcessedInvoice)
+
+
+def _invoice(invoice_id, status=InvoiceProcessingStatusEnum.PENDING, **fields):
+    return ProcessedInvoice(
+        id=invoice_id, department_id=1, uploaded_by=1, original_filename=f"{invoice_id}.pdf",
+        status=status, **fields,
+    )
+
+
+def test_only_queued_pending_invoices_are_requeued(session):
+    queued_at = datetime(2025, 1, 1)
+    session.add_all([
+        _invoice(1, queued_at=queued_at),
+        _invoice(2),
+        _invoice(3, InvoiceProcessingStatusEnum.PROCESSED, queued_at=queued_at),
+        _invoice(4, queued_at=queued_at),
+    ])
+    session.commit()
+
+    assert queued_pending_ids(session) == [1, 4]
+
+    # Every API worker re-enqueues on startup: only the first claim wins
+    assert claim_invoice(session, 1) is True
+    assert claim_invoice(session, 1) is False
+    assert queued_pending_ids(session) == [4]
+
+
+def test_stale_processing_invoices_are_requeued(session):
+    now = datetime.utcnow()
+    processing = InvoiceProcessingStatusEnum.PROCESSING
+    session.add_all([
+        _invoice(1, processing, processing_started_at=now - timedelta(hours=2)),
+        _invoice(2, processing, processing_started_at=now),
+        _invoice(3, processing),
+        _invoice(4, processing, processing_started_at=now - timedelta(hours=2), is_active=False),
+    ])
+    session.commit()
+
+    # Invoice 2 may still be in flight on another API worker
+    assert reset_stale_processing(session, timedelta(minutes=30)) == 2
+    assert queued_pending_ids(session) == [1, 3]
+
+    session.expire_all()
+    assert session.get(ProcessedInvoice, 1).processing_started_at is None
+    assert claim_invoice(session, 1) is True
+    session.expire_all()
+    assert session.get(ProcessedInvoice, 1).processing_started_at is not None
+
+
+class _Processor:
+    def __init__(self, db):
+        self.db = db
+
+    async def process_invoice(self, invoice_id):
+        assert self.db.get(ProcessedInvoice, invoice_id).status == InvoiceProcessingStatusEnum.PROCESSING
+        return {"success": True, "processing_time_sec": 0.1, "status": "PROCESSED"}
+
+
+def test_process_endpoint_claims_the_invoice(session, make_api_client, monkeypatch):
+    monkeypatch.setattr(invoice_processing, "InvoiceProcessorService", _Processor)
+    session.add_all([
+        _invoice(1, InvoiceProcessingStatusEnum.ERROR),
+        _invoice(2, InvoiceProcessingStatusEnum.PROCESSING),
+    ])
+    session.commit()
+    client = make_api_client(session, User(id=1, role=UserRoleEnum.ADMIN, department_id=1))
+
+    response = client.post("/api/v1/invoices/invoice-processing/process", json={"invoice_id": 1})
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "PROCESSED"
+
+    # Already taken by a queue worker or another request
+    response = client.post("/api/v1/invoices/invoice-processing/process", json={"invoice_id": 2})
+    assert response.status_code == 409, response.text
+
+
+def test_batch_progress_is_read_by_batch_id(session):
+    session.add_all([
+        _invoice(1, batch_id="a"),
+        _invoice(2, InvoiceProcessingStatusEnum.ERROR, batch_id="a"),
+        _invoice(3, batch_id="b"),
+    ])
+    session.commit()
+
+    progress = get_batch_progress(session, "a")
+
+    assert (progress["total"], progress["finished"], progress["is_complete"]) == (2, 1, False)
+    assert [item["invoice_id"] for item in progress["items"]] == [1, 2]
+    assert get_batch_department(session, "a") == 1
+    assert get_batch_department(session, "missing") is None
+
+
+def _zip_upload(names):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name in names:
+            archive.writestr(name, b"%PDF-1.4")
+    buffer.seek(0)
+    return UploadFile(buffer, filename="invoices.zip")
+
+
+def test_batch_limit_is_checked_before_extracting(monkeypatch):
+    monkeypatch.setattr(settings, "INVOICE_BATCH_MAX_FILES", 3)
+    written = []
+    monkeypatch.setattr(
+        invoice_processing, "_store_invoice_file",
+        lambda department_id, filename, source: written.append(filename) or filename,
+    )
+
+    with pytest.raises(invoice_processing.BatchTooLargeError) as error:
+        invoice_processing._store_batch_files(1, [
+            _zip_upload(["a.pdf", "b.pdf", "c.pdf", "readme.txt", "scans/"]),
+            UploadFile(io.BytesIO(b"%PDF-1.4"), filename="d.pdf"),
+        ])
+    assert error.value.count == 4
+    assert written == []
+
+    # Within the limit: unsupported entries do not count and are skipped
+    stored, skipped = invoice_processing._store_batch_files(1, [
+        _zip_upload(["a.pdf", "b.pdf", "c.pdf", "readme.txt"]),
+    ])
+    assert [name for name, _, _ in stored] == ["a.pdf", "b.pdf", "c.pdf"]
+    assert skipped == ["readme.txt"]
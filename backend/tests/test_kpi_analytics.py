@@ -0,0 +1,108 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.db.models import (
+    Department,
+    Employee,
+    EmployeeKPI,
+    EmployeeKPIGoal,
+    EmployeeKPIStatusEnum,
+    KPIGoal,
+    KPIGoalStatusEnum,
+)
+from app.services import kpi_analytics
+from app.services.cache import cache_service
+from app.services.kpi_analytics import invalidate_kpi_analytics_cache, load_kpi_analytics
+
+
+@pytest.fixture
+def session(make_db_session):
+    db = make_db_session(Department, Employee, KPIGoal, EmployeeKPI, EmployeeKPIGoal)
+    db.add_all([
+        Department(id=1, name="Sales", code="S"),
+        Department(id=2, name="IT", code="IT"),
+        KPIGoal(id=1, name="Revenue", year=2025, department_id=1, status=KPIGoalStatusEnum.ACTIVE),
+        KPIGoal(id=2, name="Unassigned", year=2025, department_id=1, status=KPIGoalStatusEnum.DRAFT),
+    ])
+    for employee_id, department_id in [(1, 1), (2, 1), (3, 2)]:
+        db.add(Employee(
+            id=employee_id, full_name=f"Employee {employee_id}", position="Dev", hire_date=date(2024, 1, 1),
+            base_salary=Decimal(1000), department_id=department_id,
+        ))
+    for kpi_id, employee_id, department_id, month, kpi, kpi_status in [
+        (1, 1, 1, 1, Decimal(80), EmployeeKPIStatusEnum.APPROVED),
+        (2, 2, 1, 1, Decimal(100), EmployeeKPIStatusEnum.DRAFT),
+        (3, 1, 1, 2, None, EmployeeKPIStatusEnum.DRAFT),
+        (4, 3, 2, 1, Decimal(50), EmployeeKPIStatusEnum.APPROVED),
+    ]:
+        db.add(EmployeeKPI(
+            id=kpi_id, employee_id=employee_id, department_id=department_id, year=2025, month=month,
+            kpi_percentage=kpi, status=kpi_status, monthly_bonus_calculated=Decimal(100),
+            quarterly_bonus_calculated=Decimal(10),
+        ))
+    # Three goals on one KPI must not multiply its bonus in the department summary
+    for assignment_id, goal_status in [(1, KPIGoalStatusEnum.ACHIEVED), (2, KPIGoalStatusEnum.ACTIVE),
+                                       (3, KPIGoalStatusEnum.ACHIEVED)]:
+        db.add(EmployeeKPIGoal(
+            id=assignment_id, employee_id=1, goal_id=1, employee_kpi_id=1, year=2025, month=1,
+            weight=Decimal(10), achievement_percentage=Decimal(90), status=goal_status,
+        ))
+    db.commit()
+    invalidate_kpi_analytics_cache()
+    yield db
+    invalidate_kpi_analytics_cache()
+
+
+def test_endpoint_aggregates_from_one_fact_set(session):
+    analytics = load_kpi_analytics(session, 2025)
+
+    departments = {row["department_id"]: row for row in kpi_analytics.department_summary(analytics, month=1)}
+    assert departments[1]["total_bonus_calculated"] == Decimal(220)
+    assert departments[1]["avg_kpi_percentage"] == Decimal(90)
+    assert (departments[1]["goals_count"], departments[1]["goals_achieved"]) == (3, 2)
+    assert departments[2]["department_name"] == "IT"
+
+    trends = kpi_analytics.kpi_trends(analytics)
+    assert [(row["month"], row["avg_kpi"], row["employee_count"]) for row in trends] == [
+        (1, pytest.approx(230 / 3), 3), (2, 0.0, 1),
+    ]
+
+    goals = {row["goal_id"]: row for row in kpi_analytics.goal_progress(analytics, month=1)}
+    assert (goals[1]["employees_assigned"], goals[1]["employees_achieved"]) == (1, 2)
+    assert goals[2]["employees_assigned"] == 0
+
+    dashboard = kpi_analytics.dashboard(analytics)
+    assert dashboard["overview"]["total_kpis"] == 4
+    assert (dashboard["overview"]["total_goals"], dashboard["overview"]["active_goals"]) == (2, 1)
+    assert dashboard["status_distribution"] == {"DRAFT": 2, "UNDER_REVIEW": 0, "APPROVED": 2, "REJECTED": 0}
+    assert [row["employee_id"] for row in dashboard["top_employees"]] == [1, 3]
+
+
+def test_goal_counts_are_read_for_the_requested_year(session):
+    session.add(EmployeeKPIGoal(
+        id=4, employee_id=1, goal_id=1, employee_kpi_id=1, year=2024, month=1,
+        weight=Decimal(10), status=KPIGoalStatusEnum.ACHIEVED,
+    ))
+    session.commit()
+
+    analytics = load_kpi_analytics(session, 2025)
+
+    departments = {row["department_id"]: row for row in kpi_analytics.department_summary(analytics, month=1)}
+    assert (departments[1]["goals_count"], departments[1]["goals_achieved"]) == (3, 2)
+
+
+def test_fact_set_is_cached_per_department_until_invalidated(session):
+    sales = load_kpi_analytics(session, 2025, department_id=1)
+    assert {fact.employee_id for fact in sales.facts} == {1, 2}
+
+    session.get(EmployeeKPI, 2).kpi_percentage = Decimal(60)
+    session.commit()
+    if cache_service.is_enabled:
+        cached = load_kpi_analytics(session, 2025, department_id=1)
+        assert cached.facts == sales.facts
+
+    invalidate_kpi_analytics_cache()
+    summary = kpi_analytics.employee_summary(load_kpi_analytics(session, 2025, department_id=1), month=1)
+    assert {row["employee_id"]: row["kpi_percentage"] for row in summary} == {1: Decimal(80), 2: Decimal(60)}
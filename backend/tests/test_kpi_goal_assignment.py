@@ -0,0 +1,69 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.db.models import (
+    Employee,
+    EmployeeKPI,
+    EmployeeKPIGoal,
+    KPIGoal,
+    KPIGoalTemplate,
+    KPIGoalTemplateItem,
+    User,
+    UserRoleEnum,
+)
+from app.services.kpi_goal_assignment import GoalAssignment, assign_goals
+
+
+@pytest.fixture
+def session(make_db_session):
+    db = make_db_session(Employee, KPIGoal, EmployeeKPI, EmployeeKPIGoal, KPIGoalTemplate, KPIGoalTemplateItem)
+    for employee_id in (1, 2, 3):
+        db.add(Employee(
+            id=employee_id, full_name=f"Employee {employee_id}", position="Dev", hire_date=date(2024, 1, 1),
+            base_salary=Decimal("100000"), department_id=1,
+        ))
+    for goal_id in (1, 2):
+        db.add(KPIGoal(id=goal_id, name=f"Goal {goal_id}", year=2025, department_id=1))
+    db.add(EmployeeKPIGoal(id=50, employee_id=2, goal_id=1, year=2025, month=3))
+    db.add(EmployeeKPIGoal(id=51, employee_id=3, goal_id=1, year=2025, month=2))
+    db.commit()
+    return db
+
+
+def test_assign_goals_creates_missing_pairs_and_reports_duplicates(session):
+    goals = [GoalAssignment(1, Decimal("60"), Decimal("10")), GoalAssignment(2, Decimal("40"))]
+
+    result = assign_goals(session, {1: None, 2: None, 3: None}, goals, 2025, 3, values={"notes": "bulk"})
+    session.commit()
+
+    assert sorted(result.created) == [(1, 1), (1, 2), (2, 2), (3, 1), (3, 2)]
+    assert result.skipped == {(2, 1): 50}
+    created = session.get(EmployeeKPIGoal, result.created[(1, 1)])
+    assert (created.weight, created.target_value, created.notes) == (Decimal("60"), Decimal("10"), "bulk")
+
+    rerun = assign_goals(session, {1: None, 2: None, 3: None}, goals, 2025, 3)
+    assert (len(rerun.created), len(rerun.skipped)) == (0, 6)
+    assert session.query(EmployeeKPIGoal).count() == 7
+
+
+def test_apply_template_endpoint_reports_skipped_goals(session, make_api_client):
+    session.add(KPIGoalTemplate(id=1, name="Sales", department_id=1))
+    session.add_all([
+        KPIGoalTemplateItem(template_id=1, goal_id=1, weight=Decimal("70")),
+        KPIGoalTemplateItem(template_id=1, goal_id=2, weight=Decimal("30"), default_target_value=Decimal("5")),
+    ])
+    session.commit()
+    client = make_api_client(session, User(id=1, role=UserRoleEnum.MANAGER, department_id=1))
+
+    response = client.post("/api/v1/kpi/templates/1/apply", json={"employee_ids": [1, 2], "year": 2025, "month": 3})
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["employees_updated"], body["goals_created"], body["goals_skipped"]) == (2, 3, 1)
+    assert body["skipped"] == [{"employee_id": 2, "goal_id": 1, "existing_goal_id": 50}]
+    created = session.query(EmployeeKPIGoal).filter(EmployeeKPIGoal.employee_kpi_id.isnot(None)).all()
+    assert {(goal.employee_id, goal.goal_id, goal.target_value) for goal in created} == {
+        (1, 1, None), (1, 2, Decimal("5")), (2, 2, Decimal("5")),
+    }
@@ -0,0 +1,69 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.db.models import Employee, EmployeeKPI, PayrollActual, PayrollPlan, PayrollTaxBreakdown, TaxRate
+from app.services.payroll_kpi_sync_service import PayrollKPISyncService
+
+
+@pytest.fixture
+def session(make_db_session):
+    db = make_db_session(Employee, EmployeeKPI, PayrollPlan, PayrollActual, TaxRate, PayrollTaxBreakdown)
+    for employee_id, salary in [(1, "100000"), (2, "50000"), (3, "70000")]:
+        db.add(Employee(
+            id=employee_id, full_name=f"Employee {employee_id}", position="Dev", hire_date=date(2024, 1, 1),
+            base_salary=Decimal(salary), department_id=1,
+        ))
+    for kpi_id, employee_id in [(1, 1), (2, 2), (3, 99)]:
+        db.add(EmployeeKPI(
+            id=kpi_id, employee_id=employee_id, department_id=1, year=2025, month=3,
+            monthly_bonus_calculated=Decimal("10000"), quarterly_bonus_calculated=Decimal("5000"),
+        ))
+    db.add(PayrollActual(
+        id=7, employee_id=2, department_id=1, year=2025, month=3,
+        base_salary_paid=Decimal("1"), total_paid=Decimal("1"), notes="manual",
+    ))
+    db.commit()
+    return db
+
+
+def test_department_sync_creates_updates_and_reports_missing_employees(session):
+    service = PayrollKPISyncService(session)
+
+    preview = service.get_department_sync_preview(1, 2025, 3)
+    assert (preview["total"], preview["will_create"], preview["will_update"], preview["errors"]) == (3, 1, 1, 1)
+    assert preview["total_paid"] == 180000.0
+
+    stats = service.sync_department_kpi_to_payroll(1, 2025, 3)
+    assert (stats["total"], stats["success"], stats["created"], stats["updated"], stats["errors"]) == (3, 2, 1, 1, 1)
+    assert stats["error_details"][0]["employee_kpi_id"] == 3
+
+    session.expire_all()
+    actuals = {row.employee_id: row for row in session.query(PayrollActual)}
+    assert set(actuals) == {1, 2}
+    assert actuals[1].total_paid == Decimal("115000")
+    assert actuals[1].income_tax_amount == Decimal("14950")
+    assert actuals[1].notes == "Синхронизировано из EmployeeKPI#1"
+    assert (actuals[2].id, actuals[2].total_paid, actuals[2].notes) == (7, Decimal("65000"), "manual")
+
+    rerun = service.sync_department_kpi_to_payroll(1, 2025, 3)
+    assert (rerun["created"], rerun["updated"]) == (0, 2)
+    assert session.query(PayrollActual).count() == 2
+
+
+def test_single_sync_keeps_result_shape_and_syncs_plan(session):
+    service = PayrollKPISyncService(session)
+
+    result = service.sync_employee_kpi_to_payroll(1, base_salary=Decimal("90000"))
+    assert result["action"] == "created"
+    assert (result["total_paid"], result["net_amount"]) == (105000.0, 91350.0)
+    assert session.get(PayrollActual, result["payroll_actual_id"]).base_salary_paid == Decimal("90000")
+
+    plan = service.sync_employee_kpi_to_payroll_plan(2)
+    assert (plan["action"], plan["employee_name"], plan["total_planned"]) == ("created", "Employee 2", 65000.0)
+
+    with pytest.raises(ValueError):
+        service.sync_employee_kpi_to_payroll(3)
+    with pytest.raises(ValueError):
+        service.get_sync_preview(404)
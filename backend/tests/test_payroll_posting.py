@@ -0,0 +1,101 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from app.db.models import (
+    BudgetCategory,
+    Employee,
+    EmployeeKPI,
+    Expense,
+    ExpenseTypeEnum,
+    Organization,
+    PayrollActual,
+    PayrollPlan,
+    User,
+    UserRoleEnum,
+)
+from app.services.payroll_posting import (
+    expense_comments_by_department,
+    insert_rows,
+    kpis_by_employee,
+    organizations_by_department,
+    registered_payments,
+)
+
+
+@pytest.fixture
+def session(make_db_session):
+    return make_db_session(EmployeeKPI, PayrollActual, Expense)
+
+
+@pytest.fixture
+def payroll_session(make_db_session):
+    db = make_db_session(BudgetCategory, Employee, EmployeeKPI, Expense, Organization, PayrollPlan)
+    db.add(BudgetCategory(id=7, name="Заработная плата", type=ExpenseTypeEnum.OPEX, department_id=1))
+    db.add_all([
+        Organization(id=1, name="Global"),
+        Organization(id=2, name="Second department", department_id=2),
+    ])
+    for employee_id, department_id in [(1, 1), (2, 1), (3, 2)]:
+        db.add(Employee(
+            id=employee_id, full_name=f"Employee {employee_id}", position="Dev", hire_date=date(2024, 1, 1),
+            base_salary=Decimal("100000"), department_id=department_id,
+        ))
+        db.add(PayrollPlan(
+            employee_id=employee_id, department_id=department_id, year=2025, month=3,
+            base_salary=Decimal("100000"), total_planned=Decimal("100000"),
+        ))
+    db.add(EmployeeKPI(
+        employee_id=1, department_id=1, year=2025, month=3, monthly_bonus_calculated=Decimal("20000"),
+    ))
+    db.commit()
+    return db
+
+
+def test_period_lookups_and_multi_row_insert(session):
+    insert_rows(session, PayrollActual, [
+        {"employee_id": employee_id, "department_id": 1, "year": 2025, "month": 3,
+         "base_salary_paid": Decimal("50"), "total_paid": Decimal("50"), "payment_date": payment_date}
+        for employee_id, payment_date in [(1, date(2025, 3, 10)), (2, None), (3, date(2025, 3, 25))]
+    ])
+    session.add_all([
+        EmployeeKPI(id=1, employee_id=1, department_id=1, year=2025, month=3),
+        EmployeeKPI(id=2, employee_id=1, department_id=1, year=2025, month=3),
+        EmployeeKPI(id=3, employee_id=2, department_id=1, year=2025, month=4),
+        Expense(number="1", department_id=1, organization_id=1, category_id=7, amount=1,
+                request_date=datetime(2025, 3, 1), comment="Заработная плата: Иванов"),
+        Expense(number="2", department_id=1, organization_id=1, category_id=7, amount=1,
+                request_date=datetime(2025, 4, 1), comment="Заработная плата: Петров"),
+    ])
+    session.commit()
+
+    keys = [(1, 2025, 3, date(2025, 3, 10)), (2, 2025, 3, None), (3, 2025, 3, date(2025, 3, 10))]
+    assert registered_payments(session, keys) == set(keys[:2])
+    assert session.query(PayrollActual).first().created_at is not None
+
+    kpis = kpis_by_employee(session, [1, 2], 2025, 3)
+    assert {employee_id: kpi.id for employee_id, kpi in kpis.items()} == {1: 1}
+
+    assert expense_comments_by_department(session, 7, 2025, 3) == {1: ["заработная плата: иванов"]}
+
+
+def test_generate_payroll_expenses_endpoint(payroll_session, make_api_client):
+    client = make_api_client(payroll_session, User(id=1, role=UserRoleEnum.ADMIN, username="admin"))
+    assert organizations_by_department(payroll_session, [1, 2]) == {1: 1, 2: 2}
+
+    response = client.post("/api/v1/payroll/generate-payroll-expenses", params={"year": 2025, "month": 3})
+
+    assert response.status_code == 200, response.text
+    assert response.json()["statistics"]["expenses_created"] == 3
+    expenses = payroll_session.query(Expense).order_by(Expense.number).all()
+    assert [(expense.number, expense.organization_id, expense.amount) for expense in expenses] == [
+        ("ЗП-202503-1", 1, Decimal("120000.00")),
+        ("ЗП-202503-2", 1, Decimal("100000.00")),
+        ("ЗП-202503-3", 2, Decimal("100000.00")),
+    ]
+
+    # Expenses of the period already exist: nothing new
+    rerun = client.post("/api/v1/payroll/generate-payroll-expenses", params={"year": 2025, "month": 3})
+    assert rerun.json()["statistics"]["expenses_created"] == 0
+    assert payroll_session.query(Expense).count() == 3
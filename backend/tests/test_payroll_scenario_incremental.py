@@ -0,0 +1,154 @@
+from decimal import Decimal
+
+import pytest
+
+from app.db.models import (
+    Employee,
+    PayrollActual,
+    PayrollDataSourceEnum,
+    PayrollPlan,
+    PayrollScenario,
+    PayrollScenarioDetail,
+    TaxRate,
+)
+from app.services.payroll_scenario_calculator import PayrollScenarioCalculator
+from app.services.tax_rate_resolver import invalidate_tax_rate_cache
+
+
+@pytest.fixture
+def session(make_db_session):
+    db = make_db_session(Employee, PayrollActual, PayrollPlan, TaxRate, PayrollScenario, PayrollScenarioDetail)
+    # Base year 2025: two employees paid 100k a month
+    for employee_id in (1, 2):
+        db.add(Employee(
+            id=employee_id, full_name=f"Сотрудник {employee_id}", position="Инженер",
+            base_salary=Decimal(100000), department_id=1,
+        ))
+        for month in range(1, 13):
+            db.add(PayrollActual(
+                employee_id=employee_id, department_id=1, year=2025, month=month,
+                base_salary_paid=Decimal(100000), total_paid=Decimal(100000),
+            ))
+    db.add(PayrollScenario(
+        id=1, name="2026", data_source=PayrollDataSourceEnum.ACTUAL, target_year=2026, base_year=2025,
+        headcount_change_percent=Decimal(0), salary_change_percent=Decimal(0), department_id=1,
+    ))
+    db.commit()
+    invalidate_tax_rate_cache()
+    yield db
+    invalidate_tax_rate_cache()
+
+
+def _detail_ids(db):
+    return sorted(detail.id for detail in db.query(PayrollScenarioDetail).all())
+
+
+def test_recalculation_writes_only_changed_details(session):
+    calculator = PayrollScenarioCalculator(session, 1)
+
+    first = calculator.calculate_scenario(1)
+    assert (first["mode"], first["details_created"], first["total_headcount"]) == ("sync", 2, 2)
+    assert first["total_base_salary"] == pytest.approx(2400000)
+    assert first["cost_difference"] == pytest.approx(first["total_insurance_cost"])
+    ids = _detail_ids(session)
+
+    # Same inputs and rates: nothing to write
+    again = calculator.calculate_scenario(1)
+    assert (again["mode"], again["details_updated"], again["details_created"]) == ("recalculate", 0, 0)
+
+    # Salary +10%: the same rows are updated in place
+    session.query(PayrollScenario).one().salary_change_percent = Decimal(10)
+    session.commit()
+    raised = calculator.calculate_scenario(1)
+    assert (raised["mode"], raised["details_updated"], raised["details_deleted"]) == ("sync", 2, 0)
+    assert raised["total_base_salary"] == pytest.approx(2640000)
+    assert _detail_ids(session) == ids
+
+    # Headcount -50%: the first employee is terminated in June, still the same rows
+    session.query(PayrollScenario).one().headcount_change_percent = Decimal(-50)
+    session.commit()
+    reduced = calculator.calculate_scenario(1)
+    assert (reduced["details_updated"], reduced["total_headcount"]) == (1, 1)
+    assert reduced["total_base_salary"] == pytest.approx(1320000 + 660000)
+    assert _detail_ids(session) == ids
+
+    rebuilt = calculator.calculate_scenario(1, full_rebuild=True)
+    assert (rebuilt["mode"], rebuilt["details_deleted"], rebuilt["details_created"]) == ("rebuild", 2, 2)
+    assert rebuilt["total_payroll_cost"] == pytest.approx(reduced["total_payroll_cost"])
+    assert session.query(PayrollScenarioDetail).filter(PayrollScenarioDetail.is_terminated == True).count() == 1
+
+
+def test_detail_update_recomputes_detail_and_totals(session):
+    calculator = PayrollScenarioCalculator(session, 1)
+    before = calculator.calculate_scenario(1)
+    detail, other = session.query(PayrollScenarioDetail).order_by(PayrollScenarioDetail.employee_id).all()
+    other_cost = other.total_employee_cost
+
+    after = calculator.update_scenario_detail(1, detail.id, {
+        "base_salary": Decimal(150000), "annual_bonus": Decimal(200000),
+    })
+
+    # +50k a month and the annual bonus, contributions at the default 30.2% (below the thresholds)
+    increase = Decimal(50000) * 12 + Decimal(200000)
+    assert after["total_base_salary"] == pytest.approx(before["total_base_salary"] + float(increase))
+    assert detail.total_employee_cost == Decimal("1200000.00") * Decimal("1.302") + increase * Decimal("1.302")
+    assert other.total_employee_cost == other_cost
+
+    # The edit survives a recalculation with unchanged scenario parameters
+    assert calculator.calculate_scenario(1)["details_updated"] == 0
+
+    with pytest.raises(ValueError):
+        calculator.update_scenario_detail(1, 999, {"base_salary": Decimal(1)})
+
+
+def test_base_year_data_changes_trigger_sync(session):
+    calculator = PayrollScenarioCalculator(session, 1)
+    calculator.calculate_scenario(1)
+
+    # A third employee's base-year actuals are loaded after the first calculation
+    session.add(Employee(
+        id=3, full_name="Сотрудник 3", position="Инженер", base_salary=Decimal(50000), department_id=1,
+    ))
+    for month in range(1, 13):
+        session.add(PayrollActual(
+            employee_id=3, department_id=1, year=2025, month=month,
+            base_salary_paid=Decimal(50000), total_paid=Decimal(50000),
+        ))
+    session.commit()
+
+    added = calculator.calculate_scenario(1)
+    assert (added["mode"], added["details_created"], added["total_headcount"]) == ("sync", 1, 3)
+    assert added["total_base_salary"] == pytest.approx(3000000)
+
+    # A corrected amount of an existing row is picked up too
+    actual = session.query(PayrollActual).filter_by(employee_id=3, month=12).one()
+    actual.total_paid = Decimal(170000)
+    session.commit()
+
+    corrected = calculator.calculate_scenario(1)
+    assert (corrected["mode"], corrected["details_updated"]) == ("sync", 1)
+    assert corrected["total_base_salary"] == pytest.approx(3120000)
+
+    # Other departments' data does not invalidate the scenario
+    session.add(PayrollActual(
+        employee_id=9, department_id=2, year=2025, month=1,
+        base_salary_paid=Decimal(1), total_paid=Decimal(1),
+    ))
+    session.commit()
+    assert calculator.calculate_scenario(1)["mode"] == "recalculate"
+
+
+def test_employee_changes_trigger_sync(session):
+    calculator = PayrollScenarioCalculator(session, 1)
+    calculator.calculate_scenario(1)
+    assert calculator.calculate_scenario(1)["mode"] == "recalculate"
+
+    # Details take the name and position from Employee, not from the base-year rows
+    session.get(Employee, 2).position = "Ведущий инженер"
+    session.commit()
+
+    promoted = calculator.calculate_scenario(1)
+    assert (promoted["mode"], promoted["details_updated"]) == ("sync", 1)
+    detail = session.query(PayrollScenarioDetail).filter_by(employee_id=2).one()
+    assert detail.position == "Ведущий инженер"
+    assert calculator.calculate_scenario(1)["mode"] == "recalculate"
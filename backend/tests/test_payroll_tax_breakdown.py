@@ -0,0 +1,119 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from fastapi.testclient import TestClient
+
+from app.api.v1.external_api import verify_api_token_dependency
+from app.db.models import (
+    APIToken,
+    Employee,
+    PayrollActual,
+    PayrollPlan,
+    PayrollTaxBreakdown,
+    PayrollTaxSourceEnum,
+    TaxRate,
+    TaxTypeEnum,
+)
+from app.db.session import get_db
+from app.main import app
+from app.services.payroll_tax_breakdown import (
+    refresh_department_payroll_taxes,
+    refresh_payroll_taxes,
+    refresh_payroll_taxes_for_rates,
+)
+
+
+@pytest.fixture
+def session(make_db_session):
+    db = make_db_session(PayrollActual, PayrollPlan, TaxRate, PayrollTaxBreakdown)
+    for month in (1, 2, 3):
+        db.add(PayrollActual(
+            employee_id=1, department_id=1, year=2025, month=month,
+            base_salary_paid=Decimal(900000), monthly_bonus_paid=Decimal(100000), total_paid=Decimal(1000000),
+        ))
+    db.add(PayrollPlan(
+        employee_id=1, department_id=1, year=2025, month=1,
+        base_salary=Decimal(50000), total_planned=Decimal(50000),
+    ))
+    db.commit()
+    return db
+
+
+def _actuals(db):
+    return db.query(PayrollTaxBreakdown).filter(
+        PayrollTaxBreakdown.source == PayrollTaxSourceEnum.ACTUAL
+    ).order_by(PayrollTaxBreakdown.month).all()
+
+
+def test_months_are_year_to_date_increments(session):
+    assert refresh_department_payroll_taxes(session, [2025]) == 4
+    session.commit()
+
+    rows = _actuals(session)
+    # НДФЛ: 13% up to 2.4M YTD, 15% above
+    assert [row.ndfl for row in rows] == [Decimal("130000.00"), Decimal("130000.00"), Decimal("142000.00")]
+    # ПФР (default rate): 22% up to 1,917,000 YTD, 10% above
+    assert [row.pension_contribution for row in rows] == [
+        Decimal("220000.00"), Decimal("210040.00"), Decimal("100000.00"),
+    ]
+    assert rows[0].base_salary == Decimal("900000.00")
+    assert rows[0].employer_cost == rows[0].gross + rows[0].total_contributions
+    assert sum(row.net for row in rows) == Decimal(3000000) - Decimal(402000)
+
+    plan = session.query(PayrollTaxBreakdown).filter(PayrollTaxBreakdown.source == PayrollTaxSourceEnum.PLAN).one()
+    assert plan.ndfl == Decimal("6500.00")
+
+
+def test_rate_change_and_payroll_delete_are_recomputed(session):
+    refresh_payroll_taxes(session, [(1, 2025)])
+    assert _actuals(session)[1].injury_contribution == Decimal("2000.00")
+
+    rate = TaxRate(
+        tax_type=TaxTypeEnum.INJURY_INSURANCE, name="НС", rate=Decimal("0.01"),
+        effective_from=date(2025, 2, 1), department_id=1,
+    )
+    session.add(rate)
+    refresh_payroll_taxes_for_rates(session, [rate])
+    assert [row.injury_contribution for row in _actuals(session)] == [
+        Decimal("2000.00"), Decimal("10000.00"), Decimal("10000.00"),
+    ]
+
+    session.delete(session.query(PayrollActual).filter(PayrollActual.month == 1).one())
+    refresh_payroll_taxes(session, [(1, 2025)])
+    rows = _actuals(session)
+    assert [row.month for row in rows] == [2, 3]
+    assert rows[0].ndfl == Decimal("130000.00")
+
+
+def test_plan_import_refreshes_only_imported_employees(make_db_session):
+    db = make_db_session(Employee, PayrollActual, PayrollPlan, TaxRate, PayrollTaxBreakdown)
+    for employee_id in (1, 2):
+        db.add(Employee(
+            id=employee_id, full_name=f"Сотрудник {employee_id}", position="Инженер",
+            base_salary=Decimal(100000), department_id=1,
+        ))
+    # Employee 2 already has a plan for the year, without a breakdown
+    db.add(PayrollPlan(
+        employee_id=2, department_id=1, year=2025, month=1,
+        base_salary=Decimal(50000), total_planned=Decimal(50000),
+    ))
+    db.commit()
+
+    token = APIToken(id=1, name="import", department_id=1, scopes=["WRITE"])
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[verify_api_token_dependency] = lambda: token
+    try:
+        response = TestClient(app).post("/api/v1/external/import/payroll-plans", json=[
+            {"employee_id": 1, "year": 2025, "month": month, "base_salary": 100000} for month in (1, 2)
+        ] + [{"employee_id": 1, "year": 2025, "month": 13, "base_salary": 1}])
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200, response.text
+    assert (response.json()["created_count"], response.json()["error_count"]) == (2, 1)
+    rows = db.query(PayrollTaxBreakdown.employee_id, PayrollTaxBreakdown.month).order_by(
+        PayrollTaxBreakdown.employee_id, PayrollTaxBreakdown.month
+    ).all()
+    assert [tuple(row) for row in rows] == [(1, 1), (1, 2)]
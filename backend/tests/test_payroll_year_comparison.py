@@ -0,0 +1,78 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.db.models import PayrollActual, PayrollPlan, TaxRate, TaxTypeEnum, User, UserRoleEnum
+from app.services.payroll_scenario_calculator import InsuranceImpactAnalyzer
+from app.services.payroll_year_comparison import year_matrix
+from app.services.tax_rate_resolver import invalidate_tax_rate_cache
+
+
+@pytest.fixture
+def session(make_db_session):
+    db = make_db_session(PayrollActual, PayrollPlan, TaxRate)
+    # 2024: two employees paid 100k a month, 2025: only a plan for one of them
+    for employee_id in (1, 2):
+        for month in range(1, 13):
+            db.add(PayrollActual(
+                employee_id=employee_id, department_id=1, year=2024, month=month,
+                base_salary_paid=Decimal(100000), total_paid=Decimal(100000),
+            ))
+    db.add(PayrollPlan(
+        employee_id=1, department_id=1, year=2025, month=1, base_salary=Decimal(3000000), total_planned=Decimal(3000000),
+    ))
+    db.add(TaxRate(
+        tax_type=TaxTypeEnum.PENSION_FUND, name="ПФР 2026", rate=Decimal("0.30"),
+        threshold_amount=Decimal(2000000), rate_above_threshold=Decimal("0.10"),
+        effective_from=date(2026, 1, 1), department_id=1,
+    ))
+    db.commit()
+    invalidate_tax_rate_cache()
+    yield db
+    invalidate_tax_rate_cache()
+
+
+def test_matrix_uses_actuals_plans_and_projection(session):
+    rows = {row["year"]: row for row in year_matrix(session, 1, 2023, 2026)}
+
+    assert rows[2023]["source"] is None and rows[2023]["total_cost"] == 0
+    assert (rows[2024]["source"], rows[2024]["headcount"], rows[2024]["total_salary"]) == ("actual", 2, 2400000)
+    assert rows[2024]["ndfl"] == pytest.approx(312000)
+    assert rows[2024]["pension"] == pytest.approx(528000)
+
+    # Plan year: 3M to one employee, ПФР limit 1,917,000 and НДФЛ 13% / 15% above 2.4M
+    assert rows[2025]["source"] == "plan"
+    assert rows[2025]["pension"] == pytest.approx(1917000 * 0.22 + 1083000 * 0.10)
+    assert rows[2025]["ndfl"] == pytest.approx(2400000 * 0.13 + 600000 * 0.15)
+
+    # 2026 is projected from the 2025 plan at the department's new ПФР rate
+    assert rows[2026]["source"] == "projection"
+    assert rows[2026]["pension"] == pytest.approx(2000000 * 0.30 + 1000000 * 0.10)
+    assert rows[2026]["rates"]["PENSION_FUND"] == pytest.approx(30)
+    assert rows[2026]["cost_change"] == pytest.approx(rows[2026]["total_cost"] - rows[2025]["total_cost"])
+
+
+def test_impact_applies_target_rates_to_base_payroll(session):
+    analysis = InsuranceImpactAnalyzer(session, 1).analyze_impact(2024, 2026)
+
+    # 1.2M per employee stays below both thresholds: +8% of the 2.4M payroll
+    assert analysis["pension_impact"] == pytest.approx(2400000 * 0.08)
+    assert analysis["total_impact"] == pytest.approx(analysis["pension_impact"])
+    assert analysis["rate_changes"]["ПФР"] == {"from": 22.0, "to": 30.0, "change": 8.0}
+    assert analysis["base_year_payroll"]["headcount"] == 2
+    # No 2026 payroll yet: the headcount of the 2025 plan is carried forward
+    assert analysis["target_year_headcount"] == 1
+
+
+def test_impact_endpoint_returns_breakdown(session, make_api_client):
+    client = make_api_client(session, User(id=1, role=UserRoleEnum.USER, department_id=1))
+
+    response = client.get("/api/v1/payroll-scenarios/impact-analysis", params={"base_year": 2024, "target_year": 2026})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["pension_impact"] == pytest.approx(2400000 * 0.08)
+    assert (body["medical_impact"], body["social_impact"], body["injury_impact"]) == (0, 0, 0)
+    assert body["base_year_payroll"]["total_salary"] == pytest.approx(2400000)
+    assert body["target_year_headcount"] == 1
@@ -0,0 +1,128 @@
+from decimal import Decimal
+
+import pytest
+
+from app.db.models import (
+    BudgetCategory,
+    BudgetPlanDetail,
+    BudgetVersion,
+    BudgetVersionStatusEnum,
+    Department,
+    ExpenseTypeEnum,
+    RevenuePlan,
+    RevenuePlanDetail,
+    RevenuePlanStatusEnum,
+    RevenuePlanVersion,
+    RevenueVersionStatusEnum,
+    User,
+    UserRoleEnum,
+)
+from app.services.plan_copy import copy_budget_year, copy_revenue_plans, month_factors
+
+
+@pytest.fixture
+def session(make_db_session):
+    return make_db_session(
+        BudgetCategory, BudgetVersion, BudgetPlanDetail, RevenuePlan, RevenuePlanVersion, RevenuePlanDetail,
+        Department,
+    )
+
+
+def _revenue_plan(db, name, department_id, version_status):
+    plan = RevenuePlan(
+        name=name, year=2025, department_id=department_id,
+        status=RevenuePlanStatusEnum.APPROVED, created_by=1,
+    )
+    db.add(plan)
+    db.flush()
+    version = RevenuePlanVersion(plan_id=plan.id, version_number=1, status=version_status, created_by=1)
+    db.add(version)
+    db.flush()
+    db.add(RevenuePlanDetail(
+        version_id=version.id, department_id=department_id,
+        **{f"month_{month:02d}": Decimal("100.00") for month in range(1, 13)},
+    ))
+    return plan
+
+
+def test_month_factors_requires_twelve_values():
+    assert month_factors(2.0, None) == [2.0] * 12
+    with pytest.raises(ValueError):
+        month_factors(1.0, [1.0, 2.0])
+
+
+def test_copy_revenue_plans_applies_coefficient_and_seasonality(session):
+    _revenue_plan(session, "Sales 2025", 1, RevenueVersionStatusEnum.APPROVED)
+    _revenue_plan(session, "Draft 2025", 1, RevenueVersionStatusEnum.DRAFT)
+    _revenue_plan(session, "Sales 2025", 2, RevenueVersionStatusEnum.APPROVED)
+    session.commit()
+
+    results = copy_revenue_plans(
+        session, 2025, 2026, [1, 2], created_by=1,
+        coefficient=1.1, seasonality=[1.0] * 11 + [2.0],
+    )
+    session.commit()
+
+    assert {department_id: result.created_plans for department_id, result in results.items()} == {1: 1, 2: 1}
+    assert results[1].skipped_plans == 1
+    plan = session.query(RevenuePlan).filter(RevenuePlan.year == 2026, RevenuePlan.department_id == 1).one()
+    assert plan.name == "Sales 2026"
+    detail = session.query(RevenuePlanDetail).filter(RevenuePlanDetail.version_id == results[1].version_ids[0]).one()
+    assert detail.month_01 == Decimal("110.00")
+    assert detail.month_12 == Decimal("220.00")
+    assert detail.total == Decimal("1430.00")
+
+
+def test_copy_budget_year_skips_departments_without_baseline(session):
+    session.add(BudgetCategory(id=1, name="Licenses", type=ExpenseTypeEnum.OPEX, department_id=1))
+    baseline = BudgetVersion(
+        year=2025, version_number=1, department_id=1, is_baseline=True,
+        status=BudgetVersionStatusEnum.APPROVED,
+    )
+    session.add(baseline)
+    session.flush()
+    for month in range(1, 13):
+        session.add(BudgetPlanDetail(
+            version_id=baseline.id, month=month, category_id=1,
+            planned_amount=Decimal("10.00"), type=ExpenseTypeEnum.OPEX,
+        ))
+    session.commit()
+
+    results = copy_budget_year(session, 2025, 2026, [1, 2], created_by="admin", coefficient=1.5)
+    session.commit()
+
+    assert results[1].created_details == 12
+    assert results[2].created_versions == 0
+    version = session.get(BudgetVersion, results[1].version_ids[0])
+    assert (version.year, version.status, version.is_baseline) == (2026, BudgetVersionStatusEnum.DRAFT, False)
+    assert {detail.planned_amount for detail in version.plan_details} == {Decimal("15.00")}
+
+
+def test_copy_year_endpoint_checks_role_and_departments(session, make_api_client):
+    session.add_all([
+        Department(id=1, name="IT", code="IT"),
+        Department(id=2, name="Sales", code="SALES"),
+        Department(id=3, name="Closed", code="CLOSED", is_active=False),
+    ])
+    session.add(BudgetVersion(
+        year=2025, version_number=1, department_id=2, is_baseline=True,
+        status=BudgetVersionStatusEnum.APPROVED,
+    ))
+    session.commit()
+    url = "/api/v1/budget/planning/versions/copy-year"
+    body = {"source_year": 2025, "target_year": 2026}
+
+    for role in (UserRoleEnum.USER, UserRoleEnum.ACCOUNTANT):
+        client = make_api_client(session, User(id=1, username="user", role=role, department_id=1))
+        response = client.post(url, json={**body, "department_ids": [2]})
+        assert response.status_code == 403, response.text
+
+    client = make_api_client(session, User(id=2, username="manager", role=UserRoleEnum.MANAGER, department_id=1))
+    response = client.post(url, json={**body, "department_ids": [2, 3, 4]})
+    assert response.status_code == 404, response.text
+    assert "[3, 4]" in response.json()["detail"]
+    assert session.query(BudgetVersion).count() == 1
+
+    response = client.post(url, json={**body, "department_ids": [2]})
+    assert response.status_code == 201, response.text
+    assert [(version["department_id"], version["year"]) for version in response.json()] == [(2, 2026)]
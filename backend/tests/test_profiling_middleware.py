@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from app.middleware import profiling
+from app.middleware.profiling import (
+    LoopLagMonitor,
+    create_profiling_middleware,
+    get_current_profile,
+    statement_shape,
+)
+
+
+def _client(engine, server_timing: bool = True, n_plus_one_threshold: int = 5):
+    """Build isolated app with profiling middleware for testing."""
+    app = FastAPI()
+    app.add_middleware(
+        create_profiling_middleware(
+            server_timing=server_timing,
+            n_plus_one_threshold=n_plus_one_threshold,
+        )
+    )
+    captured = {}
+
+    @app.get("/items/{count}")
+    def items(count: int):
+        with engine.connect() as conn:
+            for item_id in range(count):
+                conn.execute(text("SELECT :id"), {"id": item_id})
+        profile = get_current_profile()
+        captured["queries"] = profile.query_count
+        captured["shapes"] = dict(profile.statement_shapes)
+        return {"ok": True}
+
+    return TestClient(app), captured
+
+
+def _engine():
+    return create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+
+def test_queries_counted_per_request_and_server_timing_header():
+    client, captured = _client(_engine())
+
+    response = client.get("/items/3")
+
+    assert response.status_code == 200
+    assert captured["queries"] == 3
+    timing = response.headers["Server-Timing"]
+    assert 'desc="3 queries"' in timing
+    assert "app;dur=" in timing
+
+
+def test_server_timing_header_disabled():
+    client, _ = _client(_engine(), server_timing=False)
+
+    response = client.get("/items/1")
+
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+
+
+def test_n_plus_one_detected_by_statement_shape():
+    client, captured = _client(_engine(), n_plus_one_threshold=5)
+    before = profiling.N_PLUS_ONE.labels("GET", "/items/{count}")._value.get()
+
+    client.get("/items/6")
+
+    assert list(captured["shapes"].values()) == [6]
+    after = profiling.N_PLUS_ONE.labels("GET", "/items/{count}")._value.get()
+    assert after == before + 1
+
+
+def test_queries_outside_requests_are_not_profiled():
+    engine = _engine()
+    profiling.install_query_hooks()
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    assert get_current_profile() is None
+
+
+def test_statement_shape_collapses_in_lists_and_values():
+    assert statement_shape("SELECT * FROM t WHERE id IN (?, ?, ?)") == statement_shape(
+        "SELECT * FROM t WHERE id IN (?)"
+    )
+    assert statement_shape(
+        "INSERT INTO t (a, b) VALUES (%(a_0)s, %(b_0)s), (%(a_1)s, %(b_1)s)"
+    ) == statement_shape("INSERT INTO t (a, b) VALUES (%(a_0)s, %(b_0)s)")
+    assert statement_shape("SELECT  a\n FROM t") == "SELECT a FROM t"
+
+
+def test_loop_lag_monitor_reports_stall():
+    async def run():
+        monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+        before = profiling.LOOP_STALLS.labels("<none>")._value.get()
+        monitor.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)  # block the loop
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return before, profiling.LOOP_STALLS.labels("<none>")._value.get()
+
+    before, after = asyncio.run(run())
+
+    assert after > before
@@ -1,19 +1,23 @@
-import pytest
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
-from app.middleware.rate_limit import create_rate_limiter
+from app.middleware.rate_limit import RateLimit, create_rate_limiter, gcra_check
+from app.utils.api_token import remember_verified_token
 
 
-def _client(per_minute: int = 2, per_hour: int = 10) -> TestClient:
+def _client(per_minute: int = 2, per_hour: int = 10, **kwargs) -> TestClient:
     """Build isolated app with rate limiter for testing."""
     app = FastAPI()
-    app.add_middleware(create_rate_limiter(per_minute, per_hour))
+    app.add_middleware(create_rate_limiter(per_minute, per_hour, **kwargs))
 
     @app.get("/ping")
     def ping():
         return {"ok": True}
 
+    @app.get("/external/ping")
+    def external_ping():
+        return {"ok": True}
+
     return TestClient(app)
 
 
@@ -23,14 +27,14 @@ def test_rate_limit_blocks_after_threshold():
     assert client.get("/ping").status_code == 200
     assert client.get("/ping").status_code == 200
 
-    with pytest.raises(HTTPException) as exc:
-        client.get("/ping")
+    response = client.get("/ping")
 
-    assert exc.value.status_code == 429
-    detail = exc.value.detail
+    assert response.status_code == 429
+    detail = response.json()["detail"]
     assert isinstance(detail, dict)
     assert detail.get("error") == "Rate limit exceeded"
     assert "retry_after" in detail
+    assert response.headers["Retry-After"] == str(detail["retry_after"])
 
 
 def test_health_endpoints_bypass_rate_limit():
@@ -41,3 +45,74 @@ def test_health_endpoints_bypass_rate_limit():
         response = client.get(path)
         # docs/redoc/openapi may not be mounted, allow 404 but not 429
         assert response.status_code != 429
+
+
+def test_rate_limit_headers_report_remaining_budget():
+    client = _client(per_minute=3, per_hour=100)
+
+    first = client.get("/ping")
+    second = client.get("/ping")
+
+    assert first.headers["X-RateLimit-Limit-Minute"] == "3"
+    assert first.headers["X-RateLimit-Remaining-Minute"] == "2"
+    assert second.headers["X-RateLimit-Remaining-Minute"] == "1"
+    assert first.headers["X-RateLimit-Limit-Hour"] == "100"
+
+
+def test_hour_limit_applies_independently():
+    client = _client(per_minute=100, per_hour=2)
+
+    assert client.get("/ping").status_code == 200
+    assert client.get("/ping").status_code == 200
+    assert client.get("/ping").status_code == 429
+
+
+def test_route_group_has_own_budget():
+    client = _client(per_minute=1, per_hour=100, route_limits={"/external": RateLimit(3, 100)})
+
+    assert client.get("/ping").status_code == 200
+    assert client.get("/ping").status_code == 429
+
+    for _ in range(3):
+        assert client.get("/external/ping").status_code == 200
+    assert client.get("/external/ping").status_code == 429
+
+
+def test_verified_api_tokens_are_limited_per_token():
+    client = _client(per_minute=1, per_hour=100, token_limit=RateLimit(2, 100))
+    token_a = {"Authorization": "Bearer itb_aaa"}
+    token_b = {"Authorization": "Bearer itb_bbb"}
+    remember_verified_token("itb_aaa")
+    remember_verified_token("itb_bbb")
+
+    assert client.get("/ping", headers=token_a).status_code == 200
+    assert client.get("/ping", headers=token_a).status_code == 200
+    assert client.get("/ping", headers=token_a).status_code == 429
+
+    # Other token and anonymous traffic from the same IP keep their own buckets
+    assert client.get("/ping", headers=token_b).status_code == 200
+    assert client.get("/ping").status_code == 200
+
+
+def test_unverified_api_tokens_share_the_ip_bucket():
+    client = _client(per_minute=1, per_hour=100, token_limit=RateLimit(5, 100))
+
+    # Rotating made-up tokens does not mint new buckets
+    assert client.get("/ping", headers={"Authorization": "Bearer itb_random1"}).status_code == 200
+    assert client.get("/ping", headers={"Authorization": "Bearer itb_random2"}).status_code == 429
+    assert client.get("/ping").status_code == 429
+
+
+def test_gcra_allows_burst_then_refills_at_emission_interval():
+    interval, burst = 60.0 / 2, 2
+    allowed, tat, _, _ = gcra_check(None, 1000.0, interval, burst)
+    assert allowed
+    allowed, tat, _, remaining = gcra_check(tat, 1000.0, interval, burst)
+    assert allowed and remaining == 0
+
+    allowed, _, retry_after, _ = gcra_check(tat, 1000.0, interval, burst)
+    assert not allowed
+    assert retry_after == interval
+
+    allowed, _, _, _ = gcra_check(tat, 1000.0 + interval, interval, burst)
+    assert allowed
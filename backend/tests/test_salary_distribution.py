@@ -0,0 +1,75 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.db.models import Employee, EmployeeStatusEnum, PayrollPlan
+from app.services.cache import cache_service
+from app.services.salary_distribution import (
+    cached_distributions,
+    current_compensation_values,
+    invalidate_salary_distribution_cache,
+    planned_compensation_values,
+)
+
+
+@pytest.fixture
+def session(make_db_session):
+    db = make_db_session(Employee, PayrollPlan)
+    for employee_id, department_id, salary in [(1, 1, 40000), (2, 1, 60000), (3, 1, 130000), (4, 2, 90000)]:
+        db.add(Employee(
+            id=employee_id, full_name=f"Employee {employee_id}", position="Dev", hire_date=date(2024, 1, 1),
+            base_salary=Decimal(salary), department_id=department_id,
+        ))
+        for month in (1, 2):
+            db.add(PayrollPlan(
+                employee_id=employee_id, department_id=department_id, year=2025, month=month,
+                base_salary=Decimal(salary), total_planned=Decimal(salary * month),
+            ))
+    db.add(Employee(
+        id=5, full_name="Fired", position="Dev", hire_date=date(2024, 1, 1), base_salary=Decimal("1"),
+        department_id=1, status=EmployeeStatusEnum.FIRED,
+    ))
+    db.commit()
+    invalidate_salary_distribution_cache()
+    yield db
+    invalidate_salary_distribution_cache()
+
+
+def test_distributions_per_department_and_month(session):
+    keys = [(department_id, 2025, month) for department_id in (1, 2) for month in (1, 2)]
+    result = cached_distributions(
+        session, "planned", keys,
+        lambda missing: planned_compensation_values(2025, [1, 2], [1, 2], by_department=True),
+        bucket_size=50000,
+    )
+
+    january = result[(1, 2025, 1)]
+    assert january["statistics"]["median_salary"] == 60000
+    assert january["statistics"]["percentile_25"] == 50000
+    assert january["statistics"]["percentile_90"] == 116000
+    assert [(bucket["range_label"], bucket["employee_count"]) for bucket in january["buckets"]] == [
+        ("0-50,000", 1), ("50,000-100,000", 1), ("100,000-150,000", 1),
+    ]
+    assert result[(1, 2025, 2)]["statistics"]["max_salary"] == 260000
+    assert result[(2, 2025, 2)]["total_employees"] == 1
+
+
+def test_current_compensation_is_cached_until_invalidated(session):
+    key = (None, None, None)
+
+    def base_salaries(missing):
+        return current_compensation_values(base_salary_only=True)
+
+    stats = cached_distributions(session, "base_salary", [key], base_salaries)[key]["statistics"]
+    assert (stats["total_employees"], stats["median_salary"], stats["total_payroll"]) == (4, 75000, 320000)
+
+    session.get(Employee, 4).base_salary = Decimal("10000")
+    session.commit()
+    if cache_service.is_enabled:
+        cached = cached_distributions(session, "base_salary", [key], base_salaries)[key]["statistics"]
+        assert cached["median_salary"] == 75000
+
+    invalidate_salary_distribution_cache()
+    stats = cached_distributions(session, "base_salary", [key], base_salaries)[key]["statistics"]
+    assert stats["median_salary"] == 50000
@@ -0,0 +1,56 @@
+from datetime import date
+from decimal import Decimal
+
+from app.db.models import TaxTypeEnum
+from app.services.tax_rate_resolver import TaxRateEntry, TaxRateResolver
+from app.services.tax_rate_utils import DEFAULT_TAX_RATES
+
+
+def _rate(rate_id, rate, effective_from, effective_to=None, department_id=None, tax_type=TaxTypeEnum.PENSION_FUND):
+    return TaxRateEntry(
+        id=rate_id, tax_type=tax_type, name=f"rate {rate_id}", rate=Decimal(rate),
+        threshold_amount=None, rate_above_threshold=None,
+        effective_from=effective_from, effective_to=effective_to, department_id=department_id,
+    )
+
+
+RESOLVER = TaxRateResolver([
+    _rate(1, "0.22", date(2024, 1, 1)),
+    # Overlaps rate 1 and wins while in force, rate 1 applies again afterwards
+    _rate(2, "0.30", date(2025, 1, 1), date(2025, 6, 30)),
+    _rate(3, "0.10", date(2025, 4, 1), department_id=7),
+    _rate(4, "0.05", date(2026, 3, 1), department_id=7, tax_type=TaxTypeEnum.MEDICAL_INSURANCE),
+])
+
+
+def test_rate_on_date_with_overlaps_and_department_fallback():
+    pension = TaxTypeEnum.PENSION_FUND
+    assert RESOLVER.rate_on(pension, date(2023, 12, 31)) is DEFAULT_TAX_RATES[pension]
+    assert RESOLVER.rate_on(pension, date(2024, 5, 1)).id == 1
+    assert RESOLVER.rate_on(pension, date(2025, 6, 30)).id == 2
+    assert RESOLVER.rate_on(pension, date(2025, 7, 1)).id == 1
+
+    # Department 7 has its own rate from April, global rates before
+    assert RESOLVER.rate_on(pension, date(2025, 2, 1), department_id=7).id == 2
+    assert RESOLVER.rate_on(pension, date(2025, 4, 1), department_id=7).id == 3
+    assert RESOLVER.rate_on(pension, date(2025, 4, 1)).id == 2
+
+    dates = [date(2025, 7, 1), date(2020, 1, 1), date(2025, 3, 31), date(2025, 4, 1)]
+    assert [rate.rate for rate in RESOLVER.rate_on_dates(pension, dates, department_id=7)] == [
+        Decimal("0.10"), Decimal("0.22"), Decimal("0.30"), Decimal("0.10"),
+    ]
+    assert [getattr(rate, "id", None) for rate in RESOLVER.rate_on_dates(pension, dates)] == [1, None, 2, 2]
+
+    rates = RESOLVER.rates_on(date(2025, 5, 1), department_id=7)
+    assert set(rates) == set(DEFAULT_TAX_RATES)
+    assert rates[TaxTypeEnum.MEDICAL_INSURANCE] is DEFAULT_TAX_RATES[TaxTypeEnum.MEDICAL_INSURANCE]
+
+
+def test_rate_for_year_prefers_changes_during_the_year():
+    pension = TaxTypeEnum.PENSION_FUND
+    assert RESOLVER.rate_for_year(pension, 2024).id == 1
+    assert RESOLVER.rate_for_year(pension, 2025).id == 2
+    assert RESOLVER.rate_for_year(pension, 2025, department_id=7).id == 3
+    assert RESOLVER.rate_for_year(pension, 2026, department_id=7).id == 3
+    assert RESOLVER.rate_for_year(TaxTypeEnum.MEDICAL_INSURANCE, 2026, department_id=7).rate == Decimal("0.05")
+    assert RESOLVER.rate_for_year(TaxTypeEnum.MEDICAL_INSURANCE, 2026).rate == Decimal("0.051")
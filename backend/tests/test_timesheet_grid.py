@@ -0,0 +1,77 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app.db.models import DailyWorkRecord, DayTypeEnum, Employee, WorkTimesheet
+from app.schemas.timesheet import TimesheetGridCell
+from app.services.timesheet_grid import TimesheetConflictError, TimesheetGridError, save_grid_cells
+
+
+@pytest.fixture
+async def session_factory(make_async_session_factory):
+    factory = await make_async_session_factory(Employee, WorkTimesheet, DailyWorkRecord)
+    async with factory() as db:
+        db.add_all([
+            Employee(id=employee_id, full_name=name, position="Dev", hire_date=date(2024, 1, 1),
+                     base_salary=Decimal("100000"), department_id=department_id)
+            for employee_id, name, department_id in [(1, "Ivanov", 1), (2, "Petrov", 1), (3, "Sidorov", 2)]
+        ])
+        await db.commit()
+    return factory
+
+
+def cell(employee_id, day, hours="8", **kwargs):
+    return TimesheetGridCell(
+        employee_id=employee_id, work_date=date(2025, 3, day),
+        is_working_day=True, hours_worked=Decimal(hours), **kwargs,
+    )
+
+
+async def save(factory, cells, lock_versions=None):
+    async with factory() as db:
+        stats = await save_grid_cells(db, 1, 2025, 3, cells, lock_versions or {})
+        await db.commit()
+        timesheets = (await db.execute(select(WorkTimesheet))).scalars().all()
+        return stats, {timesheet.employee_id: timesheet for timesheet in timesheets}
+
+
+async def test_first_save_creates_timesheets_and_totals(session_factory):
+    stats, timesheets = await save(session_factory, [
+        cell(1, 3), cell(1, 4, "7.5"), cell(1, 5, "8", day_type=DayTypeEnum.SICK_LEAVE),
+        cell(2, 3), cell(2, 4, delete=True),
+    ])
+
+    assert (stats.created_timesheets, stats.inserted, stats.unchanged) == (2, 4, 1)
+    assert timesheets[1].total_days_worked == 2
+    assert timesheets[1].total_hours_worked == Decimal("15.50")
+    assert timesheets[1].lock_version == 1
+
+
+async def test_second_save_diffs_and_checks_lock_version(session_factory):
+    await save(session_factory, [cell(1, 3), cell(1, 4)])
+
+    stats, timesheets = await save(
+        session_factory,
+        [cell(1, 3), cell(1, 4, "4"), cell(1, 5), cell(1, 6, delete=True)],
+        {1: 1},
+    )
+    assert (stats.inserted, stats.updated, stats.deleted, stats.unchanged) == (1, 1, 0, 2)
+    assert timesheets[1].total_hours_worked == Decimal("20.00")
+    assert timesheets[1].lock_version == 2
+
+    stats, timesheets = await save(session_factory, [cell(1, 5, delete=True)], {1: 2})
+    assert stats.deleted == 1
+    assert timesheets[1].total_days_worked == 2
+
+    with pytest.raises(TimesheetConflictError) as error:
+        await save(session_factory, [cell(1, 7)], {1: 2})
+    assert error.value.employee_ids == [1]
+
+
+async def test_rejects_foreign_employees_and_other_months(session_factory):
+    with pytest.raises(TimesheetGridError):
+        await save(session_factory, [cell(3, 3)])
+    with pytest.raises(TimesheetGridError):
+        await save(session_factory, [TimesheetGridCell(employee_id=1, work_date=date(2025, 4, 1))])